@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+SecureOS Flash - Command Line Interface
+
+Production CLI for scripts and provisioning automation.
+Run `python3 cli.py --help` for commands and exit codes.
+"""
+
+import os
+import sys
+
+# Add project root to path (os.path rather than pathlib keeps startup fast)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.cli import main
+
+
+if __name__ == "__main__":
+    sys.exit(main())
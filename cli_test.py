@@ -6,14 +6,17 @@ Simple CLI to test the framework with Samsung backend.
 """
 
 import sys
+import argparse
 import logging
 from pathlib import Path
 
-# Add src to path
-sys.path.insert(0, str(Path(__file__).parent / "src"))
+# Add project root to path (src.utils is imported relatively from src.core)
+sys.path.insert(0, str(Path(__file__).parent))
 
-from core import ProtocolManager
-from backends.samsung import SamsungBackend
+from src.core import ProtocolManager, GraphExecutor, ManifestError, load_manifest
+from src.core import events
+from src.backends.samsung import SamsungBackend
+from src.backends.fastboot import FastbootBackend
 
 
 # Setup logging
@@ -24,7 +27,69 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def run_manifest(path: str, dry_run: bool) -> int:
+    """Compile a flash manifest and print it (dry run) or run it on the connected device."""
+    try:
+        manifest = load_manifest(path)
+        graph = manifest.compile()
+    except ManifestError as e:
+        print(f"❌ {e}")
+        return 2
+    
+    if dry_run:
+        print(graph.describe())
+        return 0
+    
+    manager = ProtocolManager()
+    manager.register_backend(SamsungBackend())
+    manager.register_backend(FastbootBackend())
+    
+    if not manager.detect_device() or not manager.init_session():
+        print("❌ No compatible device ready")
+        return 1
+    
+    managers = manifest.bind([manager])
+    missing = [device for device in graph.devices if device not in managers]
+    if missing:
+        print(f"❌ No device matches: {', '.join(missing)}")
+        return 1
+    
+    models = {device: m.current_device.model for device, m in managers.items()}
+    print(graph.describe(models=models))
+    print()
+    
+    result = GraphExecutor(managers).run(graph)
+    manager.end_session(reboot=False)
+    
+    print(f"{'✅' if result.success else '❌'} {result.message} ({result.elapsed:.1f}s)")
+    for node_id, node_result in result.results.items():
+        if not node_result.success:
+            print(f"   {node_id}: {node_result.error or node_result.message}")
+    return 0 if result.success else 1
+
+
+def bench_events() -> int:
+    """Print the event bus's per-event overhead on a high-rate progress stream."""
+    print("Event bus: cost per progress event")
+    for case, nanoseconds in events.benchmark().items():
+        print(f"   {case:<18} {nanoseconds:8.0f} ns")
+    return 0
+
+
 def main():
+    parser = argparse.ArgumentParser(description="SecureOS Flash test CLI")
+    parser.add_argument("--manifest", help="Run a flash manifest (JSON or TOML)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="With --manifest: print the plan and estimated time only")
+    parser.add_argument("--bench-events", action="store_true",
+                        help="Measure event bus overhead and exit")
+    args = parser.parse_args()
+    
+    if args.bench_events:
+        return bench_events()
+    if args.manifest:
+        return run_manifest(args.manifest, args.dry_run)
+    
     print("=" * 60)
     print("SecureOS Flash - Universal Android Flash Tool")
     print("🏴‍☠️ For Everyone. Free Forever.")
@@ -38,6 +103,9 @@ def main():
     samsung = SamsungBackend()
     manager.register_backend(samsung)
     
+    # Register fastboot backend (Pixel and other fastboot devices)
+    manager.register_backend(FastbootBackend())
+    
     print("🔍 Detecting device...")
     print()
     
@@ -103,7 +171,6 @@ def main():
     print("Framework test complete!")
     print("Next steps:")
     print("  • Build GUI")
-    print("  • Add fastboot backend")
     print("  • Add backup/restore UI")
     print("  • Add setup guides")
     print("=" * 60)
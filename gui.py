@@ -8,15 +8,94 @@ Built for everyone - grandma to power user.
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+import os
+import re
 import sys
 import threading
 from pathlib import Path
 
-# Add src to path
-sys.path.insert(0, str(Path(__file__).parent / "src"))
+# Add project root to path (src.utils is imported relatively from src.core)
+sys.path.insert(0, str(Path(__file__).parent))
 
-from core import ProtocolManager, DeviceInfo
-from backends.samsung import SamsungBackend
+from src.core import ProtocolManager, CancellationToken, FlashResult, discover_devices
+from src.backends.samsung import SamsungBackend
+from src.backends.fastboot import FastbootBackend
+from src.backends.mediatek import MediaTekBackend
+from src.gui import DeviceProgress, EventQueue, FRAME_INTERVAL_MS, format_eta, format_rate
+
+
+class DeviceRow:
+    """One attached device: selection box, progress bar and status line"""
+    
+    def __init__(self, parent, manager: ProtocolManager, ready: bool):
+        self.manager = manager
+        self.key = manager.device_key
+        self.ready = ready
+        self.busy = False
+        self.progress = DeviceProgress(self.key)
+        
+        device = manager.current_device
+        self.frame = tk.Frame(parent, bg="#1a1a1a")
+        self.frame.pack(fill=tk.X, pady=2)
+        
+        self.selected = tk.BooleanVar(value=ready)
+        tk.Checkbutton(
+            self.frame,
+            text=f"{device.manufacturer} {device.model} ({device.usb_path or device.device_id})",
+            variable=self.selected,
+            state=tk.NORMAL if ready else tk.DISABLED,
+            font=("Arial", 9),
+            bg="#1a1a1a",
+            fg="#ffffff",
+            selectcolor="#2d2d2d",
+            activebackground="#1a1a1a",
+            width=34,
+            anchor=tk.W
+        ).pack(side=tk.LEFT)
+        
+        self.bar = ttk.Progressbar(self.frame, mode='determinate', maximum=100)
+        self.bar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
+        
+        self.status = tk.Label(
+            self.frame,
+            text="Ready" if ready else "❌ Session failed",
+            font=("Arial", 9),
+            bg="#1a1a1a",
+            fg="#888888" if ready else "#ff4444",
+            width=28,
+            anchor=tk.W
+        )
+        self.status.pack(side=tk.LEFT)
+    
+    def start(self, operation: str):
+        """Operation started on this device"""
+        self.busy = True
+        self.progress.reset()
+        self.bar["value"] = 0
+        self.status.config(text=f"{operation}...", fg="#ffaa00")
+    
+    def update_progress(self, done: int, total: int, when: float):
+        """Latest progress sample from the backend"""
+        self.progress.update(done, total, when)
+        self.bar["value"] = self.progress.percent
+        self.status.config(
+            text=f"{self.progress.percent:.0f}% • {format_rate(self.progress.rate)} • "
+                 f"ETA {format_eta(self.progress.eta)}"
+        )
+    
+    def finish(self, result: FlashResult):
+        """Operation finished on this device"""
+        self.busy = False
+        if result.success:
+            self.bar["value"] = 100
+            self.status.config(text="✅ Done", fg="#00ff00")
+        elif result.cancelled:
+            self.status.config(text="✖ Cancelled", fg="#ffaa00")
+        else:
+            self.status.config(text=f"❌ {result.message}", fg="#ff4444")
+    
+    def destroy(self):
+        self.frame.destroy()
 
 
 class SecureOSFlashGUI:
@@ -25,14 +104,19 @@ class SecureOSFlashGUI:
         self.root.title("SecureOS Flash - Universal Android Flash Tool 🏴‍☠️")
         self.root.geometry("800x600")
         
-        # Protocol manager
-        self.manager = ProtocolManager()
-        self.manager.register_backend(SamsungBackend())
+        # Backend prototypes; each attached device gets its own manager
+        self.backends = [SamsungBackend(), FastbootBackend(), MediaTekBackend()]
+        self.rows = {}
+        self.cancel_token = None
+        self.running = False
         
-        self.device_info = None
+        # Worker threads never touch Tk: they post to this queue, which
+        # the UI thread drains once per frame
+        self.events = EventQueue()
         
         # Build UI
         self.create_ui()
+        self.root.after(FRAME_INTERVAL_MS, self.process_events)
         
         # Auto-detect on start
         self.detect_device()
@@ -99,7 +183,10 @@ class SecureOSFlashGUI:
         )
         self.device_details.pack(fill=tk.X)
         
-        detect_btn = tk.Button(
+        self.device_list = tk.Frame(self.device_frame, bg="#1a1a1a")
+        self.device_list.pack(fill=tk.X, pady=(5, 0))
+        
+        self.detect_btn = tk.Button(
             self.device_frame,
             text="🔄 Refresh Device",
             command=self.detect_device,
@@ -110,7 +197,7 @@ class SecureOSFlashGUI:
             padx=15,
             pady=5
         )
-        detect_btn.pack(pady=(10, 0))
+        self.detect_btn.pack(pady=(10, 0))
         
         # Actions area
         actions_frame = tk.LabelFrame(
@@ -214,9 +301,23 @@ class SecureOSFlashGUI:
         )
         self.progress_label.pack()
         
+        # Overall progress across the devices being worked on
         self.progress_bar = ttk.Progressbar(
             self.progress_frame,
-            mode='indeterminate'
+            mode='determinate',
+            maximum=100
+        )
+        
+        self.cancel_btn = tk.Button(
+            self.progress_frame,
+            text="✖ Cancel",
+            command=self.cancel_operation,
+            bg="#aa0000",
+            fg="#ffffff",
+            font=("Arial", 10),
+            relief=tk.FLAT,
+            padx=15,
+            pady=5
         )
         
         # Footer
@@ -231,44 +332,85 @@ class SecureOSFlashGUI:
             fg="#666666"
         ).pack(pady=10)
     
+    def process_events(self):
+        """Apply queued progress and worker results (runs once per frame)"""
+        try:
+            progress, calls = self.events.drain()
+            
+            for key, (done, total, when) in progress.items():
+                row = self.rows.get(key)
+                if row is not None and row.busy:
+                    row.update_progress(done, total, when)
+            if progress:
+                self.update_overall_progress()
+            
+            for callback, args in calls:
+                callback(*args)
+        finally:
+            self.root.after(FRAME_INTERVAL_MS, self.process_events)
+    
     def detect_device(self):
-        """Detect connected device"""
-        self.device_status.config(text="🔍 Detecting device...", fg="#ffaa00")
+        """Detect connected devices"""
+        if self.running:
+            return
+        
+        self.device_status.config(text="🔍 Detecting devices...", fg="#ffaa00")
         self.device_details.config(text="")
         self.flash_btn.config(state=tk.DISABLED)
         self.backup_btn.config(state=tk.DISABLED)
+        self.detect_btn.config(state=tk.DISABLED)
+        
+        previous = [row.manager for row in self.rows.values()]
+        for row in self.rows.values():
+            row.destroy()
+        self.rows = {}
         
         def detect():
-            device = self.manager.detect_device()
+            for manager in previous:
+                manager.end_session(reboot=False)
             
-            if device:
-                self.device_info = device
-                self.root.after(0, self.on_device_detected, device)
-            else:
-                self.device_info = None
-                self.root.after(0, self.on_device_not_found)
+            managers = discover_devices(self.backends)
+            # Session setup talks to the device - keep it off the Tk thread
+            ready = [manager.init_session() for manager in managers]
+            self.events.post(self.on_devices_detected, managers, ready)
         
         threading.Thread(target=detect, daemon=True).start()
     
-    def on_device_detected(self, device: DeviceInfo):
-        """Device was detected"""
-        self.device_status.config(
-            text=f"✅ Device detected: {device.manufacturer} {device.model}",
-            fg="#00ff00"
-        )
-        
-        details = f"ID: {device.device_id}\n"
-        details += f"USB: {device.usb_vendor_id}:{device.usb_product_id}\n"
-        details += f"Bootloader: {'Locked' if device.bootloader_locked else 'Unlocked'}"
+    def on_devices_detected(self, managers, ready):
+        """Device scan finished"""
+        self.detect_btn.config(state=tk.NORMAL)
+        if not managers:
+            self.on_device_not_found()
+            return
         
-        self.device_details.config(text=details)
+        for manager, ok in zip(managers, ready):
+            row = DeviceRow(self.device_list, manager, ok)
+            self.rows[row.key] = row
+            backend = manager.active_backend
+            if hasattr(backend, "progress"):
+                backend.progress = self.events.progress_callback(row.key)
+        
+        if len(managers) == 1:
+            device = managers[0].current_device
+            self.device_status.config(
+                text=f"✅ Device detected: {device.manufacturer} {device.model}",
+                fg="#00ff00"
+            )
+            
+            details = f"ID: {device.device_id}\n"
+            details += f"USB: {device.usb_vendor_id}:{device.usb_product_id}\n"
+            details += f"Bootloader: {'Locked' if device.bootloader_locked else 'Unlocked'}"
+            self.device_details.config(text=details)
+        else:
+            self.device_status.config(
+                text=f"✅ {len(managers)} devices detected - tick the ones to work on",
+                fg="#00ff00"
+            )
         
         # Enable buttons
-        self.flash_btn.config(state=tk.NORMAL)
-        self.backup_btn.config(state=tk.NORMAL)
-        
-        # Initialize session
-        self.manager.init_session()
+        if any(ready):
+            self.flash_btn.config(state=tk.NORMAL)
+            self.backup_btn.config(state=tk.NORMAL)
     
     def on_device_not_found(self):
         """No device detected"""
@@ -285,16 +427,22 @@ class SecureOSFlashGUI:
         
         self.device_details.config(text=details)
     
+    def selected_rows(self):
+        """Devices ticked for the next operation"""
+        return [row for row in self.rows.values() if row.ready and row.selected.get()]
+    
     def flash_bootloader(self):
-        """Flash bootloader to device"""
-        if not self.device_info:
-            messagebox.showerror("Error", "No device connected!")
+        """Flash bootloader to the selected devices"""
+        rows = self.selected_rows()
+        if not rows:
+            messagebox.showerror("Error", "No device selected!")
             return
         
         # Ask for confirmation
+        target = "this device" if len(rows) == 1 else f"these {len(rows)} devices"
         result = messagebox.askyesno(
             "Flash Bootloader",
-            "⚠️ WARNING ⚠️\n\n"
+            f"⚠️ WARNING ⚠️\n\nYou are about to flash {target}.\n\n"
             "Flashing a bootloader can:\n"
             "• Void your warranty\n"
             "• Brick your device if done incorrectly\n"
@@ -318,39 +466,72 @@ class SecureOSFlashGUI:
         if not filename:
             return
         
-        # Flash in background thread
-        self.show_progress("Creating safety backup...")
-        
-        def flash():
-            # This will auto-backup first
-            result = self.manager.flash_bootloader(filename, auto_backup=True)
-            self.root.after(0, self.on_flash_complete, result)
-        
-        threading.Thread(target=flash, daemon=True).start()
+        # Flash in background threads, one per device (auto-backup first)
+        self.run_on_devices(
+            rows, "Flashing",
+            lambda row, token: row.manager.flash_bootloader(filename, auto_backup=True, cancel=token),
+            self.on_flash_complete
+        )
     
     def backup_device(self):
-        """Backup device partitions"""
-        if not self.device_info:
-            messagebox.showerror("Error", "No device connected!")
+        """Backup all partitions of each selected device into an archive"""
+        rows = self.selected_rows()
+        if not rows:
+            messagebox.showerror("Error", "No device selected!")
             return
         
         # Select backup location
-        filename = filedialog.asksaveasfilename(
-            title="Save Backup As",
-            defaultextension=".img",
-            filetypes=[("Image files", "*.img"), ("All files", "*.*")]
+        if len(rows) == 1:
+            filename = filedialog.asksaveasfilename(
+                title="Save Backup As",
+                defaultextension=".sosbak",
+                filetypes=[("SecureOS backup archives", "*.sosbak"), ("All files", "*.*")]
+            )
+            if not filename:
+                return
+            archives = {rows[0].key: filename}
+        else:
+            folder = filedialog.askdirectory(title="Save Backups In")
+            if not folder:
+                return
+            # One archive per device, named after its port
+            archives = {row.key: os.path.join(folder, re.sub(r"[^\w.-]+", "_", row.key) + ".sosbak")
+                        for row in rows}
+        
+        self.run_on_devices(
+            rows, "Backing up",
+            lambda row, token: row.manager.backup_device(archives[row.key], cancel=token),
+            self.on_backup_complete
         )
+    
+    def run_on_devices(self, rows, operation, work, on_complete):
+        """
+        Run work(row, token) for each device on its own thread.
         
-        if not filename:
-            return
-        
-        self.show_progress("Backing up device...")
-        
-        def backup():
-            result = self.manager.backup_partition("BOOTLOADER", filename)
-            self.root.after(0, self.on_backup_complete, result)
-        
-        threading.Thread(target=backup, daemon=True).start()
+        Results come back through the event queue; on_complete gets
+        the list of results once every device has finished.
+        """
+        token = self.show_progress(f"{operation} {len(rows)} device(s)...")
+        results = []
+        
+        def finished(row, result):
+            row.finish(result)
+            results.append(result)
+            self.update_overall_progress()
+            if len(results) == len(rows):
+                self.hide_progress()
+                on_complete(results)
+        
+        def worker(row):
+            try:
+                result = work(row, token)
+            except Exception as e:
+                result = FlashResult(success=False, message="Internal error", error=str(e))
+            self.events.post(finished, row, result)
+        
+        for row in rows:
+            row.start(operation)
+            threading.Thread(target=worker, args=(row,), daemon=True).start()
     
     def show_setup_guide(self):
         """Show setup guide window"""
@@ -434,27 +615,66 @@ https://github.com/barrersoftware/secureos-flash
         ).pack(pady=(0, 20))
     
     def show_progress(self, message):
-        """Show progress indicator"""
+        """Show progress indicator and return a token for cancelling the operation"""
+        self.running = True
+        self.detect_btn.config(state=tk.DISABLED)
+        self.flash_btn.config(state=tk.DISABLED)
+        self.backup_btn.config(state=tk.DISABLED)
+        
         self.progress_label.config(text=message)
+        self.progress_bar["value"] = 0
         self.progress_bar.pack(fill=tk.X, pady=10)
-        self.progress_bar.start()
+        
+        self.cancel_token = CancellationToken()
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.cancel_btn.pack()
+        return self.cancel_token
     
     def hide_progress(self):
         """Hide progress indicator"""
-        self.progress_bar.stop()
         self.progress_bar.pack_forget()
+        self.cancel_btn.pack_forget()
         self.progress_label.config(text="")
+        self.cancel_token = None
+        
+        self.running = False
+        self.detect_btn.config(state=tk.NORMAL)
+        self.flash_btn.config(state=tk.NORMAL)
+        self.backup_btn.config(state=tk.NORMAL)
+    
+    def update_overall_progress(self):
+        """Overall bar: bytes done over bytes known across busy devices"""
+        busy = [row.progress for row in self.rows.values() if row.busy]
+        total = sum(progress.total for progress in busy)
+        if total:
+            self.progress_bar["value"] = 100.0 * sum(progress.done for progress in busy) / total
     
-    def on_flash_complete(self, result):
-        """Flash operation completed"""
-        self.hide_progress()
+    def cancel_operation(self):
+        """Cancel the running flash or backup"""
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+            self.cancel_btn.config(state=tk.DISABLED)
+            self.progress_label.config(text="Cancelling...")
+    
+    def on_flash_complete(self, results):
+        """Flash finished on every selected device"""
+        if len(results) > 1:
+            self.show_batch_results("Flash", results)
+            return
         
+        result = results[0]
         if result.success:
             messagebox.showinfo(
                 "Success!",
                 f"✅ {result.message}\n\n"
                 "Device will reboot automatically."
             )
+        elif result.cancelled:
+            messagebox.showwarning(
+                "Flash Cancelled",
+                "Flash was cancelled.\n\n"
+                "Reconnect the device before trying again."
+            )
         else:
             messagebox.showerror(
                 "Flash Failed",
@@ -462,18 +682,34 @@ https://github.com/barrersoftware/secureos-flash
                 f"Error: {result.error or 'Unknown error'}"
             )
     
-    def on_backup_complete(self, result):
-        """Backup operation completed"""
-        self.hide_progress()
+    def on_backup_complete(self, results):
+        """Backup finished on every selected device"""
+        if len(results) > 1:
+            self.show_batch_results("Backup", results)
+            return
         
+        result = results[0]
         if result.success:
             messagebox.showinfo("Success!", f"✅ {result.message}")
+        elif result.cancelled:
+            messagebox.showwarning("Backup Cancelled", "Backup was cancelled. No archive was kept.")
         else:
             messagebox.showerror(
                 "Backup Failed",
                 f"❌ {result.message}\n\n"
                 f"Error: {result.error or 'Unknown error'}"
             )
+    
+    def show_batch_results(self, operation, results):
+        """Summary of an operation run on several devices"""
+        succeeded = sum(1 for result in results if result.success)
+        summary = f"{operation} succeeded on {succeeded} of {len(results)} devices."
+        if succeeded == len(results):
+            messagebox.showinfo("Success!", f"✅ {summary}")
+        elif any(result.cancelled for result in results):
+            messagebox.showwarning(f"{operation} Cancelled", f"{summary}\n\nSee each device for details.")
+        else:
+            messagebox.showerror(f"{operation} Failed", f"❌ {summary}\n\nSee each device for details.")
 
 
 def main():
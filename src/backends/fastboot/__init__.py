@@ -0,0 +1,13 @@
+"""Fastboot backend package"""
+from .fastboot_backend import FastbootBackend
+from .transport import (
+    FastbootTransport, UsbFastbootTransport, TcpFastbootTransport, FastbootTransportError
+)
+from .protocol import FastbootProtocol, FastbootError
+from .fake import FakeFastbootDevice, LocalTransport
+
+__all__ = [
+    'FastbootBackend', 'FastbootTransport', 'UsbFastbootTransport', 'TcpFastbootTransport',
+    'FastbootTransportError', 'FastbootProtocol', 'FastbootError',
+    'FakeFastbootDevice', 'LocalTransport'
+]
@@ -0,0 +1,216 @@
+"""
+SecureOS Flash - Fake Fastboot Device
+
+In-memory bootloader that speaks the device side of the fastboot
+protocol, including sparse image flashing. LocalTransport connects the
+fastboot backend to it, so the whole backend can be exercised without
+hardware.
+"""
+
+from collections import deque
+from typing import Deque, Dict, Optional
+import io
+
+from . import sparse
+from .transport import FastbootTransport, FastbootTransportError
+
+
+class FakeFastbootDevice:
+    """
+    Scriptable fastboot device with in-memory partitions.
+    
+    Records every command in `commands` so tests can count round trips.
+    """
+    
+    def __init__(self, partitions: Dict[str, int], max_download_size: int = 256 * 1024 * 1024,
+                 product: str = "fake", serial: str = "FAKE0001"):
+        """
+        Initialize fake device.
+        
+        Args:
+            partitions: Partition sizes in bytes by name
+            max_download_size: Largest download the device accepts
+            product: Reported product name
+            serial: Reported serial number
+        """
+        self.partitions: Dict[str, bytearray] = {
+            name: bytearray(size) for name, size in partitions.items()
+        }
+        self.max_download_size = max_download_size
+        self.product = product
+        self.serial = serial
+        self.commands = []
+        self.downloads = 0
+        self.rebooted = False
+        
+        self._responses: Deque[bytes] = deque()
+        self._download = bytearray()
+        self._expect = 0
+        self._staged = bytearray()
+    
+    def receive(self, data: bytes):
+        """Handle one message from the host."""
+        if self._expect:
+            self._download += data
+            self._expect -= len(data)
+            if self._expect < 0:
+                self._expect = 0
+                self._fail("download overrun")
+            elif self._expect == 0:
+                self._staged = self._download
+                self._download = bytearray()
+                self._okay()
+            return
+        
+        command = bytes(data).decode("ascii")
+        self.commands.append(command)
+        name, _, argument = command.partition(":")
+        handler = getattr(self, f"_cmd_{name.replace('-', '_')}", None)
+        if handler is None:
+            self._fail(f"unknown command {name}")
+        else:
+            handler(argument)
+    
+    def send(self) -> bytes:
+        """Produce the next response for the host."""
+        if not self._responses:
+            raise FastbootTransportError("Timeout waiting for device response")
+        return self._responses.popleft()
+    
+    def _okay(self, payload: str = ""):
+        self._responses.append(b"OKAY" + payload.encode())
+    
+    def _fail(self, reason: str):
+        self._responses.append(b"FAIL" + reason.encode())
+    
+    def _info(self, text: str):
+        self._responses.append(b"INFO" + text.encode())
+    
+    def _variables(self) -> Dict[str, str]:
+        variables = {
+            "max-download-size": f"{self.max_download_size:#x}",
+            "product": self.product,
+            "serialno": self.serial,
+        }
+        for name, contents in self.partitions.items():
+            variables[f"partition-size:{name}"] = f"{len(contents):#x}"
+        return variables
+    
+    def _cmd_getvar(self, name: str):
+        variables = self._variables()
+        if name == "all":
+            for key, value in variables.items():
+                self._info(f"{key}: {value}")
+            self._okay()
+        elif name in variables:
+            self._okay(variables[name])
+        else:
+            self._fail(f"unknown variable {name}")
+    
+    def _cmd_download(self, size: str):
+        size = int(size, 16)
+        if size > self.max_download_size:
+            self._fail("data too large")
+            return
+        self.downloads += 1
+        self._expect = size
+        self._download = bytearray()
+        self._responses.append(b"DATA" + f"{size:08x}".encode())
+    
+    def _cmd_flash(self, name: str):
+        target = self.partitions.get(name)
+        if target is None:
+            self._fail(f"unknown partition {name}")
+            return
+        
+        try:
+            self._apply(target, bytes(self._staged))
+        except (sparse.SparseError, ValueError) as e:
+            self._fail(str(e))
+            return
+        self._okay()
+    
+    def _apply(self, target: bytearray, image: bytes):
+        layout = sparse.parse_sparse(io.BytesIO(image))
+        if layout is None:
+            if len(image) > len(target):
+                raise ValueError("image too large for partition")
+            target[:len(image)] = image
+            return
+        
+        runs, total_blocks, block_size = layout
+        if total_blocks * block_size > len(target):
+            raise ValueError("sparse image too large for partition")
+        for run in runs:
+            start = run.start_block * block_size
+            length = run.blocks * block_size
+            if run.kind == sparse.CHUNK_RAW:
+                target[start:start + length] = image[run.source_offset:run.source_offset + length]
+            else:
+                target[start:start + length] = run.fill * (length // 4)
+    
+    def _cmd_erase(self, name: str):
+        target = self.partitions.get(name)
+        if target is None:
+            self._fail(f"unknown partition {name}")
+            return
+        target[:] = bytes(len(target))
+        self._okay()
+    
+    def _cmd_fetch(self, name: str):
+        target = self.partitions.get(name)
+        if target is None:
+            self._fail(f"unknown partition {name}")
+            return
+        self._responses.append(b"DATA" + f"{len(target):08x}".encode())
+        for offset in range(0, len(target), sparse.READ_SIZE):
+            self._responses.append(bytes(target[offset:offset + sparse.READ_SIZE]))
+        self._okay()
+    
+    def _cmd_reboot(self, _argument: str):
+        self.rebooted = True
+        self._okay()
+
+
+class LocalTransport(FastbootTransport):
+    """Transport connected directly to a FakeFastbootDevice"""
+    
+    def __init__(self, device: FakeFastbootDevice, path: str = "local-0"):
+        """
+        Initialize local transport.
+        
+        Args:
+            device: Fake device to talk to
+            path: Reported device path
+        """
+        self.device = device
+        self.path = path
+        self.is_open = False
+    
+    def open(self) -> bool:
+        self.is_open = True
+        return True
+    
+    def close(self):
+        self.is_open = False
+    
+    def write(self, data, timeout: float):
+        if not self.is_open:
+            raise FastbootTransportError("Transport not open")
+        self.device.receive(bytes(data))
+    
+    def read(self, max_size: int, timeout: float) -> bytes:
+        if not self.is_open:
+            raise FastbootTransportError("Transport not open")
+        data = self.device.send()
+        if len(data) > max_size:
+            raise FastbootTransportError(f"Message of {len(data)} bytes exceeds {max_size}")
+        return data
+    
+    @property
+    def device_path(self) -> str:
+        return self.path
+    
+    @property
+    def serial_number(self) -> Optional[str]:
+        return self.device.serial
@@ -0,0 +1,528 @@
+"""
+SecureOS Flash - Fastboot Backend
+
+Implements flash operations for devices with a fastboot bootloader
+(Pixel and most other non-Samsung Android devices). Images larger than
+the device's max-download-size are re-sparsed into the fewest parts
+that fit and streamed from disk.
+"""
+
+import logging
+import os
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional
+
+from ...core.flash_backend import (
+    FlashBackend, DeviceInfo, FlashResult, PartitionInfo, UNKNOWN_MODEL
+)
+from ...core.cancellation import CancellationToken, OperationCancelled, cancellable_progress
+from . import sparse
+from .protocol import FastbootProtocol, FastbootError, ProgressCallback
+from .transport import FastbootTransport, FastbootTransportError, UsbFastbootTransport
+
+
+logger = logging.getLogger(__name__)
+
+
+class FastbootBackend(FlashBackend):
+    """
+    Fastboot flash backend over a pluggable transport (USB, TCP or fake).
+    
+    max-download-size is read once per session and decides whether an
+    image goes down as-is or as a series of sparse parts.
+    """
+    
+    # Used when the bootloader does not report max-download-size
+    DEFAULT_MAX_DOWNLOAD_SIZE = 256 * 1024 * 1024
+    
+    # Product names of Pixel devices (used to report the manufacturer)
+    PIXEL_PRODUCTS = ("sailfish", "marlin", "walleye", "taimen", "blueline", "crosshatch",
+                      "sargo", "bonito", "flame", "coral", "sunfish", "bramble", "redfin",
+                      "barbet", "oriole", "raven", "bluejay", "panther", "cheetah", "lynx",
+                      "tangorpro", "felix", "shiba", "husky", "akita")
+    
+    def __init__(self, transport_factory: Optional[Callable[[], FastbootTransport]] = None,
+                 block_size: int = sparse.DEFAULT_BLOCK_SIZE,
+                 max_download_size: Optional[int] = None,
+                 progress: Optional[ProgressCallback] = None):
+        """
+        Initialize fastboot backend.
+        
+        Args:
+            transport_factory: Creates the transport to use (None = USB)
+            block_size: Block size for sparse images built from raw images
+            max_download_size: Cap on the device-reported download size
+            progress: Called with (bytes done, total bytes) during transfers
+        """
+        self.transport_factory = transport_factory or UsbFastbootTransport
+        self.block_size = block_size
+        self.max_download_size_limit = max_download_size
+        self.progress = progress
+        
+        self.transport: Optional[FastbootTransport] = None
+        self.protocol: Optional[FastbootProtocol] = None
+        self.session_active = False
+        self.max_download_size = self.DEFAULT_MAX_DOWNLOAD_SIZE
+        self._variables: Optional[Dict[str, str]] = None
+        self._buffer = bytearray(sparse.READ_SIZE)
+    
+    def detect_device(self) -> Optional[DeviceInfo]:
+        """
+        Detect a device in fastboot mode.
+        
+        Returns:
+            DeviceInfo if a device answered, None otherwise
+        """
+        if self.transport is None:
+            transport = self.transport_factory()
+            try:
+                if not transport.open():
+                    return None
+            except Exception as e:
+                logger.error(f"Error opening fastboot transport: {e}")
+                return None
+            self.transport = transport
+            self.protocol = FastbootProtocol(transport)
+        
+        try:
+            product = self._getvar("product", UNKNOWN_MODEL)
+            unlocked = self._getvar("unlocked", "no")
+            serial = self._getvar("serialno", "") or self.transport.serial_number or None
+        except FastbootTransportError as e:
+            logger.error(f"Fastboot device not responding: {e}")
+            return None
+        
+        logger.info(f"Fastboot device detected on {self.transport.device_path}")
+        
+        return DeviceInfo(
+            manufacturer="Google" if product.lower() in self.PIXEL_PRODUCTS else "Android",
+            model=product,
+            device_id=f"fastboot-{serial or self.transport.device_path}",
+            usb_vendor_id="unknown",
+            usb_product_id="unknown",
+            bootloader_locked=unlocked != "yes",
+            oem_unlock_enabled=unlocked == "yes",
+            usb_debugging_enabled=False,
+            usb_path=self.transport.device_path,
+            serial=serial
+        )
+    
+    def _getvar(self, name: str, default: str) -> str:
+        """
+        Read a bootloader variable, falling back if the bootloader lacks it.
+        
+        Transport errors are not caught: the device is not answering.
+        """
+        try:
+            return self.protocol.getvar(name).strip() or default
+        except FastbootError as e:
+            logger.debug(f"getvar {name} failed: {e}")
+            return default
+    
+    def discover(self) -> List[FlashBackend]:
+        """
+        One backend per attached fastboot device.
+        
+        Only the default USB transport can be enumerated; a backend with a
+        custom transport factory (TCP, fake) stands for its one device.
+        
+        Returns:
+            List of backends
+        """
+        if self.transport_factory is not UsbFastbootTransport:
+            return [self]
+        
+        return [
+            FastbootBackend(
+                lambda port=port: UsbFastbootTransport(port=port),
+                block_size=self.block_size,
+                max_download_size=self.max_download_size_limit,
+                progress=self.progress
+            )
+            for port in UsbFastbootTransport.enumerate()
+        ]
+    
+    def init_session(self) -> bool:
+        """
+        Start a session: read max-download-size and the partition sizes.
+        
+        Returns:
+            True if session started
+        """
+        if self.protocol is None:
+            logger.error("No fastboot device connected")
+            return False
+        
+        try:
+            self._variables = self.protocol.getvar_all()
+        except (FastbootError, FastbootTransportError) as e:
+            logger.error(f"Fastboot session failed: {e}")
+            return False
+        
+        reported = self._variables.get("max-download-size")
+        try:
+            size = int(reported, 0) if reported else self.DEFAULT_MAX_DOWNLOAD_SIZE
+        except ValueError:
+            size = self.DEFAULT_MAX_DOWNLOAD_SIZE
+        if self.max_download_size_limit:
+            size = min(size, self.max_download_size_limit)
+        self.max_download_size = size
+        
+        logger.info(f"Fastboot max-download-size: {size} bytes")
+        self.session_active = True
+        return True
+    
+    def _no_session(self) -> FlashResult:
+        return FlashResult(
+            success=False,
+            message="No active session",
+            error="Call init_session() first"
+        )
+    
+    def _abandon_session(self):
+        """
+        Drop the session after a transfer was cut short.
+        
+        A download cut short leaves the bootloader waiting for data, so
+        the transport is released instead of sending further commands.
+        """
+        if self.transport is not None:
+            self.transport.close()
+        self.transport = None
+        self.protocol = None
+        self.session_active = False
+        self._variables = None
+    
+    def _cancelled(self, e: OperationCancelled) -> FlashResult:
+        """Abandon the session after a cancelled transfer."""
+        self._abandon_session()
+        return FlashResult(
+            success=False,
+            message="Cancelled",
+            error=str(e) or "Cancelled by user",
+            cancelled=True
+        )
+    
+    def _transfer_failed(self, message: str, e: Exception) -> FlashResult:
+        """Abandon the session after a transfer broke off part-way."""
+        self._abandon_session()
+        return FlashResult(
+            success=False,
+            message=message,
+            error=str(e)
+        )
+    
+    def _remove_partial(self, output_file: str):
+        try:
+            os.unlink(output_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove partial backup {output_file}: {e}")
+    
+    def _resolve_name(self, partition_name: str) -> str:
+        """Map a partition name onto the device's spelling (fastboot names are case-sensitive)."""
+        for info in self.get_partition_table():
+            if info.name.lower() == partition_name.lower():
+                return info.name
+        return partition_name.lower()
+    
+    def _read_chunks(self, source, size: int) -> Iterator[memoryview]:
+        view = memoryview(self._buffer)
+        remaining = size
+        while remaining:
+            n = source.readinto(view[:min(len(view), remaining)])
+            if not n:
+                raise OSError("Image file shrank while flashing")
+            remaining -= n
+            yield view[:n]
+    
+    def backup_partition(self, partition_name: str, output_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Read a partition with fetch (needs an unlocked bootloader or fastbootd).
+        
+        Args:
+            partition_name: Partition to backup
+            output_file: Where to save backup
+            cancel: Token to abort the backup
+            
+        Returns:
+            FlashResult
+        """
+        if not self.session_active:
+            return self._no_session()
+        
+        name = self._resolve_name(partition_name)
+        logger.info(f"Backing up {name} to {output_file}")
+        
+        try:
+            with open(output_file, "wb") as f:
+                self.protocol.upload(f"fetch:{name}", f,
+                                     cancellable_progress(cancel, self.progress))
+            
+            return FlashResult(
+                success=True,
+                message=f"Backup of {partition_name} complete"
+            )
+            
+        except OperationCancelled as e:
+            self._remove_partial(output_file)
+            return self._cancelled(e)
+        except FastbootError as e:
+            # The bootloader refused: the session is still in step
+            self._remove_partial(output_file)
+            return FlashResult(
+                success=False,
+                message="Backup failed",
+                error=str(e)
+            )
+        except (OSError, FastbootTransportError) as e:
+            self._remove_partial(output_file)
+            return self._transfer_failed("Backup failed", e)
+    
+    def flash_partition(self, partition_name: str, image_file: str,
+                        cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Flash an image, splitting it into sparse parts if it exceeds
+        max-download-size.
+        
+        Args:
+            partition_name: Partition to flash
+            image_file: Raw or sparse image file
+            cancel: Token to abort the flash (checked after every write)
+            
+        Returns:
+            FlashResult
+        """
+        if not self.session_active:
+            return self._no_session()
+        
+        if not os.path.exists(image_file):
+            return FlashResult(
+                success=False,
+                message="Image file not found",
+                error=f"File does not exist: {image_file}"
+            )
+        
+        name = self._resolve_name(partition_name)
+        size = os.path.getsize(image_file)
+        
+        try:
+            with open(image_file, "rb", buffering=0) as f:
+                if size <= self.max_download_size:
+                    logger.info(f"Flashing {name} with {image_file} ({size} bytes)")
+                    self.protocol.download(size, self._read_chunks(f, size),
+                                           cancellable_progress(cancel, self.progress))
+                    self.protocol.command(f"flash:{name}", self.protocol.command_timeout)
+                    rounds = 1
+                else:
+                    rounds = self._flash_sparse(name, f, size, cancel)
+            
+            return FlashResult(
+                success=True,
+                message=f"Flash of {partition_name} complete ({rounds} download(s))"
+            )
+            
+        except OperationCancelled as e:
+            return self._cancelled(e)
+        except FastbootError as e:
+            # The bootloader refused: the session is still in step
+            return FlashResult(
+                success=False,
+                message="Flash failed",
+                error=str(e)
+            )
+        except (OSError, FastbootTransportError, sparse.SparseError) as e:
+            # Possibly mid-download, with the bootloader still waiting for data
+            return self._transfer_failed("Flash failed", e)
+    
+    def supports_streaming(self) -> bool:
+        return True
+    
+    def flash_stream(self, partition_name: str, source: BinaryIO, size: int,
+                     cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Flash a raw image read in order from a stream.
+        
+        Images larger than max-download-size go down as sparse parts of
+        consecutive RAW blocks (no FILL detection, which needs a second
+        pass over the data).
+        
+        Args:
+            partition_name: Partition to flash
+            source: Raw image stream
+            size: Image size in bytes
+            cancel: Token to abort the flash
+            
+        Returns:
+            FlashResult
+        """
+        if not self.session_active:
+            return self._no_session()
+        
+        name = self._resolve_name(partition_name)
+        
+        try:
+            if size <= self.max_download_size:
+                logger.info(f"Flashing {name} from stream ({size} bytes)")
+                self.protocol.download(size, self._read_chunks(source, size),
+                                       cancellable_progress(cancel, self.progress))
+                self.protocol.command(f"flash:{name}", self.protocol.command_timeout)
+                rounds = 1
+            else:
+                block_size = self.block_size
+                total_blocks = (size + block_size - 1) // block_size
+                runs = [sparse.Run(sparse.CHUNK_RAW, 0, total_blocks)]
+                rounds = self._flash_parts(name, sparse.SequentialSource(source), size,
+                                           runs, total_blocks, block_size, cancel)
+            
+            return FlashResult(
+                success=True,
+                message=f"Flash of {partition_name} complete ({rounds} download(s))"
+            )
+            
+        except OperationCancelled as e:
+            return self._cancelled(e)
+        except FastbootError as e:
+            # The bootloader refused: the session is still in step
+            return FlashResult(
+                success=False,
+                message="Flash failed",
+                error=str(e)
+            )
+        except (FastbootTransportError, sparse.SparseError) as e:
+            return self._transfer_failed("Flash failed", e)
+        except Exception:
+            # The source failed mid-download (e.g. a digest mismatch)
+            self._abandon_session()
+            raise
+    
+    def _flash_sparse(self, name: str, source, size: int,
+                      cancel: Optional[CancellationToken] = None) -> int:
+        """
+        Re-sparse an oversized image and flash it part by part.
+        
+        Returns:
+            Number of download/flash round trips
+        """
+        layout = sparse.parse_sparse(source)
+        if layout is not None:
+            runs, total_blocks, block_size = layout
+        else:
+            block_size = self.block_size
+            total_blocks = (size + block_size - 1) // block_size
+            runs = sparse.scan_raw(source, size, block_size)
+        
+        return self._flash_parts(name, source, size, runs, total_blocks, block_size, cancel)
+    
+    def _flash_parts(self, name: str, source, size: int, runs: List[sparse.Run],
+                     total_blocks: int, block_size: int,
+                     cancel: Optional[CancellationToken] = None) -> int:
+        """Split runs into parts that fit max-download-size and flash them in order."""
+        parts = sparse.split_runs(runs, total_blocks, block_size, self.max_download_size)
+        total = sum(part.size for part in parts)
+        logger.info(f"Flashing {name} as {len(parts)} sparse part(s), {total} bytes")
+        
+        done = 0
+        for index, part in enumerate(parts, 1):
+            logger.debug("%s: sparse part %d/%d (%d bytes)", name, index, len(parts), part.size)
+            
+            def part_progress(sent: int, _part_total: int):
+                if self.progress:
+                    self.progress(done + sent, total)
+            
+            self.protocol.download(part.size, part.stream(source, size, self._buffer),
+                                   cancellable_progress(cancel, part_progress))
+            self.protocol.command(f"flash:{name}", self.protocol.command_timeout)
+            done += part.size
+        
+        return len(parts)
+    
+    def flash_bootloader(self, bootloader_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Flash the bootloader partition.
+        
+        Args:
+            bootloader_file: Bootloader image
+            cancel: Token to abort the flash
+            
+        Returns:
+            FlashResult
+        """
+        return self.flash_partition("bootloader", bootloader_file, cancel)
+    
+    def get_partition_list(self) -> List[str]:
+        """
+        Get list of partitions the bootloader reports.
+        
+        Returns:
+            List of partition names
+        """
+        return [p.name for p in self.get_partition_table()]
+    
+    def get_partition_table(self) -> List[PartitionInfo]:
+        """
+        Get partitions and sizes from the partition-size variables.
+        
+        Returns:
+            List of PartitionInfo
+        """
+        if not self._variables:
+            return []
+        
+        prefix = "partition-size:"
+        table = []
+        for key, value in self._variables.items():
+            if not key.startswith(prefix):
+                continue
+            try:
+                size = int(value, 0)
+            except ValueError:
+                size = None
+            table.append(PartitionInfo(name=key[len(prefix):], size=size))
+        return table
+    
+    def end_session(self, reboot: bool = True) -> bool:
+        """
+        End the session and optionally reboot.
+        
+        Args:
+            reboot: Whether to reboot device
+            
+        Returns:
+            True if successful
+        """
+        success = True
+        
+        if reboot and self.protocol is not None:
+            try:
+                self.protocol.command("reboot")
+            except (FastbootError, FastbootTransportError) as e:
+                logger.warning(f"Fastboot reboot failed: {e}")
+                success = False
+        
+        if self.transport is not None:
+            self.transport.close()
+        
+        self.transport = None
+        self.protocol = None
+        self.session_active = False
+        self._variables = None
+        return success
+    
+    def get_backend_name(self) -> str:
+        """Get backend name."""
+        return "Fastboot"
+    
+    def supports_device(self, device_info: DeviceInfo) -> bool:
+        """
+        Check if this backend supports the device.
+        
+        Args:
+            device_info: Device information
+            
+        Returns:
+            True if the device was detected in fastboot mode
+        """
+        return device_info.device_id.startswith("fastboot-")
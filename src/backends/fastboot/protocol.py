@@ -0,0 +1,168 @@
+"""
+SecureOS Flash - Fastboot Protocol
+
+Host side of the fastboot command protocol: ASCII commands answered by
+OKAY / FAIL / DATA / INFO / TEXT responses, with download data streamed
+straight from an iterator of buffers.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from .transport import FastbootTransport, MAX_WRITE_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+
+# Commands and responses are limited to 64 (legacy) / 256 bytes
+MAX_COMMAND_SIZE = 64
+MAX_RESPONSE_SIZE = 256
+
+ProgressCallback = Callable[[int, int], None]
+
+
+class FastbootError(Exception):
+    """Raised when the device answers FAIL or something unexpected"""
+
+
+class FastbootProtocol:
+    """Command-level fastboot session over a transport"""
+    
+    def __init__(self, transport: FastbootTransport, timeout: float = 10.0,
+                 command_timeout: float = 300.0):
+        """
+        Initialize protocol.
+        
+        Args:
+            transport: Opened transport
+            timeout: Timeout for short commands in seconds
+            command_timeout: Timeout for long commands (flash, erase) in seconds
+        """
+        self.transport = transport
+        self.timeout = timeout
+        self.command_timeout = command_timeout
+        self.info: List[str] = []
+    
+    def _send(self, command: str):
+        encoded = command.encode("ascii")
+        if len(encoded) > MAX_COMMAND_SIZE:
+            raise FastbootError(f"Command too long: {command}")
+        self.transport.write(encoded, self.timeout)
+    
+    def _response(self, timeout: float) -> Tuple[str, str]:
+        """
+        Read responses until a final one, collecting INFO/TEXT lines.
+        
+        Returns:
+            (status, payload) where status is OKAY or DATA
+        """
+        while True:
+            raw = self.transport.read(MAX_RESPONSE_SIZE, timeout)
+            status, payload = raw[:4].decode("ascii", "replace"), raw[4:].decode("utf-8", "replace")
+            
+            if status in ("INFO", "TEXT"):
+                self.info.append(payload)
+                logger.debug("fastboot: %s", payload)  # per device message; format lazily
+                continue
+            if status == "FAIL":
+                raise FastbootError(payload or "command failed")
+            if status in ("OKAY", "DATA"):
+                return status, payload
+            raise FastbootError(f"Unexpected response: {raw!r}")
+    
+    def command(self, command: str, timeout: Optional[float] = None) -> str:
+        """
+        Run a command that ends in OKAY.
+        
+        Args:
+            command: Fastboot command (e.g. "flash:boot")
+            timeout: Response timeout (None = short command timeout)
+            
+        Returns:
+            OKAY payload
+        """
+        self.info = []
+        self._send(command)
+        status, payload = self._response(timeout or self.timeout)
+        if status != "OKAY":
+            raise FastbootError(f"{command}: unexpected {status}")
+        return payload
+    
+    def getvar(self, name: str) -> str:
+        """Read a bootloader variable."""
+        return self.command(f"getvar:{name}")
+    
+    def getvar_all(self) -> Dict[str, str]:
+        """
+        Read all bootloader variables (reported as INFO lines).
+        
+        Returns:
+            Mapping of variable name to value
+        """
+        self.command("getvar:all")
+        variables = {}
+        for line in self.info:
+            name, sep, value = line.rpartition(":")
+            if sep:
+                variables[name.strip()] = value.strip()
+        return variables
+    
+    def download(self, size: int, chunks: Iterable, progress: Optional[ProgressCallback] = None):
+        """
+        Download data to the device's staging buffer.
+        
+        Args:
+            size: Total number of bytes (must equal the sum of the chunks)
+            chunks: Buffers to send, in order (e.g. SparsePart.stream())
+            progress: Called with (bytes sent, total bytes)
+        """
+        self.info = []
+        self._send(f"download:{size:08x}")
+        status, payload = self._response(self.timeout)
+        if status != "DATA" or int(payload, 16) != size:
+            raise FastbootError(f"Device refused download of {size} bytes")
+        
+        sent = 0
+        for chunk in chunks:
+            view = memoryview(chunk)
+            for offset in range(0, len(view), MAX_WRITE_SIZE):
+                piece = view[offset:offset + MAX_WRITE_SIZE]
+                self.transport.write(piece, self.command_timeout)
+                sent += len(piece)
+            if progress:
+                progress(sent, size)
+        
+        if sent != size:
+            raise FastbootError(f"Sent {sent} bytes, announced {size}")
+        self._response(self.command_timeout)
+    
+    def upload(self, command: str, destination, progress: Optional[ProgressCallback] = None) -> int:
+        """
+        Run a command that sends data to the host (e.g. "fetch:vendor_boot").
+        
+        Args:
+            command: Upload command
+            destination: Binary file to write to
+            progress: Called with (bytes received, total bytes)
+            
+        Returns:
+            Number of bytes received
+        """
+        self.info = []
+        self._send(command)
+        status, payload = self._response(self.command_timeout)
+        if status != "DATA":
+            raise FastbootError(f"{command}: device sent no data")
+        
+        size = int(payload, 16)
+        received = 0
+        while received < size:
+            data = self.transport.read(min(MAX_WRITE_SIZE, size - received), self.command_timeout)
+            destination.write(data)
+            received += len(data)
+            if progress:
+                progress(received, size)
+        
+        self._response(self.command_timeout)
+        return received
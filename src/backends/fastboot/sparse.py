@@ -0,0 +1,325 @@
+"""
+SecureOS Flash - Android Sparse Images
+
+Plans and streams Android sparse images for fastboot. A large image is
+split into the fewest sparse images that each fit the device's
+max-download-size: constant-filled runs become 4-byte FILL chunks, data
+runs become RAW chunks split at block boundaries, and every part covers
+the rest of the partition with DONT_CARE chunks.
+
+Parts are never materialised; their bytes are streamed from the source
+file on demand.
+"""
+
+from typing import BinaryIO, Iterator, List, Optional
+from dataclasses import dataclass
+import struct
+
+
+SPARSE_MAGIC = 0xED26FF3A
+SPARSE_HEADER_FORMAT = "<IHHHHIIII"
+SPARSE_HEADER_SIZE = struct.calcsize(SPARSE_HEADER_FORMAT)  # 28
+CHUNK_HEADER_FORMAT = "<HHII"
+CHUNK_HEADER_SIZE = struct.calcsize(CHUNK_HEADER_FORMAT)  # 12
+
+CHUNK_RAW = 0xCAC1
+CHUNK_FILL = 0xCAC2
+CHUNK_DONT_CARE = 0xCAC3
+CHUNK_CRC32 = 0xCAC4
+
+DEFAULT_BLOCK_SIZE = 4096
+
+# Bytes read per step while scanning or streaming
+READ_SIZE = 1024 * 1024
+
+
+class SparseError(ValueError):
+    """Raised for malformed sparse images or impossible splits"""
+
+
+@dataclass
+class Run:
+    """
+    A run of blocks in the output image.
+    
+    RAW runs read their data from `source_offset` in the source file;
+    FILL runs repeat `fill` (4 bytes); DONT_CARE runs carry no data.
+    """
+    kind: int
+    start_block: int
+    blocks: int
+    source_offset: int = 0
+    fill: bytes = b""
+    
+    def payload_size(self, block_size: int) -> int:
+        if self.kind == CHUNK_RAW:
+            return self.blocks * block_size
+        if self.kind == CHUNK_FILL:
+            return 4
+        return 0
+
+
+@dataclass
+class SparsePart:
+    """One download: a sparse image covering a subset of the runs"""
+    runs: List[Run]
+    total_blocks: int
+    block_size: int
+    
+    @property
+    def chunk_count(self) -> int:
+        return len(self._chunks())
+    
+    @property
+    def size(self) -> int:
+        """Exact size of the sparse image in bytes"""
+        return SPARSE_HEADER_SIZE + sum(
+            CHUNK_HEADER_SIZE + run.payload_size(self.block_size) for run in self._chunks()
+        )
+    
+    def _chunks(self) -> List[Run]:
+        """Runs padded with DONT_CARE so the part covers every block."""
+        chunks = []
+        position = 0
+        for run in self.runs:
+            if run.start_block > position:
+                chunks.append(Run(CHUNK_DONT_CARE, position, run.start_block - position))
+            chunks.append(run)
+            position = run.start_block + run.blocks
+        if position < self.total_blocks:
+            chunks.append(Run(CHUNK_DONT_CARE, position, self.total_blocks - position))
+        return chunks
+    
+    def stream(self, source: BinaryIO, source_size: int,
+               buffer: Optional[bytearray] = None) -> Iterator[memoryview]:
+        """
+        Generate the sparse image bytes.
+        
+        RAW data is read from `source` into a reused buffer; the yielded
+        views are only valid until the next item is requested.
+        
+        Args:
+            source: Source image (raw or sparse) opened in binary mode
+            source_size: Size of the source data region (bytes past it read as zero)
+            buffer: Reusable read buffer (None = allocate READ_SIZE bytes)
+            
+        Yields:
+            memoryview slices of the sparse image
+        """
+        chunks = self._chunks()
+        buffer = buffer if buffer is not None else bytearray(READ_SIZE)
+        view = memoryview(buffer)
+        block_size = self.block_size
+        
+        yield memoryview(struct.pack(
+            SPARSE_HEADER_FORMAT, SPARSE_MAGIC, 1, 0, SPARSE_HEADER_SIZE,
+            CHUNK_HEADER_SIZE, block_size, self.total_blocks, len(chunks), 0
+        ))
+        
+        for run in chunks:
+            payload = run.payload_size(block_size)
+            yield memoryview(struct.pack(
+                CHUNK_HEADER_FORMAT, run.kind, 0, run.blocks, CHUNK_HEADER_SIZE + payload
+            ))
+            
+            if run.kind == CHUNK_FILL:
+                yield memoryview(run.fill)
+            elif run.kind == CHUNK_RAW:
+                source.seek(run.source_offset)
+                remaining = payload
+                available = max(0, source_size - run.source_offset)
+                while remaining:
+                    want = min(len(buffer), remaining)
+                    n = source.readinto(view[:want]) if available > 0 else 0
+                    n = min(n or 0, available)
+                    if n < want:
+                        # Final partial block of a raw image: pad with zeros
+                        view[n:want] = bytes(want - n)
+                    available -= n
+                    remaining -= want
+                    yield view[:want]
+
+
+class SequentialSource:
+    """
+    Lets parts stream RAW runs from a non-seekable source.
+    
+    SparsePart.stream() seeks to each RAW run; when the runs cover the
+    source in order (as for a single run split by split_runs()), every
+    seek is to the current position and can be skipped.
+    """
+    
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._position = 0
+    
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence != 0 or offset != self._position:
+            raise SparseError("Stream sources can only be read in order")
+        return offset
+    
+    def readinto(self, buffer) -> int:
+        n = self._stream.readinto(buffer) or 0
+        self._position += n
+        return n
+
+
+def scan_raw(source: BinaryIO, size: int, block_size: int = DEFAULT_BLOCK_SIZE,
+             detect_fill: bool = True) -> List[Run]:
+    """
+    Split a raw image into RAW and FILL runs.
+    
+    Args:
+        source: Raw image opened in binary mode
+        size: Image size in bytes
+        block_size: Sparse block size
+        detect_fill: Turn blocks of a repeated 4-byte pattern into FILL runs
+        
+    Returns:
+        Runs covering every block of the image, in order
+    """
+    runs: List[Run] = []
+    total_blocks = (size + block_size - 1) // block_size
+    read_size = max(block_size, READ_SIZE - READ_SIZE % block_size)
+    buffer = bytearray(read_size)
+    view = memoryview(buffer)
+    block = 0
+    last_pattern = b""
+    last_fill_block = b""
+    
+    def add(kind: int, fill: bytes = b""):
+        last = runs[-1] if runs else None
+        if last and last.kind == kind and last.fill == fill and last.start_block + last.blocks == block:
+            last.blocks += 1
+        else:
+            runs.append(Run(kind, block, 1, block * block_size, fill))
+    
+    source.seek(0)
+    while block < total_blocks:
+        n = source.readinto(view)
+        if not n:
+            raise SparseError("Image shorter than its size")
+        if n % block_size and block + (n + block_size - 1) // block_size < total_blocks:
+            # Short read in the middle of the file: keep whole blocks only
+            source.seek(-(n % block_size), 1)
+            n -= n % block_size
+        
+        for offset in range(0, n, block_size):
+            data = view[offset:offset + block_size]
+            if detect_fill and len(data) == block_size:
+                pattern = bytes(data[:4])
+                if pattern != last_pattern:
+                    last_pattern = pattern
+                    last_fill_block = pattern * (block_size // 4)
+                if data == last_fill_block:
+                    add(CHUNK_FILL, pattern)
+                    block += 1
+                    continue
+            add(CHUNK_RAW)
+            block += 1
+    
+    return runs
+
+
+def parse_sparse(source: BinaryIO) -> Optional[tuple]:
+    """
+    Read the chunk layout of an existing sparse image.
+    
+    Args:
+        source: File opened in binary mode
+        
+    Returns:
+        (runs, total_blocks, block_size), or None if not a sparse image
+    """
+    source.seek(0)
+    header = source.read(SPARSE_HEADER_SIZE)
+    if len(header) < SPARSE_HEADER_SIZE:
+        return None
+    
+    (magic, _major, _minor, file_header_size, chunk_header_size, block_size,
+     total_blocks, total_chunks, _checksum) = struct.unpack(SPARSE_HEADER_FORMAT, header)
+    if magic != SPARSE_MAGIC:
+        return None
+    
+    runs: List[Run] = []
+    offset = file_header_size
+    block = 0
+    
+    for _ in range(total_chunks):
+        source.seek(offset)
+        raw = source.read(CHUNK_HEADER_SIZE)
+        if len(raw) < CHUNK_HEADER_SIZE:
+            raise SparseError("Sparse image truncated")
+        kind, _reserved, blocks, total_size = struct.unpack(CHUNK_HEADER_FORMAT, raw)
+        data_offset = offset + chunk_header_size
+        
+        if kind == CHUNK_RAW:
+            runs.append(Run(CHUNK_RAW, block, blocks, data_offset))
+        elif kind == CHUNK_FILL:
+            source.seek(data_offset)
+            runs.append(Run(CHUNK_FILL, block, blocks, fill=source.read(4)))
+        elif kind not in (CHUNK_DONT_CARE, CHUNK_CRC32):
+            raise SparseError(f"Unknown sparse chunk type {kind:#x}")
+        
+        block += blocks
+        offset += total_size
+    
+    return runs, total_blocks, block_size
+
+
+def split_runs(runs: List[Run], total_blocks: int, block_size: int,
+               max_size: int) -> List[SparsePart]:
+    """
+    Pack runs into the fewest sparse parts of at most max_size bytes.
+    
+    Runs stay in order; a RAW run that does not fit the current part is
+    split at a block boundary.
+    
+    Args:
+        runs: Runs from scan_raw() or parse_sparse()
+        total_blocks: Blocks covered by every part
+        block_size: Sparse block size
+        max_size: Device max-download-size
+        
+    Returns:
+        List of SparsePart
+    """
+    # Header plus a DONT_CARE chunk before and after the part's runs
+    overhead = SPARSE_HEADER_SIZE + 2 * CHUNK_HEADER_SIZE
+    if max_size < overhead + CHUNK_HEADER_SIZE + block_size:
+        raise SparseError(f"max-download-size {max_size} too small for sparse transfer")
+    
+    parts: List[SparsePart] = []
+    current: List[Run] = []
+    used = overhead
+    
+    def close():
+        nonlocal current, used
+        if current:
+            parts.append(SparsePart(current, total_blocks, block_size))
+        current, used = [], overhead
+    
+    for run in runs:
+        run = Run(run.kind, run.start_block, run.blocks, run.source_offset, run.fill)
+        # A gap before this run costs an extra DONT_CARE chunk
+        while True:
+            gap = CHUNK_HEADER_SIZE if current and (
+                current[-1].start_block + current[-1].blocks != run.start_block) else 0
+            cost = CHUNK_HEADER_SIZE + gap + run.payload_size(block_size)
+            
+            if used + cost <= max_size:
+                current.append(run)
+                used += cost
+                break
+            
+            if run.kind == CHUNK_RAW:
+                fit = (max_size - used - CHUNK_HEADER_SIZE - gap) // block_size
+                if fit > 0:
+                    head = Run(CHUNK_RAW, run.start_block, fit, run.source_offset)
+                    current.append(head)
+                    run = Run(CHUNK_RAW, run.start_block + fit, run.blocks - fit,
+                              run.source_offset + fit * block_size)
+            close()
+    
+    close()
+    return parts
@@ -0,0 +1,304 @@
+"""
+SecureOS Flash - Fastboot Transports
+
+Message pipes the fastboot backend talks through: USB (pyusb), TCP
+(fastboot over network, e.g. fastbootd on emulators and dev boards) and
+a local fake device for tests (see fake.py).
+"""
+
+from abc import ABC, abstractmethod
+from typing import List, Optional
+import logging
+import socket
+import struct
+
+from ...utils.usb import port_path, serial_number
+
+
+logger = logging.getLogger(__name__)
+
+
+# Fastboot USB interface: vendor-specific class, subclass 0x42, protocol 0x03
+FASTBOOT_CLASS = 0xFF
+FASTBOOT_SUBCLASS = 0x42
+FASTBOOT_PROTOCOL = 0x03
+
+# Largest single bulk/TCP write used for download data
+MAX_WRITE_SIZE = 1024 * 1024
+
+# Fastboot TCP default port and handshake
+TCP_PORT = 5554
+TCP_HANDSHAKE = b"FB01"
+
+
+class FastbootTransportError(IOError):
+    """Raised when the transport fails or times out"""
+
+
+class FastbootTransport(ABC):
+    """
+    Message-oriented pipe to a device in fastboot mode.
+    
+    write() sends one message (a command or a piece of download data);
+    read() returns one response message.
+    """
+    
+    @abstractmethod
+    def open(self) -> bool:
+        """
+        Open the device.
+        
+        Returns:
+            True if a device was found
+        """
+        pass
+    
+    @abstractmethod
+    def close(self):
+        """Release the device."""
+        pass
+    
+    @abstractmethod
+    def write(self, data, timeout: float):
+        """
+        Send one message.
+        
+        Raises:
+            FastbootTransportError: On failure or timeout
+        """
+        pass
+    
+    @abstractmethod
+    def read(self, max_size: int, timeout: float) -> bytes:
+        """
+        Receive one message of at most max_size bytes.
+        
+        Raises:
+            FastbootTransportError: On failure or timeout
+        """
+        pass
+    
+    @property
+    def device_path(self) -> str:
+        """Stable identifier for where the device is attached"""
+        return "unknown"
+    
+    @property
+    def serial_number(self) -> Optional[str]:
+        """Serial number of the opened device, None if the transport cannot tell"""
+        return None
+
+
+class UsbFastbootTransport(FastbootTransport):
+    """
+    Fastboot over USB via pyusb (imported lazily; optional dependency).
+    """
+    
+    def __init__(self, serial: Optional[str] = None, bus: Optional[int] = None,
+                 address: Optional[int] = None, port: Optional[str] = None):
+        """
+        Initialize USB transport.
+        
+        Args:
+            serial: Only open the device with this serial number
+            bus: Only open a device on this USB bus
+            address: Only open the device with this address
+            port: Only open the device on this port path (e.g. "usb-1-2.3");
+                  unlike the address it survives re-enumeration
+        """
+        self.serial = serial
+        self.bus = bus
+        self.address = address
+        self.port = port
+        self._usb = None
+        self._device = None
+        self._interface = None
+        self._ep_in = None
+        self._ep_out = None
+        self._serial: Optional[str] = None
+    
+    def open(self) -> bool:
+        try:
+            import usb.core
+            import usb.util
+        except ImportError:
+            logger.error("pyusb is not installed - fastboot over USB unavailable")
+            return False
+        
+        for device in usb.core.find(find_all=True):
+            if self.bus is not None and device.bus != self.bus:
+                continue
+            if self.address is not None and device.address != self.address:
+                continue
+            if self.port is not None and port_path(device) != self.port:
+                continue
+            
+            try:
+                interface = self._fastboot_interface(device, usb.util)
+                if interface is None:
+                    continue
+                if self.serial is not None and usb.util.get_string(
+                        device, device.iSerialNumber) != self.serial:
+                    continue
+                usb.util.claim_interface(device, interface.bInterfaceNumber)
+            except usb.core.USBError as e:
+                logger.debug(f"Skipping USB device {device.bus}:{device.address}: {e}")
+                continue
+            
+            self._usb = usb
+            self._device = device
+            self._interface = interface
+            self._serial = serial_number(device)
+            return True
+        
+        return False
+    
+    @classmethod
+    def enumerate(cls) -> List[str]:
+        """
+        USB devices that expose a fastboot interface.
+        
+        Returns:
+            Port paths, empty if pyusb is not installed
+        """
+        try:
+            import usb.core
+            import usb.util
+        except ImportError:
+            return []
+        
+        found = []
+        for device in usb.core.find(find_all=True):
+            try:
+                if cls()._fastboot_interface(device, usb.util) is not None:
+                    found.append(port_path(device))
+            except usb.core.USBError as e:
+                logger.debug(f"Skipping USB device {device.bus}:{device.address}: {e}")
+        return found
+    
+    def _fastboot_interface(self, device, util):
+        for config in device:
+            for interface in config:
+                if (interface.bInterfaceClass, interface.bInterfaceSubClass,
+                        interface.bInterfaceProtocol) != (FASTBOOT_CLASS, FASTBOOT_SUBCLASS,
+                                                          FASTBOOT_PROTOCOL):
+                    continue
+                
+                for ep in interface:
+                    if util.endpoint_direction(ep.bEndpointAddress) == util.ENDPOINT_IN:
+                        self._ep_in = ep
+                    else:
+                        self._ep_out = ep
+                return interface
+        return None
+    
+    def close(self):
+        if self._device is None:
+            return
+        try:
+            self._usb.util.release_interface(self._device, self._interface.bInterfaceNumber)
+        except self._usb.core.USBError as e:
+            logger.debug(f"Error releasing fastboot interface: {e}")
+        finally:
+            self._usb.util.dispose_resources(self._device)
+            self._device = None
+    
+    def write(self, data, timeout: float):
+        try:
+            self._ep_out.write(data, int(timeout * 1000))
+        except self._usb.core.USBError as e:
+            raise FastbootTransportError(f"USB write failed: {e}") from e
+    
+    def read(self, max_size: int, timeout: float) -> bytes:
+        try:
+            return self._ep_in.read(max_size, int(timeout * 1000)).tobytes()
+        except self._usb.core.USBError as e:
+            raise FastbootTransportError(f"USB read failed: {e}") from e
+    
+    @property
+    def device_path(self) -> str:
+        if self._device is None:
+            return "unknown"
+        return port_path(self._device)
+    
+    @property
+    def serial_number(self) -> Optional[str]:
+        return self._serial if self._device is not None else None
+
+
+class TcpFastbootTransport(FastbootTransport):
+    """
+    Fastboot over TCP: FB01 handshake, then 8-byte big-endian length
+    prefixed messages.
+    """
+    
+    def __init__(self, host: str, port: int = TCP_PORT, connect_timeout: float = 5.0):
+        """
+        Initialize TCP transport.
+        
+        Args:
+            host: Device host name or address
+            port: Fastboot TCP port
+            connect_timeout: Connection timeout in seconds
+        """
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self._sock: Optional[socket.socket] = None
+    
+    def open(self) -> bool:
+        try:
+            sock = socket.create_connection((self.host, self.port), self.connect_timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.sendall(TCP_HANDSHAKE)
+            reply = self._recv_exact(sock, 4)
+        except OSError as e:
+            logger.debug(f"No fastboot device at {self.host}:{self.port}: {e}")
+            return False
+        
+        if not reply.startswith(b"FB"):
+            sock.close()
+            logger.error(f"Bad fastboot TCP handshake: {reply!r}")
+            return False
+        
+        self._sock = sock
+        return True
+    
+    @staticmethod
+    def _recv_exact(sock: socket.socket, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise FastbootTransportError("Connection closed by device")
+            data += chunk
+        return bytes(data)
+    
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+    
+    def write(self, data, timeout: float):
+        try:
+            self._sock.settimeout(timeout)
+            self._sock.sendall(struct.pack(">Q", len(data)))
+            self._sock.sendall(data)
+        except OSError as e:
+            raise FastbootTransportError(f"TCP write failed: {e}") from e
+    
+    def read(self, max_size: int, timeout: float) -> bytes:
+        try:
+            self._sock.settimeout(timeout)
+            (length,) = struct.unpack(">Q", self._recv_exact(self._sock, 8))
+            if length > max_size:
+                raise FastbootTransportError(f"Message of {length} bytes exceeds {max_size}")
+            return self._recv_exact(self._sock, length)
+        except FastbootTransportError:
+            raise
+        except OSError as e:
+            raise FastbootTransportError(f"TCP read failed: {e}") from e
+    
+    @property
+    def device_path(self) -> str:
+        return f"tcp-{self.host}:{self.port}"
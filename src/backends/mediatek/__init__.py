@@ -0,0 +1,14 @@
+"""MediaTek backend package"""
+from .mediatek_backend import MediaTekBackend
+from .transport import (
+    MediaTekTransport, UsbMediaTekTransport, MediaTekTransportError
+)
+from .protocol import MediaTekProtocol, MediaTekError
+from .gpt import GptEntry, GptError
+from .fake import FakeMediaTekDevice, LocalTransport
+
+__all__ = [
+    'MediaTekBackend', 'MediaTekTransport', 'UsbMediaTekTransport', 'MediaTekTransportError',
+    'MediaTekProtocol', 'MediaTekError', 'GptEntry', 'GptError',
+    'FakeMediaTekDevice', 'LocalTransport'
+]
@@ -0,0 +1,287 @@
+"""
+SecureOS Flash - Fake MediaTek Device
+
+In-memory MediaTek device that speaks the device side of the BROM and
+DA protocols over a byte stream. LocalTransport connects the MediaTek
+backend to it, so the whole backend can be exercised without hardware.
+"""
+
+from typing import Dict, Generator, List, Optional, Tuple
+import struct
+
+from . import protocol as mtk
+from .gpt import GptEntry, build_gpt
+from .transport import MediaTekTransport, MediaTekTransportError, BROM_PID
+
+
+# Status codes the fake reports
+STATUS_UNSUPPORTED = 0xC0010004
+STATUS_OUT_OF_RANGE = 0xC0010005
+BROM_STATUS_ERROR = 0x1D0D
+
+_Machine = Generator[int, bytes, None]
+
+
+class FakeMediaTekDevice:
+    """
+    Scriptable MediaTek device with GPT-partitioned storage.
+    
+    The device starts in the boot ROM; once a DA has been uploaded and
+    started it answers DA commands until shut down, then returns to the
+    boot ROM (as after a reboot into BROM mode).
+    """
+    
+    def __init__(self, partitions: Dict[str, int], hw_code: int = 0x0766,
+                 sector_size: int = 512,
+                 packet_lengths: Tuple[int, int] = (0x200000, 0x100000),
+                 require_da: bool = True,
+                 me_id: Optional[bytes] = bytes(range(16))):
+        """
+        Initialize fake device.
+        
+        Args:
+            partitions: Partition name -> size in bytes (rounded up to sectors),
+                        laid out in order after the GPT
+            hw_code: Hardware code the boot ROM reports
+            sector_size: Storage sector size
+            packet_lengths: (write, read) DA packet lengths
+            require_da: Refuse JUMP_DA unless SEND_DA loaded the same address
+            me_id: ME ID the boot ROM reports (None = an empty one)
+        """
+        self.hw_code = hw_code
+        self.me_id = me_id
+        self.sector_size = sector_size
+        self.write_packet_length, self.read_packet_length = packet_lengths
+        self.require_da = require_da
+        
+        entries: List[GptEntry] = []
+        lba = 34 if sector_size == 512 else 6
+        for name, size in partitions.items():
+            sectors = max(-(-size // sector_size), 1)
+            entries.append(GptEntry(name, lba, lba + sectors - 1))
+            lba += sectors
+        self.entries = entries
+        self.storage = bytearray((lba + 33) * sector_size)
+        gpt = build_gpt(entries, sector_size)
+        self.storage[:len(gpt)] = gpt
+        
+        self.da: Optional[bytes] = None
+        self.da_address: Optional[int] = None
+        self.in_da = False
+        self.rebooted = False
+        self.powered_off = False
+        self.handshakes = 0
+        self.write_packets: List[int] = []      # Payload size of each WRITE_DATA data packet
+        
+        self._inbox = bytearray()
+        self._outbox = bytearray()
+        self._machine: _Machine = self._brom()
+        self._wanted = next(self._machine)
+    
+    def partition(self, name: str) -> bytearray:
+        """
+        Get a copy of a partition's contents by name.
+        
+        Args:
+            name: Partition name
+            
+        Returns:
+            Partition contents
+        """
+        for e in self.entries:
+            if e.name.lower() == name.lower():
+                return self.storage[e.offset(self.sector_size):
+                                    e.offset(self.sector_size) + e.size_bytes(self.sector_size)]
+        raise KeyError(name)
+    
+    def receive(self, data):
+        """Handle bytes from the host."""
+        self._inbox += data
+        while len(self._inbox) >= self._wanted:
+            chunk = bytes(self._inbox[:self._wanted])
+            del self._inbox[:self._wanted]
+            self._wanted = self._machine.send(chunk)
+    
+    def respond(self, size: int) -> bytes:
+        """Take `size` bytes of pending output."""
+        if len(self._outbox) < size:
+            raise MediaTekTransportError(
+                f"Read timed out ({len(self._outbox)} of {size} bytes pending)"
+            )
+        data = bytes(self._outbox[:size])
+        del self._outbox[:size]
+        return data
+    
+    def _reply(self, data: bytes):
+        self._outbox += data
+    
+    # Boot ROM
+    
+    def _brom(self) -> _Machine:
+        while True:
+            index = 0
+            while index < len(mtk.HANDSHAKE):
+                byte = (yield 1)[0]
+                if byte == mtk.HANDSHAKE[index]:
+                    self._reply(bytes([byte ^ 0xFF]))
+                    index += 1
+                else:
+                    index = 0
+            self.handshakes += 1
+            
+            while True:
+                command = yield 1
+                self._reply(command)
+                if command[0] == mtk.BROM_GET_HW_CODE:
+                    self._reply(struct.pack(">HH", self.hw_code, mtk.STATUS_OK))
+                elif command[0] == mtk.BROM_GET_ME_ID:
+                    me_id = self.me_id or b""
+                    self._reply(struct.pack(">I", len(me_id)) + me_id)
+                    self._reply(struct.pack(">H", mtk.STATUS_OK))
+                elif command[0] == mtk.BROM_SEND_DA:
+                    address = yield from self._brom_word()
+                    length = yield from self._brom_word()
+                    yield from self._brom_word()  # Signature length
+                    self._reply(struct.pack(">H", mtk.STATUS_OK))
+                    data = yield length
+                    self.da, self.da_address = data, address
+                    self._reply(struct.pack(">HH", mtk.checksum16(data), mtk.STATUS_OK))
+                elif command[0] == mtk.BROM_JUMP_DA:
+                    address = yield from self._brom_word()
+                    if self.require_da and (self.da is None or address != self.da_address):
+                        self._reply(struct.pack(">H", BROM_STATUS_ERROR))
+                        continue
+                    self._reply(struct.pack(">H", mtk.STATUS_OK))
+                    yield from self._da()
+                    break  # Back in the boot ROM, waiting for a handshake
+                else:
+                    self._reply(struct.pack(">H", BROM_STATUS_ERROR))
+    
+    def _brom_word(self) -> Generator[int, bytes, int]:
+        data = yield 4
+        self._reply(data)
+        return struct.unpack(">I", data)[0]
+    
+    # Download agent
+    
+    def _packet(self, payload: bytes):
+        self._reply(struct.pack(mtk.HEADER_FORMAT, mtk.DA_MAGIC, mtk.DA_PROTOCOL_FLOW, len(payload)))
+        self._reply(payload)
+    
+    def _status(self, status: int = mtk.STATUS_OK):
+        self._packet(struct.pack("<I", status))
+    
+    def _read_packet(self) -> Generator[int, bytes, bytes]:
+        magic, _, length = struct.unpack(mtk.HEADER_FORMAT, (yield mtk.HEADER_SIZE))
+        if magic != mtk.DA_MAGIC:
+            raise MediaTekTransportError(f"Fake device got bad magic {magic:#x}")
+        if not length:
+            return b""
+        return (yield length)
+    
+    def _da(self) -> Generator[int, bytes, None]:
+        self.in_da = True
+        self._packet(struct.pack("<I", mtk.DA_SYNC_SIGNAL))
+        
+        while True:
+            command, = struct.unpack("<I", (yield from self._read_packet())[:4])
+            if command == mtk.DA_DEVICE_CTRL:
+                self._status()
+                control, = struct.unpack("<I", (yield from self._read_packet())[:4])
+                if control != mtk.CTRL_GET_PACKET_LENGTH:
+                    self._status(STATUS_UNSUPPORTED)
+                    continue
+                self._status()
+                self._packet(struct.pack("<II", self.write_packet_length, self.read_packet_length))
+                self._status()
+                
+            elif command in (mtk.DA_WRITE_DATA, mtk.DA_READ_DATA):
+                self._status()
+                _, _, address, length = struct.unpack(
+                    mtk.DATA_PARAMS_FORMAT, (yield from self._read_packet())
+                )
+                if address + length > len(self.storage):
+                    self._status(STATUS_OUT_OF_RANGE)
+                    continue
+                self._status()
+                if command == mtk.DA_WRITE_DATA:
+                    yield from self._write_data(address, length)
+                else:
+                    yield from self._read_data(address, length)
+                
+            elif command == mtk.DA_SHUTDOWN:
+                self._status()
+                mode, = struct.unpack("<I", (yield from self._read_packet())[:4])
+                self._status()
+                self.rebooted = mode == mtk.SHUTDOWN_REBOOT
+                self.powered_off = not self.rebooted
+                self.in_da = False
+                self.da = self.da_address = None
+                return
+                
+            else:
+                self._status(STATUS_UNSUPPORTED)
+    
+    def _write_data(self, address: int, length: int) -> Generator[int, bytes, None]:
+        offset = address
+        while offset < address + length:
+            data = yield from self._read_packet()
+            if len(data) > self.write_packet_length or offset + len(data) > address + length:
+                self._status(STATUS_OUT_OF_RANGE)
+                return
+            self.storage[offset:offset + len(data)] = data
+            self.write_packets.append(len(data))
+            offset += len(data)
+            self._status()
+        self._status()
+    
+    def _read_data(self, address: int, length: int) -> Generator[int, bytes, None]:
+        # The fake queues one packet at a time and waits for its ack
+        for offset in range(address, address + length, self.read_packet_length):
+            end = min(offset + self.read_packet_length, address + length)
+            self._packet(bytes(self.storage[offset:end]))
+            yield from self._read_packet()
+        self._status()
+
+
+class LocalTransport(MediaTekTransport):
+    """Transport connected to a FakeMediaTekDevice in the same process"""
+    
+    def __init__(self, device: FakeMediaTekDevice, path: str = "local-0"):
+        """
+        Initialize local transport.
+        
+        Args:
+            device: Fake device to talk to
+            path: Device path reported to the backend
+        """
+        self.device = device
+        self.path = path
+        self.is_open = False
+        self.bytes_written = 0
+    
+    def open(self) -> bool:
+        self.is_open = True
+        return True
+    
+    def close(self):
+        self.is_open = False
+    
+    def write(self, data, timeout: float):
+        if not self.is_open:
+            raise MediaTekTransportError("Transport closed")
+        self.device.receive(data)
+        self.bytes_written += len(data)
+    
+    def read(self, size: int, timeout: float) -> bytes:
+        if not self.is_open:
+            raise MediaTekTransportError("Transport closed")
+        return self.device.respond(size)
+    
+    @property
+    def device_path(self) -> str:
+        return self.path
+    
+    @property
+    def product_id(self) -> Optional[int]:
+        return BROM_PID
@@ -0,0 +1,167 @@
+"""
+SecureOS Flash - GPT Parser
+
+Reads the GUID partition table MediaTek devices keep at the start of
+their user storage. The backend locates partitions by LBA from it, the
+same way the Samsung backends use the PIT.
+"""
+
+from dataclasses import dataclass
+from typing import List
+import struct
+import uuid
+import zlib
+
+
+GPT_SIGNATURE = b"EFI PART"
+
+# Header fields: signature, revision, header size, header CRC, reserved,
+# current LBA, backup LBA, first/last usable LBA, disk GUID,
+# entries LBA, entry count, entry size, entries CRC
+HEADER_FORMAT = "<8sIIIIQQQQ16sQIII"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Entry fields: type GUID, unique GUID, first LBA, last LBA, attributes, name
+ENTRY_FORMAT = "<16s16sQQQ72s"
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+
+DEFAULT_ENTRY_COUNT = 128
+
+# Partition type used by build_gpt() ("Microsoft basic data", as MTK scatter tools use)
+BASIC_DATA_TYPE = uuid.UUID("ebd0a0a2-b9e5-4433-87c0-68b6b72699c7")
+
+
+class GptError(Exception):
+    """Raised when a GPT cannot be parsed"""
+
+
+@dataclass
+class GptHeader:
+    """The fields of a GPT header the backend needs"""
+    first_usable_lba: int
+    last_usable_lba: int
+    entries_lba: int
+    entry_count: int
+    entry_size: int
+    
+    def entries_length(self) -> int:
+        return self.entry_count * self.entry_size
+
+
+@dataclass
+class GptEntry:
+    """One partition of a GPT"""
+    name: str
+    first_lba: int
+    last_lba: int         # Inclusive
+    
+    def offset(self, sector_size: int) -> int:
+        return self.first_lba * sector_size
+    
+    def size_bytes(self, sector_size: int) -> int:
+        return (self.last_lba - self.first_lba + 1) * sector_size
+
+
+def parse_header(data: bytes) -> GptHeader:
+    """
+    Parse a GPT header (the contents of LBA 1).
+    
+    Args:
+        data: Header sector
+        
+    Returns:
+        GptHeader
+        
+    Raises:
+        GptError: If the data is not a valid GPT header
+    """
+    if len(data) < HEADER_SIZE:
+        raise GptError(f"GPT header too short ({len(data)} bytes)")
+    
+    (signature, _, header_size, header_crc, _, _, _, first_usable, last_usable,
+     _, entries_lba, entry_count, entry_size, _) = struct.unpack_from(HEADER_FORMAT, data, 0)
+    if signature != GPT_SIGNATURE:
+        raise GptError("No GPT signature (storage not partitioned, or wrong sector size)")
+    if not HEADER_SIZE <= header_size <= len(data):
+        raise GptError(f"Invalid GPT header size {header_size}")
+    
+    header = bytearray(data[:header_size])
+    header[16:20] = bytes(4)
+    if zlib.crc32(header) != header_crc:
+        raise GptError("GPT header checksum mismatch")
+    if entry_size < ENTRY_SIZE:
+        raise GptError(f"Invalid GPT entry size {entry_size}")
+    
+    return GptHeader(first_usable, last_usable, entries_lba, entry_count, entry_size)
+
+
+def parse_entries(header: GptHeader, data: bytes) -> List[GptEntry]:
+    """
+    Parse the partition entry array.
+    
+    Args:
+        header: Header describing the array
+        data: Entry array (at least header.entries_length() bytes)
+        
+    Returns:
+        Used entries in table order
+        
+    Raises:
+        GptError: If the array is short
+    """
+    if len(data) < header.entries_length():
+        raise GptError(f"GPT entry array too short ({len(data)} bytes)")
+    
+    entries = []
+    for index in range(header.entry_count):
+        type_guid, _, first_lba, last_lba, _, name = struct.unpack_from(
+            ENTRY_FORMAT, data, index * header.entry_size
+        )
+        if type_guid == bytes(16):
+            continue
+        entries.append(GptEntry(
+            name=name.decode("utf-16-le", errors="replace").split("\x00", 1)[0],
+            first_lba=first_lba,
+            last_lba=last_lba
+        ))
+    return entries
+
+
+def build_gpt(partitions: List[GptEntry], sector_size: int = 512,
+              entry_count: int = DEFAULT_ENTRY_COUNT) -> bytes:
+    """
+    Build the primary GPT (protective MBR, header and entry array).
+    
+    Used by the fake device; the result is written to the start of its
+    storage.
+    
+    Args:
+        partitions: Partitions to describe
+        sector_size: Bytes per LBA
+        entry_count: Slots in the entry array
+        
+    Returns:
+        GPT bytes, starting at LBA 0
+    """
+    entries = bytearray(entry_count * ENTRY_SIZE)
+    for index, p in enumerate(partitions):
+        struct.pack_into(
+            ENTRY_FORMAT, entries, index * ENTRY_SIZE,
+            BASIC_DATA_TYPE.bytes_le, uuid.uuid4().bytes_le, p.first_lba, p.last_lba, 0,
+            p.name.encode("utf-16-le")
+        )
+    
+    entries_sectors = -(-len(entries) // sector_size)
+    first_usable = 2 + entries_sectors
+    last_usable = max([p.last_lba for p in partitions] + [first_usable])
+    header = bytearray(struct.pack(
+        HEADER_FORMAT, GPT_SIGNATURE, 0x00010000, HEADER_SIZE, 0, 0,
+        1, last_usable + entries_sectors + 1, first_usable, last_usable,
+        uuid.uuid4().bytes_le, 2, entry_count, ENTRY_SIZE, zlib.crc32(entries)
+    ))
+    struct.pack_into("<I", header, 16, zlib.crc32(header))
+    
+    gpt = bytearray(first_usable * sector_size)
+    gpt[sector_size:sector_size + len(header)] = header
+    gpt[2 * sector_size:2 * sector_size + len(entries)] = entries
+    return bytes(gpt)
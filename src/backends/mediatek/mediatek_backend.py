@@ -0,0 +1,505 @@
+"""
+SecureOS Flash - MediaTek Backend
+
+Flashes MediaTek devices from the boot ROM (or preloader): uploads a
+download agent (DA), then reads and writes partitions located through
+the device's GPT. Image data is read from disk on a helper thread into
+two alternating buffers, so each large write packet is ready as soon
+as the previous one has been acknowledged.
+"""
+
+from contextlib import closing
+from typing import BinaryIO, Callable, List, Optional
+import logging
+import os
+
+from ...core.flash_backend import FlashBackend, DeviceInfo, FlashResult, PartitionInfo
+from ...core.cancellation import CancellationToken, OperationCancelled, cancellable_progress
+from ...utils.prefetch import prefetch_chunks
+from .gpt import GptEntry, GptError, parse_header, parse_entries
+from .protocol import (
+    MediaTekProtocol, MediaTekError, ProgressCallback, DEFAULT_DA_ADDRESS, STORAGE_EMMC, PART_USER
+)
+from .transport import MediaTekTransport, UsbMediaTekTransport, MediaTekTransportError, MEDIATEK_VID
+
+
+logger = logging.getLogger(__name__)
+
+
+# DA stage image used when none is passed to the backend
+DA_ENV = "SECUREOS_FLASH_MTK_DA"
+
+# Largest write packet the host sends (the DA may allow less)
+DEFAULT_CHUNK_SIZE = 2 * 1024 * 1024
+
+
+class MediaTekBackend(FlashBackend):
+    """
+    MediaTek flash backend speaking BROM and the DA protocol natively.
+    
+    The DA is chip specific and not shipped with SecureOS Flash; pass the
+    DA stage image for the device's chip (as extracted from the vendor's
+    all-in-one DA file) or set SECUREOS_FLASH_MTK_DA.
+    """
+    
+    def __init__(self, transport_factory: Optional[Callable[[], MediaTekTransport]] = None,
+                 download_agent: Optional[str] = None,
+                 da_address: int = DEFAULT_DA_ADDRESS,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 sector_size: int = 512,
+                 storage: int = STORAGE_EMMC,
+                 progress: Optional[ProgressCallback] = None):
+        """
+        Initialize MediaTek backend.
+        
+        Args:
+            transport_factory: Creates the transport to use (None = pyusb)
+            download_agent: DA stage image (None = $SECUREOS_FLASH_MTK_DA)
+            da_address: Address the DA is loaded at and started from
+            chunk_size: Largest write packet to send
+            sector_size: Storage sector size (512 for eMMC, 4096 for UFS)
+            storage: Storage type (protocol.STORAGE_EMMC or STORAGE_UFS)
+            progress: Called with (bytes done, total bytes) during transfers
+        """
+        self.transport_factory = transport_factory or UsbMediaTekTransport
+        self.download_agent = download_agent or os.environ.get(DA_ENV) or None
+        self.da_address = da_address
+        self.chunk_size = chunk_size
+        self.sector_size = sector_size
+        self.storage = storage
+        self.progress = progress
+        
+        self.transport: Optional[MediaTekTransport] = None
+        self.protocol: Optional[MediaTekProtocol] = None
+        self.hw_code: Optional[int] = None
+        self.me_id: Optional[bytes] = None
+        self.session_active = False
+        self._gpt_entries: Optional[List[GptEntry]] = None
+    
+    def detect_device(self) -> Optional[DeviceInfo]:
+        """
+        Detect a MediaTek device in BROM or preloader mode.
+        
+        The handshake is done once per connection; later calls report the
+        device found by the first.
+        
+        Returns:
+            DeviceInfo if a device answered, None otherwise
+        """
+        if self.transport is None:
+            transport = self.transport_factory()
+            try:
+                if not transport.open():
+                    return None
+                protocol = MediaTekProtocol(transport)
+                protocol.handshake()
+                self.hw_code, _ = protocol.get_hw_code()
+                self.me_id = protocol.get_me_id()
+            except (MediaTekTransportError, MediaTekError) as e:
+                logger.error(f"MediaTek handshake failed: {e}")
+                transport.close()
+                return None
+            except Exception as e:
+                logger.error(f"Error opening MediaTek transport: {e}")
+                return None
+            self.transport = transport
+            self.protocol = protocol
+        
+        logger.info(f"MediaTek device (hw code {self.hw_code:#06x}) detected on "
+                    f"{self.transport.device_path}")
+        product_id = self.transport.product_id
+        
+        return DeviceInfo(
+            manufacturer="MediaTek",
+            model=f"MediaTek {self.hw_code:04x}",
+            device_id=f"mediatek-{self.transport.device_path}",
+            usb_vendor_id=f"{MEDIATEK_VID:04x}",
+            usb_product_id=f"{product_id:04x}" if product_id is not None else "unknown",
+            bootloader_locked=False,  # The boot ROM flashes regardless of the lock state
+            oem_unlock_enabled=True,
+            usb_debugging_enabled=True,
+            usb_path=self.transport.device_path,
+            serial=self.me_id.hex() if self.me_id else self.transport.serial_number
+        )
+    
+    def discover(self) -> List[FlashBackend]:
+        """
+        One backend per attached MediaTek device.
+        
+        Only the default pyusb transport can be enumerated; a backend with
+        a custom transport factory stands for its one device.
+        
+        Returns:
+            List of backends
+        """
+        if self.transport_factory is not UsbMediaTekTransport:
+            return [self]
+        
+        return [
+            MediaTekBackend(
+                lambda port=port: UsbMediaTekTransport(port=port),
+                download_agent=self.download_agent,
+                da_address=self.da_address,
+                chunk_size=self.chunk_size,
+                sector_size=self.sector_size,
+                storage=self.storage,
+                progress=self.progress
+            )
+            for port in UsbMediaTekTransport.enumerate()
+        ]
+    
+    def init_session(self) -> bool:
+        """
+        Upload and start the DA.
+        
+        Returns:
+            True if the DA is running
+        """
+        if self.transport is None:
+            logger.error("No MediaTek device connected")
+            return False
+        
+        if not self.download_agent:
+            logger.error(f"No download agent given (pass download_agent or set {DA_ENV})")
+            return False
+        
+        try:
+            with open(self.download_agent, "rb") as f:
+                da = f.read()
+        except OSError as e:
+            logger.error(f"Could not read download agent: {e}")
+            return False
+        
+        try:
+            self.protocol.send_da(da, self.da_address)
+            self.protocol.jump_da(self.da_address)
+            self.protocol.da_sync()
+        except (MediaTekTransportError, MediaTekError) as e:
+            logger.error(f"Starting the MediaTek DA failed: {e}")
+            return False
+        
+        self.session_active = True
+        return True
+    
+    def _no_session(self) -> FlashResult:
+        return FlashResult(
+            success=False,
+            message="No active session",
+            error="Call init_session() first"
+        )
+    
+    def _abandon_session(self):
+        """
+        Drop the session after a transfer was cut short.
+        
+        The DA is left waiting for the rest of the transfer, so the
+        transport is released; the device needs a reconnect (back into
+        BROM mode) before the next session.
+        """
+        if self.transport is not None:
+            self.transport.close()
+        self.transport = None
+        self.protocol = None
+        self.hw_code = None
+        self.me_id = None
+        self.session_active = False
+        self._gpt_entries = None
+    
+    def _cancelled(self, e: OperationCancelled) -> FlashResult:
+        """Abandon the session after a cancelled transfer."""
+        self._abandon_session()
+        return FlashResult(
+            success=False,
+            message="Cancelled",
+            error=str(e) or "Cancelled by user",
+            cancelled=True
+        )
+    
+    def _load_gpt(self) -> List[GptEntry]:
+        if self._gpt_entries is None:
+            header = parse_header(self.protocol.read_bytes(
+                self.sector_size, self.sector_size, self.storage, PART_USER
+            ))
+            self._gpt_entries = parse_entries(header, self.protocol.read_bytes(
+                header.entries_lba * self.sector_size, header.entries_length(),
+                self.storage, PART_USER
+            ))
+        return self._gpt_entries
+    
+    def _find_entry(self, partition_name: str) -> Optional[GptEntry]:
+        for entry in self._load_gpt():
+            if entry.name.lower() == partition_name.lower():
+                return entry
+        return None
+    
+    def backup_partition(self, partition_name: str, output_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Read a partition from the device.
+        
+        Args:
+            partition_name: Partition to backup
+            output_file: Where to save backup
+            cancel: Token to abort the backup (checked after every packet)
+            
+        Returns:
+            FlashResult
+        """
+        if not self.session_active:
+            return self._no_session()
+        
+        try:
+            entry = self._find_entry(partition_name)
+            if entry is None:
+                return FlashResult(
+                    success=False,
+                    message="Backup failed",
+                    error=f"Partition not in GPT: {partition_name}"
+                )
+            
+            logger.info(f"Backing up {partition_name} to {output_file}")
+            with open(output_file, "wb") as f:
+                self.protocol.read_data(entry.offset(self.sector_size),
+                                        entry.size_bytes(self.sector_size), f,
+                                        self.storage, PART_USER,
+                                        cancellable_progress(cancel, self.progress))
+            
+            return FlashResult(
+                success=True,
+                message=f"Backup of {partition_name} complete"
+            )
+            
+        except OperationCancelled as e:
+            self._remove_partial(output_file)
+            return self._cancelled(e)
+        except (OSError, MediaTekError, GptError) as e:
+            self._remove_partial(output_file)
+            return FlashResult(
+                success=False,
+                message="Backup failed",
+                error=str(e)
+            )
+    
+    def _remove_partial(self, output_file: str):
+        try:
+            os.unlink(output_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove partial backup {output_file}: {e}")
+    
+    def flash_partition(self, partition_name: str, image_file: str,
+                        cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Flash an image to a partition.
+        
+        Args:
+            partition_name: Partition to flash
+            image_file: Image file to flash
+            cancel: Token to abort the flash (checked after every packet)
+            
+        Returns:
+            FlashResult
+        """
+        if not self.session_active:
+            return self._no_session()
+        
+        if not os.path.exists(image_file):
+            return FlashResult(
+                success=False,
+                message="Image file not found",
+                error=f"File does not exist: {image_file}"
+            )
+        
+        logger.info(f"Flashing {partition_name} with {image_file}")
+        try:
+            with open(image_file, "rb", buffering=0) as f:
+                return self.flash_stream(partition_name, f, os.path.getsize(image_file), cancel)
+        except OSError as e:
+            return FlashResult(
+                success=False,
+                message="Flash failed",
+                error=str(e)
+            )
+    
+    def supports_streaming(self) -> bool:
+        return True
+    
+    def flash_stream(self, partition_name: str, source: BinaryIO, size: int,
+                     cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Flash an image read in order from a stream.
+        
+        The next packet is read from `source` on a helper thread while
+        the current one is on the wire.
+        
+        Args:
+            partition_name: Partition to flash
+            source: Image stream
+            size: Image size in bytes
+            cancel: Token to abort the flash (checked after every packet)
+            
+        Returns:
+            FlashResult
+        """
+        if not self.session_active:
+            return self._no_session()
+        
+        try:
+            entry = self._find_entry(partition_name)
+        except (MediaTekTransportError, MediaTekError, GptError) as e:
+            return FlashResult(
+                success=False,
+                message="Flash failed",
+                error=str(e)
+            )
+        if entry is None:
+            return FlashResult(
+                success=False,
+                message="Flash failed",
+                error=f"Partition not in GPT: {partition_name}"
+            )
+        if size > entry.size_bytes(self.sector_size):
+            return FlashResult(
+                success=False,
+                message="Flash failed",
+                error=f"Image ({size} bytes) is larger than {partition_name} "
+                      f"({entry.size_bytes(self.sector_size)} bytes)"
+            )
+        
+        chunk_size = min(self.chunk_size, self.protocol.write_packet_length or self.chunk_size)
+        try:
+            with closing(prefetch_chunks(source, size, chunk_size)) as chunks:
+                self.protocol.write_data(entry.offset(self.sector_size), size, chunks,
+                                         self.storage, PART_USER,
+                                         cancellable_progress(cancel, self.progress))
+            
+            return FlashResult(
+                success=True,
+                message=f"Flash of {partition_name} complete"
+            )
+            
+        except OperationCancelled as e:
+            return self._cancelled(e)
+        except (MediaTekTransportError, MediaTekError, EOFError) as e:
+            # The DA is mid-transfer and will not take another command
+            self._abandon_session()
+            return FlashResult(
+                success=False,
+                message="Flash failed",
+                error=str(e)
+            )
+        except Exception:
+            # The source failed mid-transfer (e.g. a digest mismatch)
+            self._abandon_session()
+            raise
+    
+    def flash_bootloader(self, bootloader_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Flash the LK bootloader on a MediaTek device.
+        
+        The preloader lives in the eMMC boot area, outside the GPT, and
+        is not flashed by this backend.
+        
+        Args:
+            bootloader_file: LK image
+            cancel: Token to abort the flash
+            
+        Returns:
+            FlashResult
+        """
+        return self.flash_partition("lk", bootloader_file, cancel)
+    
+    def get_partition_list(self) -> List[str]:
+        """
+        Get list of partitions from the device GPT.
+        
+        Returns:
+            List of partition names
+        """
+        return [p.name for p in self.get_partition_table()]
+    
+    def get_partition_table(self) -> List[PartitionInfo]:
+        """
+        Get partitions and their sizes from the device GPT.
+        
+        Returns:
+            List of PartitionInfo
+        """
+        if not self.session_active:
+            return []
+        
+        try:
+            entries = self._load_gpt()
+        except (MediaTekTransportError, MediaTekError, GptError) as e:
+            logger.error(f"Error getting partition list: {e}")
+            return []
+        
+        return [
+            PartitionInfo(name=e.name, size=e.size_bytes(self.sector_size))
+            for e in entries
+        ]
+    
+    def end_session(self, reboot: bool = True) -> bool:
+        """
+        Leave the DA, rebooting or powering the device off.
+        
+        Args:
+            reboot: Whether to reboot device
+            
+        Returns:
+            True if successful
+        """
+        success = True
+        
+        if self.session_active:
+            try:
+                self.protocol.shutdown(reboot)
+            except (MediaTekTransportError, MediaTekError) as e:
+                logger.warning(f"Shutting down the MediaTek DA failed: {e}")
+                success = False
+        
+        if self.transport is not None:
+            self.transport.close()
+        
+        self.transport = None
+        self.protocol = None
+        self.hw_code = None
+        self.me_id = None
+        self.session_active = False
+        self._gpt_entries = None
+        return success
+    
+    def abort_session(self):
+        """
+        Let go of the device without shutting the DA down.
+        
+        end_session(reboot=False) would power the device off, and it
+        could not be detected again for a retry.
+        """
+        if self.transport is not None:
+            self.transport.close()
+        
+        self.transport = None
+        self.protocol = None
+        self.hw_code = None
+        self.me_id = None
+        self.session_active = False
+        self._gpt_entries = None
+    
+    def get_backend_name(self) -> str:
+        """Get backend name."""
+        return "MediaTek (BROM/DA)"
+    
+    def supports_device(self, device_info: DeviceInfo) -> bool:
+        """
+        Check if this backend supports the device.
+        
+        Args:
+            device_info: Device information
+            
+        Returns:
+            True if MediaTek device
+        """
+        return device_info.manufacturer.lower() == "mediatek"
@@ -0,0 +1,356 @@
+"""
+SecureOS Flash - MediaTek Protocol
+
+Host side of the two protocols a MediaTek device speaks while flashing:
+
+- the boot ROM (BROM) protocol: a four-byte handshake, then big-endian
+  commands in which every word sent is echoed back, used to identify
+  the chip and to upload and start a download agent (DA)
+- the DA protocol, following the XFlash (DA v6) framing: every message
+  is a packet with a 12-byte header (magic, data type, length); commands
+  and their parameters are acknowledged with a status packet
+
+Only the DA commands flashing needs are implemented: packet length
+negotiation, reading and writing storage by byte address, and shutdown.
+"""
+
+from typing import Callable, Iterable, Optional, Tuple
+import io
+import logging
+import struct
+
+from .transport import MediaTekTransport
+
+
+logger = logging.getLogger(__name__)
+
+
+# BROM handshake: the host sends each byte, the ROM answers its complement
+HANDSHAKE = b"\xA0\x0A\x50\x05"
+
+# BROM commands
+BROM_GET_HW_SW_VER = 0xFC
+BROM_GET_HW_CODE = 0xFD
+BROM_GET_ME_ID = 0xE1
+BROM_SEND_DA = 0xD7
+BROM_JUMP_DA = 0xD5
+
+# Load address of the DA's first stage on most chips
+DEFAULT_DA_ADDRESS = 0x200000
+
+# DA uploads are sent in pieces of this size
+BROM_CHUNK_SIZE = 4096
+
+# XFlash packet header: magic, data type, payload length
+DA_MAGIC = 0xFEEEEEEF
+DA_PROTOCOL_FLOW = 1
+HEADER_FORMAT = "<III"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# First packet the DA sends after it starts ("SYNC")
+DA_SYNC_SIGNAL = 0x434E5953
+
+# DA commands
+DA_WRITE_DATA = 0x010004
+DA_READ_DATA = 0x010005
+DA_SHUTDOWN = 0x010007
+DA_DEVICE_CTRL = 0x010009
+
+# DEVICE_CTRL codes
+CTRL_GET_PACKET_LENGTH = 0x040007
+
+# READ/WRITE_DATA parameters: storage, partition type, address, length
+DATA_PARAMS_FORMAT = "<IIQQ"
+
+# Storage types and the eMMC/UFS user area
+STORAGE_EMMC = 0x1
+STORAGE_UFS = 0x30
+PART_USER = 0x8
+
+# SHUTDOWN modes
+SHUTDOWN_POWER_OFF = 0
+SHUTDOWN_REBOOT = 1
+
+STATUS_OK = 0
+
+ProgressCallback = Callable[[int, int], None]
+
+
+class MediaTekError(Exception):
+    """Raised when the device answers unexpectedly or reports an error"""
+
+
+def checksum16(data) -> int:
+    """XOR of the data's little-endian 16-bit words (BROM upload checksum)."""
+    view = memoryview(data).cast("B")
+    checksum = 0
+    even = len(view) & ~1
+    for word, in struct.iter_unpack("<H", view[:even]):
+        checksum ^= word
+    if len(view) & 1:
+        checksum ^= view[-1]
+    return checksum
+
+
+class MediaTekProtocol:
+    """
+    BROM and DA session over a transport.
+    
+    The BROM methods are valid until jump_da(); after da_sync() only the
+    DA methods are.
+    """
+    
+    def __init__(self, transport: MediaTekTransport, timeout: float = 5.0,
+                 transfer_timeout: float = 30.0):
+        """
+        Initialize protocol.
+        
+        Args:
+            transport: Opened transport
+            timeout: Timeout for commands in seconds
+            transfer_timeout: Timeout for a single data packet in seconds
+        """
+        self.transport = transport
+        self.timeout = timeout
+        self.transfer_timeout = transfer_timeout
+        self.write_packet_length = 0
+        self.read_packet_length = 0
+        self._header = bytearray(HEADER_SIZE)
+    
+    # BROM
+    
+    def _echo(self, data: bytes):
+        """Send BROM bytes and check that they are echoed."""
+        self.transport.write(data, self.timeout)
+        echo = self.transport.read(len(data), self.timeout)
+        if echo != data:
+            raise MediaTekError(f"BROM echoed {echo.hex()} for {data.hex()}")
+    
+    def _brom_status(self, what: str):
+        status, = struct.unpack(">H", self.transport.read(2, self.timeout))
+        if status != STATUS_OK:
+            raise MediaTekError(f"BROM {what} failed with status {status:#06x}")
+    
+    def handshake(self):
+        """
+        Perform the BROM handshake.
+        
+        Raises:
+            MediaTekError: If the device does not answer with the complements
+        """
+        for byte in HANDSHAKE:
+            self.transport.write(bytes([byte]), self.timeout)
+            reply = self.transport.read(1, self.timeout)
+            if reply[0] != byte ^ 0xFF:
+                raise MediaTekError(f"Handshake failed (got {reply.hex()} for {byte:02x})")
+    
+    def get_hw_code(self) -> Tuple[int, int]:
+        """
+        Read the chip's hardware code.
+        
+        Returns:
+            (hw code, status)
+        """
+        self._echo(bytes([BROM_GET_HW_CODE]))
+        return struct.unpack(">HH", self.transport.read(4, self.timeout))
+    
+    def get_me_id(self) -> bytes:
+        """
+        Read the chip's ME ID, a per-chip unique identifier.
+        
+        Returns:
+            ME ID bytes (usually 16; empty if the chip has none)
+            
+        Raises:
+            MediaTekError: If the ROM reports an error
+        """
+        self._echo(bytes([BROM_GET_ME_ID]))
+        length, = struct.unpack(">I", self.transport.read(4, self.timeout))
+        if length > 64:
+            raise MediaTekError(f"Implausible ME ID length {length}")
+        me_id = self.transport.read(length, self.timeout) if length else b""
+        self._brom_status("GET_ME_ID")
+        return me_id
+    
+    def send_da(self, data: bytes, address: int = DEFAULT_DA_ADDRESS, signature_length: int = 0):
+        """
+        Upload a download agent stage to device RAM.
+        
+        Args:
+            data: DA stage image (signature included)
+            address: Load address
+            signature_length: Bytes of signature at the end of `data`
+            
+        Raises:
+            MediaTekError: If the ROM rejects the upload or the checksum differs
+        """
+        self._echo(bytes([BROM_SEND_DA]))
+        self._echo(struct.pack(">I", address))
+        self._echo(struct.pack(">I", len(data)))
+        self._echo(struct.pack(">I", signature_length))
+        self._brom_status("SEND_DA")
+        
+        view = memoryview(data)
+        for offset in range(0, len(view), BROM_CHUNK_SIZE):
+            self.transport.write(view[offset:offset + BROM_CHUNK_SIZE], self.transfer_timeout)
+        
+        checksum, = struct.unpack(">H", self.transport.read(2, self.transfer_timeout))
+        if checksum != checksum16(data):
+            raise MediaTekError(f"DA upload checksum mismatch ({checksum:#06x} != {checksum16(data):#06x})")
+        self._brom_status("SEND_DA")
+        logger.debug(f"Uploaded {len(data)} byte DA to {address:#x}")
+    
+    def jump_da(self, address: int = DEFAULT_DA_ADDRESS):
+        """
+        Start the uploaded DA.
+        
+        Args:
+            address: Address the DA was loaded at
+        """
+        self._echo(bytes([BROM_JUMP_DA]))
+        self._echo(struct.pack(">I", address))
+        self._brom_status("JUMP_DA")
+    
+    # DA
+    
+    def _send_packet(self, payload, timeout: Optional[float] = None):
+        struct.pack_into(HEADER_FORMAT, self._header, 0, DA_MAGIC, DA_PROTOCOL_FLOW, len(payload))
+        self.transport.write(self._header, timeout or self.timeout)
+        self.transport.write(payload, timeout or self.timeout)
+    
+    def _receive_packet(self, timeout: Optional[float] = None) -> bytes:
+        magic, data_type, length = struct.unpack(
+            HEADER_FORMAT, self.transport.read(HEADER_SIZE, timeout or self.timeout)
+        )
+        if magic != DA_MAGIC:
+            raise MediaTekError(f"Bad DA packet magic {magic:#010x}")
+        if data_type != DA_PROTOCOL_FLOW:
+            raise MediaTekError(f"Unexpected DA packet type {data_type}")
+        return self.transport.read(length, timeout or self.timeout)
+    
+    def _receive_status(self, what: str, timeout: Optional[float] = None):
+        payload = self._receive_packet(timeout)
+        if len(payload) < 4:
+            raise MediaTekError(f"Short DA status for {what} ({len(payload)} bytes)")
+        status, = struct.unpack_from("<I", payload, 0)
+        if status != STATUS_OK:
+            raise MediaTekError(f"DA {what} failed with status {status:#010x}")
+    
+    def _command(self, command: int, params: Optional[bytes] = None, what: str = ""):
+        """Send a DA command and its parameters, checking both acknowledgements."""
+        what = what or f"command {command:#08x}"
+        self._send_packet(struct.pack("<I", command))
+        self._receive_status(what)
+        if params is not None:
+            self._send_packet(params)
+            self._receive_status(what)
+    
+    def da_sync(self):
+        """
+        Wait for the DA's SYNC packet after jump_da() and negotiate
+        packet lengths.
+        
+        Raises:
+            MediaTekError: If the DA does not start
+        """
+        payload = self._receive_packet(self.transfer_timeout)
+        if payload[:4] != struct.pack("<I", DA_SYNC_SIGNAL):
+            raise MediaTekError(f"DA did not sync (got {payload[:4].hex()})")
+        
+        self._command(DA_DEVICE_CTRL, what="DEVICE_CTRL")
+        self._send_packet(struct.pack("<I", CTRL_GET_PACKET_LENGTH))
+        self._receive_status("GET_PACKET_LENGTH")
+        self.write_packet_length, self.read_packet_length = struct.unpack(
+            "<II", self._receive_packet()[:8]
+        )
+        self._receive_status("GET_PACKET_LENGTH")
+        logger.debug(
+            f"DA packet lengths: {self.write_packet_length} write, {self.read_packet_length} read"
+        )
+    
+    def write_data(self, address: int, length: int, chunks: Iterable,
+                   storage: int = STORAGE_EMMC, partition_type: int = PART_USER,
+                   progress: Optional[ProgressCallback] = None):
+        """
+        Write to storage.
+        
+        Each chunk is sent as one packet and acknowledged by the DA;
+        chunks must not exceed write_packet_length.
+        
+        Args:
+            address: Byte offset in the storage area
+            length: Total bytes to write
+            chunks: Buffers holding exactly `length` bytes in order
+            storage: Storage type
+            partition_type: Storage area (user, boot1, ...)
+            progress: Called with (bytes done, total bytes) after each chunk
+            
+        Raises:
+            MediaTekError: If the DA rejects the write or a chunk
+        """
+        self._command(DA_WRITE_DATA,
+                      struct.pack(DATA_PARAMS_FORMAT, storage, partition_type, address, length),
+                      what="WRITE_DATA")
+        done = 0
+        for chunk in chunks:
+            if done + len(chunk) > length:
+                raise MediaTekError(f"More than {length} bytes of data for WRITE_DATA")
+            self._send_packet(chunk, self.transfer_timeout)
+            self._receive_status("WRITE_DATA", self.transfer_timeout)
+            done += len(chunk)
+            if progress:
+                progress(done, length)
+        
+        if done != length:
+            raise MediaTekError(f"WRITE_DATA got {done} of {length} bytes")
+        self._receive_status("WRITE_DATA")
+    
+    def read_data(self, address: int, length: int, sink,
+                  storage: int = STORAGE_EMMC, partition_type: int = PART_USER,
+                  progress: Optional[ProgressCallback] = None):
+        """
+        Read from storage.
+        
+        Args:
+            address: Byte offset in the storage area
+            length: Bytes to read
+            sink: Object with write(), receiving the data in order
+            storage: Storage type
+            partition_type: Storage area (user, boot1, ...)
+            progress: Called with (bytes done, total bytes) after each packet
+            
+        Raises:
+            MediaTekError: If the DA rejects the read
+        """
+        self._command(DA_READ_DATA,
+                      struct.pack(DATA_PARAMS_FORMAT, storage, partition_type, address, length),
+                      what="READ_DATA")
+        ack = struct.pack("<I", STATUS_OK)
+        done = 0
+        while done < length:
+            data = self._receive_packet(self.transfer_timeout)
+            if not data or done + len(data) > length:
+                raise MediaTekError(f"Bad READ_DATA packet of {len(data)} bytes at {done}/{length}")
+            self._send_packet(ack)
+            sink.write(data)
+            done += len(data)
+            if progress:
+                progress(done, length)
+        self._receive_status("READ_DATA")
+    
+    def read_bytes(self, address: int, length: int,
+                   storage: int = STORAGE_EMMC, partition_type: int = PART_USER) -> bytes:
+        """Read a small region of storage into memory."""
+        sink = io.BytesIO()
+        self.read_data(address, length, sink, storage, partition_type)
+        return sink.getvalue()
+    
+    def shutdown(self, reboot: bool = True):
+        """
+        Leave the DA, rebooting or powering the device off.
+        
+        Args:
+            reboot: Reboot instead of powering off
+        """
+        mode = SHUTDOWN_REBOOT if reboot else SHUTDOWN_POWER_OFF
+        self._command(DA_SHUTDOWN, struct.pack("<I", mode), what="SHUTDOWN")
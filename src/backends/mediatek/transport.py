@@ -0,0 +1,280 @@
+"""
+SecureOS Flash - MediaTek Transports
+
+Byte streams the MediaTek backend talks through. The boot ROM, the
+preloader and the download agent all enumerate as USB CDC devices;
+UsbMediaTekTransport drives their bulk endpoints through pyusb, and
+LocalTransport (see fake.py) connects to an in-memory fake device.
+"""
+
+from abc import ABC, abstractmethod
+from typing import List, Optional
+import logging
+
+from ...utils.usb import port_path, serial_number
+
+
+logger = logging.getLogger(__name__)
+
+
+# MediaTek USB Vendor ID
+MEDIATEK_VID = 0x0E8D
+
+# Product IDs: boot ROM, preloader, download agent
+BROM_PID = 0x0003
+PRELOADER_PID = 0x2000
+DA_PID = 0x2001
+MEDIATEK_PIDS = (BROM_PID, PRELOADER_PID, DA_PID)
+
+# USB CDC data interface class
+CDC_DATA_CLASS = 0x0A
+
+# Bulk read size (responses are split across reads as needed)
+READ_SIZE = 64 * 1024
+
+
+class MediaTekTransportError(IOError):
+    """Raised when the transport fails or times out"""
+
+
+class MediaTekTransport(ABC):
+    """
+    Bidirectional byte stream to a MediaTek device.
+    
+    Unlike the Odin transport this is stream oriented: read() returns
+    exactly the bytes asked for, however the device split them.
+    """
+    
+    @abstractmethod
+    def open(self) -> bool:
+        """
+        Open the device.
+        
+        Returns:
+            True if a device was found and claimed
+        """
+        pass
+    
+    @abstractmethod
+    def close(self):
+        """Release the device."""
+        pass
+    
+    @abstractmethod
+    def write(self, data, timeout: float):
+        """
+        Send bytes.
+        
+        Args:
+            data: Bytes-like object to send
+            timeout: Timeout in seconds
+            
+        Raises:
+            MediaTekTransportError: On failure or timeout
+        """
+        pass
+    
+    @abstractmethod
+    def read(self, size: int, timeout: float) -> bytes:
+        """
+        Receive exactly `size` bytes.
+        
+        Args:
+            size: Bytes to read
+            timeout: Timeout in seconds for each underlying read
+            
+        Returns:
+            The bytes read
+            
+        Raises:
+            MediaTekTransportError: On failure or timeout
+        """
+        pass
+    
+    @property
+    def device_path(self) -> str:
+        """Stable identifier for the physical port the device is on"""
+        return "unknown"
+    
+    @property
+    def product_id(self) -> Optional[int]:
+        """USB product ID of the opened device"""
+        return None
+    
+    @property
+    def serial_number(self) -> Optional[str]:
+        """USB serial number of the opened device, None if it reports none"""
+        return None
+
+
+class UsbMediaTekTransport(MediaTekTransport):
+    """
+    MediaTek transport over pyusb (libusb).
+    
+    pyusb is only imported when a device is opened, so the rest of
+    SecureOS Flash keeps working without it.
+    """
+    
+    def __init__(self, product_ids: Optional[List[int]] = None,
+                 bus: Optional[int] = None, address: Optional[int] = None,
+                 port: Optional[str] = None):
+        """
+        Initialize pyusb transport.
+        
+        Args:
+            product_ids: Accepted product IDs (None = MEDIATEK_PIDS)
+            bus: Only open a device on this USB bus
+            address: Only open the device with this address
+            port: Only open the device on this port path (e.g. "usb-1-2.3");
+                  unlike the address it survives re-enumeration
+        """
+        self.product_ids = tuple(product_ids or MEDIATEK_PIDS)
+        self.bus = bus
+        self.address = address
+        self.port = port
+        self._usb = None
+        self._device = None
+        self._interface = None
+        self._ep_in = None
+        self._ep_out = None
+        self._serial: Optional[str] = None
+        self._detached_kernel_driver = False
+        self._pending = bytearray()
+    
+    def open(self) -> bool:
+        try:
+            import usb.core
+            import usb.util
+        except ImportError:
+            logger.error("pyusb is not installed - MediaTek transport unavailable")
+            return False
+        
+        def wanted(d):
+            return (
+                d.idProduct in self.product_ids
+                and (self.bus is None or d.bus == self.bus)
+                and (self.address is None or d.address == self.address)
+                and (self.port is None or port_path(d) == self.port)
+            )
+        
+        device = usb.core.find(idVendor=MEDIATEK_VID, custom_match=wanted)
+        if device is None:
+            return False
+        
+        try:
+            try:
+                device.set_configuration()
+            except usb.core.USBError:
+                pass  # Already configured
+            
+            interface = self._find_data_interface(device, usb.util)
+            if interface is None:
+                logger.error("No CDC data interface with bulk endpoints found")
+                return False
+            
+            number = interface.bInterfaceNumber
+            if device.is_kernel_driver_active(number):
+                device.detach_kernel_driver(number)
+                self._detached_kernel_driver = True
+            usb.util.claim_interface(device, number)
+            
+        except usb.core.USBError as e:
+            logger.error(f"Could not claim MediaTek interface: {e}")
+            return False
+        
+        self._usb = usb
+        self._device = device
+        self._interface = interface
+        self._serial = serial_number(device)
+        self._pending.clear()
+        return True
+    
+    @staticmethod
+    def enumerate(product_ids: Optional[List[int]] = None) -> List[str]:
+        """
+        Attached MediaTek devices in BROM, preloader or DA mode.
+        
+        Args:
+            product_ids: Accepted product IDs (None = MEDIATEK_PIDS)
+            
+        Returns:
+            Port paths, empty if pyusb is not installed
+        """
+        try:
+            import usb.core
+        except ImportError:
+            return []
+        
+        wanted = tuple(product_ids or MEDIATEK_PIDS)
+        devices = usb.core.find(find_all=True, idVendor=MEDIATEK_VID,
+                                custom_match=lambda d: d.idProduct in wanted)
+        return [port_path(device) for device in devices]
+    
+    def _find_data_interface(self, device, util):
+        for interface in device.get_active_configuration():
+            if interface.bInterfaceClass != CDC_DATA_CLASS:
+                continue
+            
+            ep_in = ep_out = None
+            for ep in interface:
+                if util.endpoint_type(ep.bmAttributes) != util.ENDPOINT_TYPE_BULK:
+                    continue
+                if util.endpoint_direction(ep.bEndpointAddress) == util.ENDPOINT_IN:
+                    ep_in = ep
+                else:
+                    ep_out = ep
+            
+            if ep_in is not None and ep_out is not None:
+                self._ep_in, self._ep_out = ep_in, ep_out
+                return interface
+        
+        return None
+    
+    def close(self):
+        if self._device is None:
+            return
+        
+        util = self._usb.util
+        number = self._interface.bInterfaceNumber
+        try:
+            util.release_interface(self._device, number)
+            if self._detached_kernel_driver:
+                self._device.attach_kernel_driver(number)
+        except self._usb.core.USBError as e:
+            logger.debug(f"Error releasing MediaTek interface: {e}")
+        finally:
+            util.dispose_resources(self._device)
+            self._device = None
+    
+    def write(self, data, timeout: float):
+        try:
+            self._ep_out.write(data, int(timeout * 1000))
+        except self._usb.core.USBError as e:
+            raise MediaTekTransportError(f"USB write failed: {e}") from e
+    
+    def read(self, size: int, timeout: float) -> bytes:
+        while len(self._pending) < size:
+            try:
+                data = self._ep_in.read(max(READ_SIZE, size - len(self._pending)),
+                                        int(timeout * 1000))
+            except self._usb.core.USBError as e:
+                raise MediaTekTransportError(f"USB read failed: {e}") from e
+            self._pending += data.tobytes()
+        
+        result = bytes(self._pending[:size])
+        del self._pending[:size]
+        return result
+    
+    @property
+    def device_path(self) -> str:
+        if self._device is None:
+            return "unknown"
+        return port_path(self._device)
+    
+    @property
+    def product_id(self) -> Optional[int]:
+        return self._device.idProduct if self._device is not None else None
+    
+    @property
+    def serial_number(self) -> Optional[str]:
+        return self._serial if self._device is not None else None
@@ -0,0 +1,9 @@
+"""Native Odin backend package"""
+from .odin_backend import OdinBackend
+from .transport import OdinTransport, PyUSBTransport, TransportError
+from .loopback import FakeOdinDevice, LoopbackTransport
+
+__all__ = [
+    'OdinBackend', 'OdinTransport', 'PyUSBTransport', 'TransportError',
+    'FakeOdinDevice', 'LoopbackTransport'
+]
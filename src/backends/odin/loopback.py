@@ -0,0 +1,227 @@
+"""
+SecureOS Flash - Odin Loopback Device
+
+In-memory Download Mode device that speaks the device side of the Odin
+protocol. LoopbackTransport connects the native Odin backend to it, so
+the whole backend can be exercised without hardware.
+"""
+
+from collections import deque
+from typing import Deque, Dict, List, Optional
+import struct
+
+from ..samsung.pit import PitEntry, build_pit
+from . import protocol as odin
+from .transport import OdinTransport, TransportError
+
+
+class FakeOdinDevice:
+    """
+    Scriptable Odin device with in-memory partitions.
+    
+    Partitions are created from PIT entries; their contents start zeroed
+    and can be read back through `partitions`.
+    """
+    
+    def __init__(self, pit_entries: List[PitEntry], block_size: int = 512,
+                 large_packets: bool = True, serial: Optional[str] = "FAKE0001"):
+        """
+        Initialize fake device.
+        
+        Args:
+            pit_entries: Partition table the device reports
+            block_size: Bytes per PIT block
+            large_packets: Advertise large file part support
+            serial: USB serial number (None = the device reports none)
+        """
+        self.pit_entries = pit_entries
+        self.serial = serial
+        self.pit = build_pit(pit_entries)
+        self.large_packets = large_packets
+        self.partitions: Dict[int, bytearray] = {
+            e.identifier: bytearray(e.block_count * block_size) for e in pit_entries
+        }
+        self.packet_size = odin.LARGE_PACKET_SIZE if large_packets else odin.DEFAULT_PACKET_SIZE
+        self.total_bytes = 0
+        self.rebooted = False
+        self.session_ended = False
+        self.handshakes = 0
+        
+        self._responses: Deque[bytes] = deque()
+        self._connected = False
+        self._expect_parts = 0
+        self._part_index = 0
+        self._sequence = bytearray()
+        self._flash_buffer = bytearray()
+        self._dump_target: Optional[bytearray] = None
+    
+    def partition(self, name: str) -> bytearray:
+        """
+        Get the contents of a partition by name.
+        
+        Args:
+            name: Partition name
+            
+        Returns:
+            Partition contents
+        """
+        for e in self.pit_entries:
+            if e.partition_name.upper() == name.upper():
+                return self.partitions[e.identifier]
+        raise KeyError(name)
+    
+    def receive(self, data: bytes):
+        """Handle one bulk transfer from the host."""
+        if not self._connected:
+            if data == odin.HANDSHAKE:
+                self._connected = True
+                self.handshakes += 1
+                self._responses.append(odin.HANDSHAKE_REPLY)
+            return
+        
+        if self._expect_parts:
+            self._sequence += data
+            self._responses.append(struct.pack("<II", 0, self._part_index))
+            self._part_index += 1
+            self._expect_parts -= 1
+            return
+        
+        if not data:
+            return  # Zero-length packet
+        
+        control_type, request = struct.unpack_from("<II", data, 0)
+        args = struct.unpack_from("<7I", data, 8)
+        handler = {
+            odin.CONTROL_SESSION: self._session,
+            odin.CONTROL_PIT: self._pit,
+            odin.CONTROL_FILE: self._file,
+            odin.CONTROL_END: self._end,
+        }.get(control_type)
+        
+        if handler is None:
+            raise TransportError(f"Fake device: unknown control type {control_type:#x}")
+        handler(request, args)
+    
+    def respond(self) -> bytes:
+        """Next transfer from device to host."""
+        if not self._responses:
+            raise TransportError("Fake device: read with no pending response")
+        return self._responses.popleft()
+    
+    def _ok(self, control_type: int, result: int = 0):
+        self._responses.append(struct.pack("<II", control_type, result))
+    
+    def _session(self, request: int, args: tuple):
+        if request == odin.SESSION_BEGIN:
+            self._ok(odin.CONTROL_SESSION, self.packet_size if self.large_packets else 0)
+        elif request == odin.SESSION_FILE_PART_SIZE:
+            self.packet_size = args[0]
+            self._ok(odin.CONTROL_SESSION)
+        elif request == odin.SESSION_TOTAL_BYTES:
+            self.total_bytes = args[0] | args[1] << 32
+            self._ok(odin.CONTROL_SESSION)
+        else:
+            self._ok(odin.CONTROL_SESSION)
+    
+    def _pit(self, request: int, args: tuple):
+        if request == odin.TRANSFER_DUMP:
+            self._ok(odin.CONTROL_PIT, len(self.pit))
+        elif request == odin.TRANSFER_PART:
+            offset = args[0] * odin.PIT_PART_SIZE
+            self._responses.append(self.pit[offset:offset + odin.PIT_PART_SIZE])
+        else:
+            self._ok(odin.CONTROL_PIT)
+    
+    def _file(self, request: int, args: tuple):
+        if request == odin.TRANSFER_FLASH:
+            self._flash_buffer = bytearray()
+            self._dump_target = None
+            self._ok(odin.CONTROL_FILE)
+            
+        elif request == odin.TRANSFER_DUMP:
+            self._dump_target = self.partitions[args[1]]
+            self._ok(odin.CONTROL_FILE, len(self._dump_target))
+            
+        elif request == odin.TRANSFER_PART and self._dump_target is not None:
+            offset = args[0] * self.packet_size
+            chunk = self._dump_target[offset:offset + self.packet_size]
+            self._responses.append(bytes(chunk).ljust(self.packet_size, b"\0"))
+            
+        elif request == odin.TRANSFER_PART:
+            sequence_size = args[0]
+            self._expect_parts = (sequence_size + self.packet_size - 1) // self.packet_size
+            self._part_index = 0
+            self._sequence = bytearray()
+            self._ok(odin.CONTROL_FILE)
+            
+        elif request == odin.TRANSFER_END and self._dump_target is not None:
+            self._dump_target = None
+            self._ok(odin.CONTROL_FILE)
+            
+        elif request == odin.TRANSFER_END:
+            _destination, sequence_size, _unknown, _device_type, identifier, end_of_file = args[:6]
+            self._flash_buffer += self._sequence[:sequence_size]
+            if end_of_file:
+                target = self.partitions[identifier]
+                target[:len(self._flash_buffer)] = self._flash_buffer
+            self._ok(odin.CONTROL_FILE)
+    
+    def _end(self, request: int, args: tuple):
+        if request == odin.END_SESSION:
+            self.session_ended = True
+        elif request == odin.END_REBOOT:
+            self.rebooted = True
+            self._connected = False
+        self._ok(odin.CONTROL_END)
+
+
+class LoopbackTransport(OdinTransport):
+    """Transport connected to a FakeOdinDevice in the same process"""
+    
+    def __init__(self, device: FakeOdinDevice, path: str = "loopback-0"):
+        """
+        Initialize loopback transport.
+        
+        Args:
+            device: Fake device to talk to
+            path: Device path reported to the backend
+        """
+        self.device = device
+        self.path = path
+        self.is_open = False
+        self.bytes_written = 0
+    
+    def open(self) -> bool:
+        self.is_open = True
+        return True
+    
+    def close(self):
+        self.is_open = False
+    
+    def write(self, data, timeout: float) -> int:
+        if not self.is_open:
+            raise TransportError("Transport closed")
+        payload = bytes(data)
+        self.device.receive(payload)
+        self.bytes_written += len(payload)
+        return len(payload)
+    
+    def read_into(self, buffer, timeout: float) -> int:
+        if not self.is_open:
+            raise TransportError("Transport closed")
+        data = self.device.respond()
+        n = min(len(buffer), len(data))
+        memoryview(buffer)[:n] = data[:n]
+        return n
+    
+    @property
+    def device_path(self) -> str:
+        return self.path
+    
+    @property
+    def product_id(self) -> Optional[int]:
+        return 0x685D
+    
+    @property
+    def serial_number(self) -> Optional[str]:
+        return self.device.serial
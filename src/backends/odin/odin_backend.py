@@ -0,0 +1,425 @@
+"""
+SecureOS Flash - Native Odin Backend
+
+Flashes Samsung devices in Download Mode by speaking the Odin protocol
+directly over a pluggable transport, instead of spawning heimdall.
+Gives byte-level progress and tunable transfer sizes.
+"""
+
+import logging
+import os
+from typing import BinaryIO, Callable, List, Optional
+
+from ...core.flash_backend import (
+    FlashBackend, DeviceInfo, FlashResult, PartitionInfo, UNKNOWN_MODEL
+)
+from ...core.cancellation import CancellationToken, OperationCancelled, cancellable_progress
+from ..samsung.pit import PitEntry, PitError, parse_pit, DEFAULT_BLOCK_SIZE
+from .protocol import (
+    OdinProtocol, OdinProtocolError, LARGE_PACKET_SIZE, MAX_DUMP_SIZE, ProgressCallback
+)
+from .transport import OdinTransport, PyUSBTransport, TransportError, SAMSUNG_VID
+
+
+logger = logging.getLogger(__name__)
+
+
+class OdinBackend(FlashBackend):
+    """
+    Samsung flash backend using a native Odin protocol implementation.
+    
+    Transfer sizes default to what the device negotiates; packet_size and
+    sequence_packets override them for tuning.
+    """
+    
+    def __init__(self, transport_factory: Optional[Callable[[], OdinTransport]] = None,
+                 packet_size: int = LARGE_PACKET_SIZE,
+                 sequence_packets: Optional[int] = None,
+                 block_size: int = DEFAULT_BLOCK_SIZE,
+                 progress: Optional[ProgressCallback] = None):
+        """
+        Initialize native Odin backend.
+        
+        Args:
+            transport_factory: Creates the transport to use (None = pyusb)
+            packet_size: File part size to request from the device
+            sequence_packets: Parts per transfer sequence (None = protocol default)
+            block_size: Storage block size used by PIT entries
+            progress: Called with (bytes done, total bytes) during transfers
+        """
+        self.transport_factory = transport_factory or PyUSBTransport
+        self.packet_size = packet_size
+        self.sequence_packets = sequence_packets
+        self.block_size = block_size
+        self.progress = progress
+        
+        self.transport: Optional[OdinTransport] = None
+        self.protocol: Optional[OdinProtocol] = None
+        self.session_active = False
+        self._pit_entries: Optional[List[PitEntry]] = None
+    
+    def detect_device(self) -> Optional[DeviceInfo]:
+        """
+        Detect Samsung device in Download Mode.
+        
+        Returns:
+            DeviceInfo if a device answered, None otherwise
+        """
+        if self.transport is None:
+            transport = self.transport_factory()
+            try:
+                if not transport.open():
+                    return None
+            except Exception as e:
+                logger.error(f"Error opening Odin transport: {e}")
+                return None
+            self.transport = transport
+        
+        logger.info(f"Samsung device detected on {self.transport.device_path}")
+        product_id = self.transport.product_id
+        
+        return DeviceInfo(
+            manufacturer="Samsung",
+            model=UNKNOWN_MODEL,
+            device_id=f"samsung-{self.transport.device_path}",
+            usb_vendor_id=f"{SAMSUNG_VID:04x}",
+            usb_product_id=f"{product_id:04x}" if product_id is not None else "unknown",
+            bootloader_locked=False,  # In download mode = unlocked
+            oem_unlock_enabled=True,
+            usb_debugging_enabled=True,
+            usb_path=self.transport.device_path,
+            serial=self.transport.serial_number
+        )
+    
+    def discover(self) -> List[FlashBackend]:
+        """
+        One backend per attached Download Mode device.
+        
+        Only the default pyusb transport can be enumerated; a backend with
+        a custom transport factory stands for its one device.
+        
+        Returns:
+            List of backends
+        """
+        if self.transport_factory is not PyUSBTransport:
+            return [self]
+        
+        return [
+            OdinBackend(
+                lambda port=port: PyUSBTransport(port=port),
+                packet_size=self.packet_size,
+                sequence_packets=self.sequence_packets,
+                block_size=self.block_size,
+                progress=self.progress
+            )
+            for port in PyUSBTransport.enumerate()
+        ]
+    
+    def init_session(self) -> bool:
+        """
+        Perform the Odin handshake and begin a session.
+        
+        Returns:
+            True if session started
+        """
+        if self.transport is None:
+            logger.error("No Samsung device connected")
+            return False
+        
+        protocol = OdinProtocol(
+            self.transport,
+            packet_size=self.packet_size,
+            sequence_packets=self.sequence_packets
+        )
+        
+        try:
+            protocol.handshake()
+            protocol.begin_session()
+        except (TransportError, OdinProtocolError) as e:
+            logger.error(f"Odin session failed: {e}")
+            return False
+        
+        self.protocol = protocol
+        self.session_active = True
+        return True
+    
+    def _no_session(self) -> FlashResult:
+        return FlashResult(
+            success=False,
+            message="No active session",
+            error="Call init_session() first"
+        )
+    
+    def _abandon_session(self):
+        """
+        Drop the session after a transfer was cut short.
+        
+        The device is left mid-sequence, so the transport is released
+        rather than ending the session cleanly; the device needs a
+        reconnect (or reboot) before the next session.
+        """
+        if self.transport is not None:
+            self.transport.close()
+        self.transport = None
+        self.protocol = None
+        self.session_active = False
+        self._pit_entries = None
+    
+    def _cancelled(self, e: OperationCancelled) -> FlashResult:
+        """Abandon the session after a cancelled transfer."""
+        self._abandon_session()
+        return FlashResult(
+            success=False,
+            message="Cancelled",
+            error=str(e) or "Cancelled by user",
+            cancelled=True
+        )
+    
+    def _find_entry(self, partition_name: str) -> Optional[PitEntry]:
+        for entry in self._load_pit():
+            if entry.partition_name.upper() == partition_name.upper():
+                return entry
+        return None
+    
+    def _load_pit(self) -> List[PitEntry]:
+        if self._pit_entries is None:
+            self._pit_entries = parse_pit(self.protocol.dump_pit())
+        return self._pit_entries
+    
+    def backup_partition(self, partition_name: str, output_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Read a partition from the device.
+        
+        Args:
+            partition_name: Partition to backup
+            output_file: Where to save backup
+            cancel: Token to abort the backup (checked after every part)
+            
+        Returns:
+            FlashResult
+        """
+        if not self.session_active:
+            return self._no_session()
+        
+        try:
+            entry = self._find_entry(partition_name)
+            if entry is None:
+                return FlashResult(
+                    success=False,
+                    message="Backup failed",
+                    error=f"Partition not in PIT: {partition_name}"
+                )
+            
+            size = entry.size_bytes(self.block_size)
+            if size > MAX_DUMP_SIZE:
+                # The device reports the dump size as a uint32
+                return FlashResult(
+                    success=False,
+                    message="Backup failed",
+                    error=f"Partition too large to dump over Odin: {partition_name} ({size} bytes)"
+                )
+            
+            logger.info(f"Backing up {partition_name} to {output_file}")
+            with open(output_file, "wb") as f:
+                self.protocol.dump(f, entry.device_type, entry.identifier,
+                                   cancellable_progress(cancel, self.progress))
+            
+            return FlashResult(
+                success=True,
+                message=f"Backup of {partition_name} complete"
+            )
+            
+        except OperationCancelled as e:
+            self._remove_partial(output_file)
+            return self._cancelled(e)
+        except (OSError, TransportError, OdinProtocolError, PitError) as e:
+            self._remove_partial(output_file)
+            return FlashResult(
+                success=False,
+                message="Backup failed",
+                error=str(e)
+            )
+    
+    def _remove_partial(self, output_file: str):
+        try:
+            os.unlink(output_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove partial backup {output_file}: {e}")
+    
+    def flash_partition(self, partition_name: str, image_file: str,
+                        cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Flash an image to a partition.
+        
+        Args:
+            partition_name: Partition to flash
+            image_file: Image file to flash
+            cancel: Token to abort the flash (checked after every part)
+            
+        Returns:
+            FlashResult
+        """
+        if not self.session_active:
+            return self._no_session()
+        
+        if not os.path.exists(image_file):
+            return FlashResult(
+                success=False,
+                message="Image file not found",
+                error=f"File does not exist: {image_file}"
+            )
+        
+        logger.info(f"Flashing {partition_name} with {image_file}")
+        try:
+            with open(image_file, "rb", buffering=0) as f:
+                return self.flash_stream(partition_name, f, os.path.getsize(image_file), cancel)
+        except OSError as e:
+            return FlashResult(
+                success=False,
+                message="Flash failed",
+                error=str(e)
+            )
+    
+    def supports_streaming(self) -> bool:
+        return True
+    
+    def flash_stream(self, partition_name: str, source: BinaryIO, size: int,
+                     cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Flash an image read in order from a stream.
+        
+        Args:
+            partition_name: Partition to flash
+            source: Image stream
+            size: Image size in bytes
+            cancel: Token to abort the flash (checked after every part)
+            
+        Returns:
+            FlashResult
+        """
+        if not self.session_active:
+            return self._no_session()
+        
+        try:
+            entry = self._find_entry(partition_name)
+            if entry is None:
+                return FlashResult(
+                    success=False,
+                    message="Flash failed",
+                    error=f"Partition not in PIT: {partition_name}"
+                )
+            
+            self.protocol.set_total_bytes(size)
+            self.protocol.flash(source, size, entry.device_type, entry.identifier,
+                                progress=cancellable_progress(cancel, self.progress))
+            
+            return FlashResult(
+                success=True,
+                message=f"Flash of {partition_name} complete"
+            )
+            
+        except OperationCancelled as e:
+            return self._cancelled(e)
+        except (TransportError, OdinProtocolError, PitError) as e:
+            return FlashResult(
+                success=False,
+                message="Flash failed",
+                error=str(e)
+            )
+        except Exception:
+            # The source failed mid-transfer (e.g. a digest mismatch)
+            self._abandon_session()
+            raise
+    
+    def flash_bootloader(self, bootloader_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Flash bootloader on Samsung device.
+        
+        Args:
+            bootloader_file: Bootloader image
+            cancel: Token to abort the flash
+            
+        Returns:
+            FlashResult
+        """
+        return self.flash_partition("BOOTLOADER", bootloader_file, cancel)
+    
+    def get_partition_list(self) -> List[str]:
+        """
+        Get list of partitions from the device PIT.
+        
+        Returns:
+            List of partition names
+        """
+        return [p.name for p in self.get_partition_table()]
+    
+    def get_partition_table(self) -> List[PartitionInfo]:
+        """
+        Get partitions and their sizes from the device PIT.
+        
+        Returns:
+            List of PartitionInfo
+        """
+        if not self.session_active:
+            return []
+        
+        try:
+            entries = self._load_pit()
+        except (TransportError, OdinProtocolError, PitError) as e:
+            logger.error(f"Error getting partition list: {e}")
+            return []
+        
+        return [
+            PartitionInfo(name=e.partition_name, size=e.size_bytes(self.block_size),
+                          file_name=e.flash_filename or None)
+            for e in entries
+            if e.partition_name and e.block_count
+        ]
+    
+    def end_session(self, reboot: bool = True) -> bool:
+        """
+        End the Odin session and optionally reboot.
+        
+        Args:
+            reboot: Whether to reboot device
+            
+        Returns:
+            True if successful
+        """
+        success = True
+        
+        if self.session_active:
+            try:
+                self.protocol.end_session(reboot)
+            except (TransportError, OdinProtocolError) as e:
+                logger.warning(f"Ending Odin session failed: {e}")
+                success = False
+        
+        if self.transport is not None:
+            self.transport.close()
+        
+        self.transport = None
+        self.protocol = None
+        self.session_active = False
+        self._pit_entries = None
+        return success
+    
+    def get_backend_name(self) -> str:
+        """Get backend name."""
+        return "Samsung (Native Odin)"
+    
+    def supports_device(self, device_info: DeviceInfo) -> bool:
+        """
+        Check if this backend supports the device.
+        
+        Args:
+            device_info: Device information
+            
+        Returns:
+            True if Samsung device
+        """
+        return device_info.manufacturer.lower() == "samsung"
@@ -0,0 +1,333 @@
+"""
+SecureOS Flash - Odin Protocol
+
+Host side of the Samsung Odin (Loke) Download Mode protocol, following
+Heimdall's packet layouts. All packets are built in preallocated buffers;
+file data is read straight into the transfer buffer and sent without
+intermediate copies.
+"""
+
+from typing import BinaryIO, Callable, Optional
+import logging
+import struct
+
+from .transport import OdinTransport
+
+
+logger = logging.getLogger(__name__)
+
+
+HANDSHAKE = b"ODIN"
+HANDSHAKE_REPLY = b"LOKE"
+
+# Control packets are always this size; responses are two uint32s
+CONTROL_PACKET_SIZE = 1024
+RESPONSE_SIZE = 8
+
+# Control packet types
+CONTROL_SESSION = 0x64
+CONTROL_PIT = 0x65
+CONTROL_FILE = 0x66
+CONTROL_END = 0x67
+
+# Session requests
+SESSION_BEGIN = 0x00
+SESSION_DEVICE_TYPE = 0x01
+SESSION_TOTAL_BYTES = 0x02
+SESSION_FILE_PART_SIZE = 0x05
+
+# PIT / file transfer requests
+TRANSFER_FLASH = 0x00
+TRANSFER_DUMP = 0x01
+TRANSFER_PART = 0x02
+TRANSFER_END = 0x03
+
+# End requests
+END_SESSION = 0x00
+END_REBOOT = 0x01
+
+# Transfer destinations
+DESTINATION_PHONE = 0x00
+DESTINATION_MODEM = 0x01
+
+# PIT files are dumped in parts of this size
+PIT_PART_SIZE = 500
+
+# Control packet fields are uint32s; the session total is sent as a
+# uint64 split over two of them (low word first, as Heimdall does)
+MAX_FIELD_VALUE = 0xFFFFFFFF
+MAX_TOTAL_BYTES = 0xFFFFFFFFFFFFFFFF
+
+# Dumps report their size in the uint32 result field of a response
+MAX_DUMP_SIZE = MAX_FIELD_VALUE
+
+# Transfer sizes Heimdall uses for devices without / with large packet support
+DEFAULT_PACKET_SIZE = 128 * 1024
+LARGE_PACKET_SIZE = 1024 * 1024
+DEFAULT_SEQUENCE_PACKETS = 800
+LARGE_SEQUENCE_PACKETS = 30
+
+ProgressCallback = Callable[[int, int], None]
+
+_ZERO_CONTROL = bytes(CONTROL_PACKET_SIZE)
+
+
+class OdinProtocolError(Exception):
+    """Raised when the device answers unexpectedly"""
+
+
+class OdinProtocol:
+    """
+    Odin protocol session over a transport.
+    
+    Args to the constructor set the largest packet and sequence sizes the
+    host will use; begin_session() may lower them if the device does not
+    support large packets.
+    """
+    
+    def __init__(self, transport: OdinTransport, packet_size: int = LARGE_PACKET_SIZE,
+                 sequence_packets: Optional[int] = None, timeout: float = 5.0,
+                 transfer_timeout: float = 30.0):
+        """
+        Initialize protocol.
+        
+        Args:
+            transport: Opened transport
+            packet_size: File part size requested from the device
+            sequence_packets: Parts per transfer sequence
+                              (None = Heimdall default for the packet size)
+            timeout: Timeout for control packets in seconds
+            transfer_timeout: Timeout for a single file part in seconds
+        """
+        self.transport = transport
+        self.packet_size = packet_size
+        self.sequence_packets = sequence_packets
+        self.timeout = timeout
+        self.transfer_timeout = transfer_timeout
+        
+        self._control = transport.allocate(CONTROL_PACKET_SIZE)
+        self._control_view = memoryview(self._control)
+        self._response = transport.allocate(RESPONSE_SIZE)
+        self._data = None
+        self._data_view = None
+    
+    def _send_control(self, control_type: int, *values: int):
+        """Build and send a control packet in the preallocated buffer."""
+        self._control_view[:] = _ZERO_CONTROL
+        try:
+            struct.pack_into(f"<{1 + len(values)}I", self._control, 0, control_type, *values)
+        except struct.error as e:
+            raise OdinProtocolError(f"Control packet field out of range {values}: {e}") from e
+        self.transport.write(self._control, self.timeout)
+    
+    def _receive_response(self, control_type: int, timeout: Optional[float] = None) -> int:
+        """Read a response and check its type; returns the result field."""
+        n = self.transport.read_into(self._response, timeout or self.timeout)
+        if n < RESPONSE_SIZE:
+            raise OdinProtocolError(f"Short response ({n} bytes)")
+        
+        response_type, result = struct.unpack_from("<II", self._response, 0)
+        if response_type != control_type:
+            raise OdinProtocolError(
+                f"Unexpected response type {response_type:#x} (expected {control_type:#x})"
+            )
+        return result
+    
+    def _request(self, control_type: int, *values: int) -> int:
+        self._send_control(control_type, *values)
+        return self._receive_response(control_type)
+    
+    def _ensure_data_buffer(self):
+        if self._data is None or len(self._data) != self.packet_size:
+            self._data = self.transport.allocate(self.packet_size)
+            self._data_view = memoryview(self._data)
+    
+    def handshake(self):
+        """
+        Perform the ODIN/LOKE handshake.
+        
+        Raises:
+            OdinProtocolError: If the device does not answer LOKE
+        """
+        self.transport.write(HANDSHAKE, self.timeout)
+        reply = bytearray(64)
+        n = self.transport.read_into(reply, self.timeout)
+        if bytes(reply[:n]) != HANDSHAKE_REPLY:
+            raise OdinProtocolError(f"Handshake failed (got {bytes(reply[:n])!r})")
+    
+    def begin_session(self):
+        """
+        Begin a session and negotiate transfer sizes.
+        
+        A non-zero BEGIN result means the device accepts large file parts;
+        otherwise Heimdall's conservative defaults are used.
+        """
+        device_default = self._request(CONTROL_SESSION, SESSION_BEGIN, 0)
+        
+        if device_default == 0:
+            self.packet_size = min(self.packet_size, DEFAULT_PACKET_SIZE)
+        elif self.packet_size != device_default:
+            self._request(CONTROL_SESSION, SESSION_FILE_PART_SIZE, self.packet_size)
+        
+        if self.sequence_packets is None:
+            self.sequence_packets = (
+                LARGE_SEQUENCE_PACKETS if self.packet_size >= LARGE_PACKET_SIZE
+                else DEFAULT_SEQUENCE_PACKETS
+            )
+        
+        self._ensure_data_buffer()
+        logger.debug(
+            f"Odin session: {self.packet_size} byte parts, {self.sequence_packets} parts/sequence"
+        )
+    
+    def set_total_bytes(self, total: int):
+        """
+        Announce how many bytes the session will flash.
+        
+        Args:
+            total: Session size in bytes
+            
+        Raises:
+            OdinProtocolError: If the size does not fit in a uint64
+        """
+        if not 0 <= total <= MAX_TOTAL_BYTES:
+            raise OdinProtocolError(f"Session total out of range ({total} bytes)")
+        self._request(CONTROL_SESSION, SESSION_TOTAL_BYTES,
+                      total & MAX_FIELD_VALUE, total >> 32)
+    
+    def end_session(self, reboot: bool = False):
+        """
+        End the session, optionally rebooting the device.
+        
+        Args:
+            reboot: Reboot after ending the session
+        """
+        self._request(CONTROL_END, END_SESSION)
+        if reboot:
+            self._request(CONTROL_END, END_REBOOT)
+    
+    def dump_pit(self) -> bytes:
+        """
+        Download the device PIT.
+        
+        Returns:
+            Raw PIT file
+        """
+        size = self._request(CONTROL_PIT, TRANSFER_DUMP)
+        pit = bytearray(size)
+        view = memoryview(pit)
+        part = bytearray(PIT_PART_SIZE)
+        
+        for index, offset in enumerate(range(0, size, PIT_PART_SIZE)):
+            self._send_control(CONTROL_PIT, TRANSFER_PART, index)
+            n = self.transport.read_into(part, self.timeout)
+            want = min(PIT_PART_SIZE, size - offset)
+            if n < want:
+                raise OdinProtocolError(f"Short PIT part {index} ({n} bytes)")
+            view[offset:offset + want] = part[:want]
+        
+        self._request(CONTROL_PIT, TRANSFER_END)
+        return bytes(pit)
+    
+    def flash(self, source: BinaryIO, size: int, device_type: int, identifier: int,
+              destination: int = DESTINATION_PHONE,
+              progress: Optional[ProgressCallback] = None):
+        """
+        Flash `size` bytes from a file to a partition.
+        
+        Data is sent in sequences of up to sequence_packets parts; each part
+        is read from disk directly into the transfer buffer.
+        
+        Args:
+            source: Binary file positioned at the start of the image
+            size: Number of bytes to flash
+            device_type: PIT device type of the partition
+            identifier: PIT identifier of the partition
+            destination: DESTINATION_PHONE or DESTINATION_MODEM
+            progress: Called with (bytes sent, total bytes)
+            
+        Raises:
+            OdinProtocolError: If size is negative, or the device misbehaves
+        """
+        if size < 0:
+            raise OdinProtocolError(f"Invalid image size ({size} bytes)")
+        
+        self._ensure_data_buffer()
+        packet_size = self.packet_size
+        sequence_bytes = packet_size * self.sequence_packets
+        view = self._data_view
+        sent = 0
+        
+        if min(sequence_bytes, size) > MAX_FIELD_VALUE:
+            raise OdinProtocolError(f"Sequence size out of range ({sequence_bytes} bytes)")
+        
+        self._request(CONTROL_FILE, TRANSFER_FLASH)
+        
+        while sent < size:
+            sequence_size = min(sequence_bytes, size - sent)
+            self._request(CONTROL_FILE, TRANSFER_PART, sequence_size)
+            parts = (sequence_size + packet_size - 1) // packet_size
+            
+            for part_index in range(parts):
+                want = min(packet_size, sequence_size - part_index * packet_size)
+                n = source.readinto(view[:want])
+                if n != want:
+                    raise OdinProtocolError("Image file shorter than expected")
+                if want < packet_size:
+                    view[want:] = bytes(packet_size - want)
+                
+                self.transport.write(self._data, self.transfer_timeout)
+                acked = self._receive_response(0, self.transfer_timeout)
+                if acked != part_index:
+                    raise OdinProtocolError(f"Device acknowledged part {acked}, expected {part_index}")
+                
+                sent += want
+                if progress:
+                    progress(sent, size)
+            
+            last = sent >= size
+            self._send_control(
+                CONTROL_FILE, TRANSFER_END, destination, sequence_size, 0,
+                device_type, identifier, 1 if last else 0
+            )
+            self._receive_response(CONTROL_FILE, self.transfer_timeout)
+    
+    def dump(self, destination: BinaryIO, device_type: int, identifier: int,
+             progress: Optional[ProgressCallback] = None) -> int:
+        """
+        Read a partition from the device into a file.
+        
+        The device reports the partition size, then sends it part by part
+        on request (the same scheme as PIT dumps).
+        
+        Args:
+            destination: Binary file to write to
+            device_type: PIT device type of the partition
+            identifier: PIT identifier of the partition
+            progress: Called with (bytes received, total bytes)
+            
+        Returns:
+            Number of bytes read
+        """
+        self._ensure_data_buffer()
+        size = self._request(CONTROL_FILE, TRANSFER_DUMP, device_type, identifier)
+        view = self._data_view
+        received = 0
+        index = 0
+        
+        while received < size:
+            self._send_control(CONTROL_FILE, TRANSFER_PART, index)
+            n = self.transport.read_into(self._data, self.transfer_timeout)
+            want = min(self.packet_size, size - received)
+            if n < want:
+                raise OdinProtocolError(f"Short dump part {index} ({n} bytes)")
+            
+            destination.write(view[:want])
+            received += want
+            index += 1
+            if progress:
+                progress(received, size)
+        
+        self._request(CONTROL_FILE, TRANSFER_END)
+        return received
+
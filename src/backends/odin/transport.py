@@ -0,0 +1,299 @@
+"""
+SecureOS Flash - Odin Transports
+
+Byte pipes the native Odin backend talks through. PyUSBTransport drives
+real Download Mode devices through pyusb; LoopbackTransport (see
+loopback.py) connects to an in-memory fake device for tests.
+"""
+
+from abc import ABC, abstractmethod
+from typing import List, Optional
+import array
+import logging
+
+from ...utils.usb import port_path, serial_number
+
+
+logger = logging.getLogger(__name__)
+
+
+# Samsung USB Vendor ID
+SAMSUNG_VID = 0x04E8
+
+# Download Mode Product IDs
+SAMSUNG_DOWNLOAD_PIDS = (0x6601, 0x685D, 0x68C3)
+
+# USB CDC data interface class (Odin runs over its bulk endpoints)
+CDC_DATA_CLASS = 0x0A
+
+
+class TransportError(IOError):
+    """Raised when the transport fails or times out"""
+
+
+class OdinTransport(ABC):
+    """
+    Bidirectional bulk pipe to a device in Download Mode.
+    
+    Buffers from allocate() may be passed to write()/read_into() whole to
+    avoid copies; any writable buffer object also works.
+    """
+    
+    @abstractmethod
+    def open(self) -> bool:
+        """
+        Open the device.
+        
+        Returns:
+            True if a device was found and claimed
+        """
+        pass
+    
+    @abstractmethod
+    def close(self):
+        """Release the device."""
+        pass
+    
+    @abstractmethod
+    def write(self, data, timeout: float) -> int:
+        """
+        Send one bulk transfer.
+        
+        Args:
+            data: Bytes-like object to send
+            timeout: Timeout in seconds
+            
+        Returns:
+            Number of bytes written
+            
+        Raises:
+            TransportError: On failure or timeout
+        """
+        pass
+    
+    @abstractmethod
+    def read_into(self, buffer, timeout: float) -> int:
+        """
+        Receive one bulk transfer into a buffer.
+        
+        Args:
+            buffer: Writable buffer (at most len(buffer) bytes are read)
+            timeout: Timeout in seconds
+            
+        Returns:
+            Number of bytes received
+            
+        Raises:
+            TransportError: On failure or timeout
+        """
+        pass
+    
+    def allocate(self, size: int):
+        """
+        Allocate a transfer buffer in the transport's preferred type.
+        
+        Args:
+            size: Buffer size in bytes
+            
+        Returns:
+            Writable buffer of exactly `size` bytes
+        """
+        return bytearray(size)
+    
+    def send_zlp(self, timeout: float):
+        """Send a zero-length packet (some bootloaders expect one after data)."""
+        self.write(b"", timeout)
+    
+    @property
+    def device_path(self) -> str:
+        """Stable identifier for the physical port the device is on"""
+        return "unknown"
+    
+    @property
+    def product_id(self) -> Optional[int]:
+        """USB product ID of the opened device"""
+        return None
+    
+    @property
+    def serial_number(self) -> Optional[str]:
+        """Serial number of the opened device, None if it reports none"""
+        return None
+
+
+class PyUSBTransport(OdinTransport):
+    """
+    Odin transport over pyusb (libusb).
+    
+    pyusb is only imported when a device is opened, so the rest of
+    SecureOS Flash keeps working without it.
+    """
+    
+    def __init__(self, vendor_id: int = SAMSUNG_VID,
+                 product_ids: Optional[List[int]] = None,
+                 bus: Optional[int] = None, address: Optional[int] = None,
+                 port: Optional[str] = None):
+        """
+        Initialize pyusb transport.
+        
+        Args:
+            vendor_id: USB vendor ID to look for
+            product_ids: Accepted product IDs (None = known Download Mode PIDs)
+            bus: Only open a device on this USB bus
+            address: Only open the device with this address
+            port: Only open the device on this port path (e.g. "usb-1-2.3");
+                  unlike the address it survives re-enumeration
+        """
+        self.vendor_id = vendor_id
+        self.product_ids = tuple(product_ids or SAMSUNG_DOWNLOAD_PIDS)
+        self.bus = bus
+        self.address = address
+        self.port = port
+        self._usb = None
+        self._device = None
+        self._interface = None
+        self._ep_in = None
+        self._ep_out = None
+        self._serial: Optional[str] = None
+        self._detached_kernel_driver = False
+    
+    def open(self) -> bool:
+        try:
+            import usb.core
+            import usb.util
+        except ImportError:
+            logger.error("pyusb is not installed - native Odin transport unavailable")
+            return False
+        
+        def wanted(d):
+            return (
+                d.idProduct in self.product_ids
+                and (self.bus is None or d.bus == self.bus)
+                and (self.address is None or d.address == self.address)
+                and (self.port is None or port_path(d) == self.port)
+            )
+        
+        device = usb.core.find(idVendor=self.vendor_id, custom_match=wanted)
+        if device is None:
+            return False
+        
+        try:
+            try:
+                device.set_configuration()
+            except usb.core.USBError:
+                pass  # Already configured
+            
+            interface = self._find_data_interface(device, usb.util)
+            if interface is None:
+                logger.error("No CDC data interface with bulk endpoints found")
+                return False
+            
+            number = interface.bInterfaceNumber
+            if device.is_kernel_driver_active(number):
+                device.detach_kernel_driver(number)
+                self._detached_kernel_driver = True
+            usb.util.claim_interface(device, number)
+            
+        except usb.core.USBError as e:
+            logger.error(f"Could not claim Odin interface: {e}")
+            return False
+        
+        self._usb = usb
+        self._device = device
+        self._interface = interface
+        self._serial = serial_number(device)
+        return True
+    
+    @staticmethod
+    def enumerate(vendor_id: int = SAMSUNG_VID,
+                  product_ids: Optional[List[int]] = None) -> List[str]:
+        """
+        USB devices in Download Mode.
+        
+        Args:
+            vendor_id: USB vendor ID to look for
+            product_ids: Accepted product IDs (None = known Download Mode PIDs)
+            
+        Returns:
+            Port paths, empty if pyusb is not installed
+        """
+        try:
+            import usb.core
+        except ImportError:
+            return []
+        
+        wanted = tuple(product_ids or SAMSUNG_DOWNLOAD_PIDS)
+        devices = usb.core.find(find_all=True, idVendor=vendor_id,
+                                custom_match=lambda d: d.idProduct in wanted)
+        return [port_path(device) for device in devices]
+    
+    def _find_data_interface(self, device, util):
+        for interface in device.get_active_configuration():
+            if interface.bInterfaceClass != CDC_DATA_CLASS:
+                continue
+            
+            ep_in = ep_out = None
+            for ep in interface:
+                if util.endpoint_type(ep.bmAttributes) != util.ENDPOINT_TYPE_BULK:
+                    continue
+                if util.endpoint_direction(ep.bEndpointAddress) == util.ENDPOINT_IN:
+                    ep_in = ep
+                else:
+                    ep_out = ep
+            
+            if ep_in is not None and ep_out is not None:
+                self._ep_in, self._ep_out = ep_in, ep_out
+                return interface
+        
+        return None
+    
+    def close(self):
+        if self._device is None:
+            return
+        
+        util = self._usb.util
+        number = self._interface.bInterfaceNumber
+        try:
+            util.release_interface(self._device, number)
+            if self._detached_kernel_driver:
+                self._device.attach_kernel_driver(number)
+        except self._usb.core.USBError as e:
+            logger.debug(f"Error releasing Odin interface: {e}")
+        finally:
+            util.dispose_resources(self._device)
+            self._device = None
+    
+    def allocate(self, size: int):
+        # pyusb transfers array('B') objects without an intermediate copy
+        return array.array("B", bytes(size))
+    
+    def write(self, data, timeout: float) -> int:
+        try:
+            return self._ep_out.write(data, int(timeout * 1000))
+        except self._usb.core.USBError as e:
+            raise TransportError(f"USB write failed: {e}") from e
+    
+    def read_into(self, buffer, timeout: float) -> int:
+        try:
+            if isinstance(buffer, array.array):
+                return self._ep_in.read(buffer, int(timeout * 1000))
+            data = self._ep_in.read(len(buffer), int(timeout * 1000))
+        except self._usb.core.USBError as e:
+            raise TransportError(f"USB read failed: {e}") from e
+        
+        n = len(data)
+        memoryview(buffer)[:n] = data.tobytes()
+        return n
+    
+    @property
+    def device_path(self) -> str:
+        if self._device is None:
+            return "unknown"
+        return port_path(self._device)
+    
+    @property
+    def product_id(self) -> Optional[int]:
+        return self._device.idProduct if self._device is not None else None
+    
+    @property
+    def serial_number(self) -> Optional[str]:
+        return self._serial if self._device is not None else None
@@ -0,0 +1,125 @@
+"""
+SecureOS Flash - Samsung PIT Parser
+
+Parses the Partition Information Table (PIT) downloaded from Samsung
+devices in Download Mode. Layout follows Heimdall's libpit.
+"""
+
+import struct
+from typing import List
+from dataclasses import dataclass
+
+
+# PIT file magic number
+PIT_MAGIC = 0x12349876
+
+# Header: magic, entry count, 5 x uint32 (tags / chip name / unknown)
+PIT_HEADER_SIZE = 28
+
+# Each entry: 9 x uint32 followed by three 32-byte strings
+PIT_ENTRY_FORMAT = "<9I32s32s32s"
+PIT_ENTRY_SIZE = struct.calcsize(PIT_ENTRY_FORMAT)
+
+# Default block size used to express partition sizes (eMMC sectors)
+DEFAULT_BLOCK_SIZE = 512
+
+
+class PitError(ValueError):
+    """Raised when a PIT file cannot be parsed"""
+
+
+@dataclass
+class PitEntry:
+    """A single partition described by the PIT"""
+    binary_type: int
+    device_type: int
+    identifier: int
+    attributes: int
+    update_attributes: int
+    block_size_or_offset: int
+    block_count: int
+    file_offset: int
+    file_size: int
+    partition_name: str
+    flash_filename: str
+    fota_filename: str
+    
+    def size_bytes(self, block_size: int = DEFAULT_BLOCK_SIZE) -> int:
+        """
+        Get partition size in bytes.
+        
+        Args:
+            block_size: Size of one block on the device's storage
+            
+        Returns:
+            Partition size in bytes
+        """
+        return self.block_count * block_size
+
+
+def _cstr(raw: bytes) -> str:
+    return raw.split(b"\0", 1)[0].decode("ascii", errors="replace")
+
+
+def parse_pit(data: bytes) -> List[PitEntry]:
+    """
+    Parse a PIT file.
+    
+    Args:
+        data: Raw PIT file contents
+        
+    Returns:
+        List of PitEntry in table order
+        
+    Raises:
+        PitError: If the data is not a valid PIT
+    """
+    if len(data) < PIT_HEADER_SIZE:
+        raise PitError("PIT data too short")
+    
+    magic, entry_count = struct.unpack_from("<II", data, 0)
+    if magic != PIT_MAGIC:
+        raise PitError(f"Bad PIT magic: {magic:#010x}")
+    
+    end = PIT_HEADER_SIZE + entry_count * PIT_ENTRY_SIZE
+    if len(data) < end:
+        raise PitError(f"PIT truncated: {entry_count} entries need {end} bytes, got {len(data)}")
+    
+    entries = []
+    for offset in range(PIT_HEADER_SIZE, end, PIT_ENTRY_SIZE):
+        fields = struct.unpack_from(PIT_ENTRY_FORMAT, data, offset)
+        entries.append(PitEntry(
+            *fields[:9],
+            partition_name=_cstr(fields[9]),
+            flash_filename=_cstr(fields[10]),
+            fota_filename=_cstr(fields[11])
+        ))
+    
+    return entries
+
+
+def build_pit(entries: List[PitEntry]) -> bytes:
+    """
+    Serialize PIT entries (used by loopback devices and tests).
+    
+    Args:
+        entries: Entries to serialize
+        
+    Returns:
+        Raw PIT file contents
+    """
+    data = bytearray(struct.pack("<II", PIT_MAGIC, len(entries)))
+    data += b"COM_TAR2" + b"\0" * 12
+    
+    for e in entries:
+        data += struct.pack(
+            PIT_ENTRY_FORMAT,
+            e.binary_type, e.device_type, e.identifier, e.attributes,
+            e.update_attributes, e.block_size_or_offset, e.block_count,
+            e.file_offset, e.file_size,
+            e.partition_name.encode("ascii"),
+            e.flash_filename.encode("ascii"),
+            e.fota_filename.encode("ascii")
+        )
+    
+    return bytes(data)
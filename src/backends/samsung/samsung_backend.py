@@ -8,9 +8,20 @@ Based on the open source Heimdall tool.
 import subprocess
 import logging
 import os
-from typing import List, Optional
+import re
+import tempfile
+import time
+from typing import Callable, List, Optional
 
-from ...core.flash_backend import FlashBackend, DeviceInfo, FlashResult
+from ...core.flash_backend import (
+    FlashBackend, DeviceInfo, FlashResult, PartitionInfo, UNKNOWN_MODEL
+)
+from ...core.cancellation import CancellationToken, OperationCancelled
+from ...core.failures import classify
+from ...core.timeouts import TimeoutPolicy, ThroughputMeter, StallDetector
+from ...utils.process import ProcessStalled, run_monitored
+from ...utils.session_log import SessionLog
+from .pit import PitEntry, PitError, parse_pit, DEFAULT_BLOCK_SIZE
 
 
 logger = logging.getLogger(__name__)
@@ -34,16 +45,64 @@ class SamsungBackend(FlashBackend):
         # Add more as discovered
     ]
     
-    def __init__(self, heimdall_path: Optional[str] = None):
+    # Partitions assumed when the PIT cannot be parsed
+    COMMON_PARTITIONS = [
+        "BOOTLOADER",
+        "BOOT",
+        "RECOVERY",
+        "SYSTEM",
+        "USERDATA",
+        "CACHE"
+    ]
+    
+    # Heimdall actions that open an Odin session and accept --resume/--no-reboot
+    SESSION_ACTIONS = ("flash", "download", "download-pit", "print-pit", "close-pc-screen")
+    
+    # Heimdall transfer progress ("Uploading SYSTEM" ... "42%")
+    PROGRESS_PATTERN = re.compile(r"(\d{1,3})%")
+    
+    def __init__(self, heimdall_path: Optional[str] = None,
+                 block_size: int = DEFAULT_BLOCK_SIZE,
+                 persistent_session: bool = True,
+                 timeout_policy: Optional[TimeoutPolicy] = None,
+                 model: Optional[str] = None,
+                 progress: Optional[Callable[[int, int], None]] = None,
+                 session_logs: bool = True):
         """
         Initialize Samsung backend.
         
         Args:
             heimdall_path: Path to heimdall binary (None = use system PATH)
+            block_size: Storage block size used by PIT entries (512 for eMMC,
+                        4096 for UFS devices)
+            persistent_session: Chain all operations between init_session()
+                                and end_session() into one Odin session
+                                (--no-reboot/--resume). The handshake runs
+                                once and the device only reboots at
+                                end_session(reboot=True). False lets
+                                heimdall reboot after every action.
+            timeout_policy: How operation timeouts are derived from
+                            transfer sizes (None = defaults)
+            model: Device model, e.g. "SM-G998B". Heimdall cannot read it,
+                   so it is reported as "Unknown Model" unless given here;
+                   it picks the policy's model_throughput entry.
+            progress: Called with (bytes done, total bytes) during transfers
+            session_logs: Write the full heimdall output of each session
+                          to a compressed log in <data dir>/logs
         """
         self.heimdall_path = heimdall_path or "heimdall"
+        self.block_size = block_size
+        self.persistent_session = persistent_session
+        self.timeouts = timeout_policy or TimeoutPolicy()
+        self.model = model
+        self.throughput = ThroughputMeter()
+        self.progress = progress
         self.device_connected = False
         self.session_active = False
+        self._odin_session_open = False
+        self._pit_entries: Optional[List[PitEntry]] = None
+        self.session_logs = session_logs
+        self.session_log: Optional[SessionLog] = None
     
     def detect_device(self) -> Optional[DeviceInfo]:
         """
@@ -54,27 +113,21 @@ class SamsungBackend(FlashBackend):
         """
         try:
             # Use heimdall detect command
-            result = subprocess.run(
-                [self.heimdall_path, "detect"],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
+            result = self._run_heimdall("detect", timeout=self.timeouts.detect_timeout)
             
             if result.returncode == 0 and "Device detected" in result.stdout:
                 logger.info("Samsung device detected via Heimdall")
                 
-                # TODO: Parse actual device info from heimdall output
-                # For now, return generic info
                 device_info = DeviceInfo(
                     manufacturer="Samsung",
-                    model="Unknown Model",  # Parse from heimdall
+                    model=self.model or UNKNOWN_MODEL,  # heimdall does not report it
                     device_id="samsung-download-mode",
                     usb_vendor_id=self.SAMSUNG_VID,
                     usb_product_id="unknown",
                     bootloader_locked=False,  # In download mode = unlocked
                     oem_unlock_enabled=True,
-                    usb_debugging_enabled=True
+                    usb_debugging_enabled=True,
+                    serial=None  # heimdall does not report it, see DeviceInfo.identity
                 )
                 
                 self.device_connected = True
@@ -103,10 +156,133 @@ class SamsungBackend(FlashBackend):
         # Heimdall doesn't require explicit session init like some protocols
         # Session is implicit when device is in Download Mode
         logger.info("Samsung session ready (Download Mode)")
+        if self.session_logs and self.session_log is None:
+            try:
+                self.session_log = SessionLog.create("samsung")
+            except OSError as e:
+                logger.warning(f"Could not open session log: {e}")
         self.session_active = True
+        self._odin_session_open = False
         return True
     
-    def backup_partition(self, partition_name: str, output_file: str) -> FlashResult:
+    def _run_heimdall(self, action: str, *args: str, timeout: float,
+                      reboot: bool = False,
+                      size: Optional[int] = None,
+                      cancel: Optional[CancellationToken] = None) -> subprocess.CompletedProcess:
+        """
+        Run a heimdall command.
+        
+        In persistent session mode, session actions get --no-reboot so the
+        device stays in Download Mode, and every action after the first
+        successful one gets --resume to skip the Odin handshake.
+        
+        Output is watched while the command runs: progress percentages
+        feed a stall detector, so a hung transfer is killed after
+        timeouts.stall_timeout rather than at the overall deadline.
+        
+        Args:
+            action: Heimdall action (flash, download, download-pit, ...)
+            args: Action arguments
+            timeout: Overall timeout in seconds
+            reboot: Let this action end the session and reboot the device
+            size: Bytes being transferred, for progress reporting
+            cancel: Token that stops heimdall (SIGTERM, then SIGKILL)
+            
+        Returns:
+            CompletedProcess
+            
+        Raises:
+            subprocess.TimeoutExpired: Deadline passed or transfer stalled
+            OperationCancelled: Cancelled through `cancel`
+        """
+        cmd = [self.heimdall_path, action, *args]
+        chained = (
+            self.persistent_session
+            and self.session_active
+            and action in self.SESSION_ACTIONS
+        )
+        
+        if chained:
+            if self._odin_session_open:
+                cmd.append("--resume")
+            if not reboot:
+                cmd.append("--no-reboot")
+        
+        stall = StallDetector(self.timeouts.stall_timeout)
+        
+        def on_line(line: str):
+            match = self.PROGRESS_PATTERN.search(line)
+            if match is None:
+                stall.touch()
+                return
+            percent = min(int(match.group(1)), 100)
+            stall.update(percent)
+            if percent == 100:
+                # Data sent; the device may take a while to commit it
+                stall.finish()
+            if self.progress and size:
+                self.progress(size * percent // 100, size)
+        
+        try:
+            result = run_monitored(cmd, timeout, on_line=on_line, stall=stall, cancel=cancel,
+                                   log=self.session_log)
+        except BaseException:
+            # Cancelled, stalled or timed out: the Odin session is unusable
+            self._odin_session_open = False
+            raise
+        
+        if chained:
+            # Open only after a successful action that was not allowed to
+            # reboot; after a failure the next action starts with a handshake
+            self._odin_session_open = result.returncode == 0 and not reboot
+        
+        return result
+    
+    def _transfer_timeout(self, size: Optional[int]) -> float:
+        """Overall timeout for moving `size` bytes over this link."""
+        timeout = self.timeouts.transfer_timeout(size, model=self.model,
+                                                 measured=self.throughput.rate)
+        logger.debug(f"Transfer of {size} bytes: timeout {timeout:.0f}s")
+        return timeout
+    
+    def _partition_size(self, partition_name: str) -> Optional[int]:
+        """Size of a partition according to the PIT, if known."""
+        for info in self.get_partition_table():
+            if info.name.upper() == partition_name.upper():
+                return info.size
+        return None
+    
+    def _failure(self, result: subprocess.CompletedProcess) -> str:
+        """Error text of a failed heimdall run: its last output lines and where the full log is."""
+        detail = (result.stderr or result.stdout).strip()
+        if self.session_log is not None:
+            detail += f"\n(full log: {self.session_log.path})"
+        return detail
+    
+    @staticmethod
+    def _failure_kind(result: subprocess.CompletedProcess) -> str:
+        """Kind of failure (see core.failures) from heimdall's output and exit code."""
+        return classify(f"{result.stderr or ''}\n{result.stdout or ''}", result.returncode).kind
+    
+    def _cancelled(self, e: OperationCancelled) -> FlashResult:
+        return FlashResult(
+            success=False,
+            message="Cancelled",
+            error=str(e) or "Cancelled by user",
+            cancelled=True
+        )
+    
+    def _remove_partial(self, output_file: str):
+        """Delete the output of a failed or cancelled backup."""
+        try:
+            os.unlink(output_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove partial backup {output_file}: {e}")
+    
+    def backup_partition(self, partition_name: str, output_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
         """
         Backup partition from Samsung device.
         
@@ -115,6 +291,7 @@ class SamsungBackend(FlashBackend):
         Args:
             partition_name: Partition to backup
             output_file: Where to save backup
+            cancel: Token to abort the backup
             
         Returns:
             FlashResult
@@ -129,41 +306,55 @@ class SamsungBackend(FlashBackend):
         try:
             # Heimdall download-pit for partition table
             # For actual partitions, use heimdall download --PARTITION
-            cmd = [
-                self.heimdall_path,
+            logger.info(f"Backing up {partition_name} to {output_file}")
+            size = self._partition_size(partition_name)
+            started = time.monotonic()
+            result = self._run_heimdall(
                 "download",
                 f"--{partition_name.upper()}",
-                output_file
-            ]
-            
-            logger.info(f"Backing up {partition_name} to {output_file}")
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minute timeout for large partitions
+                output_file,
+                timeout=self._transfer_timeout(size),
+                size=size,
+                cancel=cancel
             )
             
             if result.returncode == 0:
+                if size:
+                    self.throughput.update(size, time.monotonic() - started)
                 return FlashResult(
                     success=True,
                     message=f"Backup of {partition_name} complete"
                 )
             else:
+                self._remove_partial(output_file)
                 return FlashResult(
                     success=False,
                     message=f"Backup failed",
-                    error=result.stderr
+                    error=self._failure(result),
+                    failure=self._failure_kind(result)
                 )
-                
+            
+        except OperationCancelled as e:
+            self._remove_partial(output_file)
+            return self._cancelled(e)
+        except ProcessStalled as e:
+            self._remove_partial(output_file)
+            return FlashResult(
+                success=False,
+                message="Backup stalled",
+                error=str(e),
+                stalled=True
+            )
         except Exception as e:
+            self._remove_partial(output_file)
             return FlashResult(
                 success=False,
                 message="Backup failed",
                 error=str(e)
             )
     
-    def flash_partition(self, partition_name: str, image_file: str) -> FlashResult:
+    def flash_partition(self, partition_name: str, image_file: str,
+                        cancel: Optional[CancellationToken] = None) -> FlashResult:
         """
         Flash partition on Samsung device.
         
@@ -172,6 +363,7 @@ class SamsungBackend(FlashBackend):
         Args:
             partition_name: Partition to flash
             image_file: Image file to flash
+            cancel: Token to abort the flash
             
         Returns:
             FlashResult
@@ -192,22 +384,20 @@ class SamsungBackend(FlashBackend):
         
         try:
             # Heimdall flash --PARTITION file.img
-            cmd = [
-                self.heimdall_path,
+            logger.info(f"Flashing {partition_name} with {image_file}")
+            size = os.path.getsize(image_file)
+            started = time.monotonic()
+            result = self._run_heimdall(
                 "flash",
                 f"--{partition_name.upper()}",
-                image_file
-            ]
-            
-            logger.info(f"Flashing {partition_name} with {image_file}")
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=600  # 10 minute timeout for large images
+                image_file,
+                timeout=self._transfer_timeout(size),
+                size=size,
+                cancel=cancel
             )
             
             if result.returncode == 0:
+                self.throughput.update(size, time.monotonic() - started)
                 return FlashResult(
                     success=True,
                     message=f"Flash of {partition_name} complete"
@@ -216,9 +406,19 @@ class SamsungBackend(FlashBackend):
                 return FlashResult(
                     success=False,
                     message=f"Flash failed",
-                    error=result.stderr
+                    error=self._failure(result),
+                    failure=self._failure_kind(result)
                 )
-                
+            
+        except OperationCancelled as e:
+            return self._cancelled(e)
+        except ProcessStalled as e:
+            return FlashResult(
+                success=False,
+                message="Flash stalled",
+                error=str(e),
+                stalled=True
+            )
         except Exception as e:
             return FlashResult(
                 success=False,
@@ -226,18 +426,20 @@ class SamsungBackend(FlashBackend):
                 error=str(e)
             )
     
-    def flash_bootloader(self, bootloader_file: str) -> FlashResult:
+    def flash_bootloader(self, bootloader_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
         """
         Flash bootloader on Samsung device.
         
         Args:
             bootloader_file: Bootloader image
+            cancel: Token to abort the flash
             
         Returns:
             FlashResult
         """
         # On Samsung, bootloader is typically the "BOOTLOADER" partition
-        return self.flash_partition("BOOTLOADER", bootloader_file)
+        return self.flash_partition("BOOTLOADER", bootloader_file, cancel)
     
     def get_partition_list(self) -> List[str]:
         """
@@ -248,33 +450,65 @@ class SamsungBackend(FlashBackend):
         Returns:
             List of partition names
         """
+        return [p.name for p in self.get_partition_table()]
+    
+    def get_partition_table(self) -> List[PartitionInfo]:
+        """
+        Get partitions and their sizes from the device PIT.
+        
+        The PIT is downloaded once per session and cached.
+        
+        Returns:
+            List of PartitionInfo
+        """
+        if self._pit_entries is None:
+            self._pit_entries = self._download_pit()
+        
+        if self._pit_entries is None:
+            return []
+        
+        if not self._pit_entries:
+            # PIT downloaded but unreadable - fall back to common partitions
+            return [PartitionInfo(name=name) for name in self.COMMON_PARTITIONS]
+        
+        return [
+            PartitionInfo(name=e.partition_name, size=e.size_bytes(self.block_size),
+                          file_name=e.flash_filename or None)
+            for e in self._pit_entries
+            if e.partition_name and e.block_count
+        ]
+    
+    def _download_pit(self) -> Optional[List[PitEntry]]:
+        """
+        Download and parse the device PIT.
+        
+        Returns:
+            Parsed entries, [] if the PIT could not be parsed,
+            None if it could not be downloaded
+        """
+        fd, pit_file = tempfile.mkstemp(prefix="secureos-samsung-pit-", suffix=".bin")
+        os.close(fd)
+        
         try:
-            # Download PIT to temp file
-            pit_file = "/tmp/secureos-samsung-pit.bin"
+            result = self._run_heimdall("download-pit", "--output", pit_file,
+                                        timeout=self.timeouts.transfer_timeout(0))
             
-            result = subprocess.run(
-                [self.heimdall_path, "download-pit", "--output", pit_file],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            if result.returncode != 0:
+                logger.error(f"PIT download failed: {self._failure(result)}")
+                return None
             
-            if result.returncode == 0:
-                # TODO: Parse PIT file to extract partition names
-                # For now, return common Samsung partitions
-                return [
-                    "BOOTLOADER",
-                    "BOOT",
-                    "RECOVERY",
-                    "SYSTEM",
-                    "USERDATA",
-                    "CACHE"
-                ]
+            with open(pit_file, "rb") as f:
+                try:
+                    return parse_pit(f.read())
+                except PitError as e:
+                    logger.warning(f"Could not parse PIT: {e}")
+                    return []
             
         except Exception as e:
             logger.error(f"Error getting partition list: {e}")
-        
-        return []
+            return None
+        finally:
+            os.unlink(pit_file)
     
     def end_session(self, reboot: bool = True) -> bool:
         """
@@ -286,16 +520,31 @@ class SamsungBackend(FlashBackend):
         Returns:
             True if successful
         """
-        if reboot:
+        if reboot and self.persistent_session and self.session_active:
             try:
-                # Heimdall will auto-reboot after successful flash
-                # No explicit reboot command needed
-                logger.info("Device will reboot automatically")
+                # Chained actions all ran with --no-reboot, so the device
+                # only leaves Download Mode if told to: close the session
+                # with a final action that may reboot (it gets --resume
+                # only if the last action left the Odin session open)
+                result = self._run_heimdall("close-pc-screen", reboot=True,
+                                            timeout=self.timeouts.transfer_timeout(0))
+                if result.returncode == 0:
+                    logger.info("Session closed - device rebooting")
+                else:
+                    logger.warning(f"Reboot command failed: {self._failure(result)}")
             except Exception as e:
                 logger.warning(f"Reboot command failed: {e}")
+        elif reboot:
+            # Without chaining heimdall rebooted after the last action
+            logger.info("Device will reboot automatically")
         
+        if self.session_log is not None:
+            self.session_log.close()
+            self.session_log = None
         self.session_active = False
+        self._odin_session_open = False
         self.device_connected = False
+        self._pit_entries = None
         return True
     
     def get_backend_name(self) -> str:
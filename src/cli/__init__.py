@@ -0,0 +1,5 @@
+"""Command line interface package"""
+
+from .commands import main, build_parser, Reporter
+
+__all__ = ['main', 'build_parser', 'Reporter']
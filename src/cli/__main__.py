@@ -0,0 +1,7 @@
+"""Entry point for python -m src.cli"""
+
+import sys
+
+from .commands import main
+
+sys.exit(main())
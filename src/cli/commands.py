@@ -0,0 +1,912 @@
+"""
+SecureOS Flash - Command Line Interface
+
+Scriptable front end for detection, backup, flash, restore, verify,
+manifest runs, the backup catalog and the firmware library. Operations
+run on one device, or with --batch on every attached device concurrently
+(at most --jobs at a time).
+
+With --json every event and result is written to stdout as one JSON
+object per line; logs always go to stderr.
+
+Exit codes:
+    0    Success on every selected device
+    1    Operation failed
+    2    Usage error or invalid manifest
+    3    No (matching) device found
+    4    Device busy
+    5    Batch partially failed (some devices succeeded, some did not)
+    130  Cancelled (Ctrl+C)
+
+Only the standard library is imported at startup; the flashing framework
+is loaded when a command needs it, so --help and usage errors are instant.
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core import CancellationToken, FlashResult, PlanGraph, ProtocolManager, RetryPolicy
+
+
+logger = logging.getLogger(__name__)
+
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NO_DEVICE = 3
+EXIT_BUSY = 4
+EXIT_PARTIAL = 5
+EXIT_CANCELLED = 130
+
+# Minimum interval between JSON progress events per device (s)
+PROGRESS_INTERVAL = 0.5
+
+# Backends tried when --backends is not given
+DEFAULT_BACKENDS = "heimdall,fastboot"
+
+
+class Reporter:
+    """Writes events to stdout as JSON lines or as readable text"""
+    
+    def __init__(self, json_lines: bool, stream=None):
+        """
+        Initialize reporter.
+        
+        Args:
+            json_lines: Write one JSON object per event
+            stream: Output stream (None = stdout)
+        """
+        self.json_lines = json_lines
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+    
+    def emit(self, event: str, device: Optional[str] = None, **fields: Any):
+        """
+        Write one event.
+        
+        Args:
+            event: Event type ("device", "start", "progress", "result", ...)
+            device: Device the event is about
+            fields: Event data
+        """
+        record: Dict[str, Any] = {"event": event, "ts": round(time.time(), 3)}
+        if device is not None:
+            record["device"] = device
+        record.update(fields)
+        
+        line = json.dumps(record, default=str) if self.json_lines else self._format(record)
+        if line is None:
+            return
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+    
+    def _format(self, record: Dict[str, Any]) -> Optional[str]:
+        event = record["event"]
+        prefix = f"[{record['device']}] " if "device" in record else ""
+        
+        if event == "device":
+            info = record["info"]
+            return (f"{info['device_id']}  {info['manufacturer']} {info['model']}  "
+                    f"({info.get('usb_path') or 'unknown port'})")
+        if event == "partitions":
+            return prefix + " ".join(record["partitions"])
+        if event == "start":
+            return f"{prefix}{record['operation']}..."
+        if event == "progress":
+            return f"{prefix}{record['percent']:.0f}%"
+        if event == "step":
+            return f"{prefix}{record['step']}: {record['state']}"
+        if event == "plan":
+            return record["text"]
+        if event == "result":
+            status = "OK" if record["success"] else ("CANCELLED" if record["cancelled"] else "FAILED")
+            detail = f" - {record['error']}" if record.get("error") and not record["success"] else ""
+            return f"{prefix}{status}: {record['message']}{detail}"
+        if event == "summary":
+            return f"{record['succeeded']} of {record['devices']} device(s) succeeded"
+        if event == "error":
+            return f"error: {record['message']}"
+        if event == "listening":
+            return f"Listening on {record['address']}"
+        if event == "indexed":
+            failed = f", {len(record['failed'])} failed" if record["failed"] else ""
+            return (f"{record['added']} added, {record['updated']} updated, {record['removed']} removed, "
+                    f"{record['unchanged']} unchanged{failed}")
+        if event == "firmware":
+            unmatched = (f"  (no partition for: {', '.join(record['unmatched'])})"
+                         if record["unmatched"] else "")
+            guessed = (f"  (for {', '.join(record['models'])}, matched on the partition table)"
+                       if record["by_partitions"] else "")
+            return (f"{prefix}{record['path']}  {record['version'] or '-'}  "
+                    f"bootloader {record['bootloader'] or '?'}{unmatched}{guessed}")
+        if event == "scrubbed":
+            member = f" [{record['member']}]" if record["member"] else ""
+            return f"{prefix}{record['status'].upper()}: {record['location']}{member}"
+        if event == "scrub":
+            return (f"{record['checked']} checked: {record['verified']} ok, {record['corrupt']} corrupt, "
+                    f"{record['missing']} missing, {record['unreadable']} unreadable "
+                    f"({record['bytes_read'] / 1e6:.0f} MB in {record['elapsed']:.1f}s)")
+        if event == "pruned":
+            return f"{record['pruned']} backups pruned"
+        if event == "imported":
+            return f"{record['imported']} backups imported from {record['directory']}"
+        if event == "port":
+            stats = record["stats"]
+            reasons = f" - {'; '.join(record['reasons'])}" if record["reasons"] else ""
+            return (f"{record['port']}  {record['state']}  {stats['transfers']} transfers, "
+                    f"{stats['failures']} failed, {stats['stalls']} stalled{reasons}")
+        return None
+    
+    def progress_callback(self, device: str) -> Callable[[int, int], None]:
+        """
+        Progress callback for a device's backend, throttled so fast
+        transfers cannot flood the output.
+        
+        Args:
+            device: Device id to report under
+            
+        Returns:
+            Callback taking (done, total)
+        """
+        last = {"time": 0.0, "step": -1}
+        
+        def report(done: int, total: int):
+            if not total:
+                return
+            percent = min(100.0, 100.0 * done / total)
+            
+            if self.json_lines:
+                now = time.monotonic()
+                if now - last["time"] < PROGRESS_INTERVAL and done < total:
+                    return
+                last["time"] = now
+            else:
+                step = int(percent // 10)
+                if step == last["step"]:
+                    return
+                last["step"] = step
+            
+            self.emit("progress", device, done=done, total=total, percent=round(percent, 1))
+        
+        return report
+
+
+class _Context:
+    """State shared by the command being run"""
+    
+    def __init__(self, args: argparse.Namespace, reporter: Reporter, cancel: "CancellationToken"):
+        self.args = args
+        self.reporter = reporter
+        self.cancel = cancel
+
+
+def _result_fields(result: "FlashResult") -> Dict[str, Any]:
+    return {
+        "success": result.success,
+        "message": result.message,
+        "error": result.error,
+        "skipped": result.skipped,
+        "cancelled": result.cancelled,
+        "stalled": result.stalled,
+        "busy": result.busy,
+        "port": result.port
+    }
+
+
+def _exit_code(results: List["FlashResult"], cancelled: bool) -> int:
+    """Exit code for a set of per-device results."""
+    if results and all(result.success for result in results):
+        return EXIT_OK
+    if cancelled:
+        return EXIT_CANCELLED
+    if any(result.success for result in results):
+        return EXIT_PARTIAL
+    if results and all(result.busy for result in results):
+        return EXIT_BUSY
+    return EXIT_FAILED
+
+
+def _make_backends(names: str, download_agent: Optional[str] = None,
+                   samsung_model: Optional[str] = None) -> list:
+    """Backend prototypes named in --backends, in order."""
+    backends = []
+    for name in [n.strip() for n in names.split(",") if n.strip()]:
+        if name == "heimdall":
+            from ..backends.samsung import SamsungBackend
+            backends.append(SamsungBackend(model=samsung_model))
+        elif name == "odin":
+            from ..backends.odin import OdinBackend
+            backends.append(OdinBackend())
+        elif name == "fastboot":
+            from ..backends.fastboot import FastbootBackend
+            backends.append(FastbootBackend())
+        elif name == "mediatek":
+            from ..backends.mediatek import MediaTekBackend
+            backends.append(MediaTekBackend(download_agent=download_agent))
+        else:
+            raise ValueError(f"Unknown backend: {name}")
+    return backends
+
+
+def _retry_policy(args: argparse.Namespace) -> "RetryPolicy":
+    """Retry policy from --retries."""
+    from ..core import RetryPolicy
+    return RetryPolicy(retries=max(0, args.retries))
+
+
+def _matches(manager: "ProtocolManager", selectors: List[str]) -> bool:
+    device = manager.current_device
+    return any(sel in (device.device_id, device.usb_path, device.model) for sel in selectors)
+
+
+def _release(managers: List["ProtocolManager"]):
+    for manager in managers:
+        if manager.active_backend is not None:
+            manager.end_session(reboot=False)
+
+
+def _select_devices(ctx: _Context, batch: bool) -> Tuple[List["ProtocolManager"], int]:
+    """
+    Discover devices and apply --device / --batch.
+    
+    Returns:
+        (managers, exit code); the list is empty unless the code is EXIT_OK
+    """
+    from dataclasses import asdict
+    from ..core import ProtocolManager, discover_devices
+    
+    args = ctx.args
+    try:
+        backends = _make_backends(args.backends, args.mtk_da, args.samsung_model)
+    except ValueError as e:
+        ctx.reporter.emit("error", message=str(e))
+        return [], EXIT_USAGE
+    
+    managers = discover_devices(backends, lambda: ProtocolManager(lock_timeout=args.lock_timeout,
+                                                                  retry_policy=_retry_policy(args)))
+    if args.device:
+        selected = [m for m in managers if _matches(m, args.device)]
+        _release([m for m in managers if m not in selected])
+        managers = selected
+    
+    if not managers:
+        ctx.reporter.emit("error", message="No compatible device found")
+        return [], EXIT_NO_DEVICE
+    
+    if not batch and len(managers) > 1:
+        _release(managers)
+        ctx.reporter.emit(
+            "error",
+            message=f"{len(managers)} devices attached - select one with --device or use --batch"
+        )
+        return [], EXIT_USAGE
+    
+    for manager in managers:
+        device = manager.current_device
+        ctx.reporter.emit("device", device.device_id, info=asdict(device))
+        backend = manager.active_backend
+        if hasattr(backend, "progress"):
+            backend.progress = ctx.reporter.progress_callback(device.device_id)
+    
+    return managers, EXIT_OK
+
+
+def _run_on_devices(ctx: _Context, work: Callable[["ProtocolManager"], "FlashResult"],
+                    operation: str) -> int:
+    """
+    Run an operation on the selected device(s), concurrently in batch mode.
+    
+    Each device gets its own session, ended (and optionally rebooted)
+    afterwards whatever the outcome. Devices on healthy ports are started
+    before those on degraded ones; devices on quarantined ports are not
+    touched.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from ..core import FlashResult
+    from ..core.port_health import QUARANTINED
+    
+    managers, code = _select_devices(ctx, ctx.args.batch)
+    if code != EXIT_OK:
+        return code
+    managers.sort(key=lambda manager: manager.port_status().rank)
+    
+    def run_one(manager: "ProtocolManager") -> "FlashResult":
+        device = manager.current_device.device_id
+        port = manager.port_status()
+        ctx.reporter.emit("start", device, operation=operation)
+        try:
+            if port.state == QUARANTINED:
+                result = FlashResult(success=False, message="Port quarantined",
+                                     error=f"{port.port}: {'; '.join(port.reasons)} - replace the "
+                                           f"cable and run 'ports --clear {port.port}'",
+                                     port=port.port)
+            elif ctx.cancel.cancelled:
+                result = FlashResult(success=False, message="Cancelled", error=ctx.cancel.reason,
+                                     cancelled=True)
+            elif not manager.init_session():
+                result = FlashResult(success=False, message="Session failed",
+                                     error="Could not initialize session")
+            else:
+                result = work(manager)
+        except Exception as e:
+            logger.exception(f"{operation} failed on {device}")
+            result = FlashResult(success=False, message="Internal error", error=str(e))
+        finally:
+            if manager.active_backend is not None:
+                manager.end_session(reboot=ctx.args.reboot)
+        
+        ctx.reporter.emit("result", device, operation=operation, **_result_fields(result))
+        return result
+    
+    with ThreadPoolExecutor(max_workers=ctx.args.jobs or len(managers)) as pool:
+        futures = [pool.submit(run_one, manager) for manager in managers]
+        results = [future.result() for future in futures]
+    
+    if len(results) > 1:
+        ctx.reporter.emit("summary", devices=len(results),
+                          succeeded=sum(1 for result in results if result.success))
+    return _exit_code(results, ctx.cancel.cancelled)
+
+
+def cmd_detect(ctx: _Context) -> int:
+    managers, code = _select_devices(ctx, batch=True)
+    _release(managers)
+    return code
+
+
+def cmd_list_partitions(ctx: _Context) -> int:
+    from ..core import FlashResult
+    
+    def work(manager: "ProtocolManager") -> "FlashResult":
+        partitions = manager.get_partition_list()
+        ctx.reporter.emit("partitions", manager.current_device.device_id, partitions=partitions)
+        if not partitions:
+            return FlashResult(success=False, message="No partitions", error="Partition table unavailable")
+        return FlashResult(success=True, message=f"{len(partitions)} partitions")
+    
+    return _run_on_devices(ctx, work, "list-partitions")
+
+
+def cmd_backup(ctx: _Context) -> int:
+    args = ctx.args
+    if args.output and args.batch and "{device}" not in args.output:
+        ctx.reporter.emit("error", message="In batch mode --output must contain {device}")
+        return EXIT_USAGE
+    
+    def work(manager: "ProtocolManager") -> "FlashResult":
+        device = manager.current_device.device_id
+        if args.output:
+            output = args.output.replace("{device}", device.replace(os.sep, "_"))
+        else:
+            output = manager.auto_backup_path(args.partition)
+        return manager.backup_partition(args.partition, output, cancel=ctx.cancel)
+    
+    return _run_on_devices(ctx, work, f"backup {args.partition}")
+
+
+def cmd_flash(ctx: _Context) -> int:
+    args = ctx.args
+    if not os.path.isfile(args.image):
+        ctx.reporter.emit("error", message=f"Image not found: {args.image}")
+        return EXIT_USAGE
+    
+    def work(manager: "ProtocolManager") -> "FlashResult":
+        return manager.flash_partition(
+            args.partition, args.image,
+            differential=args.differential,
+            verify_readback=args.verify_readback,
+            cancel=ctx.cancel
+        )
+    
+    return _run_on_devices(ctx, work, f"flash {args.partition}")
+
+
+def cmd_restore(ctx: _Context) -> int:
+    args = ctx.args
+    if args.archive and not os.path.isfile(args.archive):
+        ctx.reporter.emit("error", message=f"Archive not found: {args.archive}")
+        return EXIT_USAGE
+    
+    def work(manager: "ProtocolManager") -> "FlashResult":
+        return manager.restore_partition(
+            args.partition,
+            archive=args.archive,
+            record_id=args.record,
+            staging_dir=args.staging_dir,
+            cancel=ctx.cancel
+        )
+    
+    return _run_on_devices(ctx, work, f"restore {args.partition}")
+
+
+def cmd_verify(ctx: _Context) -> int:
+    args = ctx.args
+    if not os.path.isfile(args.image):
+        ctx.reporter.emit("error", message=f"Image not found: {args.image}")
+        return EXIT_USAGE
+    
+    def work(manager: "ProtocolManager") -> "FlashResult":
+        return manager.verify_partition(args.partition, args.image, cancel=ctx.cancel)
+    
+    return _run_on_devices(ctx, work, f"verify {args.partition}")
+
+
+def _emit_plan(ctx: _Context, graph: "PlanGraph"):
+    from ..core import default_throughput_history
+    
+    history = default_throughput_history()
+    schedule = graph.estimate(history=history)
+    total = graph.estimate_total(history=history)
+    steps = [
+        {
+            "id": node.id,
+            "action": node.action,
+            "slot": node.device,
+            "deps": node.deps,
+            "size": node.size,
+            "start": round(schedule[node.id][0], 1),
+            "end": round(schedule[node.id][1], 1)
+        }
+        for node in graph.topological_order()
+    ]
+    ctx.reporter.emit(
+        "plan",
+        name=graph.name,
+        estimated=round(total.seconds, 1),
+        estimated_low=round(total.low, 1),
+        estimated_high=round(total.high, 1),
+        steps=steps,
+        text=graph.describe(history=history)
+    )
+
+
+def cmd_plan_run(ctx: _Context) -> int:
+    from ..core import GraphExecutor, ManifestError, load_manifest
+    from ..core.manifest import DEFAULT_DEVICE
+    
+    args = ctx.args
+    try:
+        manifest = load_manifest(args.manifest)
+        graph = manifest.compile()
+    except ManifestError as e:
+        ctx.reporter.emit("error", message=str(e))
+        return EXIT_USAGE
+    
+    if args.dry_run:
+        _emit_plan(ctx, graph)
+        return EXIT_OK
+    
+    def on_update(managers: Dict[str, "ProtocolManager"]):
+        devices = {slot: m.current_device.device_id for slot, m in managers.items()}
+        
+        def report(node, state: str):
+            ctx.reporter.emit("step", devices.get(node.device), step=node.id, state=state)
+        return report
+    
+    if [spec.name for spec in manifest.devices] != [DEFAULT_DEVICE]:
+        return _run_slotted_plan(ctx, manifest, graph, on_update)
+    
+    # No device slots: the whole manifest runs on each selected device
+    def work(manager: "ProtocolManager") -> "FlashResult":
+        managers = {DEFAULT_DEVICE: manager}
+        plan = manifest.compile()
+        result = GraphExecutor(managers, on_update=on_update(managers)).run(plan, ctx.cancel)
+        return result.summarize(list(plan.nodes))
+    
+    return _run_on_devices(ctx, work, f"plan {graph.name}")
+
+
+def _run_slotted_plan(ctx: _Context, manifest, graph: "PlanGraph", on_update) -> int:
+    """Run a manifest with device slots once, across the devices bound to them."""
+    from ..core import GraphExecutor
+    
+    managers, code = _select_devices(ctx, batch=True)
+    if code != EXIT_OK:
+        return code
+    
+    bound = manifest.bind(managers)
+    _release([m for m in managers if m not in bound.values()])
+    missing = [slot for slot in graph.devices if slot not in bound]
+    if missing:
+        _release(list(bound.values()))
+        ctx.reporter.emit("error", message=f"No device matches slot(s): {', '.join(missing)}")
+        return EXIT_NO_DEVICE
+    
+    devices = {slot: m.current_device.device_id for slot, m in bound.items()}
+    try:
+        for slot, manager in bound.items():
+            if not manager.init_session():
+                ctx.reporter.emit("error", devices[slot], message="Could not initialize session")
+                return EXIT_FAILED
+        for slot in graph.devices:
+            ctx.reporter.emit("start", devices[slot], operation=f"plan {graph.name}", slot=slot)
+        
+        result = GraphExecutor(bound, on_update=on_update(bound)).run(graph, ctx.cancel)
+    finally:
+        for manager in bound.values():
+            if manager.active_backend is not None:
+                manager.end_session(reboot=ctx.args.reboot)
+    
+    results = []
+    for slot in graph.devices:
+        slot_result = result.summarize([n for n, node in graph.nodes.items() if node.device == slot])
+        ctx.reporter.emit("result", devices[slot], operation=f"plan {graph.name}", slot=slot,
+                          **_result_fields(slot_result))
+        results.append(slot_result)
+    
+    ctx.reporter.emit("summary", devices=len(results),
+                      succeeded=sum(1 for r in results if r.success), message=result.message)
+    return _exit_code(results, ctx.cancel.cancelled)
+
+
+def cmd_firmware_index(ctx: _Context) -> int:
+    from dataclasses import asdict
+    from ..core import FirmwareLibrary
+    
+    args = ctx.args
+    if not os.path.isdir(args.directory):
+        ctx.reporter.emit("error", message=f"Not a directory: {args.directory}")
+        return EXIT_USAGE
+    
+    library = FirmwareLibrary(args.library)
+    try:
+        report = library.scan(args.directory, full=args.full, workers=args.workers)
+    finally:
+        library.close()
+    
+    for path in report.failed:
+        ctx.reporter.emit("error", message=f"Could not index {path}")
+    ctx.reporter.emit("indexed", **asdict(report))
+    return EXIT_FAILED if report.failed else EXIT_OK
+
+
+def cmd_firmware_match(ctx: _Context) -> int:
+    from ..core import FirmwareLibrary, FlashResult
+    
+    args = ctx.args
+    library = FirmwareLibrary(args.library)
+    
+    def work(manager: "ProtocolManager") -> "FlashResult":
+        device = manager.current_device
+        matches = library.compatible(device, manager.get_partition_table() or None,
+                                     min_bootloader_rev=args.min_bootloader)
+        for match in matches:
+            package = match.package
+            ctx.reporter.emit("firmware", device.device_id, path=package.path,
+                              component=package.component, version=package.version,
+                              bootloader=package.bootloader, models=package.models,
+                              unmatched=match.unmatched, by_partitions=match.by_partitions)
+        if not matches:
+            target = device.model if device.model_known else "this partition table"
+            return FlashResult(success=False, message="No compatible firmware",
+                               error=f"Nothing indexed for {target}")
+        return FlashResult(success=True, message=f"{len(matches)} compatible packages")
+    
+    try:
+        return _run_on_devices(ctx, work, "firmware-match")
+    finally:
+        library.close()
+
+
+def cmd_scrub(ctx: _Context) -> int:
+    from ..core import BackupCatalog, BackupScrubber
+    from ..core.backup_catalog import STATUS_VERIFIED
+    from ..core.cancellation import OperationCancelled, checkpoint
+    
+    args = ctx.args
+    if args.workers is not None and args.workers < 1:
+        ctx.reporter.emit("error", message="--workers must be at least 1")
+        return EXIT_USAGE
+    
+    def progress(record, status):
+        if status != STATUS_VERIFIED:
+            ctx.reporter.emit("scrubbed", record.device_id, status=status, location=record.location,
+                              member=record.member, partition=record.partition)
+        # Results so far are in the catalog; the next scrub goes on from there
+        checkpoint(ctx.cancel)
+    
+    catalog = BackupCatalog(args.catalog)
+    scrubber = BackupScrubber(
+        catalog,
+        workers=args.workers,
+        rate_limit=args.rate_limit * 1e6 if args.rate_limit else None
+    )
+    try:
+        report = scrubber.scrub(max_age=args.max_age * 86400, limit=args.limit, progress=progress)
+    except OperationCancelled:
+        return EXIT_CANCELLED
+    finally:
+        catalog.close()
+    
+    ctx.reporter.emit("scrub", checked=report.checked, verified=report.verified,
+                      corrupt=len(report.corrupt), missing=len(report.missing),
+                      unreadable=len(report.unreadable), bytes_read=report.bytes_read,
+                      elapsed=round(report.elapsed, 3))
+    return EXIT_OK if report.clean else EXIT_FAILED
+
+
+def cmd_catalog_prune(ctx: _Context) -> int:
+    from ..core import BackupCatalog, RetentionPolicy
+    
+    args = ctx.args
+    if args.keep_last is not None and args.keep_last < 1:
+        ctx.reporter.emit("error", message="--keep-last must be at least 1")
+        return EXIT_USAGE
+    
+    policy = RetentionPolicy(keep_last=args.keep_last, max_age_days=args.max_age,
+                             prune_corrupt=not args.keep_corrupt)
+    catalog = BackupCatalog(args.catalog)
+    try:
+        pruned = catalog.apply_retention(policy, delete_files=not args.keep_files,
+                                         directory=args.directory)
+    finally:
+        catalog.close()
+    
+    ctx.reporter.emit("pruned", pruned=pruned)
+    return EXIT_OK
+
+
+def cmd_catalog_import(ctx: _Context) -> int:
+    from ..core import BackupCatalog
+    
+    args = ctx.args
+    if not os.path.isdir(args.directory):
+        ctx.reporter.emit("error", message=f"Not a directory: {args.directory}")
+        return EXIT_USAGE
+    
+    catalog = BackupCatalog(args.catalog)
+    try:
+        imported = catalog.import_directory(args.directory, device_id=args.device_id)
+    finally:
+        catalog.close()
+    
+    ctx.reporter.emit("imported", imported=imported, directory=args.directory)
+    return EXIT_OK
+
+
+def cmd_ports(ctx: _Context) -> int:
+    from ..core import default_port_health
+    
+    tracker = default_port_health()
+    for port in ctx.args.clear or []:
+        if not tracker.clear(port):
+            ctx.reporter.emit("error", message=f"No record for port {port}")
+            return EXIT_USAGE
+    
+    for status in tracker.statuses():
+        ctx.reporter.emit("port", **status.to_dict())
+    return EXIT_OK
+
+
+def cmd_serve(ctx: _Context) -> int:
+    from ..core import SchedulingPolicy
+    from ..daemon import Station, serve
+    
+    args = ctx.args
+    try:
+        # A partial rather than a lambda, so worker processes can receive it
+        station = Station(functools.partial(_make_backends, args.backends, args.mtk_da,
+                                            args.samsung_model),
+                          workers=args.workers, lock_timeout=args.lock_timeout,
+                          policy=SchedulingPolicy(args.schedule), processes=args.processes,
+                          retry_policy=_retry_policy(args))
+        station.refresh()
+    except ValueError as e:
+        ctx.reporter.emit("error", message=str(e))
+        return EXIT_USAGE
+    
+    # Ctrl+C stops the server; the station then cancels running jobs
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        serve(station, args.host, args.port, args.socket,
+              ready=lambda where: ctx.reporter.emit("listening", address=where))
+    except OSError as e:
+        ctx.reporter.emit("error", message=f"Cannot serve: {e}")
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Argument parser for the CLI."""
+    parser = argparse.ArgumentParser(
+        prog="secureos-flash",
+        description="SecureOS Flash - Universal Android flash tool"
+    )
+    parser.add_argument("--json", action="store_true",
+                        help="Write events and results as JSON lines on stdout")
+    parser.add_argument("--batch", action="store_true",
+                        help="Run on every attached (matching) device concurrently")
+    parser.add_argument("--jobs", "-j", type=int, default=0, metavar="N",
+                        help="Devices to work on at once in batch mode (default: all)")
+    parser.add_argument("--device", "-d", action="append", metavar="ID",
+                        help="Only use devices with this device id, USB path or model (repeatable)")
+    parser.add_argument("--backends", default=DEFAULT_BACKENDS,
+                        help=f"Comma-separated backends to try: heimdall, odin, fastboot, mediatek "
+                             f"(default: {DEFAULT_BACKENDS})")
+    parser.add_argument("--mtk-da", metavar="FILE",
+                        help="Download agent for the mediatek backend "
+                             "(default: $SECUREOS_FLASH_MTK_DA)")
+    parser.add_argument("--samsung-model", metavar="MODEL",
+                        help="Model of the device on the heimdall backend, which cannot "
+                             "read it (e.g. SM-G998B)")
+    parser.add_argument("--lock-timeout", type=float, default=None, metavar="SECONDS",
+                        help="Fail instead of waiting longer than this for a busy device")
+    parser.add_argument("--retries", type=int, default=2, metavar="N",
+                        help="Retry a transfer that fails in a transient way (USB reset, "
+                             "handshake, device dropped off) up to N times (default: 2)")
+    parser.add_argument("--reboot", action="store_true",
+                        help="Reboot devices when the operation ends")
+    parser.add_argument("--verbose", "-v", action="count", default=0,
+                        help="Log to stderr (-v info, -vv debug)")
+    
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+    
+    command = commands.add_parser("detect", help="List attached devices")
+    command.set_defaults(handler=cmd_detect)
+    
+    command = commands.add_parser("list-partitions", help="List a device's partitions")
+    command.set_defaults(handler=cmd_list_partitions)
+    
+    command = commands.add_parser("backup", help="Back up a partition")
+    command.add_argument("partition")
+    command.add_argument("--output", "-o",
+                         help="Backup file ({device} is replaced by the device id; "
+                              "default: the backup directory)")
+    command.set_defaults(handler=cmd_backup)
+    
+    command = commands.add_parser("flash", help="Flash an image to a partition")
+    command.add_argument("partition")
+    command.add_argument("image")
+    command.add_argument("--differential", action="store_true",
+                         help="Skip the flash if the partition already holds the image")
+    command.add_argument("--verify-readback", action="store_true",
+                         help="With --differential: confirm a match by reading the partition back "
+                              "(required to skip on devices that report no serial number)")
+    command.set_defaults(handler=cmd_flash)
+    
+    command = commands.add_parser("restore", help="Restore a partition from a backup")
+    command.add_argument("partition")
+    source = command.add_mutually_exclusive_group()
+    source.add_argument("--archive", help="Backup archive to restore from "
+                                          "(default: the newest catalogued backup)")
+    source.add_argument("--record", type=int, help="Catalog id of the backup to restore")
+    command.add_argument("--staging-dir",
+                         help="Where backends that cannot stream get a decompressed copy")
+    command.set_defaults(handler=cmd_restore)
+    
+    command = commands.add_parser("verify", help="Check a partition against an image")
+    command.add_argument("partition")
+    command.add_argument("image")
+    command.set_defaults(handler=cmd_verify)
+    
+    command = commands.add_parser("plan-run", help="Run a flash manifest (JSON or TOML)")
+    command.add_argument("manifest")
+    command.add_argument("--dry-run", action="store_true",
+                         help="Print the plan and estimated time without touching devices")
+    command.set_defaults(handler=cmd_plan_run)
+    
+    command = commands.add_parser("firmware-index", help="Index the firmware packages in a directory")
+    command.add_argument("directory")
+    command.add_argument("--full", action="store_true",
+                         help="Re-read every package, not only new and changed ones")
+    command.add_argument("--workers", type=int, default=2,
+                         help="Packages read at once (default: 2)")
+    command.add_argument("--library", metavar="FILE",
+                         help="Library database (default: the data directory)")
+    command.set_defaults(handler=cmd_firmware_index)
+    
+    command = commands.add_parser("firmware-match", help="List indexed firmware that fits a device")
+    command.add_argument("--min-bootloader", type=int, metavar="REV",
+                         help="Leave out Samsung firmware with an older bootloader revision")
+    command.add_argument("--library", metavar="FILE",
+                         help="Library database (default: the data directory)")
+    command.set_defaults(handler=cmd_firmware_match)
+    
+    command = commands.add_parser("scrub", help="Re-verify catalogued backups against their digests")
+    command.add_argument("--workers", type=int, default=None,
+                         help="Backups checked at once (default: CPU count)")
+    command.add_argument("--rate-limit", type=float, default=None, metavar="MB/S",
+                         help="Total read rate across all workers in MB/s (default: unlimited)")
+    command.add_argument("--max-age", type=float, default=7, metavar="DAYS",
+                         help="Only check backups not checked for this long (0 = all; default: 7)")
+    command.add_argument("--limit", type=int, metavar="N", help="Check at most N backups")
+    command.add_argument("--catalog", metavar="FILE",
+                         help="Backup catalog database (default: the data directory)")
+    command.set_defaults(handler=cmd_scrub)
+    
+    command = commands.add_parser("catalog-prune", help="Delete old backups by retention policy")
+    command.add_argument("--keep-last", type=int, default=5, metavar="N",
+                         help="Backups kept per device and partition (default: 5); the newest "
+                              "verified one is always kept")
+    command.add_argument("--max-age", type=float, default=None, metavar="DAYS",
+                         help="Also prune backups older than this")
+    command.add_argument("--keep-corrupt", action="store_true",
+                         help="Do not prune backups a scrub found corrupt or missing")
+    command.add_argument("--keep-files", action="store_true",
+                         help="Only remove catalog entries, not the backup files")
+    command.add_argument("--directory", metavar="DIR",
+                         help="Only prune backups stored below this directory")
+    command.add_argument("--catalog", metavar="FILE",
+                         help="Backup catalog database (default: the data directory)")
+    command.set_defaults(handler=cmd_catalog_prune)
+    
+    command = commands.add_parser("catalog-import", help="Catalog existing backups found in a directory")
+    command.add_argument("directory")
+    command.add_argument("--device-id", metavar="ID",
+                         help="Device to file backups under when their name does not say")
+    command.add_argument("--catalog", metavar="FILE",
+                         help="Backup catalog database (default: the data directory)")
+    command.set_defaults(handler=cmd_catalog_import)
+    
+    command = commands.add_parser("ports", help="Show USB port health")
+    command.add_argument("--clear", action="append", metavar="PORT",
+                         help="Forget a port's record, ending its quarantine (repeatable)")
+    command.set_defaults(handler=cmd_ports)
+    
+    command = commands.add_parser("serve", help="Run the station daemon (HTTP/JSON API)")
+    command.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    command.add_argument("--port", type=int, default=8765, help="TCP port (default: 8765)")
+    command.add_argument("--socket", metavar="PATH", help="Serve on a Unix socket instead of TCP")
+    command.add_argument("--workers", type=int, default=4,
+                         help="Devices worked on at once (default: 4)")
+    command.add_argument("--schedule", choices=["fifo", "sjf", "deadline"], default="sjf",
+                         help="Which waiting device gets a free worker: submission order, "
+                              "shortest estimated job first, or earliest deadline (default: sjf)")
+    command.add_argument("--processes", action="store_true",
+                         help="Run each device's session in its own worker process, restarted "
+                              "if it crashes or hangs")
+    command.set_defaults(handler=cmd_serve)
+    
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the CLI.
+    
+    Args:
+        argv: Arguments (None = sys.argv[1:])
+        
+    Returns:
+        Exit code
+    """
+    args = build_parser().parse_args(argv)
+    if args.jobs < 0:
+        build_parser().error("--jobs must not be negative")
+    
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=(logging.WARNING, logging.INFO, logging.DEBUG)[min(args.verbose, 2)],
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    from ..core.cancellation import CancellationToken
+    
+    cancel = CancellationToken()
+    ctx = _Context(args, Reporter(args.json), cancel)
+    
+    if threading.current_thread() is threading.main_thread():
+        def interrupt(_signum, _frame):
+            # A second Ctrl+C aborts immediately
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            cancel.cancel("Interrupted")
+        signal.signal(signal.SIGINT, interrupt)
+    
+    try:
+        code = args.handler(ctx)
+    except KeyboardInterrupt:
+        return EXIT_CANCELLED
+    
+    return EXIT_CANCELLED if cancel.cancelled and code != EXIT_OK else code
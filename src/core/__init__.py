@@ -1,5 +1,46 @@
 """Core package"""
-from .flash_backend import FlashBackend, DeviceInfo, FlashResult
-from .protocol_manager import ProtocolManager
+from .flash_backend import FlashBackend, DeviceInfo, FlashResult, PartitionInfo
+from .cancellation import CancellationToken, OperationCancelled
+from .protocol_manager import ProtocolManager, discover_devices
+from .digest_store import PartitionDigestStore, PartitionDigest
+from .backup_catalog import BackupCatalog, BackupRecord, RetentionPolicy
+from .backup_scrub import BackupScrubber, ScrubReport
+from .timeouts import TimeoutPolicy, ThroughputMeter, StallDetector
+from .device_locks import DeviceLockManager, DeviceBusy, LockStats, default_lock_manager
+from .job_journal import JobJournal, JobState
+from .flash_plan import PlanRunner, PlanStep
+from .plan_graph import PlanGraph, PlanNode, GraphExecutor, GraphResult
+from .manifest import Manifest, ManifestError, load_manifest, parse_manifest
+from .throughput_history import (ThroughputHistory, RateStats, DurationEstimate,
+                                 default_throughput_history)
+from .scheduling import SchedulingPolicy
+from .events import (EventBus, Event, DeviceAttached, SessionChanged, OperationStarted,
+                     OperationProgress, OperationFinished, PortHealthChanged, OperationRetrying,
+                     QueuedSubscriber, default_event_bus)
+from .profiling import Profiler, OperationProfile
+from .port_health import (PortHealthTracker, PortStatus, PortStats, HealthThresholds,
+                          default_port_health)
+from .firmware_library import FirmwareLibrary, FirmwarePackage, FirmwareMember, FirmwareMatch, ScanReport
+from .failures import Failure, RetryPolicy, classify
 
-__all__ = ['FlashBackend', 'DeviceInfo', 'FlashResult', 'ProtocolManager']
+__all__ = [
+    'FlashBackend', 'DeviceInfo', 'FlashResult', 'PartitionInfo', 'ProtocolManager', 'discover_devices',
+    'CancellationToken', 'OperationCancelled',
+    'PartitionDigestStore', 'PartitionDigest',
+    'BackupCatalog', 'BackupRecord', 'RetentionPolicy',
+    'BackupScrubber', 'ScrubReport',
+    'TimeoutPolicy', 'ThroughputMeter', 'StallDetector',
+    'DeviceLockManager', 'DeviceBusy', 'LockStats', 'default_lock_manager',
+    'JobJournal', 'JobState', 'PlanRunner', 'PlanStep',
+    'PlanGraph', 'PlanNode', 'GraphExecutor', 'GraphResult',
+    'Manifest', 'ManifestError', 'load_manifest', 'parse_manifest',
+    'ThroughputHistory', 'RateStats', 'DurationEstimate', 'default_throughput_history',
+    'SchedulingPolicy',
+    'EventBus', 'Event', 'DeviceAttached', 'SessionChanged', 'OperationStarted',
+    'OperationProgress', 'OperationFinished', 'PortHealthChanged', 'OperationRetrying',
+    'QueuedSubscriber', 'default_event_bus',
+    'Profiler', 'OperationProfile',
+    'PortHealthTracker', 'PortStatus', 'PortStats', 'HealthThresholds', 'default_port_health',
+    'FirmwareLibrary', 'FirmwarePackage', 'FirmwareMember', 'FirmwareMatch', 'ScanReport',
+    'Failure', 'RetryPolicy', 'classify'
+]
@@ -0,0 +1,436 @@
+"""
+SecureOS Flash - Indexed Backup Archive
+
+Single-file container for full-device backups. Every partition dump is
+compressed on its own and the archive ends with an index of per-partition
+offsets, so one partition can be restored without touching the others.
+
+Layout:
+    MAGIC (8 bytes)
+    member data (compressed partition dumps, back to back)
+    index (UTF-8 JSON)
+    trailer: index offset (uint64 LE) + INDEX_MAGIC (8 bytes)
+"""
+
+from typing import BinaryIO, Dict, Iterator, List, Optional
+from dataclasses import dataclass, asdict
+import bz2
+import hashlib
+import io
+import json
+import lzma
+import os
+import shutil
+import struct
+import time
+import zlib
+
+from ..utils.hashing import CHUNK_SIZE, DEFAULT_ALGORITHM
+
+
+MAGIC = b"SOSBAK01"
+INDEX_MAGIC = b"SOSBAKIX"
+TRAILER_FORMAT = "<Q8s"
+TRAILER_SIZE = struct.calcsize(TRAILER_FORMAT)
+
+# Supported member compressions
+COMPRESSIONS = ("zlib", "lzma", "bz2", "none")
+
+
+class BackupArchiveError(Exception):
+    """Raised for malformed archives or unknown members"""
+
+
+@dataclass
+class ArchiveMember:
+    """Index entry for one partition dump"""
+    partition: str
+    offset: int
+    compressed_size: int
+    size: int
+    digest: str
+    algorithm: str = DEFAULT_ALGORITHM
+    compression: str = "zlib"
+
+
+def _compressor(compression: str, level: int):
+    if compression == "zlib":
+        return zlib.compressobj(level)
+    if compression == "lzma":
+        return lzma.LZMACompressor(preset=min(level, 9))
+    if compression == "bz2":
+        return bz2.BZ2Compressor(max(level, 1))
+    if compression == "none":
+        return None
+    raise BackupArchiveError(f"Unknown compression: {compression}")
+
+
+def make_decompressor(compression: str):
+    """
+    Create a streaming decompressor for a member compression.
+    
+    Returns:
+        Decompressor object, or None for uncompressed members
+    """
+    if compression == "zlib":
+        return zlib.decompressobj()
+    if compression == "lzma":
+        return lzma.LZMADecompressor()
+    if compression == "bz2":
+        return bz2.BZ2Decompressor()
+    if compression == "none":
+        return None
+    raise BackupArchiveError(f"Unknown compression: {compression}")
+
+
+def decompress_chunks(decompressor, data) -> Iterator[bytes]:
+    """
+    Feed data to a decompressor, yielding output in blocks of at most
+    CHUNK_SIZE bytes so highly compressible dumps never blow up memory.
+    
+    Args:
+        decompressor: Object from make_decompressor() (None = passthrough)
+        data: Compressed input
+        
+    Yields:
+        Decompressed blocks
+    """
+    if decompressor is None:
+        yield data
+        return
+    
+    if hasattr(decompressor, "unconsumed_tail"):
+        # zlib
+        out = decompressor.decompress(data, CHUNK_SIZE)
+        while True:
+            if out:
+                yield out
+            if not decompressor.unconsumed_tail:
+                return
+            out = decompressor.decompress(decompressor.unconsumed_tail, CHUNK_SIZE)
+    
+    # lzma / bz2
+    out = decompressor.decompress(data, max_length=CHUNK_SIZE)
+    while True:
+        if out:
+            yield out
+        if decompressor.eof or decompressor.needs_input:
+            return
+        out = decompressor.decompress(b"", max_length=CHUNK_SIZE)
+
+
+def compress_dump(raw_file: str, output_file: str, compression: str = "zlib",
+                  level: int = 6, algorithm: str = DEFAULT_ALGORITHM) -> Dict:
+    """
+    Compress and hash a raw partition dump in one pass.
+    
+    Runs in worker processes while the next partition downloads, so it
+    only takes and returns picklable values.
+    
+    Args:
+        raw_file: Raw dump produced by backup_partition()
+        output_file: Where to write the compressed stream
+        compression: One of COMPRESSIONS
+        level: Compression level
+        algorithm: Digest algorithm for the raw data
+        
+    Returns:
+        Dict with size, compressed_size and digest
+    """
+    digest = hashlib.new(algorithm)
+    compressor = _compressor(compression, level)
+    size = 0
+    
+    with open(raw_file, "rb") as src, open(output_file, "wb") as dst:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            digest.update(chunk)
+            dst.write(compressor.compress(chunk) if compressor else chunk)
+        
+        if compressor:
+            dst.write(compressor.flush())
+        
+        compressed_size = dst.tell()
+    
+    return {
+        "size": size,
+        "compressed_size": compressed_size,
+        "digest": digest.hexdigest(),
+        "algorithm": algorithm
+    }
+
+
+class BackupArchiveWriter:
+    """
+    Builds a backup archive member by member.
+    
+    Members are appended in the order add_member() is called; the index
+    is written by close(). Used as a context manager, an exception
+    leaves the archive without an index, so it cannot pass for a
+    complete one.
+    """
+    
+    def __init__(self, path: str, metadata: Optional[Dict] = None):
+        """
+        Create a new archive.
+        
+        Args:
+            path: Archive file to create (overwritten if present)
+            metadata: Extra information stored in the index (device info, ...)
+        """
+        self.path = path
+        self.metadata = metadata or {}
+        self.members: List[ArchiveMember] = []
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+    
+    def add_member(self, partition: str, compressed_file: str, size: int,
+                   digest: str, compression: str,
+                   algorithm: str = DEFAULT_ALGORITHM) -> ArchiveMember:
+        """
+        Append an already compressed partition dump.
+        
+        Args:
+            partition: Partition name
+            compressed_file: Output of compress_dump()
+            size: Uncompressed size
+            digest: Digest of the uncompressed data
+            compression: Compression used for compressed_file
+            algorithm: Digest algorithm
+            
+        Returns:
+            The index entry for the new member
+        """
+        offset = self._file.tell()
+        
+        with open(compressed_file, "rb") as src:
+            shutil.copyfileobj(src, self._file, CHUNK_SIZE)
+        
+        member = ArchiveMember(
+            partition=partition,
+            offset=offset,
+            compressed_size=self._file.tell() - offset,
+            size=size,
+            digest=digest,
+            algorithm=algorithm,
+            compression=compression
+        )
+        self.members.append(member)
+        return member
+    
+    def close(self):
+        """Write the index and trailer and close the archive."""
+        if self._file.closed:
+            return
+        
+        try:
+            index_offset = self._file.tell()
+            index = {
+                "version": 1,
+                "created_at": time.time(),
+                "metadata": self.metadata,
+                "members": [asdict(m) for m in self.members]
+            }
+            self._file.write(json.dumps(index).encode("utf-8"))
+            self._file.write(struct.pack(TRAILER_FORMAT, index_offset, INDEX_MAGIC))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+    
+    def abort(self):
+        """Close the archive without writing an index (it stays unreadable)."""
+        self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class _MemberReader(io.RawIOBase):
+    """Streaming, decompressing reader over one archive member"""
+    
+    def __init__(self, f: BinaryIO, member: ArchiveMember):
+        self._f = f
+        self._remaining = member.compressed_size
+        self._compression = member.compression
+        self._decompressor = make_decompressor(member.compression)
+        self._pending = b""
+        self._eof = False
+        f.seek(member.offset)
+    
+    def readable(self):
+        return True
+    
+    def _read_raw(self, size: int) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        raw = self._f.read(min(size, self._remaining))
+        if not raw:
+            raise BackupArchiveError("Archive truncated")
+        self._remaining -= len(raw)
+        return raw
+    
+    def _inflate(self) -> bytes:
+        """Produce the next block of output, bounded to CHUNK_SIZE bytes"""
+        d = self._decompressor
+        
+        if d is None:
+            return self._read_raw(CHUNK_SIZE)
+        
+        if self._compression == "zlib":
+            data = d.unconsumed_tail or self._read_raw(CHUNK_SIZE)
+            if not data:
+                self._eof = True
+                return d.flush()
+            return d.decompress(data, CHUNK_SIZE)
+        
+        if d.eof:
+            self._eof = True
+            return b""
+        data = self._read_raw(CHUNK_SIZE) if d.needs_input else b""
+        if not data and d.needs_input:
+            raise BackupArchiveError("Archive truncated")
+        return d.decompress(data, max_length=CHUNK_SIZE)
+    
+    def readinto(self, b):
+        while not self._pending:
+            if self._eof:
+                return 0
+            self._pending = self._inflate()
+            if not self._pending and self._decompressor is None:
+                return 0
+        
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+    
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+class BackupArchive:
+    """
+    Read access to a backup archive.
+    
+    Only the trailer and index are read on open; member data is read
+    on demand.
+    """
+    
+    def __init__(self, path: str):
+        """
+        Open an archive.
+        
+        Args:
+            path: Archive file
+            
+        Raises:
+            BackupArchiveError: If the file is not a valid archive
+        """
+        self.path = path
+        
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise BackupArchiveError(f"Not a SecureOS backup archive: {path}")
+            
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            if end < len(MAGIC) + TRAILER_SIZE:
+                raise BackupArchiveError("Archive truncated")
+            
+            f.seek(end - TRAILER_SIZE)
+            index_offset, index_magic = struct.unpack(TRAILER_FORMAT, f.read(TRAILER_SIZE))
+            if index_magic != INDEX_MAGIC:
+                raise BackupArchiveError("Archive index missing (incomplete backup?)")
+            
+            if not len(MAGIC) <= index_offset <= end - TRAILER_SIZE:
+                raise BackupArchiveError(f"Archive index offset {index_offset} out of range")
+            f.seek(index_offset)
+            raw_index = f.read(end - TRAILER_SIZE - index_offset)
+        
+        try:
+            index = json.loads(raw_index.decode("utf-8"))
+            self.created_at: float = index.get("created_at", 0.0)
+            self.metadata: Dict = index.get("metadata", {})
+            self.members: Dict[str, ArchiveMember] = {
+                m["partition"].upper(): ArchiveMember(**m) for m in index.get("members", [])
+            }
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            raise BackupArchiveError(f"Archive index corrupt: {e}") from e
+    
+    def partitions(self) -> List[str]:
+        """
+        Get partitions contained in the archive.
+        
+        Returns:
+            Partition names in archive order
+        """
+        return [m.partition for m in sorted(self.members.values(), key=lambda m: m.offset)]
+    
+    def get_member(self, partition_name: str) -> ArchiveMember:
+        """
+        Look up a member by partition name.
+        
+        Raises:
+            BackupArchiveError: If the partition is not in the archive
+        """
+        member = self.members.get(partition_name.upper())
+        if member is None:
+            raise BackupArchiveError(f"Partition {partition_name} not in archive {self.path}")
+        return member
+    
+    def open_member(self, partition_name: str) -> BinaryIO:
+        """
+        Open a partition dump for streaming reads.
+        
+        Only this member's bytes are read and decompressed.
+        
+        Args:
+            partition_name: Partition to read
+            
+        Returns:
+            Binary file-like object yielding the uncompressed dump
+        """
+        member = self.get_member(partition_name)
+        return io.BufferedReader(_MemberReader(open(self.path, "rb"), member), CHUNK_SIZE)
+    
+    def extract(self, partition_name: str, output_file: str) -> str:
+        """
+        Restore one partition dump to a file, verifying its digest.
+        
+        Args:
+            partition_name: Partition to extract
+            output_file: Destination file
+            
+        Returns:
+            Digest of the extracted data
+            
+        Raises:
+            BackupArchiveError: If the data does not match the recorded digest
+        """
+        member = self.get_member(partition_name)
+        digest = hashlib.new(member.algorithm)
+        
+        with self.open_member(partition_name) as src, open(output_file, "wb") as dst:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                dst.write(chunk)
+        
+        if digest.hexdigest() != member.digest:
+            raise BackupArchiveError(f"Digest mismatch for {partition_name} in {self.path}")
+        
+        return member.digest
@@ -0,0 +1,481 @@
+"""
+SecureOS Flash - Backup Catalog
+
+SQLite index of every partition backup SecureOS Flash knows about:
+device, partition, size, digest, timestamp, storage location and
+verification status. Answers "latest verified bootloader for device X"
+without scanning directories, and prunes old backups by retention policy.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .backup_archive import BackupArchive, BackupArchiveError, MAGIC
+from ..utils.hashing import DEFAULT_ALGORITHM, file_digest
+from ..utils.paths import data_dir
+
+
+logger = logging.getLogger(__name__)
+
+
+# Verification states
+STATUS_UNVERIFIED = "unverified"
+STATUS_VERIFIED = "verified"
+STATUS_CORRUPT = "corrupt"
+STATUS_MISSING = "missing"
+
+# Legacy auto-backup name: secureos-backup-<partition>-<device_id>.img
+_LEGACY_NAME = re.compile(r"^secureos-backup-(?P<partition>[A-Za-z0-9_]+)-(?P<device>.+)\.img$")
+
+# Catalogued auto-backup name: <partition>-<YYYYmmdd-HHMMSS>.img
+_STAMPED_NAME = re.compile(r"^(?P<partition>[A-Za-z0-9_]+)-\d{8}-\d{6}\.img$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY,
+    device_id TEXT NOT NULL,
+    partition TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    location TEXT NOT NULL,
+    member TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'unverified',
+    verified_at REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_backups_location
+    ON backups (location, member);
+CREATE INDEX IF NOT EXISTS idx_backups_latest
+    ON backups (device_id, partition, status, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_backups_created
+    ON backups (created_at);
+CREATE INDEX IF NOT EXISTS idx_backups_checked
+    ON backups (verified_at);
+"""
+
+_COLUMNS = (
+    "id, device_id, partition, size, digest, algorithm, created_at, "
+    "location, member, status, verified_at"
+)
+
+
+@dataclass
+class BackupRecord:
+    """A catalogued partition backup"""
+    id: int
+    device_id: str
+    partition: str
+    size: int
+    digest: str
+    algorithm: str
+    created_at: float
+    location: str
+    member: str = ""  # Partition name inside an archive, "" for raw files
+    status: str = STATUS_UNVERIFIED
+    verified_at: Optional[float] = None
+    
+    @property
+    def in_archive(self) -> bool:
+        """True if the backup is a member of a backup archive"""
+        return bool(self.member)
+
+
+@dataclass
+class RetentionPolicy:
+    """
+    Which backups to keep.
+    
+    A backup is pruned if it is beyond keep_last for its device/partition
+    or older than max_age_days. The newest verified backup of every
+    device/partition is always kept.
+    """
+    keep_last: Optional[int] = 5
+    max_age_days: Optional[float] = None
+    prune_corrupt: bool = True
+
+
+class BackupCatalog:
+    """
+    SQLite catalog of partition backups.
+    
+    Safe to share between threads; all access goes through one
+    connection guarded by a lock.
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        """
+        Open (or create) a catalog.
+        
+        Args:
+            path: SQLite database file (None = <data dir>/catalog.sqlite)
+        """
+        self.path = path or os.path.join(data_dir(), "catalog.sqlite")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+    
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+    
+    def add(self, device_id: str, partition: str, location: str, size: int,
+            digest: str, algorithm: str = DEFAULT_ALGORITHM, member: str = "",
+            created_at: Optional[float] = None,
+            status: str = STATUS_UNVERIFIED) -> BackupRecord:
+        """
+        Record a backup. Re-adding the same location replaces the old entry.
+        
+        Args:
+            device_id: Device the backup was taken from
+            partition: Partition name
+            location: Backup file (or archive) path
+            size: Uncompressed size in bytes
+            digest: Digest of the uncompressed data
+            algorithm: Digest algorithm
+            member: Partition name inside an archive ("" for raw files)
+            created_at: Backup time (None = now)
+            status: Verification status
+            
+        Returns:
+            The stored BackupRecord
+        """
+        row = (
+            device_id, partition.upper(), size, digest, algorithm,
+            created_at if created_at is not None else time.time(),
+            os.path.abspath(location), member.upper(), status
+        )
+        
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO backups (device_id, partition, size, digest, "
+                "algorithm, created_at, location, member, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row
+            )
+            record_id = cursor.lastrowid
+        
+        return BackupRecord(record_id, *row)
+    
+    def get(self, record_id: int) -> Optional[BackupRecord]:
+        """
+        Get a backup by id.
+        
+        Returns:
+            BackupRecord or None
+        """
+        rows = self._query(f"SELECT {_COLUMNS} FROM backups WHERE id = ?", (record_id,))
+        return rows[0] if rows else None
+    
+    def latest(self, device_id: str, partition: str,
+               verified_only: bool = True) -> Optional[BackupRecord]:
+        """
+        Get the most recent backup of a partition.
+        
+        Args:
+            device_id: Device identifier
+            partition: Partition name
+            verified_only: Only consider backups with status "verified"
+            
+        Returns:
+            BackupRecord or None
+        """
+        if verified_only:
+            rows = self._query(
+                f"SELECT {_COLUMNS} FROM backups WHERE device_id = ? AND partition = ? "
+                "AND status = ? ORDER BY created_at DESC LIMIT 1",
+                (device_id, partition.upper(), STATUS_VERIFIED)
+            )
+        else:
+            rows = self._query(
+                f"SELECT {_COLUMNS} FROM backups WHERE device_id = ? AND partition = ? "
+                "AND status IN (?, ?) ORDER BY created_at DESC LIMIT 1",
+                (device_id, partition.upper(), STATUS_VERIFIED, STATUS_UNVERIFIED)
+            )
+        return rows[0] if rows else None
+    
+    def find(self, device_id: Optional[str] = None, partition: Optional[str] = None,
+             status: Optional[str] = None, limit: Optional[int] = None) -> List[BackupRecord]:
+        """
+        List backups, newest first.
+        
+        Args:
+            device_id: Filter by device
+            partition: Filter by partition
+            status: Filter by verification status
+            limit: Maximum number of records
+            
+        Returns:
+            List of BackupRecord
+        """
+        clauses, params = [], []
+        for column, value in (("device_id", device_id), ("status", status),
+                              ("partition", partition.upper() if partition else None)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        
+        sql = f"SELECT {_COLUMNS} FROM backups"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        return self._query(sql, tuple(params))
+    
+    def due_for_scrub(self, checked_before: float, device_id: Optional[str] = None,
+                      limit: Optional[int] = None) -> List[BackupRecord]:
+        """
+        List backups not checked since a point in time, least recently
+        checked (or never checked) first.
+        
+        Args:
+            checked_before: Only return backups last checked before this time
+            device_id: Filter by device
+            limit: Maximum number of records
+            
+        Returns:
+            List of BackupRecord
+        """
+        sql = (
+            f"SELECT {_COLUMNS} FROM backups "
+            "WHERE (verified_at IS NULL OR verified_at < ?)"
+        )
+        params: list = [checked_before]
+        if device_id is not None:
+            sql += " AND device_id = ?"
+            params.append(device_id)
+        sql += " ORDER BY verified_at IS NOT NULL, verified_at, location, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        return self._query(sql, tuple(params))
+    
+    def set_status(self, record_id: int, status: str):
+        """
+        Update the verification status of a backup.
+        
+        Args:
+            record_id: Backup id
+            status: New status (verified / unverified / corrupt / missing)
+        """
+        self.set_statuses([(record_id, status)])
+    
+    def set_statuses(self, updates: Iterable[Tuple[int, str]]):
+        """
+        Update verification status of many backups in one transaction.
+        
+        Args:
+            updates: (record_id, status) pairs
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE backups SET status = ?, verified_at = ? WHERE id = ?",
+                [(status, now, record_id) for record_id, status in updates]
+            )
+    
+    def remove(self, record_ids: Iterable[int]):
+        """
+        Remove backups from the catalog (files are left alone).
+        
+        Args:
+            record_ids: Backup ids
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM backups WHERE id = ?",
+                [(record_id,) for record_id in record_ids]
+            )
+    
+    def apply_retention(self, policy: RetentionPolicy, batch_size: int = 500,
+                        delete_files: bool = True, directory: Optional[str] = None) -> int:
+        """
+        Prune backups according to a retention policy.
+        
+        Records are deleted in batches of batch_size, each batch in its own
+        transaction, so pruning a large catalog never holds the database
+        for long. Raw backup files are deleted with their record; an archive
+        is deleted once none of its members remain catalogued.
+        
+        Args:
+            policy: What to keep
+            batch_size: Records deleted per transaction
+            delete_files: Also delete the pruned backup files
+            directory: Only consider backups stored below this directory
+                       (None = the whole catalog)
+                       
+        Returns:
+            Number of records pruned
+        """
+        doomed = self._retention_candidates(policy, directory)
+        if not doomed:
+            return 0
+        
+        logger.info(f"Pruning {len(doomed)} backups")
+        archives = set()
+        
+        for start in range(0, len(doomed), batch_size):
+            batch = doomed[start:start + batch_size]
+            self.remove(record.id for record in batch)
+            
+            if delete_files:
+                for record in batch:
+                    if record.in_archive:
+                        archives.add(record.location)
+                    else:
+                        self._delete_file(record.location)
+        
+        for archive in archives:
+            remaining = self._query(
+                f"SELECT {_COLUMNS} FROM backups WHERE location = ? LIMIT 1", (archive,)
+            )
+            if not remaining:
+                self._delete_file(archive)
+        
+        return len(doomed)
+    
+    def _retention_candidates(self, policy: RetentionPolicy,
+                              directory: Optional[str] = None) -> List[BackupRecord]:
+        """Records a policy would prune (oldest first)."""
+        cutoff = None
+        if policy.max_age_days is not None:
+            cutoff = time.time() - policy.max_age_days * 86400
+        
+        # Newest first within each device/partition; rank 1 = newest
+        rows = self._query(
+            f"SELECT {_COLUMNS} FROM backups ORDER BY device_id, partition, created_at DESC"
+        )
+        if directory is not None:
+            prefix = os.path.join(os.path.abspath(directory), "")
+            rows = [record for record in rows if record.location.startswith(prefix)]
+        
+        doomed = []
+        rank: Dict[Tuple[str, str], int] = {}
+        kept_verified = set()
+        
+        for record in rows:
+            key = (record.device_id, record.partition)
+            rank[key] = rank.get(key, 0) + 1
+            
+            if record.status in (STATUS_CORRUPT, STATUS_MISSING):
+                if policy.prune_corrupt:
+                    doomed.append(record)
+                continue
+            
+            if record.status == STATUS_VERIFIED and key not in kept_verified:
+                kept_verified.add(key)
+                continue
+            
+            too_many = policy.keep_last is not None and rank[key] > policy.keep_last
+            too_old = cutoff is not None and record.created_at < cutoff
+            if too_many or too_old:
+                doomed.append(record)
+        
+        doomed.sort(key=lambda r: r.created_at)
+        return doomed
+    
+    def import_directory(self, directory: str, device_id: Optional[str] = None) -> int:
+        """
+        Catalog existing backups found below a directory.
+        
+        Backup archives are imported member by member from their index.
+        Raw .img files are hashed; device and partition come from the
+        file name (secureos-backup-<partition>-<device>.img, or
+        <device>/<partition>-<timestamp>.img) or from device_id.
+        Files that are already catalogued are skipped.
+        
+        Args:
+            directory: Directory tree to scan
+            device_id: Device to assume when a file name does not say
+            
+        Returns:
+            Number of backups added
+        """
+        known = {row[0] for row in self._execute("SELECT DISTINCT location FROM backups")}
+        rows = []
+        
+        for root, _dirs, files in os.walk(directory):
+            for name in sorted(files):
+                path = os.path.abspath(os.path.join(root, name))
+                if path in known:
+                    continue
+                
+                try:
+                    rows.extend(self._scan_file(path, name, device_id))
+                except (OSError, BackupArchiveError) as e:
+                    logger.warning(f"Skipping {path}: {e}")
+        
+        if rows:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO backups (device_id, partition, size, digest, "
+                    "algorithm, created_at, location, member, status) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+        
+        logger.info(f"Imported {len(rows)} backups from {directory}")
+        return len(rows)
+    
+    def _scan_file(self, path: str, name: str, device_id: Optional[str]) -> List[tuple]:
+        """Catalog rows for one file found by import_directory()."""
+        with open(path, "rb") as f:
+            is_archive = f.read(len(MAGIC)) == MAGIC
+        
+        if is_archive:
+            archive = BackupArchive(path)
+            device = (archive.metadata.get("catalog_key")
+                      or archive.metadata.get("device", {}).get("device_id")
+                      or device_id or "unknown")
+            return [
+                (device, m.partition.upper(), m.size, m.digest, m.algorithm,
+                 archive.created_at, path, m.partition.upper(), STATUS_UNVERIFIED)
+                for m in archive.members.values()
+            ]
+        
+        if not name.endswith(".img"):
+            return []
+        
+        legacy = _LEGACY_NAME.match(name)
+        stamped = _STAMPED_NAME.match(name)
+        if legacy:
+            partition, device = legacy.group("partition"), legacy.group("device")
+        elif stamped:
+            partition = stamped.group("partition")
+            device = device_id or os.path.basename(os.path.dirname(path))
+        else:
+            partition, device = os.path.splitext(name)[0], device_id or "unknown"
+        
+        st = os.stat(path)
+        return [(
+            device, partition.upper(), st.st_size, file_digest(path), DEFAULT_ALGORITHM,
+            st.st_mtime, path, "", STATUS_UNVERIFIED
+        )]
+    
+    def _delete_file(self, path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not delete {path}: {e}")
+    
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+    
+    def _query(self, sql: str, params: tuple = ()) -> List[BackupRecord]:
+        return [BackupRecord(*row) for row in self._execute(sql, params)]
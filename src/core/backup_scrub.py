@@ -0,0 +1,325 @@
+"""
+SecureOS Flash - Backup Scrubber
+
+Re-verifies catalogued backups against their recorded digests so silent
+corruption is found before a restore needs the data. Files are read
+through mmap on a process pool with an overall I/O rate limit, so a
+scrub can run next to live flashing.
+
+Results are written to the catalog as they come in; an interrupted
+scrub picks up with the backups it has not checked yet. A backup that
+cannot be read at all (permissions, I/O errors) is reported but keeps
+its catalog status, so the next scrub tries it again.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import mmap
+import os
+import time
+
+from .backup_archive import (
+    BackupArchive, BackupArchiveError, decompress_chunks, make_decompressor
+)
+from .backup_catalog import (
+    BackupCatalog, BackupRecord,
+    STATUS_CORRUPT, STATUS_MISSING, STATUS_VERIFIED
+)
+from ..utils.hashing import CHUNK_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+
+# Scrub outcome for a backup that could not be read; not stored in the catalog
+UNREADABLE = "unreadable"
+
+
+@dataclass
+class ScrubReport:
+    """Outcome of a scrub run"""
+    checked: int = 0
+    verified: int = 0
+    bytes_read: int = 0
+    elapsed: float = 0.0
+    corrupt: List[BackupRecord] = field(default_factory=list)
+    missing: List[BackupRecord] = field(default_factory=list)
+    unreadable: List[BackupRecord] = field(default_factory=list)
+    
+    @property
+    def clean(self) -> bool:
+        """True if every backup checked was verified"""
+        return not self.corrupt and not self.missing and not self.unreadable
+
+
+class _Pacer:
+    """Sleeps as needed to keep reads under a byte rate"""
+    
+    def __init__(self, rate: Optional[float]):
+        self.rate = rate
+        self.start = time.monotonic()
+        self.done = 0
+    
+    def consume(self, n: int):
+        self.done += n
+        if self.rate:
+            ahead = self.done / self.rate - (time.monotonic() - self.start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def scrub_file(path: str, size: int, digest: str, algorithm: str,
+               rate: Optional[float] = None, offset: int = 0,
+               compressed_size: Optional[int] = None,
+               compression: Optional[str] = None) -> Tuple[str, int, str]:
+    """
+    Verify one backup (a raw file, or one member of an archive).
+    
+    Runs in worker processes. The file is mapped read-only and hashed in
+    CHUNK_SIZE slices; archive members are decompressed from their slice
+    of the mapping.
+    
+    Args:
+        path: Backup file or archive
+        size: Expected uncompressed size
+        digest: Expected digest
+        algorithm: Digest algorithm
+        rate: Maximum read rate in bytes/second (None = unlimited)
+        offset: Member offset inside an archive
+        compressed_size: Member length inside an archive (None = raw file)
+        compression: Member compression
+        
+    Returns:
+        (status, bytes read, detail); status is a catalog status or UNREADABLE
+    """
+    try:
+        return _scrub_file(path, size, digest, algorithm, rate, offset,
+                           compressed_size, compression)
+    except OSError as e:
+        return UNREADABLE, 0, str(e)
+
+
+def _scrub_file(path: str, size: int, digest: str, algorithm: str, rate: Optional[float],
+                offset: int, compressed_size: Optional[int],
+                compression: Optional[str]) -> Tuple[str, int, str]:
+    try:
+        file_size = os.path.getsize(path)
+    except FileNotFoundError:
+        return STATUS_MISSING, 0, "file not found"
+    
+    length = file_size if compressed_size is None else compressed_size
+    if compressed_size is None and file_size != size:
+        return STATUS_CORRUPT, 0, f"size {file_size} != {size}"
+    if offset + length > file_size:
+        return STATUS_CORRUPT, 0, "archive truncated"
+    
+    h = hashlib.new(algorithm)
+    decompressor = make_decompressor(compression) if compression else None
+    pacer = _Pacer(rate)
+    produced = 0
+    
+    if length:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            view = memoryview(m)
+            try:
+                for start in range(offset, offset + length, CHUNK_SIZE):
+                    with view[start:min(start + CHUNK_SIZE, offset + length)] as chunk:
+                        for data in decompress_chunks(decompressor, chunk):
+                            h.update(data)
+                            produced += len(data)
+                        pacer.consume(len(chunk))
+                if decompressor is not None and hasattr(decompressor, "flush"):
+                    tail = decompressor.flush()
+                    h.update(tail)
+                    produced += len(tail)
+            except Exception as e:
+                return STATUS_CORRUPT, pacer.done, f"decompression failed: {e}"
+            finally:
+                view.release()
+    
+    if produced != size:
+        return STATUS_CORRUPT, pacer.done, f"size {produced} != {size}"
+    if h.hexdigest() != digest:
+        return STATUS_CORRUPT, pacer.done, "digest mismatch"
+    return STATUS_VERIFIED, pacer.done, ""
+
+
+class BackupScrubber:
+    """
+    Parallel, rate-limited verification of catalogued backups.
+    """
+    
+    def __init__(self, catalog: BackupCatalog, workers: Optional[int] = None,
+                 rate_limit: Optional[float] = None, commit_every: int = 50):
+        """
+        Initialize scrubber.
+        
+        Args:
+            catalog: Catalog whose backups are scrubbed
+            workers: Worker processes (None = CPU count)
+            rate_limit: Total read rate in bytes/second across all workers
+                        (None = unlimited)
+            commit_every: Results written to the catalog per transaction
+        """
+        self.catalog = catalog
+        self.workers = workers or os.cpu_count() or 1
+        self.rate_limit = rate_limit
+        self.commit_every = commit_every
+    
+    def scrub(self, max_age: float = 7 * 86400, device_id: Optional[str] = None,
+              limit: Optional[int] = None,
+              progress: Optional[Callable[[BackupRecord, str], None]] = None) -> ScrubReport:
+        """
+        Verify backups not checked within max_age seconds.
+        
+        Args:
+            max_age: Re-check backups last checked longer ago than this
+                     (0 = check everything)
+            device_id: Only scrub backups of this device
+            limit: Check at most this many backups
+            progress: Called with (record, status) as each backup is checked
+            
+        Returns:
+            ScrubReport
+        """
+        started = time.time()
+        records = self.catalog.due_for_scrub(started - max_age, device_id, limit)
+        report = ScrubReport()
+        
+        if not records:
+            return report
+        
+        logger.info(f"Scrubbing {len(records)} backups with {self.workers} workers")
+        per_worker_rate = self.rate_limit / self.workers if self.rate_limit else None
+        archives: Dict[str, Union[BackupArchive, Tuple[str, str]]] = {}
+        updates: List[Tuple[int, str]] = []
+        queue = list(reversed(records))
+        running = {}
+        
+        retried = set()  # Records already requeued after a worker died
+        pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            while queue or running:
+                # Keep a small window in flight so an interrupted scrub
+                # loses little work and results stream into the catalog
+                broken = False
+                while queue and not broken:
+                    # Backups retried after a worker died run alone, so
+                    # whichever kills a worker again is the culprit
+                    isolate = queue[-1].id in retried or any(r.id in retried for r in running.values())
+                    if len(running) >= (1 if isolate else self.workers * 2):
+                        break
+                    record = queue.pop()
+                    try:
+                        submitted = self._submit(pool, record, per_worker_rate, archives)
+                    except BrokenProcessPool:
+                        queue.append(record)
+                        broken = True
+                        break
+                    if isinstance(submitted, tuple):
+                        status, detail = submitted
+                        self._finish(report, record, status, 0, detail, updates, progress)
+                    else:
+                        running[submitted] = record
+                
+                if running and not broken:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        try:
+                            status, bytes_read, detail = future.result()
+                        except BrokenProcessPool:
+                            broken = True
+                            continue
+                        except Exception as e:
+                            status, bytes_read, detail = UNREADABLE, 0, f"scrub failed: {e!r}"
+                        self._finish(report, running.pop(future), status, bytes_read, detail,
+                                     updates, progress)
+                
+                if broken:
+                    # A worker died (SIGBUS on a file truncated under its
+                    # mapping, OOM...) and took the pool's other jobs with it.
+                    # Which backup did it is unknown: each gets one more try.
+                    logger.warning("Scrub worker died - restarting the pool")
+                    pool.shutdown(wait=False)
+                    for record in running.values():
+                        if record.id in retried:
+                            self._finish(report, record, UNREADABLE, 0, "scrub worker died",
+                                         updates, progress)
+                        else:
+                            retried.add(record.id)
+                            queue.append(record)
+                    running.clear()
+                    pool = ProcessPoolExecutor(max_workers=self.workers)
+                
+                if len(updates) >= self.commit_every:
+                    self.catalog.set_statuses(updates)
+                    updates.clear()
+        finally:
+            for future in running:
+                future.cancel()
+            pool.shutdown(wait=True)
+            # Also on the way out of an interrupted scrub, so its results count
+            if updates:
+                self.catalog.set_statuses(updates)
+        
+        report.elapsed = time.time() - started
+        logger.info(
+            f"Scrub complete: {report.verified} ok, {len(report.corrupt)} corrupt, "
+            f"{len(report.missing)} missing, {len(report.unreadable)} unreadable"
+        )
+        return report
+    
+    def _submit(self, pool: ProcessPoolExecutor, record: BackupRecord,
+                rate: Optional[float], archives: Dict[str, Union[BackupArchive, Tuple[str, str]]]):
+        """Queue a backup for checking; returns its future, or (status, detail) if settled already."""
+        if not record.in_archive:
+            return pool.submit(scrub_file, record.location, record.size, record.digest,
+                               record.algorithm, rate)
+        
+        if record.location not in archives:
+            try:
+                archives[record.location] = BackupArchive(record.location)
+            except FileNotFoundError:
+                archives[record.location] = (STATUS_MISSING, "archive not found")
+            except BackupArchiveError as e:
+                archives[record.location] = (STATUS_CORRUPT, str(e))
+            except OSError as e:
+                archives[record.location] = (UNREADABLE, f"cannot read archive: {e}")
+        
+        archive = archives[record.location]
+        if isinstance(archive, tuple):
+            return archive
+        if record.member not in archive.members:
+            return STATUS_CORRUPT, f"{record.member} not in archive index"
+        
+        member = archive.members[record.member]
+        return pool.submit(scrub_file, record.location, record.size, record.digest,
+                           record.algorithm, rate, member.offset,
+                           member.compressed_size, member.compression)
+    
+    def _finish(self, report: ScrubReport, record: BackupRecord, status: str,
+                bytes_read: int, detail: str, updates: List[Tuple[int, str]],
+                progress: Optional[Callable[[BackupRecord, str], None]]):
+        report.checked += 1
+        report.bytes_read += bytes_read
+        if status != UNREADABLE:
+            updates.append((record.id, status))
+        
+        if status == STATUS_VERIFIED:
+            report.verified += 1
+        elif status == UNREADABLE:
+            logger.warning(f"Backup unreadable: {record.location} ({detail})")
+            report.unreadable.append(record)
+        elif status == STATUS_MISSING:
+            logger.warning(f"Backup missing: {record.location} ({detail})")
+            report.missing.append(record)
+        else:
+            logger.warning(f"Backup corrupt: {record.location} {record.member} ({detail})")
+            report.corrupt.append(record)
+        
+        if progress:
+            progress(record, status)
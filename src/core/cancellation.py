@@ -0,0 +1,136 @@
+"""
+SecureOS Flash - Cancellation
+
+Cooperative cancellation for long-running operations. A token is handed
+to an operation; cancelling it wakes any wait, kills child processes
+through registered callbacks and makes the next checkpoint raise
+OperationCancelled.
+"""
+
+from typing import Callable, List, Optional
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class OperationCancelled(Exception):
+    """Raised at a checkpoint once the operation's token is cancelled"""
+
+
+class CancellationToken:
+    """
+    Thread-safe cancellation flag with callbacks.
+    
+    The operator (GUI, scheduler) calls cancel(); the operation calls
+    raise_if_cancelled() at safe points and registers callbacks for work
+    it cannot poll, such as a child process.
+    """
+    
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    def cancel(self, reason: str = "Cancelled by user"):
+        """
+        Request cancellation. Safe to call from any thread, more than once.
+        
+        Args:
+            reason: Reported in the OperationCancelled error
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        
+        logger.info(f"Cancellation requested: {reason}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed: {e}")
+    
+    def raise_if_cancelled(self):
+        """
+        Checkpoint: stop here if cancellation was requested.
+        
+        Raises:
+            OperationCancelled: If cancel() has been called
+        """
+        if self._event.is_set():
+            raise OperationCancelled(self.reason)
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Sleep until cancelled or the timeout passes.
+        
+        Returns:
+            True if cancelled
+        """
+        return self._event.wait(timeout)
+    
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Register a callback to run on cancellation (immediately if the
+        token is already cancelled).
+        
+        Args:
+            callback: Called once, from the thread that cancels
+            
+        Returns:
+            Function that unregisters the callback
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                registered = True
+            else:
+                registered = False
+        
+        if not registered:
+            callback()
+        
+        def unregister():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+        
+        return unregister
+
+
+def checkpoint(cancel: Optional[CancellationToken]):
+    """Raise OperationCancelled if `cancel` is set (None = never cancelled)."""
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+
+
+def cancellable_progress(cancel: Optional[CancellationToken],
+                         progress: Optional[Callable[[int, int], None]] = None):
+    """
+    Wrap a progress callback so every progress event is also a checkpoint.
+    
+    Args:
+        cancel: Token to check
+        progress: Callback to forward to (may be None)
+        
+    Returns:
+        Progress callback, or `progress` unchanged if there is no token
+    """
+    if cancel is None:
+        return progress
+    
+    def report(done: int, total: int):
+        cancel.raise_if_cancelled()
+        if progress:
+            progress(done, total)
+    
+    return report
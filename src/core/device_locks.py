@@ -0,0 +1,287 @@
+"""
+SecureOS Flash - Device Locks
+
+Serializes operations per physical device while letting different
+devices work in parallel. Locks are reentrant, so a multi-step plan can
+hold a device across steps that lock it again, and fair: waiters get the
+device in the order they asked for it. Plans that need several devices
+acquire them together, in a fixed order, so they cannot deadlock.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, Iterator, List, Optional
+import logging
+import threading
+import time
+
+from .cancellation import CancellationToken, OperationCancelled
+
+
+logger = logging.getLogger(__name__)
+
+
+# Waits longer than this are logged
+SLOW_WAIT = 1.0
+
+
+class DeviceBusy(TimeoutError):
+    """Raised when a device lock could not be acquired in time"""
+
+
+@dataclass
+class LockStats:
+    """Wait and hold times of one device lock"""
+    acquisitions: int = 0
+    contended: int = 0          # Acquisitions that had to wait
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    hold_total: float = 0.0
+    timeouts: int = 0
+    cancellations: int = 0
+    
+    @property
+    def wait_mean(self) -> float:
+        return self.wait_total / self.acquisitions if self.acquisitions else 0.0
+
+
+class DeviceLock:
+    """
+    Fair, reentrant lock for one device.
+    
+    Waiters are served first-come, first-served. The owning thread may
+    acquire again; the lock is released when every acquire has been
+    matched by a release.
+    """
+    
+    def __init__(self, key: str):
+        """
+        Initialize lock.
+        
+        Args:
+            key: Device key (USB path or device id)
+        """
+        self.key = key
+        self.stats = LockStats()
+        # Reentrant so a cancellation callback fired from inside acquire() cannot deadlock
+        self._cond = threading.Condition(threading.RLock())
+        self._queue: Deque[object] = deque()
+        self._owner: Optional[int] = None
+        self._count = 0
+        self._operation = ""
+        self._acquired_at = 0.0
+    
+    @property
+    def owner_operation(self) -> Optional[str]:
+        """Operation currently holding the lock, None if free"""
+        return self._operation if self._owner is not None else None
+    
+    @property
+    def waiting(self) -> int:
+        """Number of threads queued for the lock"""
+        return len(self._queue)
+    
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+    
+    def acquire(self, operation: str = "", timeout: Optional[float] = None,
+                cancel: Optional[CancellationToken] = None) -> bool:
+        """
+        Acquire the lock, queuing behind earlier waiters.
+        
+        Args:
+            operation: What the lock is for (shown to later waiters and in logs)
+            timeout: Maximum wait in seconds (None = wait until cancelled)
+            cancel: Token that aborts the wait
+            
+        Returns:
+            True if acquired, False on timeout
+            
+        Raises:
+            OperationCancelled: `cancel` was cancelled while waiting
+        """
+        me = threading.get_ident()
+        started = time.monotonic()
+        
+        with self._cond:
+            if self._owner == me:
+                self._count += 1
+                return True
+            
+            if self._owner is not None or self._queue:
+                if not self._wait_turn(operation, started, timeout, cancel):
+                    return False
+                waited = time.monotonic() - started
+                self.stats.contended += 1
+            else:
+                waited = 0.0
+            
+            self._owner = me
+            self._count = 1
+            self._operation = operation
+            self._acquired_at = time.monotonic()
+            self.stats.acquisitions += 1
+            self.stats.wait_total += waited
+            self.stats.wait_max = max(self.stats.wait_max, waited)
+        
+        if waited >= SLOW_WAIT:
+            logger.info(f"{operation or 'Operation'} waited {waited:.1f}s for device {self.key}")
+        return True
+    
+    def _wait_turn(self, operation: str, started: float, timeout: Optional[float],
+                   cancel: Optional[CancellationToken]) -> bool:
+        """Queue and wait until first in line with the lock free (called with _cond held)."""
+        ticket = object()
+        self._queue.append(ticket)
+        logger.debug(f"{operation or 'Operation'} queued for device {self.key} "
+                     f"(held by {self._operation or 'unknown'}, {len(self._queue)} waiting)")
+        unregister = cancel.on_cancel(self._wake) if cancel is not None else None
+        
+        try:
+            while self._owner is not None or self._queue[0] is not ticket:
+                if cancel is not None and cancel.cancelled:
+                    self.stats.cancellations += 1
+                    raise OperationCancelled(cancel.reason)
+                
+                remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                if remaining is not None and remaining <= 0:
+                    self.stats.timeouts += 1
+                    return False
+                self._cond.wait(remaining)
+            
+            self._queue.popleft()
+            return True
+        finally:
+            if ticket in self._queue:
+                # Gave up: let the next waiter re-check whether it is first
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+            if unregister is not None:
+                unregister()
+    
+    def release(self):
+        """
+        Release one level of ownership.
+        
+        Raises:
+            RuntimeError: The calling thread does not own the lock
+        """
+        with self._cond:
+            if self._owner != threading.get_ident():
+                raise RuntimeError(f"Device lock {self.key} released by a thread that does not own it")
+            
+            self._count -= 1
+            if self._count:
+                return
+            
+            self.stats.hold_total += time.monotonic() - self._acquired_at
+            self._owner = None
+            self._operation = ""
+            self._cond.notify_all()
+
+
+class DeviceLockManager:
+    """
+    Locks keyed by physical device.
+    
+    One manager should be shared by everything that talks to devices in
+    the process; default_lock_manager() returns the shared instance.
+    """
+    
+    def __init__(self):
+        self._locks: Dict[str, DeviceLock] = {}
+        self._lock = threading.Lock()
+    
+    def lock_for(self, key: str) -> DeviceLock:
+        """
+        Get (or create) the lock for a device.
+        
+        Args:
+            key: Device key (USB path or device id)
+            
+        Returns:
+            DeviceLock
+        """
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = DeviceLock(key)
+            return lock
+    
+    @contextmanager
+    def hold(self, keys: Iterable[str], operation: str = "",
+             timeout: Optional[float] = None,
+             cancel: Optional[CancellationToken] = None) -> Iterator[None]:
+        """
+        Hold one or more devices for the duration of a block.
+        
+        Keys are acquired in sorted order, all before the block runs, so
+        two plans that need overlapping sets of devices cannot deadlock.
+        
+        Args:
+            keys: Device keys (a single key string is also accepted)
+            operation: What the devices are held for
+            timeout: Maximum total wait in seconds (None = no limit)
+            cancel: Token that aborts the wait
+            
+        Raises:
+            DeviceBusy: A device could not be acquired within the timeout
+            OperationCancelled: `cancel` was cancelled while waiting
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+        
+        deadline = None if timeout is None else time.monotonic() + timeout
+        held: List[DeviceLock] = []
+        
+        try:
+            for key in sorted(set(keys)):
+                lock = self.lock_for(key)
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if not lock.acquire(operation, remaining, cancel):
+                    raise DeviceBusy(
+                        f"Device {key} busy ({lock.owner_operation or 'in use'}) "
+                        f"- gave up after {timeout:.1f}s"
+                    )
+                held.append(lock)
+            
+            yield
+        finally:
+            for lock in reversed(held):
+                lock.release()
+    
+    def stats(self) -> Dict[str, LockStats]:
+        """
+        Wait/hold statistics per device.
+        
+        Returns:
+            Mapping of device key to LockStats
+        """
+        with self._lock:
+            return {key: lock.stats for key, lock in self._locks.items()}
+    
+    def busy(self) -> Dict[str, str]:
+        """
+        Devices currently locked.
+        
+        Returns:
+            Mapping of device key to the operation holding it
+        """
+        with self._lock:
+            locks = list(self._locks.values())
+        return {lock.key: lock.owner_operation for lock in locks if lock.owner_operation is not None}
+
+
+_default_manager: Optional[DeviceLockManager] = None
+_default_manager_lock = threading.Lock()
+
+
+def default_lock_manager() -> DeviceLockManager:
+    """Process-wide lock manager shared by all ProtocolManagers."""
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = DeviceLockManager()
+        return _default_manager
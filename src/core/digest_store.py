@@ -0,0 +1,184 @@
+"""
+SecureOS Flash - Partition Digest Store
+
+Remembers the last known digest of each partition on each device.
+Records come from verified flashes and backups, and are used by
+differential flashing to skip partitions that already hold the
+target image.
+"""
+
+from typing import Dict, Optional
+from dataclasses import dataclass, asdict
+import json
+import logging
+import os
+import threading
+import time
+
+from ..utils.hashing import DEFAULT_ALGORITHM
+from ..utils.paths import data_dir
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PartitionDigest:
+    """Last known contents of a device partition"""
+    partition: str
+    digest: str
+    size: int
+    algorithm: str = DEFAULT_ALGORITHM
+    source: str = "flash"  # "flash", "backup", "readback" or "restore"
+    recorded_at: float = 0.0
+    
+    def matches(self, digest: str, size: int, algorithm: str = DEFAULT_ALGORITHM) -> bool:
+        """
+        Check whether this record describes the given image.
+        
+        Args:
+            digest: Digest of the target image
+            size: Size of the target image in bytes
+            algorithm: Algorithm used for `digest`
+            
+        Returns:
+            True if the partition is known to hold exactly that image
+        """
+        return (
+            self.algorithm == algorithm
+            and self.size == size
+            and self.digest == digest
+        )
+
+
+class PartitionDigestStore:
+    """
+    Per-device record of partition digests.
+    
+    Each device gets one small JSON file, rewritten atomically on every
+    update so a crash never leaves a half-written record behind.
+    
+    Records are keyed by DeviceInfo.identity, which comes from the
+    device's serial number; devices without one get no records.
+    """
+    
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Initialize digest store.
+        
+        Args:
+            directory: Where to keep per-device records
+                       (None = <data dir>/digests)
+        """
+        self.directory = directory or data_dir("digests")
+        os.makedirs(self.directory, exist_ok=True)
+        self._cache: Dict[str, Dict[str, PartitionDigest]] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, device_id: str, partition_name: str) -> Optional[PartitionDigest]:
+        """
+        Get the last known digest of a partition.
+        
+        Args:
+            device_id: Device identifier
+            partition_name: Partition name
+            
+        Returns:
+            PartitionDigest or None if nothing is known
+        """
+        with self._lock:
+            return self._load(device_id).get(partition_name.upper())
+    
+    def record(self, device_id: str, partition_name: str, digest: str, size: int,
+               source: str = "flash", algorithm: str = DEFAULT_ALGORITHM) -> PartitionDigest:
+        """
+        Record the contents of a partition.
+        
+        Args:
+            device_id: Device identifier
+            partition_name: Partition name
+            digest: Hex digest of the partition contents
+            size: Number of bytes covered by the digest
+            source: Where the digest came from ("flash", "backup", "readback", "restore")
+            algorithm: Digest algorithm
+            
+        Returns:
+            The stored PartitionDigest
+        """
+        entry = PartitionDigest(
+            partition=partition_name.upper(),
+            digest=digest,
+            size=size,
+            algorithm=algorithm,
+            source=source,
+            recorded_at=time.time()
+        )
+        
+        with self._lock:
+            records = self._load(device_id)
+            records[entry.partition] = entry
+            self._save(device_id, records)
+        
+        logger.debug(f"Recorded {source} digest for {device_id}/{entry.partition}")
+        return entry
+    
+    def forget(self, device_id: str, partition_name: Optional[str] = None):
+        """
+        Drop knowledge about a partition (or a whole device).
+        
+        Called when a partition's contents become unknown, e.g. after
+        a failed flash.
+        
+        Args:
+            device_id: Device identifier
+            partition_name: Partition to forget (None = all partitions)
+        """
+        with self._lock:
+            records = self._load(device_id)
+            if partition_name is None:
+                records.clear()
+            else:
+                records.pop(partition_name.upper(), None)
+            self._save(device_id, records)
+    
+    def _path(self, device_id: str) -> str:
+        safe_id = "".join(c if c.isalnum() or c in "-_." else "_" for c in device_id)
+        return os.path.join(self.directory, f"{safe_id}.json")
+    
+    def _load(self, device_id: str) -> Dict[str, PartitionDigest]:
+        if device_id in self._cache:
+            return self._cache[device_id]
+        
+        records: Dict[str, PartitionDigest] = {}
+        path = self._path(device_id)
+        
+        try:
+            with open(path, "r") as f:
+                for item in json.load(f).get("partitions", []):
+                    entry = PartitionDigest(**item)
+                    records[entry.partition] = entry
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ignoring corrupt digest record {path}: {e}")
+        
+        self._cache[device_id] = records
+        return records
+    
+    def _save(self, device_id: str, records: Dict[str, PartitionDigest]):
+        path = self._path(device_id)
+        tmp_path = f"{path}.tmp"
+        
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "device_id": device_id,
+                    "partitions": [asdict(r) for r in records.values()]
+                },
+                f,
+                indent=2
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        
+        os.replace(tmp_path, path)
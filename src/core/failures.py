@@ -0,0 +1,160 @@
+"""
+SecureOS Flash - Failure Classification
+
+Sorts failed transfers into a few kinds by what the backend reported
+(heimdall's output and exit code, or a native backend's error text):
+
+- transient: the USB link glitched (I/O error, timeout, stall, reset)
+- handshake: the device did not answer the session handshake
+- device_gone: the device dropped off the bus
+- protocol: the device answered with something unexpected
+- image_rejected: the device or tool refused the image
+
+Transient, handshake and device_gone failures usually clear once the
+device is found again and the session restarted, so ProtocolManager
+retries the failed transfer after a short, jittered backoff (see
+RetryPolicy). The other kinds would fail the same way again and are
+returned at once.
+"""
+
+from typing import Optional, Pattern, Tuple
+from dataclasses import dataclass
+import random
+import re
+
+
+# Failure kinds
+TRANSIENT = "transient"
+HANDSHAKE = "handshake"
+DEVICE_GONE = "device_gone"
+PROTOCOL = "protocol"
+IMAGE_REJECTED = "image_rejected"
+UNKNOWN = "unknown"
+
+# Kinds worth another attempt
+RETRYABLE = (TRANSIENT, HANDSHAKE, DEVICE_GONE)
+
+# Checked in order: the first kind with a matching line wins, so the
+# specific kinds come before the catch-all transport errors
+_PATTERNS: Tuple[Tuple[str, Pattern], ...] = tuple(
+    (kind, re.compile("|".join(patterns), re.IGNORECASE))
+    for kind, patterns in (
+        (DEVICE_GONE, (
+            r"no such device",                            # ENODEV from pyusb
+            r"libusb error:? -4\b",                       # LIBUSB_ERROR_NO_DEVICE (heimdall)
+            r"LIBUSB_ERROR_NO_DEVICE",
+            r"failed to detect compatible download-mode device",
+            r"connection closed by device",
+        )),
+        (IMAGE_REJECTED, (
+            r"does not exist in the specified pit",
+            r"partition not in (pit|gpt)",
+            r"(image|file)[^\n]*(too large|larger than)",
+            r"refused download",
+            r"file does not exist",
+            r"failed to open file",
+            r"(signature|verification) fail",
+            r"not allowed",
+        )),
+        (HANDSHAKE, (
+            r"handshake",
+            r"protocol initiali[sz]ation failed",
+            r"failed to begin session",
+            r"did not sync",
+        )),
+        (PROTOCOL, (
+            r"unexpected",
+            r"\bshort (response|pit part|dump part|da status)",
+            r"\bbad [^\n]*(magic|packet)",
+            r"acknowledged part",
+            r"failed to unpack",
+            r"checksum mismatch",
+            r"echoed",
+        )),
+        (TRANSIENT, (
+            r"libusb error:? -(1|7|9)\b",                 # IO, TIMEOUT, PIPE
+            r"LIBUSB_ERROR_(IO|TIMEOUT|PIPE|OVERFLOW|INTERRUPTED)",
+            r"usb (read|write) failed",
+            r"timed? ?out",
+            r"whilst (sending|receiving)",
+            r"failed to (send|receive)",
+            r"transport (not open|closed)",
+            r"input/output error",
+            r"broken pipe",
+            r"resource busy",
+        )),
+    )
+)
+
+
+@dataclass
+class Failure:
+    """Why a transfer failed"""
+    kind: str
+    reason: str  # The output line that gave it away, or a description
+    
+    @property
+    def retryable(self) -> bool:
+        return self.kind in RETRYABLE
+
+
+def classify(output: Optional[str], returncode: Optional[int] = None,
+             stalled: bool = False) -> Failure:
+    """
+    Classify a failed transfer.
+    
+    Args:
+        output: Tool output or backend error text
+        returncode: Exit code, when a tool was run
+        stalled: The transfer stopped making progress and was killed
+        
+    Returns:
+        Failure (kind UNKNOWN when nothing is recognised)
+    """
+    if stalled:
+        return Failure(TRANSIENT, "transfer stalled")
+    
+    lines = [line.strip() for line in (output or "").splitlines() if line.strip()]
+    for kind, pattern in _PATTERNS:
+        for line in lines:
+            if pattern.search(line):
+                return Failure(kind, line)
+    
+    if returncode is not None and returncode < 0:
+        # Killed by a signal we did not send: libusb tools tend to crash
+        # when the device resets under them
+        return Failure(TRANSIENT, f"killed by signal {-returncode}")
+    
+    return Failure(UNKNOWN, lines[-1] if lines else "no error output")
+
+
+@dataclass
+class RetryPolicy:
+    """
+    How failed transfers are retried.
+    
+    Only the transfer that failed is retried, and only for RETRYABLE
+    failures. Before retry n the manager waits
+    min(max_delay, base_delay * 2 ** (n - 1)), scaled by a random factor
+    in [1 - jitter, 1] so that devices knocked out together (a hub
+    reset, say) do not all come back at the same moment.
+    """
+    retries: int = 2                  # Attempts after the first (0 = off)
+    base_delay: float = 1.0           # Seconds before the first retry
+    max_delay: float = 15.0
+    jitter: float = 0.5
+    redetect_timeout: float = 30.0    # How long a device may take to re-enumerate
+    redetect_interval: float = 1.0    # Between detection attempts
+    
+    def delay(self, retry: int) -> float:
+        """
+        Backoff before a retry.
+        
+        Args:
+            retry: Retry number, from 1
+            
+        Returns:
+            Seconds to wait
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return delay * random.uniform(1.0 - self.jitter, 1.0)
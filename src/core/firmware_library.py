@@ -0,0 +1,663 @@
+"""
+SecureOS Flash - Firmware Library
+
+SQLite index of the firmware packages in a directory tree: Samsung
+.tar / .tar.md5 packages (AP, BL, CP, CSC) and fastboot image zips.
+For every package it records the members with their offsets, sizes and
+digests, the models the package targets and its bootloader version.
+
+Packages are read once when they are indexed. Later scans only re-read
+files whose size or mtime changed. Looking up the firmware that fits a
+detected device needs no archive I/O at all.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+
+from .flash_backend import DeviceInfo, PartitionInfo
+from ..utils.hashing import CHUNK_SIZE, DEFAULT_ALGORITHM
+from ..utils.paths import data_dir
+
+
+logger = logging.getLogger(__name__)
+
+
+# Package formats
+FORMAT_TAR = "tar"
+FORMAT_ZIP = "zip"
+
+# Files the scanner looks at
+PACKAGE_SUFFIXES = (".tar", ".tar.md5", ".zip")
+
+# Packages hashed at once during a scan (hashing releases the GIL)
+DEFAULT_WORKERS = 2
+
+# Samsung package name: <component>_<version>_..., e.g. AP_G998BXXU5CVDD_CL1234_...
+_SAMSUNG_NAME = re.compile(r"^(?P<component>AP|BL|CP|CSC|HOME_CSC|USERDATA)_(?P<version>[A-Z0-9]{9,})_")
+
+# Samsung version suffix after the model: CSC region (2), update type (1),
+# bootloader revision (1), major (1), year (1), month (1), build (1)
+_SAMSUNG_SUFFIX = 8
+
+# Member suffixes that are written to a partition (after stripping compression)
+_IMAGE_SUFFIXES = (".img", ".bin", ".mbn", ".elf", ".ext4", ".raw")
+_COMPRESSION_SUFFIXES = {".lz4": "lz4"}
+
+# LZ4 frame header: magic, FLG (bit 3 = content size present), BD, content size
+_LZ4_MAGIC = b"\x04\x22\x4d\x18"
+
+# fastboot metadata member ("require board=oriole", "require version-bootloader=...")
+_ANDROID_INFO = "android-info.txt"
+_ANDROID_INFO_LIMIT = 64 * 1024
+
+_SCHEMA = """
+PRAGMA foreign_keys = ON;
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    component TEXT NOT NULL DEFAULT '',
+    version TEXT NOT NULL DEFAULT '',
+    bootloader TEXT NOT NULL DEFAULT '',
+    bootloader_rev INTEGER,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS package_models (
+    package_id INTEGER NOT NULL REFERENCES packages (id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    PRIMARY KEY (model, package_id)
+);
+CREATE TABLE IF NOT EXISTS members (
+    package_id INTEGER NOT NULL REFERENCES packages (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    partition TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    image_size INTEGER,
+    digest TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    compression TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_members_package
+    ON members (package_id);
+CREATE INDEX IF NOT EXISTS idx_package_models_package
+    ON package_models (package_id);
+"""
+
+_PACKAGE_COLUMNS = (
+    "id, path, size, mtime_ns, format, component, version, bootloader, "
+    "bootloader_rev, indexed_at"
+)
+
+_ORDER = " ORDER BY bootloader_rev DESC, version DESC, path"
+
+# Package ids per IN (...) query (SQLite limits bound parameters)
+_BATCH = 500
+
+_MEMBER_COLUMNS = (
+    "name, partition, offset, stored_size, size, image_size, digest, "
+    "algorithm, compression"
+)
+
+
+@dataclass
+class FirmwareMember:
+    """A file inside a firmware package"""
+    name: str
+    partition: str                    # Target partition, "" if not an image
+    offset: int                       # Start of the stored data in the package
+    stored_size: int                  # Bytes stored at `offset`
+    size: int                         # Bytes when extracted
+    image_size: Optional[int]         # Bytes written to the partition, None if unknown
+    digest: str                       # Digest of the extracted member
+    algorithm: str = DEFAULT_ALGORITHM
+    compression: str = ""             # "lz4", "deflate", ... ("" = written as stored)
+
+
+@dataclass
+class FirmwarePackage:
+    """An indexed firmware package"""
+    id: int
+    path: str
+    size: int
+    mtime_ns: int
+    format: str
+    component: str = ""               # Samsung AP / BL / CP / CSC, "" otherwise
+    version: str = ""
+    bootloader: str = ""
+    bootloader_rev: Optional[int] = None  # Samsung anti-rollback revision
+    indexed_at: float = 0.0
+    models: List[str] = field(default_factory=list)
+    members: List[FirmwareMember] = field(default_factory=list)
+    
+    @property
+    def images(self) -> List[FirmwareMember]:
+        """Members that are written to a partition"""
+        return [m for m in self.members if m.partition]
+
+
+@dataclass
+class FirmwareMatch:
+    """A package that fits a device"""
+    package: FirmwarePackage
+    unmatched: List[str] = field(default_factory=list)  # Images for partitions the device lacks
+    by_partitions: bool = False       # Model unknown: matched on the partition table alone
+
+
+@dataclass
+class ScanReport:
+    """What a library scan changed"""
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    failed: List[str] = field(default_factory=list)
+
+
+def normalize_model(model: str) -> str:
+    """
+    Canonical form of a model name ("SM-G998B" and "g998b" are the same).
+    
+    Args:
+        model: Model as reported by a device or package
+        
+    Returns:
+        Upper-case model without the Samsung "SM-" prefix
+    """
+    model = model.strip().upper()
+    return model[3:] if model.startswith("SM-") else model
+
+
+def member_partition(name: str) -> Tuple[str, str]:
+    """
+    Partition a package member is written to.
+    
+    Args:
+        name: Member path inside the package
+        
+    Returns:
+        (partition name or "" if the member is not an image, compression)
+    """
+    base = os.path.basename(name).lower()
+    stem, suffix = os.path.splitext(base)
+    compression = _COMPRESSION_SUFFIXES.get(suffix, "")
+    if compression:
+        base = stem
+    
+    stem, suffix = os.path.splitext(base)
+    if suffix not in _IMAGE_SUFFIXES or not stem:
+        return "", compression
+    return stem.upper(), compression
+
+
+def member_file_name(name: str) -> str:
+    """
+    File name a package member is flashed as (what a Samsung PIT lists).
+    
+    Args:
+        name: Member path inside the package
+        
+    Returns:
+        Lower-case base name without a compression suffix
+    """
+    base = os.path.basename(name).lower()
+    stem, suffix = os.path.splitext(base)
+    return stem if suffix in _COMPRESSION_SUFFIXES else base
+
+
+def samsung_version_info(version: str) -> Tuple[str, Optional[int]]:
+    """
+    Model and bootloader revision encoded in a Samsung firmware version.
+    
+    G998BXXU5CVDD is model G998B, region XX, update type U, bootloader
+    revision 5; revisions past 9 are letters (A = 10).
+    
+    Args:
+        version: Firmware version string
+        
+    Returns:
+        (model, bootloader revision or None)
+    """
+    if len(version) <= _SAMSUNG_SUFFIX:
+        return "", None
+    model = version[:-_SAMSUNG_SUFFIX]
+    rev = version[-5]
+    if rev.isdigit():
+        return model, int(rev)
+    if rev.isalpha():
+        return model, ord(rev.upper()) - ord("A") + 10
+    return model, None
+
+
+def _lz4_content_size(header: bytes) -> Optional[int]:
+    """Uncompressed size from an LZ4 frame header, if the frame records it."""
+    if len(header) < 14 or header[:4] != _LZ4_MAGIC or not header[4] & 0x08:
+        return None
+    return struct.unpack_from("<Q", header, 6)[0]
+
+
+def _parse_android_info(text: str) -> Tuple[List[str], str]:
+    """Boards and bootloader version required by an android-info.txt."""
+    boards: List[str] = []
+    bootloader = ""
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith("require "):
+            continue
+        key, _, value = line[len("require "):].partition("=")
+        if key.strip() in ("board", "product"):
+            boards.extend(v.strip() for v in value.split("|") if v.strip())
+        elif key.strip() == "version-bootloader":
+            bootloader = value.split("|")[0].strip()
+    return boards, bootloader
+
+
+@dataclass
+class _Indexed:
+    """Everything read from one package file"""
+    format: str
+    members: List[FirmwareMember]
+    models: List[str] = field(default_factory=list)
+    component: str = ""
+    version: str = ""
+    bootloader: str = ""
+    bootloader_rev: Optional[int] = None
+
+
+def _hash_stream(source, algorithm: str) -> Tuple[str, int, bytes]:
+    """Digest, length and first bytes of a member stream."""
+    digest = hashlib.new(algorithm)
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    head = b""
+    total = 0
+    while True:
+        n = source.readinto(view)
+        if not n:
+            break
+        if total < _ANDROID_INFO_LIMIT:
+            head += bytes(view[:min(n, _ANDROID_INFO_LIMIT - total)])
+        digest.update(view[:n])
+        total += n
+    return digest.hexdigest(), total, head
+
+
+def _index_tar(path: str) -> _Indexed:
+    """Read a .tar / .tar.md5 package in one sequential pass."""
+    members = []
+    info_text = None
+    
+    # Stream mode reads the file front to back; the .md5 trailer is ignored
+    with open(path, "rb") as f, tarfile.open(fileobj=f, mode="r|") as tar:
+        for info in tar:
+            if not info.isfile():
+                continue
+            partition, compression = member_partition(info.name)
+            digest, size, head = _hash_stream(tar.extractfile(info), DEFAULT_ALGORITHM)
+            image_size = _lz4_content_size(head) if compression == "lz4" else size
+            if os.path.basename(info.name) == _ANDROID_INFO:
+                info_text = head.decode("utf-8", errors="replace")
+            members.append(FirmwareMember(
+                name=info.name, partition=partition, offset=info.offset_data,
+                stored_size=info.size, size=size, image_size=image_size,
+                digest=digest, compression=compression
+            ))
+    
+    indexed = _Indexed(FORMAT_TAR, members)
+    if info_text is not None:
+        indexed.models, indexed.bootloader = _parse_android_info(info_text)
+    return indexed
+
+
+def _index_zip(path: str) -> _Indexed:
+    """Read a fastboot image zip (members are hashed decompressed)."""
+    members = []
+    info_text = None
+    
+    with open(path, "rb") as raw, zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            # Data starts after the local header, whose extra field may
+            # differ from the central directory's
+            raw.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", raw.read(4))
+            offset = info.header_offset + 30 + name_length + extra_length
+            
+            partition, compression = member_partition(info.filename)
+            with archive.open(info) as source:
+                digest, size, head = _hash_stream(source, DEFAULT_ALGORITHM)
+            if os.path.basename(info.filename) == _ANDROID_INFO:
+                info_text = head.decode("utf-8", errors="replace")
+            image_size = _lz4_content_size(head) if compression == "lz4" else size
+            if info.compress_type != zipfile.ZIP_STORED:
+                compression = compression or "deflate"
+            members.append(FirmwareMember(
+                name=info.filename, partition=partition, offset=offset,
+                stored_size=info.compress_size, size=size, image_size=image_size,
+                digest=digest, compression=compression
+            ))
+    
+    indexed = _Indexed(FORMAT_ZIP, members)
+    if info_text is not None:
+        indexed.models, indexed.bootloader = _parse_android_info(info_text)
+    return indexed
+
+
+def index_package(path: str) -> _Indexed:
+    """
+    Read a package and describe its contents.
+    
+    Args:
+        path: .tar, .tar.md5 or .zip file
+        
+    Returns:
+        What the library stores about the package
+        
+    Raises:
+        OSError, tarfile.TarError, zipfile.BadZipFile: The package is unreadable
+    """
+    if path.lower().endswith(".zip"):
+        indexed = _index_zip(path)
+    else:
+        indexed = _index_tar(path)
+    
+    name = _SAMSUNG_NAME.match(os.path.basename(path))
+    if name:
+        indexed.component = name.group("component")
+        indexed.version = name.group("version")
+        model, rev = samsung_version_info(indexed.version)
+        if model and model not in indexed.models:
+            indexed.models.append(model)
+        indexed.bootloader_rev = rev
+        if rev is not None and not indexed.bootloader:
+            indexed.bootloader = str(rev)
+    
+    indexed.models = sorted({normalize_model(m) for m in indexed.models})
+    return indexed
+
+
+class FirmwareLibrary:
+    """
+    SQLite index of local firmware packages.
+    
+    Safe to share between threads; all access goes through one
+    connection guarded by a lock.
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        """
+        Open (or create) a library index.
+        
+        Args:
+            path: SQLite database file (None = <data dir>/firmware.sqlite)
+        """
+        self.path = path or os.path.join(data_dir(), "firmware.sqlite")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+    
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+    
+    def scan(self, directory: str, full: bool = False,
+             workers: int = DEFAULT_WORKERS) -> ScanReport:
+        """
+        Bring the index up to date with a directory tree.
+        
+        New packages are indexed, packages whose size or mtime changed
+        are re-indexed, and packages that disappeared from the tree are
+        dropped. Unchanged packages are not opened.
+        
+        Args:
+            directory: Directory tree to scan
+            full: Re-index every package, changed or not
+            workers: Packages read at once
+            
+        Returns:
+            ScanReport
+        """
+        root = os.path.abspath(directory)
+        known = {
+            path: (package_id, size, mtime_ns)
+            for package_id, path, size, mtime_ns in self._execute(
+                "SELECT id, path, size, mtime_ns FROM packages WHERE path LIKE ? ESCAPE '\\'",
+                (self._prefix_pattern(root),)
+            )
+        }
+        report = ScanReport()
+        seen = set()
+        todo = []
+        
+        for dirpath, _dirs, files in os.walk(root):
+            for name in sorted(files):
+                if not name.lower().endswith(PACKAGE_SUFFIXES):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError as e:
+                    logger.warning(f"Skipping {path}: {e}")
+                    continue
+                seen.add(path)
+                
+                previous = known.get(path)
+                if not full and previous is not None and previous[1:] == (st.st_size, st.st_mtime_ns):
+                    report.unchanged += 1
+                    continue
+                todo.append((path, st.st_size, st.st_mtime_ns, previous is not None))
+        
+        def index_one(item) -> bool:
+            path, size, mtime_ns, _ = item
+            try:
+                indexed = index_package(path)
+            except (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile) as e:
+                logger.warning(f"Could not index {path}: {e}")
+                return False
+            self._store(path, size, mtime_ns, indexed)
+            logger.info(f"Indexed {path} ({len(indexed.members)} members)")
+            return True
+        
+        if todo:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                for item, ok in zip(todo, pool.map(index_one, todo)):
+                    if not ok:
+                        report.failed.append(item[0])
+                    elif item[3]:
+                        report.updated += 1
+                    else:
+                        report.added += 1
+        
+        gone = [package_id for path, (package_id, _, _) in known.items() if path not in seen]
+        if gone:
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM packages WHERE id = ?",
+                                       [(package_id,) for package_id in gone])
+            report.removed = len(gone)
+        
+        logger.info(
+            f"Scanned {root}: {report.added} added, {report.updated} updated, "
+            f"{report.removed} removed, {report.unchanged} unchanged, {len(report.failed)} failed"
+        )
+        return report
+    
+    def get(self, path: str) -> Optional[FirmwarePackage]:
+        """
+        Get an indexed package by file path.
+        
+        Returns:
+            FirmwarePackage or None
+        """
+        packages = self._packages(
+            f"SELECT {_PACKAGE_COLUMNS} FROM packages WHERE path = ?", (os.path.abspath(path),)
+        )
+        return packages[0] if packages else None
+    
+    def packages(self, model: Optional[str] = None) -> List[FirmwarePackage]:
+        """
+        List indexed packages, newest bootloader and version first.
+        
+        Args:
+            model: Only packages that target this model
+            
+        Returns:
+            List of FirmwarePackage
+        """
+        if model is None:
+            return self._packages(f"SELECT {_PACKAGE_COLUMNS} FROM packages{_ORDER}")
+        return self._packages(
+            f"SELECT {_PACKAGE_COLUMNS} FROM packages WHERE id IN "
+            f"(SELECT package_id FROM package_models WHERE model = ?){_ORDER}",
+            (normalize_model(model),)
+        )
+    
+    def compatible(self, device: DeviceInfo,
+                   partitions: Optional[List[PartitionInfo]] = None,
+                   min_bootloader_rev: Optional[int] = None) -> List[FirmwareMatch]:
+        """
+        Indexed firmware that fits a device. Reads only the index.
+        
+        A package fits if it targets the device's model. With a partition
+        table, packages with an image larger than its partition are left
+        out. An image goes to the partition of the same name, or to the one
+        whose PIT file name it has (modem.bin is written to RADIO).
+        
+        Heimdall and native Odin do not report the model. For such devices a
+        package fits if it names a model and every one of its images has a
+        partition in the table that is large enough; these matches are
+        marked by_partitions. Packages that name no model never fit.
+        
+        Args:
+            device: Detected device
+            partitions: The device's partition table (None = match on model
+                        only, and nothing matches a device of unknown model)
+            min_bootloader_rev: Leave out packages with an older Samsung
+                                bootloader revision (the device would refuse
+                                them as a rollback)
+                                
+        Returns:
+            Matches, those with every image matched first, then newest first
+        """
+        sizes: Dict[str, Optional[int]] = {}
+        by_file: Dict[str, str] = {}
+        for info in partitions or []:
+            sizes[info.name.upper()] = info.size
+            if info.file_name:
+                by_file[info.file_name.lower()] = info.name.upper()
+        
+        if device.model_known:
+            candidates = self.packages(device.model)
+        elif any(info.size for info in partitions or []):
+            candidates = [p for p in self.packages() if p.models and p.images]
+        else:
+            # No model and no real partition table (not even sizes)
+            return []
+        
+        matches = []
+        for package in candidates:
+            if (min_bootloader_rev is not None and package.bootloader_rev is not None
+                    and package.bootloader_rev < min_bootloader_rev):
+                continue
+            
+            if partitions is None:
+                matches.append(FirmwareMatch(package))
+                continue
+            
+            unmatched = []
+            fits = True
+            for member in package.images:
+                partition = member.partition
+                if partition not in sizes:
+                    partition = by_file.get(member_file_name(member.name))
+                if partition is None:
+                    unmatched.append(member.name)
+                    continue
+                limit = sizes[partition]
+                if limit is not None and member.image_size is not None and member.image_size > limit:
+                    logger.debug(f"{package.path}: {member.name} does not fit {partition}")
+                    fits = False
+                    break
+            
+            if not device.model_known and unmatched:
+                fits = False
+            
+            if fits:
+                matches.append(FirmwareMatch(package, unmatched, by_partitions=not device.model_known))
+        
+        # Stable sort keeps the newest-first order within each group
+        matches.sort(key=lambda m: bool(m.unmatched))
+        return matches
+    
+    def _store(self, path: str, size: int, mtime_ns: int, indexed: _Indexed):
+        """Replace a package's rows in one transaction."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM packages WHERE path = ?", (path,))
+            package_id = self._conn.execute(
+                "INSERT INTO packages (path, size, mtime_ns, format, component, version, "
+                "bootloader, bootloader_rev, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, indexed.format, indexed.component, indexed.version,
+                 indexed.bootloader, indexed.bootloader_rev, time.time())
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO package_models (package_id, model) VALUES (?, ?)",
+                [(package_id, model) for model in indexed.models]
+            )
+            self._conn.executemany(
+                f"INSERT INTO members (package_id, {_MEMBER_COLUMNS}) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(package_id, m.name, m.partition, m.offset, m.stored_size, m.size,
+                  m.image_size, m.digest, m.algorithm, m.compression)
+                 for m in indexed.members]
+            )
+    
+    def _packages(self, sql: str, params: tuple = ()) -> List[FirmwarePackage]:
+        """Packages selected by a query, with their models and members."""
+        with self._lock:
+            packages = [FirmwarePackage(*row) for row in self._conn.execute(sql, params)]
+            if not packages:
+                return []
+            
+            by_id = {package.id: package for package in packages}
+            ids = list(by_id)
+            for start in range(0, len(ids), _BATCH):
+                batch = tuple(ids[start:start + _BATCH])
+                marks = ", ".join("?" * len(batch))
+                for package_id, model in self._conn.execute(
+                    f"SELECT package_id, model FROM package_models WHERE package_id IN ({marks}) "
+                    "ORDER BY model", batch
+                ):
+                    by_id[package_id].models.append(model)
+                for row in self._conn.execute(
+                    f"SELECT package_id, {_MEMBER_COLUMNS} FROM members "
+                    f"WHERE package_id IN ({marks}) ORDER BY package_id, offset", batch
+                ):
+                    by_id[row[0]].members.append(FirmwareMember(*row[1:]))
+        return packages
+    
+    @staticmethod
+    def _prefix_pattern(root: str) -> str:
+        """LIKE pattern for paths below a directory."""
+        escaped = root.rstrip(os.sep).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"{escaped}{os.sep}%"
+    
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
@@ -6,9 +6,15 @@ Each backend (Samsung, Fastboot, MediaTek) implements this interface.
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import Any, BinaryIO, Dict, List, Optional
 from dataclasses import dataclass
 
+from .cancellation import CancellationToken
+
+
+# DeviceInfo.model of a device that does not report its model
+UNKNOWN_MODEL = "Unknown Model"
+
 
 @dataclass
 class DeviceInfo:
@@ -21,6 +27,26 @@ class DeviceInfo:
     bootloader_locked: bool
     oem_unlock_enabled: bool
     usb_debugging_enabled: bool
+    usb_path: Optional[str] = None  # Physical port (e.g. "usb-1-2.3"), None if unknown
+    serial: Optional[str] = None  # Hardware serial number, None if the backend cannot read one
+    
+    @property
+    def identity(self) -> Optional[str]:
+        """
+        Key for records about this particular device ("<manufacturer>-<serial>").
+        
+        usb_path only says where a device is attached (and so does device_id
+        on some backends), so without a serial there is no identity and
+        nothing is remembered about the device's contents.
+        """
+        if not self.serial:
+            return None
+        return f"{self.manufacturer.lower()}-{self.serial}"
+    
+    @property
+    def model_known(self) -> bool:
+        """False when the backend could not read the device's model"""
+        return bool(self.model) and self.model != UNKNOWN_MODEL
 
 
 @dataclass
@@ -29,6 +55,22 @@ class FlashResult:
     success: bool
     message: str
     error: Optional[str] = None
+    skipped: bool = False  # True if nothing had to be written (differential flash)
+    cancelled: bool = False  # True if the operation was cancelled
+    profile: Optional[Dict[str, Any]] = None  # OperationProfile.to_dict() when profiled
+    stalled: bool = False  # True if the transfer stopped making progress
+    retries: int = 0  # Attempts made beyond the first
+    failure: Optional[str] = None  # Failure kind (see core.failures) when success is False
+    port: Optional[str] = None  # USB path the operation ran on (set by ProtocolManager)
+    busy: bool = False  # True if the device was held by another operation, so nothing ran
+
+
+@dataclass
+class PartitionInfo:
+    """A partition on the device"""
+    name: str
+    size: Optional[int] = None  # Size in bytes, None if unknown
+    file_name: Optional[str] = None  # Image file the PIT assigns to it (Samsung), None if none
 
 
 class FlashBackend(ABC):
@@ -37,6 +79,11 @@ class FlashBackend(ABC):
     
     Each manufacturer (Samsung, Google, MediaTek) implements this interface
     to provide flash capabilities using their specific protocols.
+    
+    Transfer operations take an optional CancellationToken. Cancelling it
+    must stop the operation within seconds (killing any child process),
+    remove partial output files and return a FlashResult with
+    cancelled=True.
     """
     
     @abstractmethod
@@ -60,13 +107,15 @@ class FlashBackend(ABC):
         pass
     
     @abstractmethod
-    def backup_partition(self, partition_name: str, output_file: str) -> FlashResult:
+    def backup_partition(self, partition_name: str, output_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
         """
         Backup a partition from device to file.
         
         Args:
             partition_name: Name of partition (e.g., 'boot', 'recovery', 'bootloader')
             output_file: Path to save backup file
+            cancel: Token to abort the operation (None = not cancellable)
             
         Returns:
             FlashResult with success status and message
@@ -74,26 +123,62 @@ class FlashBackend(ABC):
         pass
     
     @abstractmethod
-    def flash_partition(self, partition_name: str, image_file: str) -> FlashResult:
+    def flash_partition(self, partition_name: str, image_file: str,
+                        cancel: Optional[CancellationToken] = None) -> FlashResult:
         """
         Flash an image file to a partition.
         
         Args:
             partition_name: Name of partition to flash
             image_file: Path to image file
+            cancel: Token to abort the operation (None = not cancellable)
             
         Returns:
             FlashResult with success status and message
         """
         pass
     
+    def supports_streaming(self) -> bool:
+        """
+        Whether flash_stream() can send an image straight from a stream.
+        
+        Backends that drive the device themselves override this; those
+        that hand a file to an external tool cannot stream.
+        
+        Returns:
+            True if flash_stream() is implemented
+        """
+        return False
+    
+    def flash_stream(self, partition_name: str, source: BinaryIO, size: int,
+                     cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Flash `size` bytes read sequentially from a stream (no seeking).
+        
+        Only called when supports_streaming() is True. Exceptions raised
+        by the source (e.g. a failed digest check) are not turned into
+        results; they propagate to the caller.
+        
+        Args:
+            partition_name: Name of partition to flash
+            source: Binary stream positioned at the start of the image
+            size: Number of bytes to flash
+            cancel: Token to abort the operation (None = not cancellable)
+            
+        Returns:
+            FlashResult with success status and message
+        """
+        raise NotImplementedError(f"{self.get_backend_name()} cannot flash from a stream")
+    
     @abstractmethod
-    def flash_bootloader(self, bootloader_file: str) -> FlashResult:
+    def flash_bootloader(self, bootloader_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
         """
         Flash a bootloader to device.
         
         Args:
             bootloader_file: Path to bootloader image
+            cancel: Token to abort the operation (None = not cancellable)
             
         Returns:
             FlashResult with success status and message
@@ -110,6 +195,18 @@ class FlashBackend(ABC):
         """
         pass
     
+    def get_partition_table(self) -> List[PartitionInfo]:
+        """
+        Get partitions on device together with their sizes.
+        
+        Backends that can read a real partition table (e.g. Samsung PIT)
+        override this. The default only knows partition names.
+        
+        Returns:
+            List of PartitionInfo
+        """
+        return [PartitionInfo(name=name) for name in self.get_partition_list()]
+    
     @abstractmethod
     def end_session(self, reboot: bool = True) -> bool:
         """
@@ -123,6 +220,31 @@ class FlashBackend(ABC):
         """
         pass
     
+    def abort_session(self):
+        """
+        Drop the session after a failed transfer so that detect_device()
+        and init_session() can start over.
+        
+        The default ends the session without rebooting. Backends whose
+        end_session() would do more than that to the device (power it
+        off, say) override this to just let go of it.
+        """
+        self.end_session(reboot=False)
+    
+    def discover(self) -> List["FlashBackend"]:
+        """
+        One backend instance per attached device this backend can drive.
+        
+        Backends whose transport can address devices individually return
+        a fresh instance bound to each device, so several devices can be
+        driven at once. The default, for backends that cannot tell
+        devices apart, is this instance alone.
+        
+        Returns:
+            List of backends (detect_device() picks the device up)
+        """
+        return [self]
+    
     @abstractmethod
     def get_backend_name(self) -> str:
         """
@@ -0,0 +1,291 @@
+"""
+SecureOS Flash - Flash Plans
+
+Runs an ordered list of steps (backup, flash, verify) on one device
+through ProtocolManager, recording every step in the job journal. When
+a plan is interrupted - crash, cancellation, unplugged cable - it can be
+resumed on the reconnected device: finished steps are checked cheaply
+against the journal and skipped, and work continues with the first step
+that is not known to be done.
+"""
+
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+from dataclasses import dataclass, asdict
+import logging
+import os
+
+from .flash_backend import FlashResult
+from .cancellation import CancellationToken, OperationCancelled
+from .device_locks import DeviceBusy
+from .job_journal import JobJournal, JobState
+from ..utils.hashing import file_signature
+
+if TYPE_CHECKING:
+    from .protocol_manager import ProtocolManager
+
+
+logger = logging.getLogger(__name__)
+
+
+ACTIONS = ("backup", "flash", "verify")
+
+
+@dataclass
+class PlanStep:
+    """One step of a flash plan"""
+    action: str                    # "backup", "flash" or "verify"
+    partition: str
+    image: Optional[str] = None    # Image to flash or verify against
+    output: Optional[str] = None   # Backup file (None = automatic backup path)
+    differential: bool = False     # Skip a flash the device already has
+    id: str = ""
+    
+    def describe(self) -> str:
+        if self.action == "backup":
+            return f"back up {self.partition}"
+        if self.action == "verify":
+            return f"verify {self.partition}"
+        return f"flash {self.partition} with {os.path.basename(self.image or '')}"
+
+
+class PlanRunner:
+    """Executes and resumes journaled plans on a ProtocolManager's device"""
+    
+    def __init__(self, manager: "ProtocolManager", journal: JobJournal):
+        """
+        Initialize runner.
+        
+        Args:
+            manager: Manager with a detected device and open session
+            journal: Where plan progress is recorded
+        """
+        self.manager = manager
+        self.journal = journal
+    
+    def prepare(self, steps: List[PlanStep]) -> List[PlanStep]:
+        """
+        Validate steps and fill in ids and backup paths.
+        
+        Args:
+            steps: Steps in execution order
+            
+        Returns:
+            The prepared steps
+            
+        Raises:
+            ValueError: A step is malformed
+        """
+        for index, step in enumerate(steps):
+            if step.action not in ACTIONS:
+                raise ValueError(f"Unknown plan action: {step.action}")
+            if step.action in ("flash", "verify") and not step.image:
+                raise ValueError(f"Step {index} ({step.action} {step.partition}) needs an image")
+            if step.action == "backup" and not step.output:
+                # Fixed now so a resumed plan checks the same file
+                step.output = self.manager.auto_backup_path(step.partition)
+            if step.image:
+                step.image = os.path.abspath(step.image)
+            step.id = step.id or f"{index}:{step.action}:{step.partition.upper()}"
+        
+        return steps
+    
+    def run(self, steps: List[PlanStep], job_id: Optional[str] = None,
+            cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Start a new plan.
+        
+        Args:
+            steps: Steps in execution order
+            job_id: Job id (None = generate one)
+            cancel: Token to abort the plan (it stays resumable)
+            
+        Returns:
+            FlashResult; on failure the job can be resumed with resume()
+        """
+        if self.manager.current_device is None:
+            return FlashResult(
+                success=False,
+                message="No device connected",
+                error="Call detect_device() first"
+            )
+        
+        try:
+            steps = self.prepare(steps)
+        except ValueError as e:
+            return FlashResult(success=False, message="Invalid plan", error=str(e))
+        
+        job_id = self.journal.create(
+            self.manager.catalog_key,
+            [asdict(step) for step in steps],
+            job_id
+        )
+        logger.info(f"Starting plan {job_id} ({len(steps)} steps)")
+        return self._execute(job_id, steps, None, cancel)
+    
+    def resume(self, job_id: str, cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Resume an interrupted plan on the current device.
+        
+        Args:
+            job_id: Job to resume
+            cancel: Token to abort the plan
+            
+        Returns:
+            FlashResult
+        """
+        state = self.journal.load(job_id)
+        if state is None:
+            return FlashResult(success=False, message="Resume failed", error=f"No journal for job {job_id}")
+        if state.finished:
+            return FlashResult(success=False, message="Resume failed", error=f"Job {job_id} already finished")
+        
+        device = self.manager.current_device
+        if device is None or self.manager.catalog_key != state.device_id:
+            return FlashResult(
+                success=False,
+                message="Resume failed",
+                error=f"Job {job_id} belongs to device {state.device_id}"
+            )
+        
+        steps = [PlanStep(**step) for step in state.steps]
+        if device.identity is None:
+            # The device id only says where the device is: this may not be
+            # the device the plan ran on, so nothing done so far counts
+            logger.warning(f"{device.device_id} reports no serial number - running plan {job_id} from the start")
+            return self._execute(job_id, steps, None, cancel)
+        
+        logger.info(f"Resuming plan {job_id} at step {state.next_step} of {len(steps)}")
+        return self._execute(job_id, steps, state, cancel)
+    
+    def abandon(self, job_id: str):
+        """Mark an interrupted plan as finished so it is no longer offered for resume."""
+        self.journal.finish(job_id, False, "abandoned")
+    
+    def _execute(self, job_id: str, steps: List[PlanStep], state: Optional[JobState],
+                 cancel: Optional[CancellationToken]) -> FlashResult:
+        try:
+            # Hold the device for the whole plan so nothing runs between steps
+            with self.manager.device_lock(f"plan {job_id}", cancel):
+                return self._execute_locked(job_id, steps, state, cancel)
+        except (DeviceBusy, OperationCancelled) as e:
+            return FlashResult(
+                success=False,
+                message=f"Plan {job_id} not started",
+                error=str(e) or "Cancelled by user",
+                cancelled=isinstance(e, OperationCancelled),
+                busy=isinstance(e, DeviceBusy)
+            )
+    
+    def _execute_locked(self, job_id: str, steps: List[PlanStep], state: Optional[JobState],
+                        cancel: Optional[CancellationToken]) -> FlashResult:
+        done = skipped = 0
+        
+        for step in steps:
+            if state is not None and step.id in state.completed:
+                if self._still_valid(step, state.completed[step.id]):
+                    logger.info(f"[{job_id}] {step.describe()}: already done")
+                    skipped += 1
+                    continue
+                logger.info(f"[{job_id}] {step.describe()}: journal record no longer holds - redoing")
+            
+            if state is not None and step.id in state.started and step.action == "flash":
+                # Interrupted mid-flash: whatever was recorded for the partition is stale
+                self.manager.digest_store.forget(state.device_id, step.partition)
+            
+            result = self.execute_step(job_id, step, cancel)
+            if not result.success:
+                return FlashResult(
+                    success=False,
+                    message=f"Plan {job_id} stopped at: {step.describe()}",
+                    error=result.error,
+                    cancelled=result.cancelled
+                )
+            done += 1
+        
+        message = f"Plan {job_id} complete ({done} steps run, {skipped} already done)"
+        self.journal.finish(job_id, True, message)
+        return FlashResult(success=True, message=message)
+    
+    def execute_step(self, job_id: str, step: PlanStep,
+                     cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Run one prepared step and journal its outcome.
+        
+        The caller is responsible for ordering and for holding the device.
+        
+        Args:
+            job_id: Journal the step belongs to
+            step: Prepared step
+            cancel: Token to abort the step
+            
+        Returns:
+            FlashResult of the step
+        """
+        self.journal.step_started(job_id, step.id)
+        logger.info(f"[{job_id}] {step.describe()}")
+        result, details = self._run_step(step, cancel)
+        
+        if result.success:
+            self.journal.step_done(job_id, step.id, **details)
+        else:
+            self.journal.step_failed(job_id, step.id, result.error or result.message)
+        return result
+    
+    def _run_step(self, step: PlanStep, cancel: Optional[CancellationToken]):
+        """Run one step; returns (FlashResult, journal details)."""
+        manager = self.manager
+        
+        if step.action == "backup":
+            result = manager.backup_partition(step.partition, step.output, cancel=cancel)
+            if not result.success:
+                return result, {}
+            return result, {"output": step.output, "size": os.path.getsize(step.output)}
+        
+        if step.action == "verify":
+            result = manager.verify_partition(step.partition, step.image, cancel=cancel)
+            return result, {"digest": manager.image_digest(step.image)} if result.success else {}
+        
+        result = manager.flash_partition(
+            step.partition, step.image,
+            differential=step.differential,
+            cancel=cancel
+        )
+        if not result.success or not step.differential:
+            # Only differential flashes leave a digest record to check on resume
+            return result, {}
+        _, size, mtime_ns = file_signature(step.image)
+        return result, {
+            "digest": manager.image_digest(step.image),
+            "size": size,
+            "mtime_ns": mtime_ns
+        }
+    
+    def _still_valid(self, step: PlanStep, details: Dict[str, Any]) -> bool:
+        """
+        Cheap check that a journaled step's effect still holds.
+        
+        Backups must still exist with the recorded size. Flashes need an
+        unchanged image (size and mtime) and a digest store record that
+        still says the partition holds it (so a plain, non-differential
+        flash always runs again); a verify needs a read-back record for
+        the same digest.
+        """
+        manager = self.manager
+        
+        if step.action == "backup":
+            output = details.get("output", step.output)
+            return bool(output) and os.path.exists(output) and os.path.getsize(output) == details.get("size")
+        
+        key = manager.record_key
+        known = manager.digest_store.get(key, step.partition) if key is not None else None
+        if known is None or known.digest != details.get("digest"):
+            return False
+        
+        if step.action == "verify":
+            return known.source == "readback"
+        
+        try:
+            _, size, mtime_ns = file_signature(step.image)
+        except OSError:
+            return False
+        return size == details.get("size") and mtime_ns == details.get("mtime_ns")
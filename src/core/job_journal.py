@@ -0,0 +1,227 @@
+"""
+SecureOS Flash - Job Journal
+
+Append-only, fsync'd log of plan progress. Each job gets a JSON-lines
+file: the plan itself, then one record per step start, completion or
+failure. After a crash the journal says exactly which steps finished,
+so an interrupted plan can resume where it stopped.
+
+A record is only trusted once it is complete on disk; a torn last line
+from a crash mid-write is ignored.
+"""
+
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from ..utils.paths import data_dir
+
+
+logger = logging.getLogger(__name__)
+
+
+# Record types
+EVENT_PLAN = "plan"
+EVENT_STARTED = "started"
+EVENT_DONE = "done"
+EVENT_FAILED = "failed"
+EVENT_FINISHED = "finished"
+
+
+@dataclass
+class JobState:
+    """What a job's journal says about it"""
+    job_id: str
+    device_id: str
+    steps: List[Dict[str, Any]]
+    created_at: float
+    completed: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # step id -> done record
+    started: List[str] = field(default_factory=list)   # Steps started but not completed
+    failed: Dict[str, str] = field(default_factory=dict)  # step id -> error
+    finished: bool = False
+    result: Optional[Dict[str, Any]] = None
+    
+    @property
+    def next_step(self) -> Optional[int]:
+        """Index of the first step not completed, None if all are"""
+        for index, step in enumerate(self.steps):
+            if step["id"] not in self.completed:
+                return index
+        return None
+
+
+class JobJournal:
+    """
+    Directory of job journals.
+    
+    Appends are serialized per journal object and each one is fsync'd
+    before the call returns.
+    """
+    
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Initialize journal.
+        
+        Args:
+            directory: Where job files live (None = <data dir>/jobs)
+        """
+        self.directory = directory or data_dir("jobs")
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+    
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.jsonl")
+    
+    def _append(self, job_id: str, record: Dict[str, Any]):
+        record["ts"] = time.time()
+        line = json.dumps(record, sort_keys=True) + "\n"
+        
+        with self._lock:
+            path = self._path(job_id)
+            created = not os.path.exists(path)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            
+            if created:
+                # Make the new file's directory entry durable too
+                self._fsync_directory()
+    
+    def _fsync_directory(self):
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    
+    def create(self, device_id: str, steps: List[Dict[str, Any]],
+               job_id: Optional[str] = None) -> str:
+        """
+        Start a job.
+        
+        Args:
+            device_id: Device the plan runs on
+            steps: Plan steps (JSON-serializable dicts with a unique "id")
+            job_id: Job id (None = generate one)
+            
+        Returns:
+            Job id
+        """
+        job_id = job_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+        self._append(job_id, {"event": EVENT_PLAN, "device_id": device_id, "steps": steps})
+        return job_id
+    
+    def step_started(self, job_id: str, step_id: str):
+        """Record that a step is about to run."""
+        self._append(job_id, {"event": EVENT_STARTED, "step": step_id})
+    
+    def step_done(self, job_id: str, step_id: str, **details):
+        """
+        Record that a step completed.
+        
+        Args:
+            job_id: Job id
+            step_id: Step id
+            details: What the step produced (digests, sizes, files)
+        """
+        self._append(job_id, {"event": EVENT_DONE, "step": step_id, "details": details})
+    
+    def step_failed(self, job_id: str, step_id: str, error: str):
+        """Record that a step failed."""
+        self._append(job_id, {"event": EVENT_FAILED, "step": step_id, "error": error})
+    
+    def finish(self, job_id: str, success: bool, message: str = ""):
+        """Record that the job ended (successfully or not) and need not be resumed."""
+        self._append(job_id, {"event": EVENT_FINISHED, "success": success, "message": message})
+    
+    def load(self, job_id: str) -> Optional[JobState]:
+        """
+        Replay a job's journal.
+        
+        Args:
+            job_id: Job id
+            
+        Returns:
+            JobState, or None if there is no readable journal
+        """
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+        
+        state: Optional[JobState] = None
+        for number, line in enumerate(lines, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if number == len(lines):
+                    logger.warning(f"Ignoring torn last record in job {job_id}")
+                    break
+                logger.error(f"Corrupt record {number} in job {job_id}")
+                return None
+            
+            event = record.get("event")
+            if event == EVENT_PLAN:
+                state = JobState(job_id, record["device_id"], record["steps"], record["ts"])
+                continue
+            if state is None:
+                logger.error(f"Job {job_id} journal does not start with a plan")
+                return None
+            
+            step = record.get("step")
+            if event == EVENT_STARTED:
+                state.failed.pop(step, None)
+                if step not in state.started:
+                    state.started.append(step)
+            elif event == EVENT_DONE:
+                state.completed[step] = record.get("details", {})
+                if step in state.started:
+                    state.started.remove(step)
+            elif event == EVENT_FAILED:
+                state.failed[step] = record.get("error", "")
+                if step in state.started:
+                    state.started.remove(step)
+            elif event == EVENT_FINISHED:
+                state.finished = True
+                state.result = record
+        
+        return state
+    
+    def unfinished(self, device_id: Optional[str] = None) -> List[JobState]:
+        """
+        Jobs that were interrupted before they finished, oldest first.
+        
+        Args:
+            device_id: Only jobs for this device
+            
+        Returns:
+            List of JobState
+        """
+        jobs = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".jsonl"):
+                continue
+            state = self.load(name[:-len(".jsonl")])
+            if state is None or state.finished:
+                continue
+            if device_id is not None and state.device_id != device_id:
+                continue
+            jobs.append(state)
+        
+        return sorted(jobs, key=lambda job: job.created_at)
+    
+    def remove(self, job_id: str):
+        """Delete a job's journal."""
+        try:
+            os.unlink(self._path(job_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,371 @@
+"""
+SecureOS Flash - Flash Manifests
+
+Declarative description of a flashing job: which firmware files to use,
+which partitions to write on which devices, backup and verify policies,
+and ordering constraints between partitions. A manifest is JSON or TOML
+and compiles into a PlanGraph that GraphExecutor runs.
+
+Example (TOML):
+
+    name = "pixel-production"
+    
+    [defaults]
+    backup = true
+    verify = false
+    differential = true
+    
+    [firmware.boot]
+    path = "images/boot.img"        # Relative to the manifest
+    sha256 = "9f86d08..."           # Optional, checked before flashing
+    
+    [[devices]]
+    name = "slot1"
+    usb_path = "usb-1-2"            # Or device_id / model; omitted = any device
+    
+    [[partitions]]
+    name = "boot"
+    firmware = "boot"
+    verify = true
+    after = ["vbmeta"]              # Flash (and verify) vbmeta first
+"""
+
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+from dataclasses import dataclass, field
+import json
+import os
+
+from .flash_backend import DeviceInfo
+from .flash_plan import PlanStep
+from .plan_graph import PlanGraph, PlanNode
+
+if TYPE_CHECKING:
+    from .protocol_manager import ProtocolManager
+
+
+# Name used for the device when a manifest does not list any
+DEFAULT_DEVICE = "device"
+
+
+class ManifestError(ValueError):
+    """Raised for manifests that cannot be read or compiled"""
+
+
+@dataclass
+class FirmwareSource:
+    """An image file the manifest flashes"""
+    name: str
+    path: str
+    sha256: Optional[str] = None
+    
+    @property
+    def size(self) -> Optional[int]:
+        """Image size in bytes, None if the file is missing"""
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return None
+
+
+@dataclass
+class DeviceSpec:
+    """A device slot and how to recognise the device that fills it"""
+    name: str
+    usb_path: Optional[str] = None
+    device_id: Optional[str] = None
+    model: Optional[str] = None
+    
+    def matches(self, device: DeviceInfo) -> bool:
+        """
+        Check whether a detected device fills this slot.
+        
+        Args:
+            device: Detected device
+            
+        Returns:
+            True if every criterion given in the spec matches
+        """
+        if self.usb_path and device.usb_path != self.usb_path:
+            return False
+        if self.device_id and device.device_id != self.device_id:
+            return False
+        if self.model and device.model != self.model:
+            return False
+        return True
+
+
+@dataclass
+class PartitionSpec:
+    """What to do with one partition"""
+    name: str
+    firmware: Optional[str] = None      # None = back up (and/or verify) only
+    backup: bool = False
+    verify: bool = False
+    differential: bool = True
+    after: List[str] = field(default_factory=list)
+    devices: Optional[List[str]] = None  # None = every device
+
+
+@dataclass
+class Manifest:
+    """A parsed flash manifest"""
+    name: str
+    firmware: Dict[str, FirmwareSource]
+    devices: List[DeviceSpec]
+    partitions: List[PartitionSpec]
+    path: Optional[str] = None
+    
+    def bind(self, managers: List["ProtocolManager"]) -> Dict[str, "ProtocolManager"]:
+        """
+        Assign detected devices to the manifest's device slots.
+        
+        Slots are filled in manifest order, each with the first unassigned
+        manager whose device matches the slot's criteria.
+        
+        Args:
+            managers: Managers with detected devices
+            
+        Returns:
+            Mapping of slot name to manager (unfilled slots are left out)
+        """
+        free = [manager for manager in managers if manager.current_device is not None]
+        bound = {}
+        for spec in self.devices:
+            for manager in free:
+                if spec.matches(manager.current_device):
+                    bound[spec.name] = manager
+                    free.remove(manager)
+                    break
+        return bound
+    
+    def compile(self) -> PlanGraph:
+        """
+        Compile the manifest into a dependency graph.
+        
+        Every firmware file gets a host-side prepare node (existence and
+        digest check) that may run concurrently with everything else. Each
+        partition entry expands, per device, into backup -> flash -> verify
+        nodes. A flash waits for its firmware's prepare node and for the
+        last node of every partition named in `after` on the same device.
+        
+        Returns:
+            PlanGraph
+            
+        Raises:
+            ManifestError: The ordering constraints contain a cycle
+        """
+        graph = PlanGraph(self.name)
+        
+        for source in self.firmware.values():
+            graph.add(PlanNode(
+                id=f"prepare:{source.name}",
+                action="prepare",
+                source=source,
+                size=source.size or 0
+            ))
+        
+        for device in self.devices:
+            last: Dict[str, str] = {}
+            entries = [p for p in self.partitions if p.devices is None or device.name in p.devices]
+            for spec in entries:
+                last[spec.name.upper()] = self._add_partition(graph, device.name, spec)
+            
+            # Ordering constraints, once every entry's nodes exist
+            for spec in entries:
+                first = graph.nodes[self._node_id(device.name, spec, first=True)]
+                for name in spec.after:
+                    if name.upper() not in last:
+                        raise ManifestError(
+                            f"Partition {spec.name} on {device.name} must come after {name}, "
+                            f"which is not flashed there"
+                        )
+                    first.deps.append(last[name.upper()])
+        
+        try:
+            graph.topological_order()
+        except ValueError as e:
+            raise ManifestError(str(e)) from e
+        
+        return graph
+    
+    def _node_id(self, device: str, spec: PartitionSpec, first: bool = False) -> str:
+        if first:
+            # The node `after` constraints attach to
+            action = "flash" if spec.firmware else ("backup" if spec.backup else "verify")
+        else:
+            action = "verify" if spec.verify else ("flash" if spec.firmware else "backup")
+        return f"{device}:{action}:{spec.name.upper()}"
+    
+    def _add_partition(self, graph: PlanGraph, device: str, spec: PartitionSpec) -> str:
+        """Add one partition entry's nodes for a device; returns the id of its last node."""
+        source = self.firmware.get(spec.firmware) if spec.firmware else None
+        size = (source.size or 0) if source else 0
+        previous: Optional[str] = None
+        
+        if spec.backup:
+            previous = f"{device}:backup:{spec.name.upper()}"
+            graph.add(PlanNode(
+                id=previous,
+                action="backup",
+                device=device,
+                step=PlanStep("backup", spec.name, id=previous),
+                size=size
+            ))
+        
+        if source:
+            node_id = f"{device}:flash:{spec.name.upper()}"
+            graph.add(PlanNode(
+                id=node_id,
+                action="flash",
+                device=device,
+                step=PlanStep("flash", spec.name, source.path,
+                              differential=spec.differential, id=node_id),
+                deps=[f"prepare:{source.name}"] + ([previous] if previous else []),
+                size=size
+            ))
+            previous = node_id
+        
+        if spec.verify:
+            node_id = f"{device}:verify:{spec.name.upper()}"
+            graph.add(PlanNode(
+                id=node_id,
+                action="verify",
+                device=device,
+                step=PlanStep("verify", spec.name, source.path, id=node_id),
+                deps=[previous],
+                size=size
+            ))
+            previous = node_id
+        
+        return previous
+
+
+def parse_manifest(data: Dict[str, Any], base_dir: str = ".",
+                   path: Optional[str] = None) -> Manifest:
+    """
+    Build a Manifest from decoded JSON/TOML.
+    
+    Args:
+        data: Decoded manifest
+        base_dir: Directory relative firmware paths are resolved against
+        path: File the manifest came from (for messages)
+        
+    Returns:
+        Manifest
+        
+    Raises:
+        ManifestError: The manifest is malformed
+    """
+    if not isinstance(data, dict):
+        raise ManifestError("Manifest must be a table/object")
+    
+    firmware = {}
+    for name, entry in (data.get("firmware") or {}).items():
+        if isinstance(entry, str):
+            entry = {"path": entry}
+        if not isinstance(entry, dict) or "path" not in entry:
+            raise ManifestError(f"Firmware {name} needs a path")
+        firmware[name] = FirmwareSource(
+            name=name,
+            path=os.path.abspath(os.path.join(base_dir, os.path.expanduser(entry["path"]))),
+            sha256=entry.get("sha256")
+        )
+    
+    devices = []
+    for entry in data.get("devices") or [{"name": DEFAULT_DEVICE}]:
+        if "name" not in entry:
+            raise ManifestError("Every device needs a name")
+        devices.append(DeviceSpec(
+            name=entry["name"],
+            usb_path=entry.get("usb_path"),
+            device_id=entry.get("device_id"),
+            model=entry.get("model")
+        ))
+    device_names = [device.name for device in devices]
+    if len(set(device_names)) != len(device_names):
+        raise ManifestError("Device names must be unique")
+    
+    defaults = data.get("defaults") or {}
+    partitions = []
+    for entry in data.get("partitions") or []:
+        if "name" not in entry:
+            raise ManifestError("Every partition entry needs a name")
+        spec = PartitionSpec(
+            name=entry["name"],
+            firmware=entry.get("firmware"),
+            backup=bool(entry.get("backup", defaults.get("backup", False))),
+            verify=bool(entry.get("verify", defaults.get("verify", False))),
+            differential=bool(entry.get("differential", defaults.get("differential", True))),
+            after=list(entry.get("after", [])),
+            devices=entry.get("devices")
+        )
+        
+        if spec.firmware is not None and spec.firmware not in firmware:
+            raise ManifestError(f"Partition {spec.name} uses unknown firmware {spec.firmware}")
+        if spec.firmware is None and spec.verify:
+            raise ManifestError(f"Partition {spec.name} cannot be verified without firmware")
+        if spec.firmware is None and not spec.backup:
+            raise ManifestError(f"Partition {spec.name} has nothing to do")
+        for device in spec.devices or []:
+            if device not in device_names:
+                raise ManifestError(f"Partition {spec.name} targets unknown device {device}")
+        partitions.append(spec)
+    
+    names = [(spec.name.upper(), tuple(spec.devices or device_names)) for spec in partitions]
+    for index, (name, targets) in enumerate(names):
+        for other, other_targets in names[:index]:
+            if name == other and set(targets) & set(other_targets):
+                raise ManifestError(f"Partition {name} is listed twice for the same device")
+    
+    return Manifest(
+        name=data.get("name") or (os.path.basename(path) if path else "manifest"),
+        firmware=firmware,
+        devices=devices,
+        partitions=partitions,
+        path=path
+    )
+
+
+def _load_toml(f) -> Dict[str, Any]:
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ManifestError("TOML manifests need Python 3.11+ or the tomli package") from None
+    
+    try:
+        return tomllib.load(f)
+    except tomllib.TOMLDecodeError as e:
+        raise ManifestError(f"Invalid TOML: {e}") from e
+
+
+def load_manifest(path: str) -> Manifest:
+    """
+    Read a manifest file (.json or .toml).
+    
+    Args:
+        path: Manifest file
+        
+    Returns:
+        Manifest
+        
+    Raises:
+        ManifestError: The file cannot be read or is malformed
+    """
+    try:
+        if path.lower().endswith(".toml"):
+            with open(path, "rb") as f:
+                data = _load_toml(f)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+    except OSError as e:
+        raise ManifestError(f"Cannot read manifest {path}: {e}") from e
+    except ValueError as e:
+        if isinstance(e, ManifestError):
+            raise
+        raise ManifestError(f"Invalid JSON in {path}: {e}") from e
+    
+    return parse_manifest(data, os.path.dirname(os.path.abspath(path)), path)
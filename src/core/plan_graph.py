@@ -0,0 +1,572 @@
+"""
+SecureOS Flash - Plan Graphs
+
+Dependency graph of a flashing job and the engine that runs it. Nodes
+are host-side preparation (checking and hashing firmware) or device
+steps (backup, flash, verify). The executor runs every node as soon as
+its dependencies are done: preparation concurrently on a small worker
+pool, each device's steps one at a time in its own lane, and different
+devices in parallel. The same scheduling model gives the dry-run time
+estimate.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+from dataclasses import asdict, dataclass, field
+import heapq
+import logging
+import os
+import threading
+import time
+
+from .flash_backend import FlashResult
+from .flash_plan import PlanRunner, PlanStep
+from .cancellation import CancellationToken, OperationCancelled
+from .device_locks import DeviceBusy
+from .timeouts import TimeoutPolicy, MiB
+from .throughput_history import DurationEstimate, ThroughputHistory, fallback_estimate
+from ..utils.hashing import file_digest
+
+if TYPE_CHECKING:
+    from .manifest import FirmwareSource
+    from .protocol_manager import ProtocolManager
+
+
+logger = logging.getLogger(__name__)
+
+
+# Rate at which firmware is read and hashed during preparation (bytes/s)
+HASH_THROUGHPUT = 300 * MiB
+
+# Node states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+@dataclass
+class PlanNode:
+    """One unit of work in a plan graph"""
+    id: str
+    action: str                              # "prepare", "backup", "flash" or "verify"
+    device: Optional[str] = None             # Device slot, None for host-side work
+    step: Optional[PlanStep] = None          # Device step to run
+    source: Optional["FirmwareSource"] = None  # Firmware to prepare
+    deps: List[str] = field(default_factory=list)
+    size: int = 0                            # Bytes moved or hashed (for estimates)
+
+
+class PlanGraph:
+    """Nodes of a plan and the dependencies between them"""
+    
+    def __init__(self, name: str):
+        """
+        Initialize graph.
+        
+        Args:
+            name: Plan name (shown in logs and dry runs)
+        """
+        self.name = name
+        self.nodes: Dict[str, PlanNode] = {}
+    
+    def add(self, node: PlanNode):
+        """
+        Add a node.
+        
+        Raises:
+            ValueError: A node with the same id exists
+        """
+        if node.id in self.nodes:
+            raise ValueError(f"Duplicate plan node {node.id}")
+        self.nodes[node.id] = node
+    
+    @property
+    def devices(self) -> List[str]:
+        """Device slots the plan uses, in order of first appearance"""
+        devices: List[str] = []
+        for node in self.nodes.values():
+            if node.device is not None and node.device not in devices:
+                devices.append(node.device)
+        return devices
+    
+    def topological_order(self) -> List[PlanNode]:
+        """
+        Nodes ordered so every node follows its dependencies.
+        
+        Ties keep insertion order, so the result is stable.
+        
+        Returns:
+            List of nodes
+            
+        Raises:
+            ValueError: A dependency is unknown or the graph has a cycle
+        """
+        remaining = {}
+        for node in self.nodes.values():
+            for dep in node.deps:
+                if dep not in self.nodes:
+                    raise ValueError(f"{node.id} depends on unknown node {dep}")
+            remaining[node.id] = len(set(node.deps))
+        
+        dependents: Dict[str, List[str]] = {node_id: [] for node_id in self.nodes}
+        for node in self.nodes.values():
+            for dep in set(node.deps):
+                dependents[dep].append(node.id)
+        
+        position = {node_id: index for index, node_id in enumerate(self.nodes)}
+        ready = [position[node_id] for node_id, count in remaining.items() if count == 0]
+        heapq.heapify(ready)
+        ids = list(self.nodes)
+        order = []
+        
+        while ready:
+            node_id = ids[heapq.heappop(ready)]
+            order.append(self.nodes[node_id])
+            for dependent in dependents[node_id]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    heapq.heappush(ready, position[dependent])
+        
+        if len(order) != len(self.nodes):
+            stuck = sorted(node_id for node_id, count in remaining.items() if count)
+            raise ValueError(f"Plan has a dependency cycle involving: {', '.join(stuck)}")
+        
+        return order
+    
+    def node_estimate(self, node: PlanNode, policy: Optional[TimeoutPolicy] = None,
+                      model: Optional[str] = None,
+                      history: Optional[ThroughputHistory] = None,
+                      port: Optional[str] = None) -> DurationEstimate:
+        """
+        Expected run time of a node.
+        
+        Args:
+            node: Node to estimate
+            policy: Throughput assumptions where there is no history
+            model: Model of the node's device
+            history: Measured transfer rates (None = policy only)
+            port: USB path of the node's device
+            
+        Returns:
+            DurationEstimate
+        """
+        if node.action == "prepare":
+            seconds = node.size / HASH_THROUGHPUT
+            return DurationEstimate(seconds, seconds, seconds)
+        if history is None:
+            return fallback_estimate(node.size, policy, model)
+        operation = "flash" if node.action == "flash" else "backup"
+        return history.estimate(operation, node.size or None, model,
+                                node.step.partition if node.step else None, port, policy)
+    
+    def node_duration(self, node: PlanNode, policy: TimeoutPolicy,
+                      model: Optional[str] = None) -> float:
+        """Expected run time of a node in seconds, without history."""
+        return self.node_estimate(node, policy, model).seconds
+    
+    def estimate(self, policy: Optional[TimeoutPolicy] = None,
+                 models: Optional[Dict[str, str]] = None,
+                 prepare_workers: int = 2,
+                 history: Optional[ThroughputHistory] = None,
+                 ports: Optional[Dict[str, str]] = None,
+                 bound: str = "seconds") -> Dict[str, Tuple[float, float]]:
+        """
+        Simulate the executor's schedule.
+        
+        Each device runs one step at a time and preparation has
+        `prepare_workers` slots; a node starts when its dependencies are
+        done and its lane is free.
+        
+        Args:
+            policy: Throughput assumptions (None = defaults)
+            models: Device model per slot, for per-model throughput
+            prepare_workers: Concurrent preparation slots
+            history: Measured transfer rates (None = policy only)
+            ports: USB path per slot, for per-port history
+            bound: Node durations to use: "seconds" (expected), "low" or "high"
+            
+        Returns:
+            Mapping of node id to (start, end) in seconds from plan start
+        """
+        models = models or {}
+        ports = ports or {}
+        host = [0.0] * max(1, prepare_workers)
+        lanes: Dict[str, float] = {}
+        schedule: Dict[str, Tuple[float, float]] = {}
+        
+        for node in self.topological_order():
+            ready = max((schedule[dep][1] for dep in node.deps), default=0.0)
+            estimate = self.node_estimate(node, policy, models.get(node.device), history,
+                                          ports.get(node.device))
+            duration = getattr(estimate, bound)
+            
+            if node.device is None:
+                start = max(ready, heapq.heappop(host))
+                heapq.heappush(host, start + duration)
+            else:
+                start = max(ready, lanes.get(node.device, 0.0))
+                lanes[node.device] = start + duration
+            
+            schedule[node.id] = (start, start + duration)
+        
+        return schedule
+    
+    def estimate_total(self, policy: Optional[TimeoutPolicy] = None,
+                       models: Optional[Dict[str, str]] = None,
+                       prepare_workers: int = 2,
+                       history: Optional[ThroughputHistory] = None,
+                       ports: Optional[Dict[str, str]] = None) -> DurationEstimate:
+        """
+        Expected run time of the whole plan with confidence bounds.
+        
+        The bounds are the schedule with every node at its low or high
+        estimate, so they are conservative rather than statistically
+        combined.
+        
+        Returns:
+            DurationEstimate of the plan's makespan
+        """
+        totals = {}
+        for bound in ("seconds", "low", "high"):
+            schedule = self.estimate(policy, models, prepare_workers, history, ports, bound)
+            totals[bound] = max((end for _, end in schedule.values()), default=0.0)
+        
+        samples = [
+            self.node_estimate(node, policy, (models or {}).get(node.device), history,
+                               (ports or {}).get(node.device)).samples
+            for node in self.nodes.values() if node.device is not None
+        ]
+        return DurationEstimate(totals["seconds"], totals["low"], totals["high"],
+                                samples=min(samples, default=0),
+                                basis="history" if samples and min(samples) else "default")
+    
+    def describe(self, policy: Optional[TimeoutPolicy] = None,
+                 models: Optional[Dict[str, str]] = None,
+                 prepare_workers: int = 2,
+                 history: Optional[ThroughputHistory] = None,
+                 ports: Optional[Dict[str, str]] = None) -> str:
+        """
+        Human-readable plan with estimated timings (the dry run).
+        
+        Args:
+            policy: Throughput assumptions (None = defaults)
+            models: Device model per slot
+            prepare_workers: Concurrent preparation slots
+            history: Measured transfer rates (None = policy only)
+            ports: USB path per slot
+            
+        Returns:
+            Multi-line description
+        """
+        schedule = self.estimate(policy, models, prepare_workers, history, ports)
+        total = self.estimate_total(policy, models, prepare_workers, history, ports)
+        devices = self.devices
+        
+        lines = [
+            f"Plan {self.name}: {len(self.nodes)} steps on {len(devices)} "
+            f"device{'s' if len(devices) != 1 else ''}, estimated {_format_seconds(total.seconds)} "
+            f"({_format_seconds(total.low)} - {_format_seconds(total.high)}, "
+            f"{'measured rates' if total.basis == 'history' else 'assumed rates'})"
+        ]
+        for node in sorted(self.topological_order(), key=lambda n: (schedule[n.id][0], n.device or "")):
+            start, end = schedule[node.id]
+            what = node.step.describe() if node.step else f"check {os.path.basename(node.source.path)}"
+            lines.append(
+                f"  {_format_seconds(start):>8} - {_format_seconds(end):<8} "
+                f"{node.device or 'host':<10} {what} ({node.size / MiB:.1f} MiB)"
+            )
+            if node.deps:
+                lines.append(f"{'':31}after {', '.join(node.deps)}")
+        
+        return "\n".join(lines)
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+@dataclass
+class GraphResult:
+    """Outcome of a plan graph run"""
+    success: bool
+    message: str
+    results: Dict[str, FlashResult] = field(default_factory=dict)  # Node id -> result
+    skipped: List[str] = field(default_factory=list)   # Not run because a dependency failed
+    jobs: Dict[str, str] = field(default_factory=dict)  # Device slot -> journal job id
+    cancelled: bool = False
+    elapsed: float = 0.0
+    
+    def summarize(self, node_ids: List[str]) -> FlashResult:
+        """
+        Collapse a set of nodes (e.g. one device's) into a single result.
+        
+        Args:
+            node_ids: Nodes to summarize
+            
+        Returns:
+            FlashResult, successful if every node ran and succeeded
+        """
+        failures = [
+            f"{node_id}: {self.results[node_id].error or self.results[node_id].message}"
+            for node_id in node_ids
+            if node_id in self.results and not self.results[node_id].success
+        ]
+        skipped = [node_id for node_id in node_ids if node_id in self.skipped]
+        if not failures and not skipped:
+            return FlashResult(success=True, message=f"{len(node_ids)} steps done")
+        
+        return FlashResult(
+            success=False,
+            message=f"{len(failures)} step(s) failed, {len(skipped)} skipped",
+            error="; ".join(failures) or None,
+            cancelled=self.cancelled
+        )
+
+
+class _GraphRun:
+    """Shared scheduling state of one executor run"""
+    
+    def __init__(self, graph: PlanGraph, cancel: Optional[CancellationToken],
+                 on_update: Optional[Callable[[PlanNode, str], None]]):
+        self.graph = graph
+        self.order = graph.topological_order()
+        self.cancel = cancel
+        self.on_update = on_update
+        self.state = {node.id: PENDING for node in self.order}
+        self.results: Dict[str, FlashResult] = {}
+        self.jobs: Dict[str, str] = {}
+        self.cond = threading.Condition()
+    
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+    
+    def _set(self, node: PlanNode, state: str, result: Optional[FlashResult] = None):
+        """Change a node's state (called with cond held)."""
+        self.state[node.id] = state
+        if result is not None:
+            self.results[node.id] = result
+        self.cond.notify_all()
+        if self.on_update:
+            try:
+                self.on_update(node, state)
+            except Exception as e:
+                logger.warning(f"Plan update callback failed: {e}")
+    
+    def next_ready(self, lane: Optional[str]) -> Optional[PlanNode]:
+        """
+        Block until a node of the lane can run and claim it.
+        
+        Returns:
+            Node to run, or None when the lane has nothing left to do
+        """
+        with self.cond:
+            while True:
+                cancelled = self.cancel is not None and self.cancel.cancelled
+                waiting = False
+                
+                for node in self.order:
+                    if node.device != lane or self.state[node.id] != PENDING:
+                        continue
+                    deps = [self.state[dep] for dep in node.deps]
+                    if cancelled or FAILED in deps or SKIPPED in deps:
+                        self._set(node, SKIPPED)
+                    elif all(state == DONE for state in deps):
+                        self._set(node, RUNNING)
+                        return node
+                    else:
+                        waiting = True
+                
+                if not waiting:
+                    return None
+                self.cond.wait()
+    
+    def complete(self, node: PlanNode, result: FlashResult):
+        with self.cond:
+            self._set(node, DONE if result.success else FAILED, result)
+    
+    def fail_lane(self, lane: str, result: FlashResult):
+        """Fail every pending node of a lane (its device is unusable)."""
+        with self.cond:
+            for node in self.order:
+                if node.device == lane and self.state[node.id] == PENDING:
+                    self._set(node, FAILED, result)
+    
+    def lane_succeeded(self, lane: str) -> bool:
+        with self.cond:
+            return all(self.state[node.id] == DONE for node in self.order if node.device == lane)
+
+
+class GraphExecutor:
+    """
+    Runs plan graphs across one or more devices.
+    
+    Each device slot is bound to a ProtocolManager with a detected device
+    and an open session. A device lane holds its device lock for the
+    whole run and journals its steps like a flash plan, so an interrupted
+    device can be finished later with ProtocolManager.resume_plan().
+    """
+    
+    def __init__(self, managers: Dict[str, "ProtocolManager"], prepare_workers: int = 2,
+                 on_update: Optional[Callable[[PlanNode, str], None]] = None):
+        """
+        Initialize executor.
+        
+        Args:
+            managers: ProtocolManager per device slot
+            prepare_workers: Threads for host-side preparation
+            on_update: Called with (node, state) on every state change;
+                       must not block
+        """
+        self.managers = managers
+        self.prepare_workers = max(1, prepare_workers)
+        self.on_update = on_update
+    
+    def run(self, graph: PlanGraph, cancel: Optional[CancellationToken] = None) -> GraphResult:
+        """
+        Run a plan graph to completion.
+        
+        A failed node skips everything that depends on it; independent
+        branches and other devices carry on.
+        
+        Args:
+            graph: Plan to run
+            cancel: Token to abort the run
+            
+        Returns:
+            GraphResult
+        """
+        started = time.monotonic()
+        run = _GraphRun(graph, cancel, self.on_update)
+        unregister = cancel.on_cancel(run.wake) if cancel is not None else None
+        
+        threads = [
+            threading.Thread(target=self._device_lane, args=(run, device),
+                             name=f"plan-{device}", daemon=True)
+            for device in graph.devices
+        ]
+        threads += [
+            threading.Thread(target=self._host_lane, args=(run,),
+                             name=f"plan-prepare-{index}", daemon=True)
+            for index in range(self.prepare_workers)
+        ]
+        
+        logger.info(f"Running plan {graph.name}: {len(graph.nodes)} steps, "
+                    f"{len(graph.devices)} devices")
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if unregister is not None:
+                unregister()
+        
+        done = sum(1 for state in run.state.values() if state == DONE)
+        failed = [node_id for node_id, state in run.state.items() if state == FAILED]
+        skipped = [node_id for node_id, state in run.state.items() if state == SKIPPED]
+        success = done == len(run.state)
+        
+        message = f"Plan {graph.name}: {done} of {len(run.state)} steps done"
+        if failed:
+            message += f", failed: {', '.join(failed)}"
+        if skipped:
+            message += f", {len(skipped)} skipped"
+        
+        return GraphResult(
+            success=success,
+            message=message,
+            results=run.results,
+            skipped=skipped,
+            jobs=run.jobs,
+            cancelled=cancel is not None and cancel.cancelled and not success,
+            elapsed=time.monotonic() - started
+        )
+    
+    def _host_lane(self, run: _GraphRun):
+        while True:
+            node = run.next_ready(None)
+            if node is None:
+                return
+            try:
+                result = self._prepare(node, run.cancel)
+            except Exception as e:
+                logger.exception(f"Preparing {node.id} failed")
+                result = FlashResult(success=False, message="Preparation failed", error=str(e))
+            run.complete(node, result)
+    
+    def _prepare(self, node: PlanNode, cancel: Optional[CancellationToken]) -> FlashResult:
+        """Check a firmware file and hash it once for every device."""
+        source = node.source
+        if cancel is not None and cancel.cancelled:
+            return FlashResult(success=False, message="Cancelled", error=cancel.reason, cancelled=True)
+        if not os.path.isfile(source.path):
+            return FlashResult(
+                success=False,
+                message="Firmware missing",
+                error=f"{source.name}: {source.path} not found"
+            )
+        
+        digest = file_digest(source.path)
+        if source.sha256 and digest.lower() != source.sha256.lower():
+            return FlashResult(
+                success=False,
+                message="Firmware digest mismatch",
+                error=f"{source.name}: expected {source.sha256}, got {digest}"
+            )
+        
+        for manager in self.managers.values():
+            manager.remember_image_digest(source.path, digest)
+        return FlashResult(success=True, message=f"{source.name} ready")
+    
+    def _device_lane(self, run: _GraphRun, device: str):
+        manager = self.managers.get(device)
+        if manager is None or manager.current_device is None:
+            run.fail_lane(device, FlashResult(
+                success=False,
+                message="No device connected",
+                error=f"No device assigned to {device}"
+            ))
+            return
+        
+        nodes = [node for node in run.order if node.device == device]
+        runner = PlanRunner(manager, manager.journal)
+        try:
+            steps = runner.prepare([node.step for node in nodes])
+        except ValueError as e:
+            run.fail_lane(device, FlashResult(success=False, message="Invalid plan", error=str(e)))
+            return
+        
+        job_id = manager.journal.create(
+            manager.catalog_key,
+            [asdict(step) for step in steps]
+        )
+        run.jobs[device] = job_id
+        
+        try:
+            with manager.device_lock(f"plan {run.graph.name}", run.cancel):
+                while True:
+                    node = run.next_ready(device)
+                    if node is None:
+                        break
+                    try:
+                        result = runner.execute_step(job_id, node.step, run.cancel)
+                    except Exception as e:
+                        logger.exception(f"{node.id} failed")
+                        result = FlashResult(success=False, message="Step failed", error=str(e))
+                    run.complete(node, result)
+        except (DeviceBusy, OperationCancelled) as e:
+            run.fail_lane(device, FlashResult(
+                success=False,
+                message="Device busy" if isinstance(e, DeviceBusy) else "Cancelled",
+                error=str(e) or "Cancelled by user",
+                cancelled=isinstance(e, OperationCancelled),
+                busy=isinstance(e, DeviceBusy)
+            ))
+        
+        if run.lane_succeeded(device):
+            manager.journal.finish(job_id, True, f"Plan {run.graph.name} complete")
@@ -0,0 +1,284 @@
+"""
+SecureOS Flash - Port Health
+
+Per-port record of how transfers go, to catch worn USB ports and flaky
+cables before they quietly slow a station down. Every flash, backup and
+restore on a port updates its:
+
+- speed: throughput relative to the model's baseline (same model and
+  partition on any port, from the throughput history)
+- failure, stall and retry rates
+
+A port whose rates cross the thresholds is degraded: schedulers run its
+jobs after those of healthy ports. A port that keeps failing is
+quarantined for a while: no new jobs are started on it until the
+quarantine ends or an operator clears the port (after swapping the
+cable, say).
+"""
+
+from typing import Dict, List, Optional
+from dataclasses import dataclass, field, asdict
+import json
+import logging
+import os
+import threading
+import time
+
+from .flash_backend import FlashResult
+from .throughput_history import RateStats
+from ..utils.paths import data_dir
+
+
+logger = logging.getLogger(__name__)
+
+
+# Port states, best first
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+QUARANTINED = "quarantined"
+
+STATES = (HEALTHY, DEGRADED, QUARANTINED)
+
+
+@dataclass
+class HealthThresholds:
+    """
+    When a port counts as degraded or quarantined.
+    
+    Rates are exponentially weighted (newest transfer weighs `weight`),
+    so a port recovers once a new cable works, and old history fades.
+    """
+    weight: float = 0.2
+    min_transfers: int = 5            # Before rates can degrade a port
+    max_failure_rate: float = 0.25
+    max_stall_rate: float = 0.15
+    max_retry_rate: float = 0.5       # Retries per transfer
+    min_speed: float = 0.6            # Fraction of the model baseline
+    min_speed_samples: int = 3        # Measured transfers before speed counts
+    min_baseline_samples: int = 3     # Baseline samples before a transfer is compared
+    min_bytes: int = 4 * 1024 * 1024  # Smaller transfers are dominated by setup time
+    quarantine_failures: int = 3      # Consecutive failures
+    quarantine_failure_rate: float = 0.5
+    quarantine_time: float = 3600.0   # Seconds
+
+
+@dataclass
+class PortStats:
+    """Transfer record of one port"""
+    transfers: int = 0
+    failures: int = 0
+    stalls: int = 0
+    retries: int = 0
+    failure_rate: float = 0.0
+    stall_rate: float = 0.0
+    retry_rate: float = 0.0
+    speed: float = 1.0                # Weighted rate / baseline rate
+    speed_samples: int = 0
+    consecutive_failures: int = 0
+    quarantined_until: float = 0.0
+    last_error: Optional[str] = None
+    updated_at: float = 0.0
+
+
+@dataclass
+class PortStatus:
+    """Health of a port and why"""
+    port: str
+    state: str
+    reasons: List[str] = field(default_factory=list)
+    stats: PortStats = field(default_factory=PortStats)
+    
+    @property
+    def rank(self) -> int:
+        """Scheduling rank: 0 healthy, 1 degraded, 2 quarantined"""
+        return STATES.index(self.state)
+    
+    def to_dict(self) -> Dict:
+        return {"port": self.port, "state": self.state, "reasons": self.reasons,
+                "stats": asdict(self.stats)}
+
+
+class PortHealthTracker:
+    """
+    Persistent per-port transfer health.
+    
+    One tracker should be shared by every manager of a station (one
+    file, so every writer must go through the same instance).
+    """
+    
+    def __init__(self, path: Optional[str] = None,
+                 thresholds: Optional[HealthThresholds] = None):
+        """
+        Initialize tracker.
+        
+        Args:
+            path: Health file (None = <data dir>/port_health.json)
+            thresholds: When ports degrade (None = defaults)
+        """
+        self.path = path or os.path.join(data_dir(), "port_health.json")
+        self.thresholds = thresholds or HealthThresholds()
+        self._lock = threading.Lock()
+        self._stats: Optional[Dict[str, PortStats]] = None
+    
+    def record(self, port: str, result: FlashResult, size: int, elapsed: float,
+               baseline: Optional[RateStats] = None) -> PortStatus:
+        """
+        Record a finished transfer on a port.
+        
+        Cancelled and skipped transfers say nothing about the port and
+        are ignored.
+        
+        Args:
+            port: USB path
+            result: Backend result (stalled / retries are counted)
+            size: Bytes moved
+            elapsed: Wall time of the transfer in seconds
+            baseline: Rate of the same model and partition across ports,
+                      looked up before this transfer was added to it
+                      
+        Returns:
+            The port's status afterwards
+        """
+        if result.cancelled or result.skipped:
+            return self.status(port)
+        
+        t = self.thresholds
+        with self._lock:
+            stats = self._load().setdefault(port, PortStats())
+            before = self._assess(port, stats).state
+            
+            weight = max(1.0 / (stats.transfers + 1), t.weight)
+            failed = not result.success
+            stats.transfers += 1
+            stats.failures += failed
+            stats.stalls += result.stalled
+            stats.retries += result.retries
+            stats.failure_rate += weight * (failed - stats.failure_rate)
+            stats.stall_rate += weight * (result.stalled - stats.stall_rate)
+            stats.retry_rate += weight * (result.retries - stats.retry_rate)
+            stats.consecutive_failures = stats.consecutive_failures + 1 if failed else 0
+            if failed:
+                stats.last_error = (result.error or result.message)[:200]
+            
+            if (result.success and size >= t.min_bytes and elapsed > 0
+                    and baseline is not None and baseline.samples >= t.min_baseline_samples
+                    and baseline.rate > 0):
+                speed = (size / elapsed) / baseline.rate
+                stats.speed_samples += 1
+                speed_weight = max(1.0 / stats.speed_samples, t.weight)
+                stats.speed += speed_weight * (speed - stats.speed)
+            
+            if failed and stats.quarantined_until <= time.time() and (
+                stats.consecutive_failures >= t.quarantine_failures
+                or (stats.transfers >= t.min_transfers
+                    and stats.failure_rate >= t.quarantine_failure_rate)
+            ):
+                stats.quarantined_until = time.time() + t.quarantine_time
+            
+            stats.updated_at = time.time()
+            status = self._assess(port, PortStats(**asdict(stats)))
+            self._save()
+        
+        if status.state != before:
+            log = logger.warning if status.rank > STATES.index(before) else logger.info
+            log(f"Port {port} is now {status.state}" +
+                (f": {'; '.join(status.reasons)}" if status.reasons else ""))
+        return status
+    
+    def status(self, port: Optional[str]) -> PortStatus:
+        """
+        Current health of a port (healthy if it has no record).
+        
+        Args:
+            port: USB path (None = unknown port, always healthy)
+        """
+        if port is None:
+            return PortStatus("unknown", HEALTHY)
+        with self._lock:
+            stats = self._load().get(port)
+            if stats is None:
+                return PortStatus(port, HEALTHY)
+            return self._assess(port, PortStats(**asdict(stats)))
+    
+    def statuses(self) -> List[PortStatus]:
+        """Health of every port with a record, worst first."""
+        with self._lock:
+            statuses = [self._assess(port, PortStats(**asdict(stats)))
+                        for port, stats in self._load().items()]
+        statuses.sort(key=lambda s: (-s.rank, s.port))
+        return statuses
+    
+    def clear(self, port: str) -> bool:
+        """
+        Forget a port's record, ending any quarantine.
+        
+        Returns:
+            False if the port had no record
+        """
+        with self._lock:
+            stats = self._load()
+            if stats.pop(port, None) is None:
+                return False
+            self._save()
+        logger.info(f"Port {port} cleared")
+        return True
+    
+    def _assess(self, port: str, stats: PortStats) -> PortStatus:
+        """State of a port from its stats."""
+        t = self.thresholds
+        remaining = stats.quarantined_until - time.time()
+        if remaining > 0:
+            return PortStatus(port, QUARANTINED, [
+                f"{stats.consecutive_failures} consecutive failures" if stats.consecutive_failures
+                else f"failure rate {stats.failure_rate:.0%}",
+                f"quarantined for {remaining / 60:.0f} more minutes"
+            ], stats)
+        
+        reasons = []
+        if stats.transfers >= t.min_transfers:
+            if stats.failure_rate > t.max_failure_rate:
+                reasons.append(f"failure rate {stats.failure_rate:.0%}")
+            if stats.stall_rate > t.max_stall_rate:
+                reasons.append(f"stall rate {stats.stall_rate:.0%}")
+            if stats.retry_rate > t.max_retry_rate:
+                reasons.append(f"{stats.retry_rate:.1f} retries per transfer")
+        if stats.speed_samples >= t.min_speed_samples and stats.speed < t.min_speed:
+            reasons.append(f"throughput at {stats.speed:.0%} of the model baseline")
+        return PortStatus(port, DEGRADED if reasons else HEALTHY, reasons, stats)
+    
+    def _load(self) -> Dict[str, PortStats]:
+        """Read the health file once (called with _lock held)."""
+        if self._stats is not None:
+            return self._stats
+        
+        self._stats = {}
+        try:
+            with open(self.path, "r") as f:
+                for port, item in json.load(f).get("ports", {}).items():
+                    self._stats[port] = PortStats(**item)
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ignoring corrupt port health file {self.path}: {e}")
+        return self._stats
+    
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"ports": {port: asdict(stats) for port, stats in self._stats.items()}}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+_default_tracker: Optional[PortHealthTracker] = None
+_default_tracker_lock = threading.Lock()
+
+
+def default_port_health() -> PortHealthTracker:
+    """Process-wide tracker shared by all ProtocolManagers."""
+    global _default_tracker
+    with _default_tracker_lock:
+        if _default_tracker is None:
+            _default_tracker = PortHealthTracker()
+        return _default_tracker
@@ -0,0 +1,254 @@
+"""
+SecureOS Flash - Operation Profiling
+
+On-demand profiling of device operations, to tell whether a slow
+station spends its time in Python, in the flashing tools or waiting on
+USB. A profile records, for one operation:
+
+- wall time, and CPU time of this process
+- CPU time and I/O counters of each child process (heimdall, ...)
+- a cProfile of the operation's thread and a tracemalloc snapshot,
+  summarized for the framework's own code
+
+Profiles are attached to the operation's FlashResult and written to
+<data dir>/profiles (.json summary, .prof for pstats/snakeviz,
+.tracemalloc for tracemalloc.Snapshot.load).
+
+Enable with SECUREOS_FLASH_PROFILE=all (or a comma-separated list of
+operations, e.g. "flash,backup"), or pass a Profiler to ProtocolManager.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+import cProfile
+import itertools
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+
+from ..utils.paths import data_dir
+from ..utils.process import ChildUsage, collect_child_usage
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+logger = logging.getLogger(__name__)
+
+
+PROFILE_ENV = "SECUREOS_FLASH_PROFILE"
+
+# Entries kept in a profile's summaries
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 10
+
+# Frames stored per allocation
+TRACEMALLOC_FRAMES = 5
+
+# Code counted as the framework's own
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cProfile and tracemalloc are process-wide; only one operation at a time
+# gets them, concurrent ones are profiled without
+_interpreter_profile = threading.Lock()
+
+_profiles = threading.local()
+_sequence = itertools.count(1)
+
+
+@dataclass
+class OperationProfile:
+    """Where one operation's time and memory went"""
+    operation: str
+    device: Optional[str]
+    started_at: float = field(default_factory=time.time)
+    wall: float = 0.0
+    cpu_user: float = 0.0         # This process (all threads)
+    cpu_system: float = 0.0
+    children: List[ChildUsage] = field(default_factory=list)
+    functions: List[Dict[str, Any]] = field(default_factory=list)    # Framework code by cumulative time
+    memory_peak: Optional[int] = None                                # Bytes traced at the peak
+    allocations: List[Dict[str, Any]] = field(default_factory=list)  # Framework lines by size
+    files: Dict[str, str] = field(default_factory=dict)              # Kind -> path
+    notes: List[str] = field(default_factory=list)
+    
+    @property
+    def children_cpu(self) -> float:
+        return sum(child.user_cpu + child.system_cpu for child in self.children)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["children_cpu"] = self.children_cpu
+        return data
+
+
+class Profiler:
+    """
+    Profiles selected device operations.
+    
+    Nested operations (a flash inside a plan run) are covered by the
+    outermost profile.
+    """
+    
+    def __init__(self, operations: Sequence[str] = ("all",), interpreter: bool = True,
+                 directory: Optional[str] = None):
+        """
+        Initialize profiler.
+        
+        Args:
+            operations: Operation names to profile ("all" = every operation)
+            interpreter: Also run cProfile and tracemalloc (slows Python
+                         code down; resource accounting is always on)
+            directory: Where profiles are written (None = <data dir>/profiles)
+        """
+        self.operations = {name.strip() for name in operations if name.strip()}
+        self.interpreter = interpreter
+        self.directory = directory
+    
+    @classmethod
+    def from_env(cls) -> Optional["Profiler"]:
+        """
+        Profiler configured by SECUREOS_FLASH_PROFILE, or None when unset.
+        
+        "1" or "all" profiles every operation; otherwise the value lists
+        operation names separated by commas.
+        """
+        value = os.environ.get(PROFILE_ENV, "").strip()
+        if value.lower() in ("", "0", "no", "off"):
+            return None
+        if value.lower() in ("1", "yes", "on"):
+            value = "all"
+        return cls(value.split(","))
+    
+    def wants(self, operation: str) -> bool:
+        """Whether an operation should be profiled."""
+        return "all" in self.operations or operation in self.operations
+    
+    @contextmanager
+    def profile(self, operation: str, device: Optional[str] = None) -> Iterator[Optional[OperationProfile]]:
+        """
+        Profile a block.
+        
+        Yields:
+            OperationProfile, complete once the block exits (None when
+            this thread is already inside a profile)
+        """
+        if getattr(_profiles, "active", False):
+            yield None
+            return
+        
+        profile = OperationProfile(operation, device)
+        interpreter = self.interpreter and _interpreter_profile.acquire(blocking=False)
+        if self.interpreter and not interpreter:
+            profile.notes.append("cProfile/tracemalloc skipped: another operation is being profiled")
+        
+        profiler = None
+        started_tracing = False
+        if interpreter:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                started_tracing = True
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            profiler = cProfile.Profile()
+        
+        _profiles.active = True
+        usage_before = resource.getrusage(resource.RUSAGE_SELF) if resource else None
+        started = time.monotonic()
+        try:
+            with collect_child_usage() as children:
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    yield profile
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _profiles.active = False
+            profile.wall = time.monotonic() - started
+            profile.children = children
+            if usage_before is not None:
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                profile.cpu_user = usage.ru_utime - usage_before.ru_utime
+                profile.cpu_system = usage.ru_stime - usage_before.ru_stime
+            
+            snapshot = None
+            if interpreter:
+                try:
+                    profile.memory_peak = tracemalloc.get_traced_memory()[1]
+                    snapshot = tracemalloc.take_snapshot().filter_traces([
+                        tracemalloc.Filter(True, os.path.join(PACKAGE_ROOT, "*")),
+                        tracemalloc.Filter(False, os.path.abspath(__file__)),
+                    ])
+                finally:
+                    if started_tracing:
+                        tracemalloc.stop()
+                    _interpreter_profile.release()
+            
+            try:
+                self._write(profile, profiler, snapshot)
+            except OSError as e:
+                logger.warning(f"Could not write profile of {operation}: {e}")
+    
+    def _write(self, profile: OperationProfile, profiler: Optional[cProfile.Profile],
+               snapshot: Optional[tracemalloc.Snapshot]):
+        """Summarize the interpreter data into the profile and write its files."""
+        directory = self.directory or data_dir("profiles")
+        os.makedirs(directory, exist_ok=True)
+        device = re.sub(r"[^\w.-]+", "_", profile.device or "nodevice")
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(profile.started_at))
+        base = os.path.join(directory, f"{stamp}-{device}-{profile.operation}-{os.getpid()}-{next(_sequence)}")
+        
+        if profiler is not None:
+            stats = pstats.Stats(profiler)
+            profile.functions = _top_functions(stats)
+            profile.files["cprofile"] = f"{base}.prof"
+            stats.dump_stats(profile.files["cprofile"])
+        
+        if snapshot is not None:
+            profile.allocations = [
+                {
+                    "location": f"{os.path.relpath(stat.traceback[0].filename, PACKAGE_ROOT)}:{stat.traceback[0].lineno}",
+                    "size": stat.size,
+                    "count": stat.count,
+                }
+                for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+            ]
+            profile.files["tracemalloc"] = f"{base}.tracemalloc"
+            snapshot.dump(profile.files["tracemalloc"])
+        
+        profile.files["summary"] = f"{base}.json"
+        with open(profile.files["summary"], "w") as f:
+            json.dump(profile.to_dict(), f, indent=1)
+        
+        logger.info(
+            f"Profiled {profile.operation}: {profile.wall:.2f}s wall, "
+            f"{profile.cpu_user + profile.cpu_system:.2f}s CPU, "
+            f"{profile.children_cpu:.2f}s in {len(profile.children)} child process(es) "
+            f"-> {profile.files['summary']}"
+        )
+
+
+def _top_functions(stats: pstats.Stats) -> List[Dict[str, Any]]:
+    """Framework functions of a cProfile run by cumulative time."""
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        if not filename.startswith(PACKAGE_ROOT):
+            continue
+        rows.append({
+            "function": f"{os.path.relpath(filename, PACKAGE_ROOT)}:{line}({name})",
+            "calls": calls,
+            "own": own,
+            "cumulative": cumulative,
+        })
+    rows.sort(key=lambda row: row["cumulative"], reverse=True)
+    return rows[:TOP_FUNCTIONS]
@@ -5,25 +5,147 @@ Manages detection and selection of appropriate flash backend
 based on connected device.
 """
 
-from typing import List, Optional
+from contextlib import contextmanager
+from dataclasses import asdict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import functools
+import inspect
 import logging
+import lzma
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import zlib
 
-from .flash_backend import FlashBackend, DeviceInfo, FlashResult
+from .flash_backend import FlashBackend, DeviceInfo, FlashResult, PartitionInfo
+from .cancellation import CancellationToken, OperationCancelled, checkpoint
+from .device_locks import DeviceBusy, DeviceLockManager, default_lock_manager
+from .digest_store import PartitionDigestStore
+from .backup_archive import BackupArchiveError, BackupArchiveWriter, compress_dump
+from .backup_catalog import BackupCatalog, BackupRecord, RetentionPolicy
+from .job_journal import JobJournal, JobState
+from .flash_plan import PlanRunner, PlanStep
+from .throughput_history import DurationEstimate, ThroughputHistory, default_throughput_history
+from .events import (EventBus, DeviceAttached, SessionChanged, OperationStarted,
+                     OperationProgress, OperationFinished, OperationRetrying, PortHealthChanged,
+                     default_event_bus)
+from .failures import DEVICE_GONE, HANDSHAKE, Failure, RetryPolicy, classify
+from .port_health import PortHealthTracker, PortStatus, default_port_health
+from .profiling import OperationProfile, Profiler
+from .restore import RestoreError, RestoreSource
+from ..utils.hashing import DEFAULT_ALGORITHM, file_digest, file_signature
+from ..utils.paths import data_dir
 
 
 logger = logging.getLogger(__name__)
 
 
+def _failed_result(message: str, error: str, cancelled: bool) -> FlashResult:
+    # on_busy is called for a busy device or a cancelled lock wait
+    return FlashResult(success=False, message=message, error=error, cancelled=cancelled,
+                       busy=not cancelled)
+
+
+def _device_operation(operation: str, on_busy=_failed_result):
+    """
+    Run a ProtocolManager method while holding the current device's lock.
+    
+    The method's `cancel` argument (if any) also aborts the lock wait.
+    When the lock cannot be taken the method is not run and
+    on_busy(message, error, cancelled) supplies the return value.
+    
+    Once locked, the call is reported on the manager's event bus and
+    passed through its hooks; with nothing subscribed it runs directly.
+    Operations selected by the manager's profiler are profiled.
+    """
+    def decorate(method):
+        signature = inspect.signature(method)
+        
+        @functools.wraps(method)
+        def locked(self, *args, **kwargs):
+            cancel = None
+            if "cancel" in signature.parameters:
+                cancel = signature.bind(self, *args, **kwargs).arguments.get("cancel")
+            
+            try:
+                with self.device_lock(operation, cancel):
+                    if self.profiler is not None and self.profiler.wants(operation):
+                        return self._profiled(operation, method, signature, args, kwargs)
+                    if self.events.idle:
+                        return method(self, *args, **kwargs)
+                    return self._observed(operation, method, signature, args, kwargs)
+            except DeviceBusy as e:
+                logger.warning(f"{operation}: {e}")
+                return on_busy("Device busy", str(e), False)
+            except OperationCancelled as e:
+                return on_busy("Cancelled", str(e) or "Cancelled by user", True)
+        
+        return locked
+    return decorate
+
+
 class ProtocolManager:
     """
     Central manager that detects devices and routes operations
     to the appropriate backend (Samsung, Fastboot, MediaTek, etc.)
     """
     
-    def __init__(self):
+    def __init__(self, digest_store: Optional[PartitionDigestStore] = None,
+                 catalog: Optional[BackupCatalog] = None,
+                 locks: Optional[DeviceLockManager] = None,
+                 lock_timeout: Optional[float] = None,
+                 journal: Optional[JobJournal] = None,
+                 events: Optional[EventBus] = None,
+                 history: Optional[ThroughputHistory] = None,
+                 profiler: Optional[Profiler] = None,
+                 port_health: Optional[PortHealthTracker] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 retention: Optional[RetentionPolicy] = None):
+        """
+        Initialize protocol manager.
+        
+        Args:
+            digest_store: Record of known partition digests, used for
+                          differential flashing (None = default store)
+            catalog: Index of backups taken through this manager
+                     (None = default catalog)
+            locks: Per-device lock manager (None = the process-wide one)
+            lock_timeout: Longest wait for a busy device in seconds before
+                          an operation fails (None = wait until cancelled)
+            journal: Job journal for flash plans (None = default journal)
+            events: Bus for device and operation events (None = the
+                    process-wide one)
+            history: Measured transfer rates, updated by every flash and
+                     backup (None = the process-wide history)
+            profiler: Profiles selected operations (None = as configured
+                      by SECUREOS_FLASH_PROFILE, normally off)
+            port_health: Per-port transfer health, updated by every flash,
+                         backup and restore (None = the process-wide tracker)
+            retry_policy: How transfers that fail in a transient way are
+                          retried (None = RetryPolicy() defaults)
+            retention: Which automatic safety backups to keep, applied to
+                       a device's auto-backup directory after each one
+                       (None = RetentionPolicy() defaults)
+        """
         self.backends: List[FlashBackend] = []
         self.active_backend: Optional[FlashBackend] = None
         self.current_device: Optional[DeviceInfo] = None
+        self.digest_store = digest_store or PartitionDigestStore()
+        self.catalog = catalog or BackupCatalog()
+        self.locks = locks or default_lock_manager()
+        self.lock_timeout = lock_timeout
+        self.journal = journal or JobJournal()
+        self.events = events or default_event_bus()
+        self.history = history or default_throughput_history()
+        self.profiler = profiler or Profiler.from_env()
+        self.port_health = port_health or default_port_health()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retention = retention or RetentionPolicy()
+        self.last_profile: Optional[OperationProfile] = None
+        self._image_digests: Dict[tuple, str] = {}
+        self._operations: List[str] = []  # Running operations, outermost first
     
     def register_backend(self, backend: FlashBackend):
         """
@@ -35,6 +157,138 @@ class ProtocolManager:
         self.backends.append(backend)
         logger.info(f"Registered backend: {backend.get_backend_name()}")
     
+    @property
+    def device_key(self) -> Optional[str]:
+        """Lock key of the current device: its USB path, else its device id"""
+        if self.current_device is None:
+            return None
+        return self.current_device.usb_path or self.current_device.device_id
+    
+    @property
+    def record_key(self) -> Optional[str]:
+        """
+        Key of the current device's digest records: DeviceInfo.identity,
+        None if the backend could not read a serial number.
+        
+        Without a serial nothing is recorded about the device's contents,
+        differential flashing reads partitions back instead of trusting
+        records, and restores must name their backup.
+        """
+        if self.current_device is None:
+            return None
+        return self.current_device.identity
+    
+    @property
+    def catalog_key(self) -> str:
+        """
+        Device column of the current device's catalog and journal records.
+        
+        The device id stands in for a missing serial number; several
+        devices can share it, so records filed under it are not trusted
+        to describe the device (see record_key).
+        """
+        return self.record_key or self.current_device.device_id
+    
+    @contextmanager
+    def device_lock(self, operation: str = "",
+                    cancel: Optional[CancellationToken] = None) -> Iterator[None]:
+        """
+        Hold the current device for a block of operations.
+        
+        Operation methods lock the device themselves; use this to keep
+        other threads off the device across several of them. Does nothing
+        while no device is selected.
+        
+        Args:
+            operation: What the device is held for (shown to waiters)
+            cancel: Token that aborts the wait
+            
+        Raises:
+            DeviceBusy: Not acquired within lock_timeout
+            OperationCancelled: Cancelled while waiting
+        """
+        key = self.device_key
+        if key is None:
+            yield
+            return
+        
+        with self.locks.hold([key], operation, self.lock_timeout, cancel):
+            yield
+    
+    def _observed(self, operation: str, method: Callable, signature: inspect.Signature,
+                  args: tuple, kwargs: dict):
+        """Run a locked operation through the hooks, publishing its events."""
+        bus = self.events
+        if bus.before_hooks:
+            arguments = signature.bind(self, *args, **kwargs).arguments
+            arguments.pop("self", None)
+            for hook in bus.before_hooks:
+                override = hook(self, operation, arguments)
+                if override is not None:
+                    logger.info(f"{operation} skipped by hook {hook!r}")
+                    return override
+        
+        if bus.wants(OperationStarted):
+            bus.publish(OperationStarted(self.device_key, operation))
+        
+        backend = self.active_backend
+        downstream = getattr(backend, "progress", None)
+        tapped = (not self._operations and hasattr(backend, "progress")
+                  and bus.wants(OperationProgress))
+        if tapped:
+            backend.progress = self._progress_tap(downstream)
+        self._operations.append(operation)
+        
+        started = time.monotonic()
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException as e:
+            if bus.wants(OperationFinished):
+                bus.publish(OperationFinished(self.device_key, operation, None,
+                                              time.monotonic() - started, str(e) or type(e).__name__))
+            raise
+        finally:
+            self._operations.pop()
+            if tapped:
+                backend.progress = downstream
+        
+        elapsed = time.monotonic() - started
+        if bus.wants(OperationFinished):
+            bus.publish(OperationFinished(self.device_key, operation, result, elapsed))
+        for hook in bus.after_hooks:
+            hook(self, operation, result, elapsed)
+        return result
+    
+    def _profiled(self, operation: str, method: Callable, signature: inspect.Signature,
+                  args: tuple, kwargs: dict):
+        """Run a locked operation under the profiler, attaching the profile to its result."""
+        with self.profiler.profile(operation, self.device_key) as profile:
+            if self.events.idle:
+                result = method(self, *args, **kwargs)
+            else:
+                result = self._observed(operation, method, signature, args, kwargs)
+        
+        if profile is not None:
+            self.last_profile = profile
+            if isinstance(result, FlashResult):
+                result.profile = profile.to_dict()
+        return result
+    
+    def _progress_tap(self, downstream: Optional[Callable[[int, int], None]]) -> Callable[[int, int], None]:
+        """Backend progress callback that also publishes OperationProgress."""
+        bus = self.events
+        device = self.device_key
+        operations = self._operations
+        
+        def progress(done: int, total: int):
+            if downstream:
+                downstream(done, total)
+            if operations:
+                bus.publish(OperationProgress(device, operations[-1], done, total))
+        
+        return progress
+    
+    @_device_operation("detect", on_busy=lambda *_: None)
     def detect_device(self) -> Optional[DeviceInfo]:
         """
         Detect connected device by trying all registered backends.
@@ -54,11 +308,15 @@ class ProtocolManager:
                 
                 self.active_backend = backend
                 self.current_device = device_info
+                if self.events.wants(DeviceAttached):
+                    self.events.publish(DeviceAttached(self.device_key, device_info,
+                                                       backend.get_backend_name()))
                 return device_info
         
         logger.warning("No compatible device detected")
         return None
     
+    @_device_operation("init_session", on_busy=lambda *_: False)
     def init_session(self) -> bool:
         """
         Initialize session with detected device.
@@ -71,15 +329,21 @@ class ProtocolManager:
             return False
         
         logger.info("Initializing session...")
-        return self.active_backend.init_session()
+        ok = self.active_backend.init_session()
+        if self.events.wants(SessionChanged):
+            self.events.publish(SessionChanged(self.device_key, active=ok, ok=ok))
+        return ok
     
-    def backup_partition(self, partition_name: str, output_file: str) -> FlashResult:
+    @_device_operation("backup")
+    def backup_partition(self, partition_name: str, output_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
         """
         Backup a partition using active backend.
         
         Args:
             partition_name: Partition to backup
             output_file: Where to save backup
+            cancel: Token to abort the backup
             
         Returns:
             FlashResult
@@ -92,18 +356,60 @@ class ProtocolManager:
             )
         
         logger.info(f"Backing up partition: {partition_name}")
-        return self.active_backend.backup_partition(partition_name, output_file)
+        backend = self.active_backend
+        result, elapsed = self._transfer(
+            "backup", partition_name,
+            lambda: backend.backup_partition(partition_name, output_file, cancel), cancel
+        )
+        
+        size = os.path.getsize(output_file) if result.success and os.path.exists(output_file) else 0
+        self._record_transfer("backup", partition_name, result, size, elapsed)
+        if result.success and os.path.exists(output_file):
+            # A fresh backup tells us exactly what the partition holds
+            digest = self.image_digest(output_file)
+            self._record_digest(partition_name, digest, size, source="backup")
+            self.catalog.add(self.catalog_key, partition_name, output_file, size, digest)
+            
+            directory = os.path.abspath(self._auto_backup_dir())
+            if os.path.dirname(os.path.abspath(output_file)) == directory:
+                self._prune_auto_backups(directory)
+        
+        return result
     
-    def flash_partition(self, partition_name: str, image_file: str) -> FlashResult:
+    def _prune_auto_backups(self, directory: str):
+        """Apply the retention policy to a device's automatic backups."""
+        try:
+            pruned = self.catalog.apply_retention(self.retention, directory=directory)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Could not prune automatic backups: {e}")
+            return
+        if pruned:
+            logger.info(f"Pruned {pruned} old automatic backups in {directory}")
+    
+    @_device_operation("flash")
+    def flash_partition(self, partition_name: str, image_file: str,
+                        differential: bool = False,
+                        verify_readback: bool = False,
+                        cancel: Optional[CancellationToken] = None) -> FlashResult:
         """
         Flash a partition using active backend.
         
+        In differential mode the partition is skipped when its last known
+        digest (from a verified flash or backup) already matches the image.
+        Only differential flashes record the image's digest afterwards; a
+        plain flash forgets the partition's record rather than hash the
+        whole image for a record nobody asked for.
+        
         Args:
             partition_name: Partition to flash
             image_file: Image to flash
+            differential: Skip the flash if the partition already holds the image
+            verify_readback: Confirm a differential match by reading the
+                             partition back before skipping it
+            cancel: Token to abort the flash
             
         Returns:
-            FlashResult
+            FlashResult (skipped=True if nothing was written)
         """
         if not self.active_backend:
             return FlashResult(
@@ -112,16 +418,551 @@ class ProtocolManager:
                 error="Call detect_device() first"
             )
         
+        if differential and os.path.exists(image_file):
+            try:
+                matches = self._partition_matches(partition_name, image_file,
+                                                  verify_readback, cancel)
+            except OperationCancelled as e:
+                return FlashResult(
+                    success=False,
+                    message="Flash cancelled",
+                    error=str(e) or "Cancelled by user",
+                    cancelled=True
+                )
+            
+            if matches:
+                logger.info(f"Partition {partition_name} already up to date - skipping")
+                return FlashResult(
+                    success=True,
+                    message=f"{partition_name} already up to date",
+                    skipped=True
+                )
+        
         logger.info(f"Flashing partition: {partition_name}")
-        return self.active_backend.flash_partition(partition_name, image_file)
+        backend = self.active_backend
+        result, elapsed = self._transfer(
+            "flash", partition_name,
+            lambda: backend.flash_partition(partition_name, image_file, cancel), cancel
+        )
+        self._flash_finished(partition_name, image_file, result, elapsed,
+                             record_digest=differential or verify_readback)
+        return result
     
-    def flash_bootloader(self, bootloader_file: str, auto_backup: bool = True) -> FlashResult:
+    def _flash_finished(self, partition_name: str, image_file: str, result: FlashResult,
+                        elapsed: float, record_digest: bool):
+        """
+        Record a flash from an image file in its port's health and the
+        throughput history.
+        
+        The partition's digest record is replaced by the image's if
+        record_digest is set and the flash succeeded, else dropped.
+        """
+        if os.path.exists(image_file):
+            self._record_transfer("flash", partition_name, result, os.path.getsize(image_file), elapsed)
+        if result.success and record_digest:
+            self._record_digest(
+                partition_name,
+                self.image_digest(image_file),
+                os.path.getsize(image_file),
+                source="flash"
+            )
+        else:
+            # Contents are unknown after a failed flash, and not tracked
+            # after a plain one
+            self._forget_digest(partition_name)
+    
+    @_device_operation("restore")
+    def restore_partition(self, partition_name: str, archive: Optional[str] = None,
+                          record_id: Optional[int] = None,
+                          staging_dir: Optional[str] = None,
+                          cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Put a backup back onto a partition.
+        
+        Backends that can flash from a stream get the backup decompressed
+        on the fly, so a compressed backup is never expanded on disk.
+        Other backends get the raw dump itself, or a staging file that is
+        deleted afterwards. Size and digest are checked as the data is
+        read; a mismatch aborts the transfer before its last bytes go out.
+        
+        Args:
+            partition_name: Partition to restore
+            archive: Backup archive to take the partition from
+            record_id: Catalog id of the backup to restore
+            staging_dir: Where backends that need a file get one
+                         (None = system temp directory)
+            cancel: Token to abort the restore
+            
+        With neither archive nor record_id, the newest catalogued backup
+        of the partition for this device is used (verified ones first);
+        this needs a device serial number (see record_key).
+        
+        Returns:
+            FlashResult
+        """
+        if not self.active_backend:
+            return FlashResult(
+                success=False,
+                message="No device connected",
+                error="Call detect_device() first"
+            )
+        
+        key = self.record_key
+        if archive is None and record_id is None and key is None:
+            return FlashResult(
+                success=False,
+                message="Restore failed",
+                error=f"{self.current_device.device_id} reports no serial number, so its "
+                      f"backups cannot be told from other devices' - choose one by archive or record id"
+            )
+        try:
+            source = self._restore_source(key, partition_name, archive, record_id)
+        except (BackupArchiveError, OSError) as e:
+            return FlashResult(success=False, message="Restore failed", error=str(e))
+        if source is None:
+            return FlashResult(
+                success=False,
+                message="Restore failed",
+                error=f"No backup of {partition_name} for {key}"
+            )
+        
+        backend = self.active_backend
+        staged = None
+        elapsed = None  # Set when the backend has been handed the data
+        try:
+            if backend.supports_streaming():
+                logger.info(f"Restoring {partition_name} from {source.location} (streaming)")
+                
+                def attempt() -> FlashResult:
+                    # A retry reads the backup again from the start
+                    with source.open() as reader:
+                        return backend.flash_stream(partition_name, reader, source.size, cancel)
+            else:
+                if source.compressed:
+                    logger.info(f"Restoring {partition_name} from {source.location} (staged)")
+                    image = staged = source.stage(staging_dir, cancel=cancel)
+                else:
+                    image = source.location
+                    digest = (self.image_digest(image) if source.algorithm == DEFAULT_ALGORITHM
+                              else file_digest(image, source.algorithm))
+                    if source.digest and digest != source.digest:
+                        raise RestoreError(f"Digest mismatch in {image}: backup is corrupt")
+                checkpoint(cancel)
+                
+                def attempt() -> FlashResult:
+                    return backend.flash_partition(partition_name, image, cancel)
+            
+            result, elapsed = self._transfer("restore", partition_name, attempt, cancel)
+        except OperationCancelled as e:
+            result = FlashResult(
+                success=False,
+                message="Restore cancelled",
+                error=str(e) or "Cancelled by user",
+                cancelled=True
+            )
+        except (RestoreError, BackupArchiveError, OSError, EOFError, zlib.error, lzma.LZMAError) as e:
+            logger.error(f"Restore of {partition_name} failed: {e}")
+            result = FlashResult(success=False, message="Restore failed", error=str(e))
+        finally:
+            if staged is not None:
+                os.unlink(staged)
+        
+        if elapsed is not None:
+            self._record_transfer("flash", partition_name, result, source.size, elapsed)
+        if result.success:
+            if source.digest:
+                self._record_digest(partition_name, source.digest, source.size,
+                                    source="restore", algorithm=source.algorithm)
+        else:
+            # Contents are unknown after a failed flash
+            self._forget_digest(partition_name)
+        
+        return result
+    
+    def _transfer(self, operation: str, partition_name: str, attempt: Callable[[], FlashResult],
+                  cancel: Optional[CancellationToken],
+                  retries: Optional[int] = None) -> Tuple[FlashResult, float]:
+        """
+        Run a backend transfer, retrying it as the retry policy allows.
+        
+        Failures are classified (see core.failures). After a retryable
+        one the session is dropped, the device detected again (it may
+        have re-enumerated after a USB reset) and a new session started,
+        then the same transfer runs again. Nothing else is repeated.
+        
+        Args:
+            operation: "backup", "flash" or "restore" (for logs and events)
+            partition_name: Partition being transferred
+            attempt: Runs the transfer once
+            cancel: Token that also aborts the backoff and re-detection
+            retries: Retry limit for this transfer (default: the policy's)
+            
+        Returns:
+            (result of the last attempt, duration of that attempt in seconds)
+        """
+        policy = self.retry_policy
+        limit = policy.retries if retries is None else retries
+        retries = 0
+        while True:
+            started = time.monotonic()
+            result = attempt()
+            elapsed = time.monotonic() - started
+            if result.success or result.cancelled:
+                break
+            
+            if result.failure:
+                failure = Failure(result.failure, (result.error or "").strip().split("\n", 1)[0])
+            else:
+                failure = classify(result.error, stalled=result.stalled)
+            result.failure = failure.kind
+            if not failure.retryable or retries >= limit:
+                break
+            
+            delay = policy.delay(retries + 1)
+            logger.warning(f"{operation} of {partition_name} failed ({failure.kind}: {failure.reason}) - "
+                           f"retry {retries + 1}/{limit} in {delay:.1f}s")
+            if self.events.wants(OperationRetrying):
+                self.events.publish(OperationRetrying(self.device_key, operation, partition_name,
+                                                      retries + 1, failure.kind, failure.reason, delay))
+            try:
+                self._wait(delay, cancel)
+                lost = self._reconnect(cancel)
+            except OperationCancelled as e:
+                result = FlashResult(
+                    success=False,
+                    message=f"{operation.capitalize()} cancelled",
+                    error=str(e) or "Cancelled by user",
+                    cancelled=True
+                )
+                break
+            if lost == DEVICE_GONE:
+                result.failure = DEVICE_GONE
+                result.error = f"{result.error}\nDevice not back for a retry"
+                break
+            if lost == HANDSHAKE:
+                result.failure = HANDSHAKE
+                result.error = f"{result.error}\nDevice back but no new session for a retry"
+                break
+            retries += 1
+        
+        result.retries = retries
+        return result, elapsed
+    
+    def _reconnect(self, cancel: Optional[CancellationToken]) -> Optional[str]:
+        """
+        Start a new session on the current device after a failed transfer.
+        
+        Waits up to retry_policy.redetect_timeout for the device to be
+        detected again. Another device turning up instead does not count:
+        the serial number must match or, for devices without one, the
+        device id (that is, the port).
+        
+        Returns:
+            None once a new session is up, else why not: DEVICE_GONE if
+            the device did not come back, HANDSHAKE if it did but the
+            session would not start
+            
+        Raises:
+            OperationCancelled: Cancelled while waiting for the device
+        """
+        backend = self.active_backend
+        expected = self.current_device
+        policy = self.retry_policy
+        backend.abort_session()
+        
+        deadline = time.monotonic() + policy.redetect_timeout
+        while True:
+            info = backend.detect_device()
+            if info is not None:
+                if expected.identity is not None:
+                    same = info.identity == expected.identity
+                else:
+                    same = info.identity is None and info.device_id == expected.device_id
+                if same:
+                    break
+                logger.error(f"Found {info.identity or info.device_id} where "
+                             f"{expected.identity or expected.device_id} was - not retrying")
+                backend.abort_session()
+                return DEVICE_GONE
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(f"{expected.device_id} did not come back within {policy.redetect_timeout:.0f}s")
+                return DEVICE_GONE
+            self._wait(min(policy.redetect_interval, remaining), cancel)
+        
+        self.current_device = info
+        ok = backend.init_session()
+        if self.events.wants(SessionChanged):
+            self.events.publish(SessionChanged(self.device_key, active=ok, ok=ok))
+        if not ok:
+            logger.error(f"{expected.device_id} is back but the session did not start")
+            return HANDSHAKE
+        return None
+    
+    @staticmethod
+    def _wait(seconds: float, cancel: Optional[CancellationToken]):
+        """Sleep, unless cancelled first (raises OperationCancelled)."""
+        if cancel is None:
+            time.sleep(seconds)
+        elif cancel.wait(seconds):
+            raise OperationCancelled(cancel.reason)
+    
+    def _restore_source(self, device_key: Optional[str], partition_name: str, archive: Optional[str],
+                        record_id: Optional[int]) -> Optional[RestoreSource]:
+        """Find the backup restore_partition() should use."""
+        if archive is not None:
+            return RestoreSource.from_archive(archive, partition_name)
+        
+        if record_id is not None:
+            record = self.catalog.get(record_id)
+        else:
+            record = (self.catalog.latest(device_key, partition_name)
+                      or self.catalog.latest(device_key, partition_name, verified_only=False))
+        return RestoreSource.from_record(record) if record is not None else None
+    
+    def _record_transfer(self, operation: str, partition_name: str, result: FlashResult,
+                         size: int, elapsed: float):
+        """
+        Add a finished transfer to its port's health and, if it
+        succeeded, to the throughput history.
+        
+        Port health compares the transfer with the model's baseline, so
+        it is updated before the history takes the transfer in.
+        """
+        device = self.current_device
+        port = device.usb_path
+        result.port = port
+        
+        if port is not None and not (result.cancelled or result.skipped):
+            baseline = None
+            if result.success:
+                baseline, _ = self.history.lookup(operation, device.model, partition_name)
+            try:
+                before = self.port_health.status(port).state
+                status = self.port_health.record(port, result, size, elapsed, baseline)
+            except OSError as e:
+                logger.warning(f"Could not update port health: {e}")
+            else:
+                if status.state != before and self.events.wants(PortHealthChanged):
+                    self.events.publish(PortHealthChanged(self.device_key, port, status.state,
+                                                          status.reasons))
+        
+        if result.success:
+            try:
+                self.history.record(operation, device.model, partition_name, port, size, elapsed)
+            except OSError as e:
+                logger.warning(f"Could not update throughput history: {e}")
+    
+    def port_status(self) -> PortStatus:
+        """
+        Health of the current device's port.
+        
+        Returns:
+            PortStatus (healthy when the port is unknown)
+        """
+        return self.port_health.status(self.current_device.usb_path if self.current_device else None)
+    
+    def estimate_transfer(self, operation: str, partition_name: str,
+                          size: Optional[int] = None) -> DurationEstimate:
+        """
+        Expected duration of a flash or backup on the current device,
+        from its model's and port's measured history.
+        
+        Args:
+            operation: "flash" or "backup" (a verify reads like a backup)
+            partition_name: Partition
+            size: Bytes to move (None = typical size for the partition)
+            
+        Returns:
+            DurationEstimate
+        """
+        device = self.current_device
+        operation = "backup" if operation == "verify" else operation
+        return self.history.estimate(
+            operation, size,
+            model=device.model if device else None,
+            partition=partition_name,
+            port=device.usb_path if device else None
+        )
+    
+    def image_digest(self, path: str) -> str:
+        """
+        Digest of a local file, cached by path, size and mtime so the same
+        image is hashed only once across a re-provisioning run.
+        
+        Args:
+            path: Image or backup file
+            
+        Returns:
+            Hex digest
+        """
+        key = file_signature(path)
+        digest = self._image_digests.get(key)
+        
+        if digest is None:
+            digest = file_digest(path)
+            self._image_digests[key] = digest
+        
+        return digest
+    
+    def remember_image_digest(self, path: str, digest: str):
+        """
+        Seed the digest cache with a digest computed elsewhere, such as a
+        manifest's prepare step, so the file is not hashed again.
+        
+        Args:
+            path: Image file (unchanged since it was hashed)
+            digest: Its hex digest
+        """
+        self._image_digests[file_signature(path)] = digest
+    
+    def _record_digest(self, partition_name: str, digest: str, size: int, source: str,
+                       algorithm: str = DEFAULT_ALGORITHM):
+        """Record what a partition of the current device holds, if the device can be identified."""
+        key = self.record_key
+        if key is not None:
+            self.digest_store.record(key, partition_name, digest, size,
+                                     source=source, algorithm=algorithm)
+    
+    def _forget_digest(self, partition_name: str):
+        """Drop the record of a partition of the current device."""
+        key = self.record_key
+        if key is not None:
+            self.digest_store.forget(key, partition_name)
+    
+    def _partition_matches(self, partition_name: str, image_file: str,
+                           verify_readback: bool,
+                           cancel: Optional[CancellationToken] = None) -> bool:
+        """
+        Check whether a partition is known to hold an image.
+        
+        A device without a serial number has no digest records, so its
+        partitions can only be skipped after a read-back.
+        
+        Args:
+            partition_name: Partition to check
+            image_file: Target image
+            verify_readback: Confirm a recorded match by reading the partition back
+            cancel: Token to abort the read-back
+            
+        Returns:
+            True if the flash can be skipped
+            
+        Raises:
+            OperationCancelled: The read-back was cancelled
+        """
+        key = self.record_key
+        if key is None:
+            if not verify_readback:
+                logger.info(f"{self.current_device.device_id} reports no serial number - "
+                            f"flashing {partition_name} (skipping it needs verify_readback)")
+                return False
+            logger.info(f"Comparing {partition_name} with the image by read-back...")
+            return self._readback_matches(partition_name, image_file, cancel).success
+        
+        known = self.digest_store.get(key, partition_name)
+        if known is None:
+            return False
+        
+        size = os.path.getsize(image_file)
+        target = self.image_digest(image_file)
+        
+        if not known.matches(target, size):
+            return False
+        
+        if not verify_readback:
+            return True
+        
+        logger.info(f"Confirming {partition_name} contents by read-back...")
+        result = self._readback_matches(partition_name, image_file, cancel)
+        if not result.success:
+            logger.info(f"Read-back of {partition_name}: {result.error}")
+        return result.success
+    
+    def _readback_matches(self, partition_name: str, image_file: str,
+                          cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Read a partition back and compare it with an image.
+        
+        The digest store is updated either way: a match is recorded as
+        a read-back, a mismatch forgets the partition.
+        
+        Raises:
+            OperationCancelled: The read-back was cancelled
+        """
+        size = os.path.getsize(image_file)
+        target = self.image_digest(image_file)
+        fd, readback_file = tempfile.mkstemp(prefix="secureos-readback-", suffix=".img")
+        os.close(fd)
+        
+        try:
+            result = self.active_backend.backup_partition(partition_name, readback_file, cancel)
+            if result.cancelled:
+                raise OperationCancelled(result.error)
+            if not result.success:
+                return FlashResult(success=False, message="Read-back failed", error=result.error)
+            
+            # Partitions are usually larger than the image written to them
+            if os.path.getsize(readback_file) < size or file_digest(readback_file, limit=size) != target:
+                self._forget_digest(partition_name)
+                return FlashResult(
+                    success=False,
+                    message="Verification failed",
+                    error=f"{partition_name} does not match {os.path.basename(image_file)}"
+                )
+            
+            self._record_digest(partition_name, target, size, source="readback")
+            return FlashResult(success=True, message=f"{partition_name} matches image")
+        finally:
+            if os.path.exists(readback_file):
+                os.unlink(readback_file)
+    
+    @_device_operation("verify")
+    def verify_partition(self, partition_name: str, image_file: str,
+                         cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Verify a partition against an image by reading it back.
+        
+        Args:
+            partition_name: Partition to verify
+            image_file: Image the partition should hold
+            cancel: Token to abort the read-back
+            
+        Returns:
+            FlashResult (success=True if the contents match)
+        """
+        if not self.active_backend:
+            return FlashResult(
+                success=False,
+                message="No device connected",
+                error="Call detect_device() first"
+            )
+        
+        try:
+            return self._readback_matches(partition_name, image_file, cancel)
+        except OperationCancelled as e:
+            return FlashResult(
+                success=False,
+                message="Verification cancelled",
+                error=str(e) or "Cancelled by user",
+                cancelled=True
+            )
+    
+    @_device_operation("flash_bootloader")
+    def flash_bootloader(self, bootloader_file: str, auto_backup: bool = True,
+                         cancel: Optional[CancellationToken] = None, retry: bool = False) -> FlashResult:
         """
         Flash bootloader with optional automatic backup.
         
+        A failed bootloader write is not retried unless asked: the retry
+        writes again over a bootloader that may be half written, and a
+        device that does not come back for it is left stuck there.
+        
         Args:
             bootloader_file: Bootloader image to flash
             auto_backup: Create safety backup first (recommended)
+            cancel: Token to abort the backup or flash
+            retry: Retry a failed write as the retry policy allows
             
         Returns:
             FlashResult
@@ -138,15 +979,292 @@ class ProtocolManager:
             logger.info("Creating safety backup before flashing...")
             backup_result = self.backup_partition(
                 "bootloader",
-                f"/tmp/secureos-backup-bootloader-{self.current_device.device_id}.img"
+                self.auto_backup_path("bootloader"),
+                cancel
             )
             
+            if backup_result.cancelled:
+                return backup_result
             if not backup_result.success:
                 logger.warning("Backup failed - proceeding anyway")
         
         logger.info("Flashing bootloader...")
-        return self.active_backend.flash_bootloader(bootloader_file)
+        backend = self.active_backend
+        result, elapsed = self._transfer("flash", "bootloader",
+                                         lambda: backend.flash_bootloader(bootloader_file, cancel),
+                                         cancel, retries=None if retry else 0)
+        # Same records as flash_partition: the safety backup above filed
+        # the old bootloader's digest, which no longer holds
+        self._flash_finished("bootloader", bootloader_file, result, elapsed, record_digest=False)
+        return result
+    
+    @_device_operation("backup_device")
+    def backup_device(self, archive_file: str, partitions: Optional[List[str]] = None,
+                      exclude: Optional[List[str]] = None, compression: str = "zlib",
+                      level: int = 6, workers: Optional[int] = None,
+                      cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Back up every partition in the device's partition table into one
+        indexed archive.
+        
+        Partitions are downloaded one after another over USB. Each finished
+        dump is compressed and hashed on a process pool while the next one
+        downloads, then appended to the archive in table order.
+        
+        A cancelled or failed backup (disk full, a compression worker
+        lost) deletes the incomplete archive and its catalog entries.
+        
+        Args:
+            archive_file: Archive to create
+            partitions: Partitions to back up (None = whole partition table)
+            exclude: Partitions to leave out (e.g. USERDATA)
+            compression: Member compression ("zlib", "lzma", "bz2", "none")
+            level: Compression level
+            workers: Compression processes (None = CPU count)
+            cancel: Token to abort the backup
+            
+        Returns:
+            FlashResult (error lists partitions that could not be backed up)
+        """
+        if not self.active_backend:
+            return FlashResult(
+                success=False,
+                message="No device connected",
+                error="Call detect_device() first"
+            )
+        
+        table = self.active_backend.get_partition_table()
+        if partitions is not None:
+            wanted = {p.upper() for p in partitions}
+            table = [p for p in table if p.name.upper() in wanted]
+        if exclude:
+            skip = {p.upper() for p in exclude}
+            table = [p for p in table if p.name.upper() not in skip]
+        
+        if not table:
+            return FlashResult(
+                success=False,
+                message="Backup failed",
+                error="No partitions to back up"
+            )
+        
+        try:
+            work_dir = tempfile.mkdtemp(
+                prefix=".secureos-backup-",
+                dir=os.path.dirname(os.path.abspath(archive_file))
+            )
+        except OSError as e:
+            return FlashResult(success=False, message="Backup failed", error=str(e))
+        failed: List[str] = []
+        records = []
+        pending = []  # (PartitionInfo, raw file, compressed file, future) in table order
+        
+        logger.info(f"Backing up {len(table)} partitions to {archive_file}")
+        
+        # Imported here: multiprocessing is slow to import and only needed for full backups
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+        
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool, \
+                    BackupArchiveWriter(archive_file, metadata={
+                        "device": asdict(self.current_device),
+                        "catalog_key": self.catalog_key,
+                        "backend": self.active_backend.get_backend_name(),
+                        "partition_table": [asdict(p) for p in table]
+                    }) as archive:
+                try:
+                    for index, partition in enumerate(table):
+                        checkpoint(cancel)
+                        raw_file = os.path.join(work_dir, f"{index:03d}.raw")
+                        logger.info(f"Backing up partition: {partition.name}")
+                        result, _ = self._transfer(
+                            "backup", partition.name,
+                            lambda: self.active_backend.backup_partition(partition.name, raw_file, cancel),
+                            cancel
+                        )
+                        
+                        if result.cancelled:
+                            raise OperationCancelled(result.error)
+                        if not result.success:
+                            logger.warning(f"Backup of {partition.name} failed: {result.error}")
+                            failed.append(partition.name)
+                            if os.path.exists(raw_file):
+                                os.unlink(raw_file)
+                        else:
+                            compressed_file = f"{raw_file}.{compression}"
+                            future = pool.submit(compress_dump, raw_file, compressed_file,
+                                                 compression, level)
+                            pending.append((partition, raw_file, compressed_file, future))
+                        
+                        # Append whatever has finished while the next download runs
+                        while pending and pending[0][3].done():
+                            records.append(self._append_backup_member(
+                                archive, compression, *pending.pop(0)))
+                    
+                    while pending:
+                        checkpoint(cancel)
+                        records.append(self._append_backup_member(
+                            archive, compression, *pending.pop(0)))
+                except BaseException:
+                    # Leaving the pool waits for its jobs: drop the ones not started yet
+                    for *_, future in pending:
+                        future.cancel()
+                    raise
+        except OperationCancelled as e:
+            logger.info(f"Backup cancelled - removing {archive_file}")
+            self._discard_backup(archive_file, records)
+            return FlashResult(
+                success=False,
+                message="Backup cancelled",
+                error=str(e) or "Cancelled by user",
+                cancelled=True
+            )
+        except (OSError, BrokenProcessPool) as e:
+            # Disk full, archive unwritable, a compression worker died...
+            logger.error(f"Backup to {archive_file} failed - removing it: {e}")
+            self._discard_backup(archive_file, records)
+            return FlashResult(
+                success=False,
+                message="Backup failed",
+                error=str(e) or type(e).__name__
+            )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        
+        done = len(table) - len(failed)
+        if failed:
+            return FlashResult(
+                success=False,
+                message=f"Backed up {done} of {len(table)} partitions",
+                error=f"Failed partitions: {', '.join(failed)}"
+            )
+        
+        return FlashResult(
+            success=True,
+            message=f"Backup of {done} partitions complete"
+        )
+    
+    def _discard_backup(self, archive_file: str, records: List[BackupRecord]):
+        """Remove an unfinished backup archive and its catalog entries."""
+        self.catalog.remove(record.id for record in records)
+        try:
+            os.unlink(archive_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove {archive_file}: {e}")
+    
+    def _append_backup_member(self, archive: BackupArchiveWriter,
+                              compression: str, partition: PartitionInfo,
+                              raw_file: str, compressed_file: str, future) -> BackupRecord:
+        """Wait for a compression job and add its output to the archive."""
+        info = future.result()
+        archive.add_member(
+            partition.name,
+            compressed_file,
+            info["size"],
+            info["digest"],
+            compression,
+            info["algorithm"]
+        )
+        self._record_digest(
+            partition.name,
+            info["digest"],
+            info["size"],
+            source="backup",
+            algorithm=info["algorithm"]
+        )
+        record = self.catalog.add(
+            self.catalog_key,
+            partition.name,
+            archive.path,
+            info["size"],
+            info["digest"],
+            algorithm=info["algorithm"],
+            member=partition.name
+        )
+        os.unlink(raw_file)
+        os.unlink(compressed_file)
+        return record
+    
+    def auto_backup_path(self, partition_name: str) -> str:
+        """
+        Location for an automatic safety backup of a partition.
+        
+        Backups are kept per device and time-stamped so earlier ones are
+        not overwritten. Each backup_partition() into this directory
+        applies the manager's retention policy to it.
+        
+        Args:
+            partition_name: Partition being backed up
+            
+        Returns:
+            Path for the backup file
+        """
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self._auto_backup_dir(), f"{partition_name.upper()}-{stamp}.img")
+    
+    def _auto_backup_dir(self) -> str:
+        return data_dir("backups", self.catalog_key)
+    
+    def run_plan(self, steps: List[PlanStep], job_id: Optional[str] = None,
+                 cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Run backup/flash/verify steps as one journaled plan.
+        
+        Every step is recorded in the job journal, so if the plan is
+        interrupted it can be continued with resume_plan() after the
+        device is reconnected.
+        
+        Args:
+            steps: Steps in execution order
+            job_id: Job id (None = generate one)
+            cancel: Token to abort the plan
+            
+        Returns:
+            FlashResult
+        """
+        return PlanRunner(self, self.journal).run(steps, job_id, cancel)
     
+    def interrupted_plans(self) -> List[JobState]:
+        """
+        Plans for the current device that did not finish.
+        
+        Returns:
+            List of JobState, oldest first
+        """
+        if self.current_device is None:
+            return []
+        return self.journal.unfinished(self.catalog_key)
+    
+    def resume_plan(self, job_id: str, cancel: Optional[CancellationToken] = None) -> FlashResult:
+        """
+        Resume an interrupted plan from its first incomplete step.
+        
+        Steps the journal records as done are checked cheaply (backup
+        file present, image unchanged, digest store still agrees) and
+        skipped.
+        
+        Args:
+            job_id: Job to resume
+            cancel: Token to abort the plan
+            
+        Returns:
+            FlashResult
+        """
+        return PlanRunner(self, self.journal).resume(job_id, cancel)
+    
+    def abandon_plan(self, job_id: str):
+        """
+        Give up on an interrupted plan.
+        
+        Args:
+            job_id: Job to abandon
+        """
+        PlanRunner(self, self.journal).abandon(job_id)
+    
+    @_device_operation("partition_list", on_busy=lambda *_: [])
     def get_partition_list(self) -> List[str]:
         """
         Get list of partitions from active backend.
@@ -159,6 +1277,20 @@ class ProtocolManager:
         
         return self.active_backend.get_partition_list()
     
+    @_device_operation("partition_table", on_busy=lambda *_: [])
+    def get_partition_table(self) -> List[PartitionInfo]:
+        """
+        Get partitions and their sizes from active backend.
+        
+        Returns:
+            List of PartitionInfo
+        """
+        if not self.active_backend:
+            return []
+        
+        return self.active_backend.get_partition_table()
+    
+    @_device_operation("end_session", on_busy=lambda *_: False)
     def end_session(self, reboot: bool = True) -> bool:
         """
         End session with device.
@@ -174,6 +1306,8 @@ class ProtocolManager:
         
         logger.info("Ending session...")
         result = self.active_backend.end_session(reboot)
+        if self.events.wants(SessionChanged):
+            self.events.publish(SessionChanged(self.device_key, active=not result, ok=result))
         
         if result:
             self.active_backend = None
@@ -189,3 +1323,41 @@ class ProtocolManager:
             DeviceInfo or None
         """
         return self.current_device
+
+
+def discover_devices(backends: List[FlashBackend],
+                     manager_factory: Optional[Callable[[], ProtocolManager]] = None) -> List[ProtocolManager]:
+    """
+    Detect every attached device, each in its own ProtocolManager.
+    
+    Each backend is asked for one instance per device it can see
+    (FlashBackend.discover()); every instance that detects a device gets
+    a manager of its own, so the devices can be driven concurrently. A
+    device seen by more than one backend is kept once, with the first.
+    
+    Args:
+        backends: Backend prototypes, in order of preference
+        manager_factory: Creates the managers (None = ProtocolManager())
+        
+    Returns:
+        Managers with a detected device, in discovery order
+    """
+    manager_factory = manager_factory or ProtocolManager
+    managers: List[ProtocolManager] = []
+    seen = set()
+    
+    for backend in backends:
+        for instance in backend.discover():
+            manager = manager_factory()
+            manager.register_backend(instance)
+            if manager.detect_device() is None:
+                continue
+            if manager.device_key in seen:
+                logger.info(f"{manager.device_key} already claimed by another backend")
+                manager.end_session(reboot=False)
+                continue
+            seen.add(manager.device_key)
+            managers.append(manager)
+    
+    logger.info(f"Discovered {len(managers)} device(s)")
+    return managers
@@ -0,0 +1,172 @@
+"""
+SecureOS Flash - Backup Restore Sources
+
+Reads a backup (a raw dump or a compressed archive member) as one
+stream of its uncompressed bytes for restoring to a device. Size and
+digest are checked while the data is read, and a mismatch is raised
+before the last bytes are handed out, so a backend sending the stream
+never completes a transfer of corrupt data.
+"""
+
+from typing import BinaryIO, Optional
+from dataclasses import dataclass
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+
+from .backup_archive import BackupArchive
+from .backup_catalog import BackupRecord
+from .cancellation import CancellationToken, checkpoint
+from ..utils.hashing import CHUNK_SIZE, DEFAULT_ALGORITHM
+
+
+logger = logging.getLogger(__name__)
+
+
+# Free space a staging file must leave on its filesystem (bytes)
+STAGING_RESERVE = 256 * 1024 * 1024
+
+
+class RestoreError(Exception):
+    """Raised when backup data is missing, short or does not match its digest"""
+
+
+class VerifyingReader(io.RawIOBase):
+    """
+    Reads exactly `size` bytes from a source, hashing them on the way.
+    
+    readinto() fills the whole buffer unless the data ends, and raises
+    RestoreError instead of returning the final bytes if the digest does
+    not match, or as soon as the source turns out to be short.
+    """
+    
+    def __init__(self, source: BinaryIO, size: int, digest: Optional[str],
+                 algorithm: str = DEFAULT_ALGORITHM, name: str = "backup"):
+        self._source = source
+        self._remaining = size
+        self._hash = hashlib.new(algorithm) if digest else None
+        self.size = size
+        self.digest = digest
+        self.name = name
+        self.verified = False
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, b) -> int:
+        view = memoryview(b).cast("B")[:self._remaining]
+        filled = 0
+        while filled < len(view):
+            n = self._source.readinto(view[filled:])
+            if not n:
+                raise RestoreError(
+                    f"{self.name} ended after {self.size - self._remaining + filled} "
+                    f"of {self.size} bytes"
+                )
+            filled += n
+        
+        if self._hash is not None:
+            self._hash.update(view[:filled])
+        self._remaining -= filled
+        if self._remaining == 0 and filled:
+            self._check()
+        return filled
+    
+    def _check(self):
+        if self._hash is not None and self._hash.hexdigest() != self.digest:
+            raise RestoreError(f"Digest mismatch in {self.name}: backup is corrupt")
+        self.verified = True
+    
+    def close(self):
+        if not self.closed:
+            self._source.close()
+        super().close()
+
+
+@dataclass
+class RestoreSource:
+    """Where a partition's backup data lives and what it should hash to"""
+    location: str             # Raw dump or backup archive
+    partition: str
+    size: int
+    digest: Optional[str]
+    algorithm: str = DEFAULT_ALGORITHM
+    member: str = ""          # Partition name inside an archive, "" for raw dumps
+    
+    @property
+    def compressed(self) -> bool:
+        """True if the data has to be decompressed (i.e. is not a plain file)"""
+        return bool(self.member)
+    
+    @classmethod
+    def from_record(cls, record: BackupRecord) -> "RestoreSource":
+        """Source of a catalogued backup."""
+        return cls(record.location, record.partition, record.size, record.digest,
+                   record.algorithm, record.member)
+    
+    @classmethod
+    def from_archive(cls, path: str, partition_name: str) -> "RestoreSource":
+        """
+        Source of one member of a backup archive.
+        
+        Raises:
+            BackupArchiveError: Not an archive, or partition not in it
+        """
+        member = BackupArchive(path).get_member(partition_name)
+        return cls(path, member.partition, member.size, member.digest,
+                   member.algorithm, member.partition)
+    
+    def open(self) -> VerifyingReader:
+        """Open the uncompressed data for one sequential read."""
+        if self.member:
+            stream = BackupArchive(self.location).open_member(self.member)
+        else:
+            stream = open(self.location, "rb")
+        return VerifyingReader(stream, self.size, self.digest, self.algorithm,
+                               name=f"Backup of {self.partition} ({self.location})")
+    
+    def stage(self, directory: Optional[str] = None, reserve: int = STAGING_RESERVE,
+              cancel: Optional[CancellationToken] = None) -> str:
+        """
+        Decompress into a staging file, verifying it, for backends that
+        can only flash files. The caller deletes the file.
+        
+        Args:
+            directory: Where to stage (None = system temp directory)
+            reserve: Free bytes that must remain after staging
+            cancel: Token checked between chunks
+            
+        Returns:
+            Path of the staging file
+            
+        Raises:
+            RestoreError: Not enough space, or the data is corrupt
+            OperationCancelled: Cancelled through `cancel`
+        """
+        directory = directory or tempfile.gettempdir()
+        free = shutil.disk_usage(directory).free
+        if free < self.size + reserve:
+            raise RestoreError(
+                f"Not enough space to stage {self.partition} in {directory}: "
+                f"{self.size} bytes needed, {max(free - reserve, 0)} available"
+            )
+        
+        fd, path = tempfile.mkstemp(prefix="secureos-restore-", suffix=".img", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as dst, self.open() as src:
+                buffer = bytearray(CHUNK_SIZE)
+                while True:
+                    checkpoint(cancel)
+                    n = src.readinto(buffer)
+                    if not n:
+                        break
+                    dst.write(memoryview(buffer)[:n])
+        except BaseException:
+            os.unlink(path)
+            raise
+        
+        logger.debug(f"Staged {self.partition} ({self.size} bytes) in {path}")
+        return path
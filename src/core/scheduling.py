@@ -0,0 +1,61 @@
+"""
+SecureOS Flash - Job Scheduling
+
+Chooses which waiting job gets a free worker. Shortest-job-first
+finishes more devices per hour when there are more devices waiting
+than workers (short jobs no longer sit behind long ones); the deadline
+policy runs jobs with a deadline by latest possible start time first.
+Waiting jobs age, so a long job is never starved.
+"""
+
+from typing import Optional, Tuple
+from dataclasses import dataclass
+
+
+FIFO = "fifo"
+SJF = "sjf"
+DEADLINE = "deadline"
+
+POLICIES = (FIFO, SJF, DEADLINE)
+
+
+@dataclass
+class SchedulingPolicy:
+    """
+    Priority of waiting jobs; lower keys run first.
+    
+    fifo: submission order.
+    sjf: estimated duration, minus `aging` seconds per second waited.
+    deadline: jobs with a deadline by latest start (deadline minus
+              estimated duration), then the rest as sjf.
+    """
+    name: str = SJF
+    aging: float = 0.5
+    
+    def __post_init__(self):
+        if self.name not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {self.name} (choose from {', '.join(POLICIES)})")
+    
+    def key(self, estimate: float, submitted_at: float, now: float,
+            deadline: Optional[float] = None) -> Tuple:
+        """
+        Sort key of a waiting job.
+        
+        Args:
+            estimate: Expected duration in seconds (up to the job's end)
+            submitted_at: When the job was submitted (time.time())
+            now: Current time (time.time())
+            deadline: When the job must be done (time.time() based)
+            
+        Returns:
+            Tuple to compare with other jobs' keys
+        """
+        if self.name == FIFO:
+            return (submitted_at,)
+        
+        shortest = estimate - self.aging * (now - submitted_at)
+        if self.name == DEADLINE:
+            if deadline is not None:
+                return (0, deadline - estimate, submitted_at)
+            return (1, shortest, submitted_at)
+        return (shortest, submitted_at)
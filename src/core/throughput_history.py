@@ -0,0 +1,272 @@
+"""
+SecureOS Flash - Throughput History
+
+Measured transfer rates of completed flashes and backups, kept per
+device model, partition and USB port, and the time estimates built on
+them. A station learns how long each kind of job really takes on each
+port, which the plan estimator and the job scheduler use instead of a
+guessed link speed.
+"""
+
+from typing import Dict, Optional, Tuple
+from dataclasses import dataclass, asdict
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from .timeouts import TimeoutPolicy
+from ..utils.paths import data_dir
+
+
+logger = logging.getLogger(__name__)
+
+
+# Weight of the newest sample once a key has this many samples; earlier
+# samples are a plain average, later ones decay (cables and ports age)
+MIN_WEIGHT = 0.1
+
+# z-score of the confidence bounds (90% two-sided)
+CONFIDENCE_Z = 1.645
+
+# Relative spread assumed while a key has a single sample
+SINGLE_SAMPLE_SPREAD = 0.25
+
+# Bounds of an estimate with no history, as factors of the expected time
+UNKNOWN_LOW, UNKNOWN_HIGH = 0.5, 2.0
+
+# Fixed cost of a device step (command round trips, session checks) in
+# seconds, added to the transfer time of estimates without history
+STEP_OVERHEAD = 2.0
+
+ANY = "*"
+
+
+@dataclass
+class RateStats:
+    """Running statistics of one key's transfers"""
+    samples: int = 0
+    rate: float = 0.0        # Mean effective rate (bytes/s), setup time included
+    variance: float = 0.0    # Of the rate
+    size: float = 0.0        # Mean bytes per transfer
+    updated_at: float = 0.0
+    
+    def add(self, rate: float, size: int):
+        """Fold in one transfer (exponentially weighted after 1/MIN_WEIGHT samples)."""
+        self.samples += 1
+        weight = max(1.0 / self.samples, MIN_WEIGHT)
+        delta = rate - self.rate
+        self.rate += weight * delta
+        self.variance = (1 - weight) * (self.variance + weight * delta * delta)
+        self.size += weight * (size - self.size)
+        self.updated_at = time.time()
+    
+    @property
+    def spread(self) -> float:
+        """Standard deviation of the rate, assumed when there is one sample"""
+        if self.samples < 2:
+            return self.rate * SINGLE_SAMPLE_SPREAD
+        return math.sqrt(self.variance)
+
+
+@dataclass
+class DurationEstimate:
+    """Expected duration with a confidence interval, in seconds"""
+    seconds: float
+    low: float
+    high: float
+    samples: int = 0         # History samples behind the estimate
+    basis: str = "default"   # Which history level matched ("port", "model", ..., "default")
+    
+    def __add__(self, other: "DurationEstimate") -> "DurationEstimate":
+        return DurationEstimate(
+            self.seconds + other.seconds,
+            self.low + other.low,
+            self.high + other.high,
+            min(self.samples, other.samples),
+            self.basis if self.basis == other.basis else "mixed"
+        )
+
+
+def fallback_estimate(size: Optional[int], policy: Optional[TimeoutPolicy] = None,
+                      model: Optional[str] = None) -> DurationEstimate:
+    """
+    Estimate of a transfer with no history: STEP_OVERHEAD plus size over
+    the policy's throughput, with wide fixed bounds.
+    """
+    policy = policy or TimeoutPolicy()
+    seconds = STEP_OVERHEAD + (size or 0) / policy.throughput(model)
+    return DurationEstimate(seconds, seconds * UNKNOWN_LOW, seconds * UNKNOWN_HIGH)
+
+
+class ThroughputHistory:
+    """
+    Persistent per-model, per-partition, per-port transfer rates.
+    
+    Each transfer updates six levels of keys, from most to least
+    specific: model+partition+port, model+partition, model, partition,
+    port, and everything. Estimates use the most specific level with
+    enough samples, so a new port still gets a figure from the same
+    model on other ports.
+    """
+    
+    LEVELS = ("port", "model+partition", "model", "partition", "port-only", "any")
+    
+    def __init__(self, path: Optional[str] = None, min_samples: int = 1):
+        """
+        Initialize history.
+        
+        Args:
+            path: History file (None = <data dir>/throughput.json)
+            min_samples: Samples a level needs before estimates use it
+        """
+        self.path = path or os.path.join(data_dir(), "throughput.json")
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._stats: Optional[Dict[str, RateStats]] = None
+    
+    @staticmethod
+    def _keys(operation: str, model: Optional[str], partition: Optional[str],
+              port: Optional[str]) -> Tuple[str, ...]:
+        model = model or ANY
+        partition = (partition or ANY).upper()
+        port = port or ANY
+        return (
+            f"{operation}|{model}|{partition}|{port}",
+            f"{operation}|{model}|{partition}|{ANY}",
+            f"{operation}|{model}|{ANY}|{ANY}",
+            f"{operation}|{ANY}|{partition}|{ANY}",
+            f"{operation}|{ANY}|{ANY}|{port}",
+            f"{operation}|{ANY}|{ANY}|{ANY}",
+        )
+    
+    def record(self, operation: str, model: Optional[str], partition: str,
+               port: Optional[str], size: int, elapsed: float):
+        """
+        Record a completed transfer.
+        
+        Args:
+            operation: "flash" or "backup"
+            model: Device model
+            partition: Partition name
+            port: USB path of the device (None if unknown)
+            size: Bytes moved
+            elapsed: Wall time of the backend call in seconds
+        """
+        if size <= 0 or elapsed <= 0:
+            return
+        
+        rate = size / elapsed
+        keys = set(self._keys(operation, model, partition, port))
+        with self._lock:
+            stats = self._load()
+            for key in keys:
+                stats.setdefault(key, RateStats()).add(rate, size)
+            self._save(stats)
+        
+        logger.debug(f"{operation} {partition} on {port or 'unknown port'}: "
+                     f"{rate / (1024 * 1024):.1f} MiB/s")
+    
+    def lookup(self, operation: str, model: Optional[str] = None,
+               partition: Optional[str] = None,
+               port: Optional[str] = None) -> Tuple[Optional[RateStats], str]:
+        """
+        Most specific statistics available for a transfer.
+        
+        Args:
+            operation: "flash" or "backup"
+            model: Device model (None = any)
+            partition: Partition name (None = any)
+            port: USB path (None = any)
+            
+        Returns:
+            (stats or None, level name from LEVELS or "default")
+        """
+        with self._lock:
+            stats = self._load()
+            for level, key in zip(self.LEVELS, self._keys(operation, model, partition, port)):
+                entry = stats.get(key)
+                if entry is not None and entry.samples >= self.min_samples and entry.rate > 0:
+                    return RateStats(**asdict(entry)), level
+        return None, "default"
+    
+    def estimate(self, operation: str, size: Optional[int], model: Optional[str] = None,
+                 partition: Optional[str] = None, port: Optional[str] = None,
+                 policy: Optional[TimeoutPolicy] = None) -> DurationEstimate:
+        """
+        Expected duration of a transfer.
+        
+        With history the bounds come from the measured rate spread
+        (widened for few samples); without it see fallback_estimate().
+        
+        Args:
+            operation: "flash" or "backup"
+            size: Bytes to move (None = the key's typical size)
+            model: Device model
+            partition: Partition name
+            port: USB path
+            policy: Fallback throughput assumptions
+            
+        Returns:
+            DurationEstimate
+        """
+        stats, level = self.lookup(operation, model, partition, port)
+        
+        if stats is None:
+            return fallback_estimate(size, policy, model)
+        
+        if size is None:
+            size = stats.size
+        # Prediction interval for one more transfer: sigma * sqrt(1 + 1/n)
+        margin = CONFIDENCE_Z * stats.spread * math.sqrt(1 + 1 / stats.samples)
+        fast = stats.rate + margin
+        slow = max(stats.rate - margin, stats.rate * 0.1)
+        return DurationEstimate(
+            size / stats.rate,
+            size / fast,
+            size / slow,
+            samples=stats.samples,
+            basis=level
+        )
+    
+    def _load(self) -> Dict[str, RateStats]:
+        """Read the history file once (called with _lock held)."""
+        if self._stats is not None:
+            return self._stats
+        
+        self._stats = {}
+        try:
+            with open(self.path, "r") as f:
+                for key, item in json.load(f).get("rates", {}).items():
+                    self._stats[key] = RateStats(**item)
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ignoring corrupt throughput history {self.path}: {e}")
+        return self._stats
+    
+    def _save(self, stats: Dict[str, RateStats]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"rates": {key: asdict(entry) for key, entry in stats.items()}}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+_default_history: Optional[ThroughputHistory] = None
+_default_history_lock = threading.Lock()
+
+
+def default_throughput_history() -> ThroughputHistory:
+    """
+    Process-wide history shared by all ProtocolManagers (one file, so
+    every writer must go through the same instance).
+    """
+    global _default_history
+    with _default_history_lock:
+        if _default_history is None:
+            _default_history = ThroughputHistory()
+        return _default_history
@@ -0,0 +1,170 @@
+"""
+SecureOS Flash - Operation Timeouts
+
+Derives per-operation deadlines from the number of bytes moved and the
+expected link throughput, and detects stalled transfers from their
+progress events. Large transfers on slow links get the time they need;
+hung ones fail after the stall timeout instead of the full deadline.
+"""
+
+from typing import Callable, Dict, Optional
+from dataclasses import dataclass, field
+import time
+
+
+MiB = 1024 * 1024
+
+
+@dataclass
+class TimeoutPolicy:
+    """
+    How long an operation may take.
+    
+    The deadline for a transfer of `size` bytes is
+    setup_time + safety_factor * size / throughput, clamped to
+    [minimum, maximum]. Throughput is the measured rate if there is one,
+    else the per-model figure, else default_throughput.
+    """
+    setup_time: float = 15.0                # Handshake and session setup (s)
+    default_throughput: float = 4 * MiB     # Conservative USB 2.0 eMMC rate (bytes/s)
+    model_throughput: Dict[str, float] = field(default_factory=dict)
+    safety_factor: float = 2.0
+    minimum: float = 20.0
+    maximum: float = 4 * 3600.0
+    unknown_size: float = 600.0             # Deadline when the byte count is unknown
+    stall_timeout: Optional[float] = 30.0   # Max time without progress (None = off)
+    detect_timeout: float = 5.0
+    
+    def throughput(self, model: Optional[str] = None,
+                   measured: Optional[float] = None) -> float:
+        """
+        Expected throughput for a transfer.
+        
+        Args:
+            model: Device model (looked up in model_throughput)
+            measured: Throughput measured on this link, if any
+            
+        Returns:
+            Bytes per second
+        """
+        if measured:
+            return measured
+        if model and model in self.model_throughput:
+            return self.model_throughput[model]
+        return self.default_throughput
+    
+    def transfer_timeout(self, size: Optional[int], model: Optional[str] = None,
+                         measured: Optional[float] = None) -> float:
+        """
+        Deadline for moving `size` bytes.
+        
+        Args:
+            size: Bytes to transfer (None = unknown)
+            model: Device model
+            measured: Measured throughput in bytes/s
+            
+        Returns:
+            Timeout in seconds
+        """
+        if size is None:
+            return self.unknown_size
+        
+        rate = self.throughput(model, measured)
+        timeout = self.setup_time + self.safety_factor * size / rate
+        return max(self.minimum, min(self.maximum, timeout))
+
+
+class ThroughputMeter:
+    """Exponentially weighted average of observed transfer rates"""
+    
+    def __init__(self, weight: float = 0.3, min_bytes: int = 4 * MiB):
+        """
+        Initialize meter.
+        
+        Args:
+            weight: Weight of the newest sample (0-1)
+            min_bytes: Ignore transfers smaller than this (setup time dominates)
+        """
+        self.weight = weight
+        self.min_bytes = min_bytes
+        self.rate: Optional[float] = None
+    
+    def update(self, size: int, elapsed: float):
+        """
+        Record a completed transfer.
+        
+        Args:
+            size: Bytes transferred
+            elapsed: Wall time in seconds
+        """
+        if size < self.min_bytes or elapsed <= 0:
+            return
+        
+        sample = size / elapsed
+        if self.rate is None:
+            self.rate = sample
+        else:
+            self.rate += self.weight * (sample - self.rate)
+
+
+class StallDetector:
+    """
+    Tracks progress events and reports when they stop.
+    
+    update() is fed monotonically increasing progress values (bytes or
+    percent); touch() marks activity before a transfer reports progress
+    (handshake output and the like). finish() stops stall detection once
+    the data is sent and only the device-side commit is left.
+    """
+    
+    def __init__(self, stall_timeout: Optional[float],
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize detector.
+        
+        Args:
+            stall_timeout: Seconds without progress before the operation is
+                           stalled (None = never)
+            clock: Time source
+        """
+        self.stall_timeout = stall_timeout
+        self.clock = clock
+        self.done = 0
+        self.started = False
+        self.finished = False
+        self.last_progress = clock()
+    
+    def touch(self):
+        """Mark activity; ignored once real progress is being reported."""
+        if not self.started:
+            self.last_progress = self.clock()
+    
+    def update(self, done: float):
+        """
+        Report progress.
+        
+        Args:
+            done: Progress so far; only an increase resets the stall timer
+        """
+        self.started = True
+        if done > self.done:
+            self.done = done
+            self.last_progress = self.clock()
+    
+    def finish(self):
+        """Stop stall detection (transfer complete)."""
+        self.finished = True
+    
+    def idle(self) -> float:
+        """Seconds since the last progress"""
+        return self.clock() - self.last_progress
+    
+    def remaining(self) -> float:
+        """Seconds left before the operation counts as stalled"""
+        if self.finished or self.stall_timeout is None:
+            return float("inf")
+        return self.stall_timeout - self.idle()
+    
+    @property
+    def stalled(self) -> bool:
+        return self.remaining() <= 0
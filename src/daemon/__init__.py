@@ -0,0 +1,9 @@
+"""Station daemon package"""
+
+from .station import Station, StationJob
+from .server import StationHTTPServer, StationRequestHandler, serve
+from .status_board import StatusBoard, WorkerStatus
+from .supervisor import Supervisor
+
+__all__ = ['Station', 'StationJob', 'StationHTTPServer', 'StationRequestHandler', 'serve',
+           'Supervisor', 'StatusBoard', 'WorkerStatus']
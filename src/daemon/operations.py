@@ -0,0 +1,101 @@
+"""
+SecureOS Flash - Station Operations
+
+The operations a station runs on a device, as plain functions of a
+ProtocolManager. The station calls them on its worker threads, and
+supervised worker processes call them on the manager they own, so both
+run jobs the same way.
+"""
+
+from typing import Any, Callable, Dict, Tuple
+
+from ..core import CancellationToken, FlashResult, GraphExecutor, ManifestError, ProtocolManager, load_manifest
+from ..core.manifest import DEFAULT_DEVICE
+
+
+def run_operation(manager: ProtocolManager, operation: str, params: Dict[str, Any],
+                  cancel: CancellationToken, on_event: Callable[..., None],
+                  on_progress: Callable[[int, int], None]) -> Tuple[FlashResult, Dict[str, Any]]:
+    """
+    Run one operation on a manager's device, starting a session if needed.
+    
+    end-session is not handled here: what ending a session means depends
+    on who owns the manager.
+    
+    Args:
+        manager: Manager with a detected device
+        operation: Operation name (see Station.OPERATIONS)
+        params: Operation parameters
+        cancel: Token that aborts the operation
+        on_event: Called as on_event(event, **fields) for job events
+        on_progress: Backend progress callback (done, total)
+        
+    Returns:
+        (FlashResult, extra result fields)
+    """
+    backend = manager.active_backend
+    if not getattr(backend, "session_active", False) and not manager.init_session():
+        return FlashResult(success=False, message="Session failed",
+                           error="Could not initialize session"), {}
+    
+    previous = getattr(backend, "progress", None)
+    if hasattr(backend, "progress"):
+        backend.progress = on_progress
+    try:
+        return _operation(manager, operation, params, cancel, on_event)
+    finally:
+        if hasattr(backend, "progress"):
+            backend.progress = previous
+
+
+def _operation(manager: ProtocolManager, operation: str, params: Dict[str, Any],
+               cancel: CancellationToken,
+               on_event: Callable[..., None]) -> Tuple[FlashResult, Dict[str, Any]]:
+    if operation == "list-partitions":
+        partitions = manager.get_partition_list()
+        if not partitions:
+            return FlashResult(success=False, message="No partitions",
+                               error="Partition table unavailable"), {}
+        return FlashResult(success=True, message=f"{len(partitions)} partitions"), {"partitions": partitions}
+    
+    if operation == "backup":
+        output = params.get("output") or manager.auto_backup_path(params["partition"])
+        return manager.backup_partition(params["partition"], output, cancel=cancel), {"output": output}
+    
+    if operation == "flash":
+        return manager.flash_partition(
+            params["partition"], params["image"],
+            differential=bool(params.get("differential", False)),
+            verify_readback=bool(params.get("verify_readback", False)),
+            cancel=cancel
+        ), {}
+    
+    if operation == "restore":
+        return manager.restore_partition(
+            params["partition"],
+            archive=params.get("archive"),
+            record_id=params.get("record_id"),
+            cancel=cancel
+        ), {}
+    
+    if operation == "verify":
+        return manager.verify_partition(params["partition"], params["image"], cancel=cancel), {}
+    
+    # plan
+    try:
+        manifest = load_manifest(params["manifest"])
+        graph = manifest.compile()
+    except ManifestError as e:
+        return FlashResult(success=False, message="Invalid manifest", error=str(e)), {}
+    if graph.devices != [DEFAULT_DEVICE]:
+        return FlashResult(
+            success=False,
+            message="Invalid manifest",
+            error="Manifests with device slots are not supported here - submit one job per device"
+        ), {}
+    
+    def on_update(node, state):
+        on_event("step", step=node.id, state=state)
+    
+    result = GraphExecutor({DEFAULT_DEVICE: manager}, on_update=on_update).run(graph, cancel)
+    return result.summarize(list(graph.nodes)), {"plan_jobs": result.jobs}
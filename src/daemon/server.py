@@ -0,0 +1,304 @@
+"""
+SecureOS Flash - Station HTTP API
+
+JSON control API for a Station, served over localhost TCP or a Unix
+socket with the standard library HTTP server.
+
+    GET    /health                  Liveness and job counts
+    GET    /devices[?refresh=1]     Cached devices (re-scan with refresh=1)
+    POST   /devices/refresh         Re-scan for devices
+    GET    /jobs                    All jobs
+    POST   /jobs                    Submit {"operation", "device", ...params}
+    GET    /jobs/<id>               One job
+    GET    /jobs/<id>/events        Job events as chunked JSON lines, or as
+                                    server-sent events with
+                                    Accept: text/event-stream. Query:
+                                    since=<seq>, follow=0 for a snapshot
+    DELETE /jobs/<id>               Cancel a job
+    GET    /ports                   Port health, worst first
+    DELETE /ports/<port>            Clear a port's record (ends quarantine)
+    GET    /workers                 Worker processes from the status board
+
+Connections are kept alive (HTTP/1.1), so a client polling or submitting
+jobs pays no connection setup per request.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+import json
+import logging
+import os
+import socket
+import socketserver
+
+from .station import Station, StationJob
+
+
+logger = logging.getLogger(__name__)
+
+
+# How often an idle event stream sends a keep-alive (s)
+STREAM_KEEPALIVE = 15.0
+
+# Largest accepted request body
+MAX_BODY = 1024 * 1024
+
+
+class StationRequestHandler(BaseHTTPRequestHandler):
+    """Routes API requests to the server's Station"""
+    
+    protocol_version = "HTTP/1.1"
+    server_version = "SecureOSFlash"
+    
+    def setup(self):
+        # Headers and body go out in separate writes; on TCP, Nagle plus
+        # delayed ACKs would add ~40 ms to every keep-alive request
+        self.disable_nagle_algorithm = self.request.family in (socket.AF_INET, socket.AF_INET6)
+        super().setup()
+    
+    @property
+    def station(self) -> Station:
+        return self.server.station
+    
+    def address_string(self) -> str:
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else "unix"
+    
+    def log_message(self, format: str, *args: Any):
+        logger.debug(f"{self.address_string()} - {format % args}")
+    
+    def _send_json(self, status: int, payload: Any):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _error(self, status: int, message: str):
+        self._send_json(status, {"error": message})
+    
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        header = self.headers.get("Content-Length") or "0"
+        try:
+            length = int(header)
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY:
+            # The body is left unread, so the connection cannot be reused
+            self.close_connection = True
+            if length < 0:
+                self._error(400, f"Invalid Content-Length: {header}")
+            else:
+                self._error(413, "Request body too large")
+            return None
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._error(400, f"Invalid JSON: {e}")
+            return None
+        if not isinstance(data, dict):
+            self._error(400, "Request body must be a JSON object")
+            return None
+        return data
+    
+    def _route(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return parts, query
+    
+    def _job_or_404(self, job_id: str) -> Optional[StationJob]:
+        job = self.station.job(job_id)
+        if job is None:
+            self._error(404, f"No job {job_id}")
+        return job
+    
+    def do_GET(self):
+        parts, query = self._route()
+        
+        if parts == ["health"]:
+            jobs = self.station.jobs()
+            self._send_json(200, {
+                "status": "ok",
+                "jobs": len(jobs),
+                "active": sum(1 for job in jobs if not job.finished)
+            })
+        elif parts == ["devices"]:
+            refreshed = self.station.refresh() if query.get("refresh") == "1" else None
+            self._send_json(200, dict(self.station.devices(), refreshed=refreshed))
+        elif parts == ["ports"]:
+            self._send_json(200, self.station.ports())
+        elif parts == ["workers"]:
+            self._send_json(200, self.station.worker_status())
+        elif parts == ["jobs"]:
+            self._send_json(200, {"jobs": [job.to_dict() for job in self.station.jobs()]})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self._job_or_404(parts[1])
+            if job:
+                self._send_json(200, job.to_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            job = self._job_or_404(parts[1])
+            if job is None:
+                return
+            try:
+                since = int(query.get("since", 0))
+            except ValueError:
+                self._error(400, "since must be an integer")
+                return
+            self._stream_events(job, since, query.get("follow") != "0")
+        else:
+            self._error(404, f"No route for GET {self.path}")
+    
+    def do_POST(self):
+        parts, _ = self._route()
+        data = self._read_json()
+        if data is None:
+            return
+        
+        if parts == ["devices", "refresh"]:
+            refreshed = self.station.refresh()
+            self._send_json(200 if refreshed else 409, dict(self.station.devices(), refreshed=refreshed))
+        elif parts == ["jobs"]:
+            operation = data.pop("operation", None)
+            device = data.pop("device", None)
+            try:
+                job = self.station.submit(operation, device, data)
+            except ValueError as e:
+                self._error(400, str(e))
+            except KeyError as e:
+                self._error(404, e.args[0])
+            else:
+                self._send_json(202, job.to_dict())
+        else:
+            self._error(404, f"No route for POST {self.path}")
+    
+    def do_DELETE(self):
+        parts, _ = self._route()
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self._job_or_404(parts[1])
+            if job:
+                cancelled = self.station.cancel(job.id)
+                self._send_json(200 if cancelled else 409, job.to_dict())
+        elif len(parts) == 2 and parts[0] == "ports":
+            if self.station.clear_port(parts[1]):
+                self._send_json(200, self.station.ports())
+            else:
+                self._error(404, f"No record for port {parts[1]}")
+        else:
+            self._error(404, f"No route for DELETE {self.path}")
+    
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+    
+    def _stream_events(self, job: StationJob, since: int, follow: bool):
+        """Send a job's events as they happen until it finishes."""
+        sse = "text/event-stream" in (self.headers.get("Accept") or "")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if sse else "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        
+        seq = since
+        try:
+            while True:
+                events, finished = job.events_after(seq, STREAM_KEEPALIVE if follow else None)
+                if events:
+                    seq = events[-1]["seq"]
+                    if sse:
+                        payload = "".join(f"id: {e['seq']}\nevent: {e['event']}\ndata: {json.dumps(e)}\n\n"
+                                          for e in events)
+                    else:
+                        payload = "".join(json.dumps(e) + "\n" for e in events)
+                    self._write_chunk(payload.encode("utf-8"))
+                elif follow and not finished:
+                    self._write_chunk(b": keep-alive\n\n" if sse else b"\n")
+                
+                if finished or not follow:
+                    break
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug(f"Event stream for job {job.id} closed by client")
+            self.close_connection = True
+
+
+class StationHTTPServer(ThreadingHTTPServer):
+    """Threaded TCP server bound to a Station"""
+    
+    daemon_threads = True
+    
+    def __init__(self, address, station: Station):
+        self.station = station
+        super().__init__(address, StationRequestHandler)
+    
+    def server_bind(self):
+        # Skip HTTPServer's reverse DNS lookup of the bind address
+        socketserver.TCPServer.server_bind(self)
+        host, port = self.server_address[:2]
+        self.server_name = host
+        self.server_port = port
+
+
+if hasattr(socket, "AF_UNIX"):
+    class StationUnixServer(ThreadingMixIn, socketserver.UnixStreamServer):
+        """Threaded Unix socket server bound to a Station"""
+        
+        daemon_threads = True
+        
+        def __init__(self, path: str, station: Station):
+            self.station = station
+            if os.path.exists(path):
+                os.unlink(path)  # Stale socket from an earlier run
+            super().__init__(path, StationRequestHandler)
+        
+        def server_bind(self):
+            # Create the socket 0600 rather than chmod it after bind(),
+            # which would leave other local users a window to connect
+            umask = os.umask(0o177)
+            try:
+                super().server_bind()
+            finally:
+                os.umask(umask)
+else:
+    StationUnixServer = None
+
+
+def serve(station: Station, host: str = "127.0.0.1", port: int = 8765,
+          socket_path: Optional[str] = None,
+          ready: Optional[Callable[[str], None]] = None):
+    """
+    Serve the station API until interrupted, then shut the station down.
+    
+    Args:
+        station: Station to expose
+        host: TCP bind address (ignored with socket_path)
+        port: TCP port (ignored with socket_path)
+        socket_path: Serve on this Unix socket instead of TCP
+        ready: Called with the listening address once requests are accepted
+    """
+    if socket_path:
+        if StationUnixServer is None:
+            raise OSError("Unix sockets are not supported on this platform")
+        server = StationUnixServer(socket_path, station)
+        where = socket_path
+    else:
+        server = StationHTTPServer((host, port), station)
+        where = f"http://{host}:{server.server_port}"
+    
+    logger.info(f"Station API listening on {where}")
+    if ready:
+        ready(where)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+        station.shutdown()
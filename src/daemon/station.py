@@ -0,0 +1,618 @@
+"""
+SecureOS Flash - Station
+
+Long-lived state behind the station daemon: one warm ProtocolManager per
+attached device (sessions stay open between jobs, image digests stay
+cached), a job table, and a worker pool. Jobs for the same device run
+one after another in submission order; different devices run in
+parallel. When more devices have work than there are workers, the
+scheduling policy (shortest job first by default, from measured
+throughput history) picks which device gets the next free worker.
+Devices on degraded ports go after those on healthy ones, and jobs for
+a device on a quarantined port fail instead of starting.
+With processes=True every device's session runs in a worker process of
+its own (see supervisor.py) and the worker threads only wait on them.
+Every job keeps an event log that clients can replay and follow while
+it runs.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+import logging
+import os
+import threading
+import time
+import uuid
+
+from ..core import (CancellationToken, DurationEstimate, FlashBackend, FlashResult, ManifestError,
+                    PortHealthTracker, ProtocolManager, RetryPolicy, SchedulingPolicy,
+                    ThroughputHistory, default_port_health, default_throughput_history, discover_devices, load_manifest)
+from ..core.port_health import PortStatus, QUARANTINED
+from ..core.throughput_history import fallback_estimate
+from .operations import run_operation
+from .status_board import BUSY, IDLE
+from .supervisor import Supervisor
+
+
+logger = logging.getLogger(__name__)
+
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# Minimum interval between recorded progress events per job (s)
+PROGRESS_INTERVAL = 0.25
+
+# Events kept per job; older ones are dropped (clients see a gap in seq)
+MAX_EVENTS = 2000
+
+# Finished jobs kept in the job table
+MAX_FINISHED_JOBS = 500
+
+
+class StationJob:
+    """A submitted operation and its event log"""
+    
+    def __init__(self, operation: str, device_id: str, params: Dict[str, Any],
+                 estimate: Optional[DurationEstimate] = None,
+                 deadline: Optional[float] = None):
+        """
+        Initialize job.
+        
+        Args:
+            operation: Operation name (see Station.OPERATIONS)
+            device_id: Device the job runs on
+            params: Operation parameters
+            estimate: Expected duration
+            deadline: When the job should be done (time.time() based)
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.operation = operation
+        self.device_id = device_id
+        self.params = params
+        self.estimate = estimate or fallback_estimate(0)
+        self.deadline = deadline
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.cancel = CancellationToken()
+        
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=MAX_EVENTS)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._last_progress = 0.0
+    
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable summary of the job."""
+        return {
+            "id": self.id,
+            "operation": self.operation,
+            "device": self.device_id,
+            "params": self.params,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "estimate": {
+                "seconds": round(self.estimate.seconds, 1),
+                "low": round(self.estimate.low, 1),
+                "high": round(self.estimate.high, 1),
+                "basis": self.estimate.basis
+            },
+            "deadline": self.deadline,
+            "result": self.result
+        }
+    
+    def add_event(self, event: str, **fields: Any):
+        """
+        Append an event and wake streaming clients.
+        
+        Args:
+            event: Event type
+            fields: Event data
+        """
+        with self._cond:
+            self._seq += 1
+            record = {"seq": self._seq, "event": event, "ts": round(time.time(), 3)}
+            record.update(fields)
+            self._events.append(record)
+            self._cond.notify_all()
+    
+    def progress(self, done: int, total: int):
+        """Backend progress callback (throttled)."""
+        now = time.monotonic()
+        if now - self._last_progress < PROGRESS_INTERVAL and done < total:
+            return
+        self._last_progress = now
+        percent = round(min(100.0, 100.0 * done / total), 1) if total else None
+        self.add_event("progress", done=done, total=total, percent=percent)
+    
+    def set_state(self, state: str, result: Optional[FlashResult] = None, **extra: Any):
+        """Move the job to a new state, recording it as an event."""
+        with self._cond:
+            self.state = state
+            if state == RUNNING:
+                self.started_at = time.time()
+            if state in FINISHED_STATES:
+                self.finished_at = time.time()
+            if result is not None:
+                self.result = dict(asdict(result), **extra)
+            self.add_event("state", state=state, result=self.result if state in FINISHED_STATES else None)
+    
+    def events_after(self, seq: int, timeout: Optional[float] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Events newer than `seq`, waiting up to `timeout` for one to arrive.
+        
+        Args:
+            seq: Last sequence number the caller has seen
+            timeout: Seconds to wait when there is nothing new (None = don't wait)
+            
+        Returns:
+            (events, finished) - finished is True once the job is done and
+            every event has been returned
+        """
+        with self._cond:
+            if timeout and self._seq <= seq and not self.finished:
+                self._cond.wait(timeout)
+            events = [event for event in self._events if event["seq"] > seq]
+            last = events[-1]["seq"] if events else seq
+            return events, self.finished and last >= self._seq
+
+
+class Station:
+    """
+    Devices, jobs and workers of one flashing station.
+    
+    Operations: list-partitions, backup, flash, verify, plan and
+    end-session. Parameters mirror the ProtocolManager methods.
+    """
+    
+    OPERATIONS = ("list-partitions", "backup", "flash", "restore", "verify", "plan", "end-session")
+    
+    def __init__(self, backend_factory: Callable[[], List[FlashBackend]],
+                 workers: int = 4, lock_timeout: Optional[float] = None,
+                 policy: Optional[SchedulingPolicy] = None,
+                 history: Optional[ThroughputHistory] = None,
+                 port_health: Optional[PortHealthTracker] = None,
+                 processes: bool = False,
+                 retry_policy: Optional[RetryPolicy] = None):
+        """
+        Initialize station.
+        
+        Args:
+            backend_factory: Creates the backend prototypes used for discovery
+            workers: Devices worked on at once
+            lock_timeout: Longest wait for a device held by another process
+                          component (None = wait)
+            policy: Which waiting device runs next (None = shortest job first)
+            history: Measured transfer rates behind job estimates
+                     (None = the process-wide history)
+            port_health: Per-port health behind scheduling
+                         (None = the process-wide tracker)
+            processes: Run each device's session in a worker process
+                       (backend_factory must then be picklable)
+            retry_policy: How failed transfers are retried
+                          (None = RetryPolicy() defaults)
+                          
+        Raises:
+            ValueError: processes=True with a backend factory that cannot
+                        be sent to a worker process
+        """
+        self.backend_factory = backend_factory
+        self.lock_timeout = lock_timeout
+        self.retry_policy = retry_policy
+        self.policy = policy or SchedulingPolicy()
+        self.history = history or default_throughput_history()
+        self.port_health = port_health or default_port_health()
+        self.workers = max(1, workers)
+        self.supervisor = (
+            Supervisor(backend_factory, lock_timeout=lock_timeout, history=self.history,
+                       port_health=self.port_health, retry_policy=retry_policy)
+            if processes else None
+        )
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="station")
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._managers: Dict[str, ProtocolManager] = {}
+        self._queues: Dict[str, Deque[StationJob]] = {}
+        self._running = set()  # Devices with a job on a worker
+        self._jobs: Dict[str, StationJob] = {}
+        self._refreshed_at: Optional[float] = None
+    
+    # Devices
+    
+    def refresh(self) -> bool:
+        """
+        Re-scan for devices.
+        
+        Skipped while any job is queued or running, since probing could
+        disturb a device mid-transfer.
+        
+        Returns:
+            True if the scan ran
+        """
+        with self._refresh_lock:
+            return self._refresh()
+    
+    def _refresh(self) -> bool:
+        with self._lock:
+            if any(self._queues.values()) or self._busy_devices():
+                return False
+            old = list(self._managers.values())
+            self._managers = {}
+        
+        for manager in old:
+            if self.supervisor is not None:
+                self.supervisor.stop(manager.current_device.device_id)
+            elif manager.active_backend is not None:
+                manager.end_session(reboot=False)
+        
+        if self.supervisor is not None:
+            managers = self._start_workers()
+        else:
+            managers = discover_devices(
+                self.backend_factory(),
+                lambda: ProtocolManager(lock_timeout=self.lock_timeout, history=self.history,
+                                        port_health=self.port_health, retry_policy=self.retry_policy)
+            )
+        with self._lock:
+            self._managers = {m.current_device.device_id: m for m in managers}
+            self._refreshed_at = time.time()
+        logger.info(f"Station has {len(managers)} device(s)")
+        return True
+    
+    def _start_workers(self) -> List[ProtocolManager]:
+        """Discover devices and start a worker process for each."""
+        managers = []
+        for device in self.supervisor.discover():
+            # Knows the device for estimates and port health; the session
+            # itself lives in the worker
+            manager = ProtocolManager(lock_timeout=self.lock_timeout, history=self.history,
+                                      port_health=self.port_health)
+            manager.current_device = device.info
+            self.supervisor.start(device)
+            managers.append(manager)
+        return managers
+    
+    def _busy_devices(self) -> List[str]:
+        return list(self._running)
+    
+    def devices(self) -> Dict[str, Any]:
+        """
+        Cached device list.
+        
+        Returns:
+            {"devices": [...], "refreshed_at": time}
+        """
+        with self._lock:
+            managers = dict(self._managers)
+            busy = set(self._busy_devices())
+            queued = {device: len(queue) for device, queue in self._queues.items()}
+            refreshed_at = self._refreshed_at
+        
+        devices = []
+        for device_id, manager in managers.items():
+            info = manager.current_device
+            if info is None:
+                continue
+            port = manager.port_status()
+            entry = dict(
+                asdict(info),
+                id=device_id,
+                busy=device_id in busy,
+                queued=queued.get(device_id, 0),
+                session=bool(getattr(manager.active_backend, "session_active", False)),
+                port_health=port.state,
+                port_reasons=port.reasons
+            )
+            if self.supervisor is not None:
+                worker = self.supervisor.status(device_id)
+                entry["session"] = worker is not None and worker.state in (IDLE, BUSY)
+                entry["worker"] = worker.to_dict() if worker is not None else None
+            devices.append(entry)
+        return {"devices": devices, "refreshed_at": refreshed_at}
+    
+    def worker_status(self) -> Dict[str, Any]:
+        """
+        Worker processes as shown on the status board (read without locks).
+        
+        Returns:
+            {"board": shared memory name or None, "workers": [...]}; both
+            empty unless the station runs devices in worker processes
+        """
+        if self.supervisor is None:
+            return {"board": None, "workers": []}
+        return {"board": self.supervisor.board.name,
+                "workers": [status.to_dict() for status in self.supervisor.statuses()]}
+    
+    def ports(self) -> Dict[str, Any]:
+        """
+        Health of every port with a transfer record.
+        
+        Returns:
+            {"ports": [...]}, worst first
+        """
+        return {"ports": [status.to_dict() for status in self.port_health.statuses()]}
+    
+    def clear_port(self, port: str) -> bool:
+        """
+        Forget a port's record (e.g. after replacing its cable), ending
+        any quarantine.
+        
+        Returns:
+            False if the port had no record
+        """
+        cleared = self.port_health.clear(port)
+        self._dispatch()
+        return cleared
+    
+    # Jobs
+    
+    def submit(self, operation: str, device_id: Optional[str] = None,
+               params: Optional[Dict[str, Any]] = None) -> StationJob:
+        """
+        Queue a job.
+        
+        Args:
+            operation: One of OPERATIONS
+            device_id: Target device (may be omitted with a single device)
+            params: Operation parameters; "deadline" (Unix time) gives the
+                    job a deadline for the deadline scheduling policy
+                    
+        Returns:
+            The queued job
+            
+        Raises:
+            ValueError: Unknown operation, missing or invalid parameters
+            KeyError: Unknown or ambiguous device
+        """
+        params = dict(params or {})
+        if operation not in self.OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+        for name in self._required(operation):
+            if not params.get(name):
+                raise ValueError(f"{operation} needs '{name}'")
+        deadline = params.pop("deadline", None)
+        if deadline is not None:
+            try:
+                deadline = float(deadline)
+            except (TypeError, ValueError):
+                raise ValueError("deadline must be a Unix timestamp")
+        
+        with self._lock:
+            if device_id is None:
+                if len(self._managers) != 1:
+                    raise KeyError(f"{len(self._managers)} devices attached - give a device id")
+                device_id = next(iter(self._managers))
+            manager = self._managers.get(device_id)
+            if manager is None:
+                raise KeyError(f"Unknown device: {device_id}")
+        
+        job = StationJob(operation, device_id, params, self._estimate(operation, params, manager), deadline)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+            self._queues.setdefault(device_id, deque()).append(job)
+        
+        job.add_event("state", state=QUEUED, result=None)
+        self._dispatch()
+        return job
+    
+    def _estimate(self, operation: str, params: Dict[str, Any],
+                  manager: ProtocolManager) -> DurationEstimate:
+        """Expected duration of a job on its device, from throughput history."""
+        if operation in ("flash", "verify", "backup"):
+            image = params.get("image")
+            size = os.path.getsize(image) if image and os.path.isfile(image) else None
+            return manager.estimate_transfer(operation, params["partition"], size)
+        
+        if operation == "restore":
+            return manager.estimate_transfer("flash", params["partition"])
+        
+        if operation == "plan":
+            try:
+                graph = load_manifest(params["manifest"]).compile()
+            except (ManifestError, OSError):
+                return fallback_estimate(0)
+            device = manager.current_device
+            return graph.estimate_total(
+                history=self.history,
+                models={slot: device.model for slot in graph.devices},
+                ports={slot: device.usb_path for slot in graph.devices}
+            )
+        
+        return fallback_estimate(0)
+    
+    @staticmethod
+    def _required(operation: str) -> Tuple[str, ...]:
+        if operation in ("backup", "restore"):
+            return ("partition",)
+        if operation in ("flash", "verify"):
+            return ("partition", "image")
+        if operation == "plan":
+            return ("manifest",)
+        return ()
+    
+    def _prune(self):
+        """Forget the oldest finished jobs beyond MAX_FINISHED_JOBS (called with _lock held)."""
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+    
+    def job(self, job_id: str) -> Optional[StationJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def jobs(self) -> List[StationJob]:
+        with self._lock:
+            return list(self._jobs.values())
+    
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job.
+        
+        Returns:
+            False if there is no such unfinished job
+        """
+        job = self.job(job_id)
+        if job is None or job.finished:
+            return False
+        
+        with self._lock:
+            queue = self._queues.get(job.device_id)
+            dequeued = queue is not None and job in queue and job.state == QUEUED
+            if dequeued:
+                queue.remove(job)
+        
+        job.cancel.cancel("Cancelled by client")
+        if dequeued:
+            job.set_state(CANCELLED, FlashResult(success=False, message="Cancelled before start",
+                                                 cancelled=True))
+        return True
+    
+    def _priority(self, queue: Deque[StationJob], now: float) -> tuple:
+        """
+        Scheduling key of a device's queue (called with _lock held).
+        
+        The queue runs in order, so its next job's estimate decides for
+        shortest-job-first; for deadlines the most urgent job counts,
+        with the estimates of the jobs ahead of it added to its own.
+        """
+        head = queue[0]
+        key = self.policy.key(head.estimate.seconds, head.created_at, now)
+        
+        ahead = 0.0
+        for job in queue:
+            ahead += job.estimate.seconds
+            if job.deadline is not None:
+                key = min(key, self.policy.key(ahead, head.created_at, now, job.deadline))
+        return key
+    
+    def _port_status(self, device_id: str) -> PortStatus:
+        """Health of a device's port (called with _lock held)."""
+        manager = self._managers.get(device_id)
+        return self.port_health.status(
+            manager.current_device.usb_path if manager and manager.current_device else None
+        )
+    
+    def _dispatch(self):
+        """
+        Hand free workers to the waiting devices the policy ranks first,
+        healthy ports before degraded ones. Jobs waiting on a quarantined
+        port are failed.
+        """
+        refused: List[Tuple[StationJob, PortStatus]] = []
+        with self._lock:
+            now = time.time()
+            while len(self._running) < self.workers:
+                waiting = []
+                for device_id, queue in self._queues.items():
+                    if not queue or device_id in self._running:
+                        continue
+                    port = self._port_status(device_id)
+                    if port.state == QUARANTINED:
+                        refused.extend((job, port) for job in queue)
+                        queue.clear()
+                        continue
+                    waiting.append(((port.rank,) + self._priority(queue, now), device_id))
+                if not waiting:
+                    break
+                _, device_id = min(waiting)
+                job = self._queues[device_id][0]
+                job.state = RUNNING
+                self._running.add(device_id)
+                self._pool.submit(self._work, device_id, job)
+        
+        for job, port in refused:
+            job.set_state(FAILED, FlashResult(
+                success=False,
+                message="Port quarantined",
+                error=f"{port.port}: {'; '.join(port.reasons)} - replace the cable and clear the port",
+                port=port.port
+            ))
+    
+    def _work(self, device_id: str, job: StationJob):
+        """Run one job on a worker, then pass the worker on."""
+        try:
+            self._run(job)
+        finally:
+            with self._lock:
+                queue = self._queues.get(device_id)
+                if queue and queue[0] is job:
+                    queue.popleft()
+                self._running.discard(device_id)
+            self._dispatch()
+    
+    def _run(self, job: StationJob):
+        job.set_state(RUNNING)
+        manager = self._managers.get(job.device_id)
+        
+        try:
+            result, extra = self._execute(job, manager)
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            result, extra = FlashResult(success=False, message="Internal error", error=str(e)), {}
+        
+        if result.success:
+            state = SUCCEEDED
+        elif result.cancelled or job.cancel.cancelled:
+            state = CANCELLED
+        else:
+            state = FAILED
+        job.set_state(state, result, **extra)
+    
+    def _execute(self, job: StationJob, manager: Optional[ProtocolManager]) -> Tuple[FlashResult, Dict[str, Any]]:
+        params = job.params
+        if manager is None or manager.current_device is None:
+            return FlashResult(success=False, message="Device gone", error=f"{job.device_id} not attached"), {}
+        
+        if job.operation == "end-session":
+            reboot = bool(params.get("reboot", False))
+            if self.supervisor is not None:
+                ended = self.supervisor.stop(job.device_id, reboot)
+            else:
+                ended = manager.end_session(reboot=reboot)
+            with self._lock:
+                self._managers.pop(job.device_id, None)
+            return FlashResult(success=ended, message="Session ended" if ended else "Could not end session"), {}
+        
+        if self.supervisor is not None:
+            return self.supervisor.run(job.device_id, job.id, job.operation, params, job.cancel,
+                                       job.add_event, job.progress)
+        return run_operation(manager, job.operation, params, job.cancel, job.add_event, job.progress)
+    
+    def shutdown(self, reboot: bool = False):
+        """
+        Cancel all jobs, wait for workers and end every session.
+        
+        Args:
+            reboot: Reboot devices as their sessions end
+        """
+        for job in self.jobs():
+            if not job.finished:
+                self.cancel(job.id)
+        self._pool.shutdown(wait=True)
+        
+        with self._lock:
+            managers = list(self._managers.values())
+            self._managers = {}
+        if self.supervisor is not None:
+            self.supervisor.close(reboot)
+            return
+        for manager in managers:
+            if manager.active_backend is not None:
+                manager.end_session(reboot=reboot)
@@ -0,0 +1,217 @@
+"""
+SecureOS Flash - Worker Status Board
+
+Fixed-size table in shared memory where every worker process publishes
+its state, current job and progress. The supervisor, the station API
+and a GUI in another process read it without taking any lock, so a
+worker stuck in a backend can never block the people watching it.
+
+Each slot has exactly one writer at a time: the worker while it runs,
+the supervisor while it does not. Writes are bracketed by a sequence
+counter (a seqlock): it is odd while a write is in progress, and a
+reader that sees it odd, or changed across its copy, simply reads again.
+"""
+
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+import struct
+import threading
+import time
+
+from multiprocessing import shared_memory
+
+
+# Board header: magic, slot count, slot size
+HEADER_FORMAT = "<8sII"
+HEADER_SIZE = 16
+MAGIC = b"SOSBOARD"
+
+# Slot: sequence, pid, restarts, done, total, updated, heartbeat,
+# state, device, job, operation, partition, message
+SLOT_FORMAT = "<QIIQQdd16s64s16s16s32s96s"
+SLOT_SIZE = struct.calcsize(SLOT_FORMAT)
+
+_SEQ = struct.Struct("<Q")
+
+_TEXT_FIELDS = ("state", "device", "job", "operation", "partition", "message")
+_TEXT_SIZES = (16, 64, 16, 16, 32, 96)
+
+# Reads retried before yielding to a writer that is mid-update
+_READ_SPINS = 100
+
+# Worker states
+STARTING = "starting"
+IDLE = "idle"
+BUSY = "busy"
+RESTARTING = "restarting"
+FAILED = "failed"
+STOPPED = "stopped"
+
+
+@dataclass
+class WorkerStatus:
+    """One worker's slot on the board"""
+    slot: int
+    pid: int = 0
+    restarts: int = 0
+    done: int = 0
+    total: int = 0
+    updated: float = 0.0
+    heartbeat: float = 0.0
+    state: str = ""
+    device: str = ""
+    job: str = ""
+    operation: str = ""
+    partition: str = ""
+    message: str = ""
+    
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.total:
+            return None
+        return min(100.0, 100.0 * self.done / self.total)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(asdict(self), percent=self.percent)
+
+
+def _text(value: bytes) -> str:
+    return value.split(b"\0", 1)[0].decode("utf-8", errors="ignore")
+
+
+def _attach(name: str, child: bool) -> shared_memory.SharedMemory:
+    """Open an existing segment without letting this process's exit destroy it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the segment for cleanup
+        # at exit, as if this process had created it. A child shares its
+        # creator's resource tracker, where the registration is harmless
+        # and unregistering would drop the creator's own
+        memory = shared_memory.SharedMemory(name=name)
+        if not child:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+class StatusBoard:
+    """Shared-memory table of worker states"""
+    
+    def __init__(self, slots: int):
+        """
+        Create a board.
+        
+        Args:
+            slots: Number of workers it can hold
+        """
+        self.slots = slots
+        self._memory = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + slots * SLOT_SIZE)
+        self._owner = True
+        self._write_lock = threading.Lock()
+        struct.pack_into(HEADER_FORMAT, self._memory.buf, 0, MAGIC, slots, SLOT_SIZE)
+    
+    @classmethod
+    def attach(cls, name: str, child: bool = False) -> "StatusBoard":
+        """
+        Open a board created by another process (a worker, or a GUI).
+        
+        Args:
+            name: StatusBoard.name of the board
+            child: The caller was started by the board's creator through
+                   multiprocessing
+                   
+        Raises:
+            FileNotFoundError: No such board
+            ValueError: The segment is not a status board
+        """
+        board = cls.__new__(cls)
+        board._memory = _attach(name, child)
+        board._owner = False
+        board._write_lock = threading.Lock()
+        magic, slots, slot_size = struct.unpack_from(HEADER_FORMAT, board._memory.buf, 0)
+        if magic != MAGIC or slot_size != SLOT_SIZE:
+            board._memory.close()
+            raise ValueError(f"{name} is not a status board")
+        board.slots = slots
+        return board
+    
+    @property
+    def name(self) -> str:
+        """Name other processes attach with"""
+        return self._memory.name
+    
+    def write(self, slot: int, **fields: Any):
+        """
+        Update fields of a slot.
+        
+        Only the slot's current writer may call this; threads of that
+        writer are serialised here, readers never wait.
+        
+        Args:
+            slot: Slot index
+            fields: WorkerStatus fields to change
+        """
+        offset = self._offset(slot)
+        buf = self._memory.buf
+        with self._write_lock:
+            current = self._unpack(slot, bytes(buf[offset:offset + SLOT_SIZE]))
+            for key, value in fields.items():
+                setattr(current, key, value)
+            seq = _SEQ.unpack_from(buf, offset)[0]
+            _SEQ.pack_into(buf, offset, seq + 1)
+            struct.pack_into(
+                SLOT_FORMAT, buf, offset, seq + 1,
+                current.pid, current.restarts, current.done, current.total,
+                current.updated, current.heartbeat,
+                *(getattr(current, name).encode("utf-8")[:size]
+                  for name, size in zip(_TEXT_FIELDS, _TEXT_SIZES))
+            )
+            _SEQ.pack_into(buf, offset, seq + 2)
+    
+    def read(self, slot: int) -> WorkerStatus:
+        """
+        Consistent copy of a slot, without locking.
+        
+        Args:
+            slot: Slot index
+            
+        Returns:
+            WorkerStatus
+        """
+        offset = self._offset(slot)
+        buf = self._memory.buf
+        spins = 0
+        while True:
+            before = _SEQ.unpack_from(buf, offset)[0]
+            data = bytes(buf[offset:offset + SLOT_SIZE])
+            if not before & 1 and _SEQ.unpack_from(buf, offset)[0] == before:
+                return self._unpack(slot, data)
+            spins += 1
+            if spins >= _READ_SPINS:
+                spins = 0
+                time.sleep(0)
+    
+    def snapshot(self) -> List[WorkerStatus]:
+        """Every slot in use, in slot order."""
+        return [status for status in (self.read(slot) for slot in range(self.slots)) if status.device]
+    
+    def close(self):
+        """Detach; the creator also destroys the board."""
+        self._memory.close()
+        if self._owner:
+            try:
+                self._memory.unlink()
+            except FileNotFoundError:
+                pass
+    
+    def _offset(self, slot: int) -> int:
+        if not 0 <= slot < self.slots:
+            raise IndexError(f"No slot {slot} on a board of {self.slots}")
+        return HEADER_SIZE + slot * SLOT_SIZE
+    
+    @staticmethod
+    def _unpack(slot: int, data: bytes) -> WorkerStatus:
+        values = struct.unpack(SLOT_FORMAT, data)
+        return WorkerStatus(slot, *values[1:7], *(_text(v) for v in values[7:]))
+
@@ -0,0 +1,704 @@
+"""
+SecureOS Flash - Worker Supervisor
+
+Runs every device session in a process of its own. A worker process
+owns one device's backend and ProtocolManager and runs that device's
+jobs, so hashing, decompression and output parsing on different devices
+use different cores, and a backend that crashes or hangs takes down one
+device instead of the station.
+
+The supervisor:
+
+- starts a worker per device and hands it jobs over a pipe
+- relays job events back to the caller
+- restarts crashed workers, with back-off, up to MAX_RESTARTS per
+  RESTART_WINDOW
+- kills workers that stop their heartbeat, or that ignore a cancel for
+  longer than CANCEL_GRACE
+
+Workers publish state and progress on a StatusBoard in shared memory.
+Throughput history and port health stay in the supervisor, which is
+their only writer; workers reach them through a small RPC pipe.
+"""
+
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+
+from ..core import (CancellationToken, DeviceInfo, FlashBackend, FlashResult, PartitionDigestStore,
+                    PortHealthChanged, PortHealthTracker, ProtocolManager, RetryPolicy,
+                    ThroughputHistory, default_event_bus, default_port_health, default_throughput_history)
+from .operations import run_operation
+from .status_board import BUSY, FAILED, IDLE, RESTARTING, STARTING, STOPPED, StatusBoard, WorkerStatus
+
+
+logger = logging.getLogger(__name__)
+
+
+# Devices a board has room for
+DEFAULT_SLOTS = 64
+
+# Worker heartbeat period, and how long a silent worker lives (s)
+HEARTBEAT_INTERVAL = 1.0
+HANG_TIMEOUT = 30.0
+
+# How long a worker gets to finish after a cancel before it is killed (s)
+CANCEL_GRACE = 10.0
+
+# How long a job waits for its worker to come up (s)
+START_TIMEOUT = 60.0
+
+# How long a worker gets to end its session when stopped (s)
+STOP_TIMEOUT = 30.0
+
+# Restarts allowed within the window before a worker is given up on
+MAX_RESTARTS = 5
+RESTART_WINDOW = 300.0
+MAX_BACKOFF = 30.0
+
+# Supervisor poll period (s)
+POLL_INTERVAL = 0.5
+
+# Minimum interval between progress messages a worker sends (s)
+PROGRESS_INTERVAL = 0.25
+
+# What workers may call on the supervisor's shared state
+_RPC_METHODS = {
+    "history": ("lookup", "record", "estimate"),
+    "port_health": ("status", "record"),
+}
+
+# Job operations whose interruption leaves a partition's contents unknown
+_WRITES = ("flash", "restore")
+
+
+@dataclass
+class DeviceSlot:
+    """A discovered device and how its worker finds it again"""
+    info: DeviceInfo
+    key: str                      # ProtocolManager.device_key
+    hint: Tuple[int, int]         # (backend index, discover() index)
+
+
+@dataclass
+class _Worker:
+    """Supervisor-side state of one worker process"""
+    slot: int
+    device: DeviceSlot
+    process: Any = None
+    conn: Any = None
+    ready: bool = False
+    stopping: bool = False
+    failed: bool = False
+    error: str = ""
+    restarts: List[float] = field(default_factory=list)
+    next_start: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)  # Held while talking to the worker
+
+
+class Supervisor:
+    """
+    Worker processes for a station's devices.
+    
+    The backend factory is called in every worker process, so it must
+    be picklable: a module-level function, or a functools.partial of one.
+    """
+    
+    def __init__(self, backend_factory: Callable[[], List[FlashBackend]],
+                 slots: int = DEFAULT_SLOTS, lock_timeout: Optional[float] = None,
+                 history: Optional[ThroughputHistory] = None,
+                 port_health: Optional[PortHealthTracker] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
+        """
+        Initialize supervisor.
+        
+        Args:
+            backend_factory: Creates the backend prototypes (picklable)
+            slots: Most devices supervised at once
+            lock_timeout: Passed to the workers' ProtocolManagers
+            history: Throughput history workers record into
+                     (None = the process-wide history)
+            port_health: Port health workers record into
+                         (None = the process-wide tracker)
+            retry_policy: Passed to the workers' ProtocolManagers
+            
+        Raises:
+            ValueError: The backend factory cannot be sent to a worker
+        """
+        try:
+            pickle.dumps(backend_factory)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            raise ValueError(f"Backend factory must be picklable for worker processes: {e}")
+        
+        self.backend_factory = backend_factory
+        self.lock_timeout = lock_timeout
+        self.retry_policy = retry_policy
+        self.history = history or default_throughput_history()
+        self.port_health = port_health or default_port_health()
+        self.events = default_event_bus()
+        self.digest_store = PartitionDigestStore()
+        self.board = StatusBoard(slots)
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._workers: Dict[str, _Worker] = {}
+        self._closed = threading.Event()
+        self._monitor = threading.Thread(target=self._watch, name="supervisor", daemon=True)
+        self._monitor.start()
+    
+    # Devices
+    
+    def discover(self) -> List[DeviceSlot]:
+        """
+        Detect attached devices in this process, then release them for
+        their workers.
+        
+        Returns:
+            One DeviceSlot per device, in discovery order
+        """
+        slots: List[DeviceSlot] = []
+        seen = set()
+        for backend_index, backend in enumerate(self.backend_factory()):
+            for instance_index, instance in enumerate(backend.discover()):
+                manager = ProtocolManager(history=self.history, port_health=self.port_health)
+                manager.register_backend(instance)
+                info = manager.detect_device()
+                if info is None:
+                    continue
+                key = manager.device_key
+                manager.end_session(reboot=False)
+                if key in seen:
+                    logger.info(f"{key} already claimed by another backend")
+                    continue
+                seen.add(key)
+                slots.append(DeviceSlot(info, key, (backend_index, instance_index)))
+        
+        logger.info(f"Discovered {len(slots)} device(s) for worker processes")
+        return slots
+    
+    def start(self, device: DeviceSlot):
+        """
+        Start a worker for a device (replacing any worker it had).
+        
+        Args:
+            device: Device from discover()
+            
+        Raises:
+            RuntimeError: The board has no free slot
+        """
+        device_id = device.info.device_id
+        self.stop(device_id, reboot=False)
+        
+        with self._lock:
+            used = {worker.slot for worker in self._workers.values()}
+            free = [slot for slot in range(self.board.slots) if slot not in used]
+            if not free:
+                raise RuntimeError(f"Status board is full ({self.board.slots} workers)")
+            worker = _Worker(free[0], device)
+            self._workers[device_id] = worker
+        
+        with worker.lock:
+            self._spawn(worker)
+    
+    def stop(self, device_id: str, reboot: bool = False) -> bool:
+        """
+        Stop a device's worker, ending its session first.
+        
+        Args:
+            device_id: Device
+            reboot: Reboot the device as the session ends
+            
+        Returns:
+            True if the session ended cleanly (or there was no worker)
+        """
+        with self._lock:
+            worker = self._workers.get(device_id)
+        if worker is None:
+            return True
+        
+        worker.stopping = True
+        with worker.lock:
+            ended = self._stop_process(worker, reboot)
+            self.board.write(worker.slot, state=STOPPED, pid=0, device="", job="", operation="",
+                             partition="", done=0, total=0, message="")
+        with self._lock:
+            if self._workers.get(device_id) is worker:
+                del self._workers[device_id]
+        return ended
+    
+    def close(self, reboot: bool = False):
+        """
+        Stop every worker and destroy the board.
+        
+        Args:
+            reboot: Reboot devices as their sessions end
+        """
+        self._closed.set()
+        with self._lock:
+            device_ids = list(self._workers)
+        for device_id in device_ids:
+            self.stop(device_id, reboot)
+        self._monitor.join(POLL_INTERVAL * 4)
+        self.board.close()
+    
+    def statuses(self) -> List[WorkerStatus]:
+        """Every worker's slot on the board (lock-free read)."""
+        return self.board.snapshot()
+    
+    def status(self, device_id: str) -> Optional[WorkerStatus]:
+        """A device's slot on the board, None if it has no worker."""
+        with self._lock:
+            worker = self._workers.get(device_id)
+        return self.board.read(worker.slot) if worker is not None else None
+    
+    # Jobs
+    
+    def run(self, device_id: str, job_id: str, operation: str, params: Dict[str, Any],
+            cancel: CancellationToken, on_event: Callable[..., None],
+            on_progress: Callable[[int, int], None]) -> Tuple[FlashResult, Dict[str, Any]]:
+        """
+        Run a job in a device's worker and wait for it.
+        
+        Args:
+            device_id: Device
+            job_id: Job id (shown on the board)
+            operation: Operation name (see Station.OPERATIONS)
+            params: Operation parameters
+            cancel: Token that aborts the job
+            on_event: Called as on_event(event, **fields) for job events
+            on_progress: Called with (done, total)
+            
+        Returns:
+            (FlashResult, extra result fields)
+        """
+        with self._lock:
+            worker = self._workers.get(device_id)
+        if worker is None:
+            return FlashResult(success=False, message="Device gone",
+                               error=f"{device_id} has no worker"), {}
+        
+        with worker.lock:
+            if not self._await_ready(worker, cancel):
+                if cancel.cancelled:
+                    return FlashResult(success=False, message="Cancelled before start",
+                                       cancelled=True), {}
+                return FlashResult(success=False, message="Worker unavailable",
+                                   error=worker.error or self.board.read(worker.slot).message), {}
+            
+            try:
+                worker.conn.send(("run", job_id, operation, params))
+            except (OSError, EOFError, ValueError):
+                return self._lost(worker, operation, params, "Worker crashed"), {}
+            return self._follow(worker, operation, params, cancel, on_event, on_progress)
+    
+    def _follow(self, worker: _Worker, operation: str, params: Dict[str, Any],
+                cancel: CancellationToken, on_event: Callable[..., None],
+                on_progress: Callable[[int, int], None]) -> Tuple[FlashResult, Dict[str, Any]]:
+        """Relay a running job's messages until it finishes (worker.lock held)."""
+        cancel_sent: Optional[float] = None
+        while True:
+            now = time.monotonic()
+            if cancel.cancelled and cancel_sent is None:
+                cancel_sent = now
+                try:
+                    worker.conn.send(("cancel",))
+                except (OSError, EOFError, ValueError):
+                    pass
+            if cancel_sent is not None and now - cancel_sent > CANCEL_GRACE:
+                logger.warning(f"Worker for {worker.device.key} ignored cancel - killing it")
+                self._kill(worker)
+                result = self._lost(worker, operation, params, "Cancelled")
+                result.cancelled = True
+                result.error = "Worker did not stop in time and was restarted"
+                return result, {}
+            
+            try:
+                message = worker.conn.recv() if worker.conn.poll(POLL_INTERVAL) else None
+            except (OSError, EOFError):
+                return self._lost(worker, operation, params, "Worker crashed"), {}
+            
+            if message is None:
+                if not worker.process.is_alive():
+                    return self._lost(worker, operation, params, "Worker crashed"), {}
+                if time.time() - self.board.read(worker.slot).heartbeat > HANG_TIMEOUT:
+                    logger.error(f"Worker for {worker.device.key} stopped responding - killing it")
+                    self._kill(worker)
+                    return self._lost(worker, operation, params, "Worker hung"), {}
+                continue
+            
+            kind = message[0]
+            if kind == "progress":
+                on_progress(message[1], message[2])
+            elif kind == "event":
+                on_event(message[1], **message[2])
+            elif kind == "result":
+                return FlashResult(**message[1]), message[2]
+    
+    def _lost(self, worker: _Worker, operation: str, params: Dict[str, Any],
+              message: str) -> FlashResult:
+        """Result of a job whose worker died under it."""
+        worker.ready = False
+        exitcode = worker.process.exitcode if worker.process is not None else None
+        identity = worker.device.info.identity
+        if operation in _WRITES and params.get("partition") and identity is not None:
+            # The partition may hold part of the image now
+            self.digest_store.forget(identity, params["partition"])
+        return FlashResult(
+            success=False,
+            message=message,
+            error=f"Worker for {worker.device.key} exited with code {exitcode}; it will be restarted"
+            if exitcode is not None else f"Worker for {worker.device.key} is restarting",
+            port=worker.device.info.usb_path
+        )
+    
+    def _await_ready(self, worker: _Worker, cancel: CancellationToken) -> bool:
+        """Wait for the worker to find its device (worker.lock held)."""
+        deadline = time.monotonic() + START_TIMEOUT
+        while not worker.ready:
+            if worker.failed or cancel.cancelled or time.monotonic() > deadline:
+                return False
+            if worker.process is None or not worker.process.is_alive():
+                # Being restarted by the monitor, which needs the lock
+                worker.lock.release()
+                try:
+                    time.sleep(POLL_INTERVAL)
+                finally:
+                    worker.lock.acquire()
+                continue
+            try:
+                if not worker.conn.poll(POLL_INTERVAL):
+                    continue
+                message = worker.conn.recv()
+            except (OSError, EOFError):
+                continue
+            if message[0] == "ready":
+                worker.ready = True
+                worker.error = ""
+            elif message[0] == "error":
+                worker.error = message[1]
+        return True
+    
+    # Processes
+    
+    def _spawn(self, worker: _Worker):
+        """Start a worker's process (worker.lock held)."""
+        conn, child_conn = self._context.Pipe()
+        rpc, child_rpc = self._context.Pipe()
+        self.board.write(
+            worker.slot, state=STARTING, pid=0, device=worker.device.info.device_id,
+            job="", operation="", partition="", done=0, total=0, message="",
+            restarts=len(worker.restarts), heartbeat=time.time(), updated=time.time()
+        )
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker.slot, self.board.name, self.backend_factory, worker.device.key,
+                  worker.device.hint, child_conn, child_rpc, logging.getLogger().level,
+                  self.lock_timeout, self.retry_policy),
+            name=f"secureos-worker-{worker.slot}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        child_rpc.close()
+        worker.process = process
+        worker.conn = conn
+        worker.ready = False
+        threading.Thread(target=self._serve_rpc, args=(worker, rpc),
+                         name=f"supervisor-rpc-{worker.slot}", daemon=True).start()
+        logger.info(f"Started worker {process.pid} for {worker.device.key}")
+    
+    def _stop_process(self, worker: _Worker, reboot: bool) -> bool:
+        """Ask a worker to end its session and exit (worker.lock held)."""
+        process = worker.process
+        if process is None:
+            return True
+        
+        ended = False
+        if process.is_alive() and worker.ready:
+            try:
+                worker.conn.send(("stop", reboot))
+                deadline = time.monotonic() + STOP_TIMEOUT
+                while time.monotonic() < deadline and worker.conn.poll(max(0.0, deadline - time.monotonic())):
+                    message = worker.conn.recv()
+                    if message[0] == "stopped":
+                        ended = message[1]
+                        break
+            except (OSError, EOFError, ValueError):
+                pass
+            process.join(STOP_TIMEOUT)
+        else:
+            ended = True
+        
+        if process.is_alive():
+            self._kill(worker)
+        worker.conn.close()
+        worker.process = None
+        worker.ready = False
+        return ended
+    
+    def _kill(self, worker: _Worker):
+        process = worker.process
+        process.kill()
+        process.join(STOP_TIMEOUT)
+    
+    def _watch(self):
+        """Monitor thread: restart workers that died or stopped beating."""
+        while not self._closed.wait(POLL_INTERVAL):
+            with self._lock:
+                workers = list(self._workers.values())
+            for worker in workers:
+                # A worker running a job is watched by the job's thread
+                if worker.stopping or worker.failed or not worker.lock.acquire(blocking=False):
+                    continue
+                try:
+                    self._check(worker)
+                except Exception:
+                    logger.exception(f"Supervising {worker.device.key} failed")
+                finally:
+                    worker.lock.release()
+    
+    def _check(self, worker: _Worker):
+        """Restart a worker if it needs it (worker.lock held)."""
+        process = worker.process
+        now = time.time()
+        
+        if process is not None and process.is_alive():
+            if now - self.board.read(worker.slot).heartbeat <= HANG_TIMEOUT:
+                return
+            logger.error(f"Worker for {worker.device.key} stopped responding - killing it")
+            self._kill(worker)
+        
+        if process is not None:
+            logger.warning(f"Worker for {worker.device.key} exited with code {process.exitcode}")
+            worker.conn.close()
+            worker.process = None
+            worker.ready = False
+            worker.restarts = [t for t in worker.restarts if now - t < RESTART_WINDOW] + [now]
+            if len(worker.restarts) > MAX_RESTARTS:
+                worker.failed = True
+                logger.error(f"Giving up on {worker.device.key}: {MAX_RESTARTS} restarts "
+                             f"in {RESTART_WINDOW:.0f}s")
+                self.board.write(worker.slot, state=FAILED, pid=0, restarts=len(worker.restarts),
+                                 message=f"Gave up after {MAX_RESTARTS} restarts")
+                return
+            worker.next_start = now + min(MAX_BACKOFF, 2.0 ** (len(worker.restarts) - 1))
+            self.board.write(worker.slot, state=RESTARTING, pid=0, restarts=len(worker.restarts),
+                             job="", operation="", partition="")
+        
+        if now >= worker.next_start:
+            self._spawn(worker)
+    
+    def _serve_rpc(self, worker: _Worker, conn):
+        """Answer a worker's calls on the shared history and port health."""
+        targets = {"history": self.history, "port_health": self.port_health}
+        while True:
+            try:
+                target, method, args, kwargs = conn.recv()
+            except (OSError, EOFError):
+                break
+            
+            try:
+                if method not in _RPC_METHODS.get(target, ()):
+                    raise AttributeError(f"{target}.{method} is not available to workers")
+                if target == "port_health" and method == "record":
+                    value = self._record_port(worker, *args, **kwargs)
+                else:
+                    value = getattr(targets[target], method)(*args, **kwargs)
+                reply = ("ok", value)
+            except Exception as e:
+                reply = ("error", e)
+            
+            try:
+                conn.send(reply)
+            except (OSError, EOFError):
+                break
+        conn.close()
+    
+    def _record_port(self, worker: _Worker, port: str, *args, **kwargs):
+        """port_health.record on behalf of a worker, publishing state changes here."""
+        before = self.port_health.status(port).state
+        status = self.port_health.record(port, *args, **kwargs)
+        if status.state != before and self.events.wants(PortHealthChanged):
+            self.events.publish(PortHealthChanged(worker.device.key, port, status.state, status.reasons))
+        return status
+
+
+class _Remote:
+    """Worker-side stand-in for an object that lives in the supervisor"""
+    
+    def __init__(self, conn, lock: threading.Lock, target: str):
+        self._conn = conn
+        self._lock = lock
+        self._target = target
+    
+    def __getattr__(self, method: str):
+        def call(*args, **kwargs):
+            with self._lock:
+                self._conn.send((self._target, method, args, kwargs))
+                status, value = self._conn.recv()
+            if status == "error":
+                raise value
+            return value
+        return call
+
+
+class _WorkerProcess:
+    """A worker's device, job loop and link to the supervisor"""
+    
+    def __init__(self, slot: int, board: StatusBoard, conn, rpc, lock_timeout: Optional[float],
+                 retry_policy: Optional[RetryPolicy]):
+        self.slot = slot
+        self.board = board
+        self.conn = conn
+        self.lock_timeout = lock_timeout
+        self.retry_policy = retry_policy
+        self.manager: Optional[ProtocolManager] = None
+        self.commands: "queue.Queue" = queue.Queue()
+        self.current: Optional[CancellationToken] = None
+        self._send_lock = threading.Lock()
+        self._rpc_lock = threading.Lock()
+        self._rpc = rpc
+        self._last_progress = 0.0
+    
+    def send(self, *message: Any):
+        with self._send_lock:
+            self.conn.send(message)
+    
+    def find_device(self, backend_factory: Callable[[], List[FlashBackend]], key: str,
+                    hint: Tuple[int, int]) -> Optional[ProtocolManager]:
+        """
+        Detect this worker's device, trying the instance it was found on
+        first so other devices are not disturbed.
+        """
+        candidates = []
+        for backend_index, backend in enumerate(backend_factory()):
+            for instance_index, instance in enumerate(backend.discover()):
+                candidates.append(((backend_index, instance_index) != tuple(hint), instance))
+        candidates.sort(key=lambda candidate: candidate[0])
+        
+        for _, instance in candidates:
+            manager = ProtocolManager(
+                lock_timeout=self.lock_timeout,
+                retry_policy=self.retry_policy,
+                history=_Remote(self._rpc, self._rpc_lock, "history"),
+                port_health=_Remote(self._rpc, self._rpc_lock, "port_health")
+            )
+            manager.register_backend(instance)
+            if manager.detect_device() is None:
+                continue
+            if manager.device_key == key:
+                return manager
+            manager.end_session(reboot=False)
+        return None
+    
+    def listen(self):
+        """Reader thread: queue jobs, apply cancels at once."""
+        while True:
+            try:
+                message = self.conn.recv()
+            except (OSError, EOFError):
+                # Supervisor gone: stop without rebooting anything
+                message = ("stop", False)
+            
+            if message[0] == "cancel":
+                token = self.current
+                if token is not None:
+                    token.cancel("Cancelled by client")
+                continue
+            if message[0] == "stop" and self.current is not None:
+                self.current.cancel("Worker stopping")
+            self.commands.put(message)
+            if message[0] == "stop":
+                return
+    
+    def serve(self):
+        """Run jobs until told to stop."""
+        threading.Thread(target=self.listen, name="worker-listen", daemon=True).start()
+        while True:
+            message = self.commands.get()
+            if message[0] == "stop":
+                ended = True
+                if self.manager.active_backend is not None:
+                    ended = self.manager.end_session(reboot=message[1])
+                try:
+                    self.send("stopped", ended)
+                except (OSError, EOFError):
+                    pass
+                return
+            
+            _, job_id, operation, params = message
+            self.run(job_id, operation, params)
+    
+    def run(self, job_id: str, operation: str, params: Dict[str, Any]):
+        self.current = CancellationToken()
+        self.board.write(self.slot, state=BUSY, job=job_id, operation=operation,
+                         partition=str(params.get("partition", "")), done=0, total=0,
+                         message="", updated=time.time())
+        try:
+            result, extra = run_operation(self.manager, operation, params, self.current,
+                                          self.event, self.progress)
+        except Exception as e:
+            logging.getLogger(__name__).exception(f"Job {job_id} failed")
+            result, extra = FlashResult(success=False, message="Internal error", error=str(e)), {}
+        finally:
+            self.current = None
+        
+        self.board.write(self.slot, state=IDLE, message=result.message[:96], updated=time.time())
+        self.send("result", asdict(result), extra)
+    
+    def event(self, event: str, **fields: Any):
+        self.send("event", event, fields)
+    
+    def progress(self, done: int, total: int):
+        now = time.monotonic()
+        self.board.write(self.slot, done=done, total=total, updated=time.time())
+        if now - self._last_progress < PROGRESS_INTERVAL and done < total:
+            return
+        self._last_progress = now
+        self.send("progress", done, total)
+
+
+def _heartbeat(board: StatusBoard, slot: int, stop: threading.Event):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        board.write(slot, heartbeat=time.time())
+
+
+def _worker_main(slot: int, board_name: str, backend_factory: Callable[[], List[FlashBackend]],
+                 key: str, hint: Tuple[int, int], conn, rpc, log_level: int,
+                 lock_timeout: Optional[float], retry_policy: Optional[RetryPolicy]):
+    """Entry point of a worker process."""
+    # Ctrl+C reaches the whole process group; the supervisor decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        level=log_level,
+        format=f'%(asctime)s - [{key}] %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    board = StatusBoard.attach(board_name, child=True)
+    board.write(slot, pid=os.getpid(), heartbeat=time.time())
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(board, slot, stop), name="worker-heartbeat",
+                            daemon=True)
+    beat.start()
+    
+    worker = _WorkerProcess(slot, board, conn, rpc, lock_timeout, retry_policy)
+    try:
+        worker.manager = worker.find_device(backend_factory, key, hint)
+        if worker.manager is None:
+            board.write(slot, message=f"Device {key} not found")
+            conn.send(("error", f"Device {key} not found"))
+            raise SystemExit(3)
+        
+        board.write(slot, state=IDLE, message="", updated=time.time())
+        conn.send(("ready", asdict(worker.manager.current_device)))
+        worker.serve()
+    finally:
+        stop.set()
+        beat.join(HEARTBEAT_INTERVAL * 2)
+        board.close()
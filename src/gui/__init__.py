@@ -0,0 +1,5 @@
+"""GUI support package"""
+
+from .progress import DeviceProgress, EventQueue, FRAME_INTERVAL_MS, format_eta, format_rate
+
+__all__ = ['DeviceProgress', 'EventQueue', 'FRAME_INTERVAL_MS', 'format_eta', 'format_rate']
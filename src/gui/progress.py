@@ -0,0 +1,137 @@
+"""
+SecureOS Flash - GUI Event Queue
+
+Hands work results and transfer progress from worker threads to the UI
+thread. Workers never touch widgets: they post callbacks and report
+progress here, and the UI drains the queue once per frame. Progress is
+coalesced per device (only the latest value is kept), so a backend
+reporting thousands of times a second costs the UI one update per frame.
+"""
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+import threading
+import time
+
+
+# UI refresh period (ms) - 20 frames per second
+FRAME_INTERVAL_MS = 50
+
+# Window over which throughput is averaged (s)
+RATE_WINDOW = 3.0
+
+
+@dataclass
+class DeviceProgress:
+    """Transfer progress of one device, with throughput and ETA"""
+    device: str
+    done: int = 0
+    total: int = 0
+    rate: float = 0.0  # bytes/s over RATE_WINDOW
+    samples: Deque[Tuple[float, int]] = field(default_factory=deque, repr=False)
+    
+    @property
+    def percent(self) -> float:
+        if not self.total:
+            return 0.0
+        return min(100.0, 100.0 * self.done / self.total)
+    
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left at the current rate (None until a rate is known)"""
+        if not self.rate or not self.total:
+            return None
+        return max(0.0, (self.total - self.done) / self.rate)
+    
+    def update(self, done: int, total: int, when: float):
+        """Record a progress sample taken at monotonic time `when`."""
+        if total != self.total or done < self.done:
+            # A new transfer (next partition, or flash after backup)
+            self.samples.clear()
+            self.rate = 0.0
+        self.done = done
+        self.total = total
+        
+        self.samples.append((when, done))
+        while len(self.samples) > 2 and when - self.samples[0][0] > RATE_WINDOW:
+            self.samples.popleft()
+        first_time, first_done = self.samples[0]
+        if when > first_time:
+            self.rate = (done - first_done) / (when - first_time)
+    
+    def reset(self):
+        self.done = self.total = 0
+        self.rate = 0.0
+        self.samples.clear()
+
+
+class EventQueue:
+    """
+    Thread-safe queue between worker threads and the UI thread.
+    
+    post() queues a callback to run on the UI thread, in order.
+    progress_callback() gives a backend progress callback that only
+    stores the latest value for its device. drain() is called by the UI
+    thread once per frame.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: List[Tuple[Callable, tuple]] = []
+        self._progress: Dict[str, Tuple[int, int, float]] = {}
+    
+    def post(self, callback: Callable, *args: Any):
+        """Run callback(*args) on the UI thread at the next frame."""
+        with self._lock:
+            self._calls.append((callback, args))
+    
+    def progress_callback(self, device: str) -> Callable[[int, int], None]:
+        """
+        Backend progress callback for a device.
+        
+        Args:
+            device: Key the progress is reported under
+            
+        Returns:
+            Callback taking (done, total)
+        """
+        def report(done: int, total: int):
+            sample = (done, total, time.monotonic())
+            with self._lock:
+                self._progress[device] = sample
+        
+        return report
+    
+    def drain(self) -> Tuple[Dict[str, Tuple[int, int, float]], List[Tuple[Callable, tuple]]]:
+        """
+        Take everything queued since the last drain.
+        
+        Returns:
+            (latest (done, total, time) per device, callbacks in post order)
+        """
+        with self._lock:
+            progress, self._progress = self._progress, {}
+            calls, self._calls = self._calls, []
+        return progress, calls
+
+
+def format_rate(rate: float) -> str:
+    """Human-readable throughput, e.g. '12.3 MB/s'"""
+    for unit in ("B/s", "KB/s", "MB/s"):
+        if rate < 1024:
+            return f"{rate:.0f} {unit}" if unit == "B/s" else f"{rate:.1f} {unit}"
+        rate /= 1024
+    return f"{rate:.1f} GB/s"
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """Remaining time as m:ss or h:mm:ss ('--:--' when unknown)"""
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds + 0.5)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
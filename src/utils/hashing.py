@@ -0,0 +1,63 @@
+"""
+SecureOS Flash - Hashing Helpers
+
+Streaming digests of image and backup files.
+"""
+
+import hashlib
+import os
+from typing import Optional
+
+
+# Digest algorithm used for images, backups and device records
+DEFAULT_ALGORITHM = "sha256"
+
+# Read size for streaming digests (1 MiB)
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path: str, algorithm: str = DEFAULT_ALGORITHM,
+                limit: Optional[int] = None) -> str:
+    """
+    Compute the hex digest of a file without loading it into memory.
+    
+    Args:
+        path: File to hash
+        algorithm: hashlib algorithm name
+        limit: Only hash the first `limit` bytes (None = whole file)
+        
+    Returns:
+        Hex digest string
+    """
+    digest = hashlib.new(algorithm)
+    remaining = limit
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    
+    with open(path, "rb", buffering=0) as f:
+        while remaining is None or remaining > 0:
+            want = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+            n = f.readinto(view[:want])
+            if not n:
+                break
+            digest.update(view[:n])
+            if remaining is not None:
+                remaining -= n
+    
+    return digest.hexdigest()
+
+
+def file_signature(path: str) -> tuple:
+    """
+    Cheap identity of a file's current contents (path, size, mtime).
+    
+    Used to cache digests of images that are flashed repeatedly.
+    
+    Args:
+        path: File to stat
+        
+    Returns:
+        Tuple usable as a cache key
+    """
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
@@ -0,0 +1,30 @@
+"""
+SecureOS Flash - Data Paths
+
+Locations for state that SecureOS Flash keeps between runs
+(partition digests, backup catalogs, journals, ...).
+"""
+
+import os
+
+
+# Override the data directory (useful for stations and tests)
+DATA_DIR_ENV = "SECUREOS_FLASH_HOME"
+
+
+def data_dir(*parts: str) -> str:
+    """
+    Get (and create) a directory below the SecureOS Flash data directory.
+    
+    Args:
+        parts: Optional sub-directory components
+        
+    Returns:
+        Absolute path of the directory
+    """
+    base = os.environ.get(DATA_DIR_ENV) or os.path.join(
+        os.path.expanduser("~"), ".secureos-flash"
+    )
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,95 @@
+"""
+SecureOS Flash - Prefetching Reads
+
+Reads a stream into a small ring of preallocated buffers on a helper
+thread, so the next chunk is already in memory while the current one is
+being sent. With two buffers (double buffering) the USB link never waits
+on the disk unless the disk is the slower of the two.
+"""
+
+from typing import BinaryIO, Iterator
+import logging
+import queue
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+# Buffers in flight: one being sent, one being filled
+DEFAULT_DEPTH = 2
+
+# How long to wait for the reader thread when the consumer stops early
+READER_JOIN_TIMEOUT = 5.0
+
+_END = object()
+
+
+def prefetch_chunks(source: BinaryIO, size: int, chunk_size: int,
+                    depth: int = DEFAULT_DEPTH) -> Iterator[memoryview]:
+    """
+    Read `size` bytes from a stream in chunks, `depth - 1` chunks ahead.
+    
+    Every chunk but the last is exactly `chunk_size` bytes. A yielded
+    view stays valid until the next chunk is requested; its buffer is
+    then handed back to the reader. Errors raised by the source
+    (including EOFError if it ends early) are re-raised in the
+    consumer at the chunk where they happened.
+    
+    Args:
+        source: Stream with readinto()
+        size: Bytes to read
+        chunk_size: Bytes per chunk
+        depth: Buffers to allocate (at least 2)
+        
+    Yields:
+        memoryview of each chunk
+    """
+    free: "queue.Queue" = queue.Queue()
+    ready: "queue.Queue" = queue.Queue()
+    for _ in range(max(depth, 2)):
+        free.put(bytearray(chunk_size))
+    stop = threading.Event()
+    
+    def reader():
+        remaining = size
+        try:
+            while remaining and not stop.is_set():
+                buffer = free.get()
+                if buffer is None:
+                    return
+                view = memoryview(buffer)[:min(chunk_size, remaining)]
+                filled = 0
+                while filled < len(view):
+                    n = source.readinto(view[filled:])
+                    if not n:
+                        raise EOFError(f"Source ended after {size - remaining + filled} of {size} bytes")
+                    filled += n
+                remaining -= filled
+                ready.put((buffer, filled))
+            ready.put(_END)
+        except BaseException as e:
+            ready.put(e)
+    
+    thread = threading.Thread(target=reader, name="prefetch", daemon=True)
+    thread.start()
+    
+    current = None
+    try:
+        while True:
+            if current is not None:
+                free.put(current)
+                current = None
+            item = ready.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            current, n = item
+            yield memoryview(current)[:n]
+    finally:
+        stop.set()
+        free.put(None)
+        thread.join(READER_JOIN_TIMEOUT)
+        if thread.is_alive():
+            logger.warning("Prefetch reader did not stop in time")
@@ -0,0 +1,391 @@
+"""
+SecureOS Flash - Process Helpers
+
+Runs flashing tools as child processes while watching their output, so
+callers can enforce an overall deadline, a stall timeout and
+cancellation. Children are stopped with SIGTERM first, so the tool can
+release the USB interface, and killed if they do not exit in time.
+
+Output is never buffered whole: only a bounded tail of each stream is
+kept for error reporting, and the full transcript goes to an optional
+compressed SessionLog, so memory per child stays constant however much
+the tool prints.
+
+Inside collect_child_usage() every child's CPU time and I/O counters
+are recorded as well (for profiling).
+"""
+
+import logging
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Sequence
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# Time a child gets to exit after SIGTERM before it is killed
+TERMINATE_GRACE = 5.0
+
+# Time to wait for a killed child to be reaped
+KILL_GRACE = 2.0
+
+# Output kept in memory per stream (the rest is only in the session log)
+TAIL_LINES = 100
+TAIL_BYTES = 16 * 1024
+
+# Longest line forwarded; longer runs without a newline are split
+MAX_LINE = 4096
+
+# Lines waiting to be handled; when full the readers block and the
+# child's writes stall on the pipe instead of growing our memory
+QUEUE_LINES = 1024
+
+# Queue marker used to wake the output loop on cancellation
+_WAKE = object()
+
+STDOUT = "out"
+STDERR = "err"
+
+# Per-thread stack of lists collecting ChildUsage records
+_usage = threading.local()
+
+
+@dataclass
+class ChildUsage:
+    """Resources used by one child process"""
+    command: str
+    pid: int
+    returncode: Optional[int]
+    wall: float                  # Seconds from start to exit
+    user_cpu: float = 0.0        # RUSAGE_CHILDREN delta over reaping it
+    system_cpu: float = 0.0
+    rchar: Optional[int] = None  # /proc/<pid>/io (None where unavailable)
+    wchar: Optional[int] = None
+    read_bytes: Optional[int] = None   # Of those, from/to storage
+    write_bytes: Optional[int] = None
+
+
+@contextmanager
+def collect_child_usage() -> Iterator[List[ChildUsage]]:
+    """
+    Record the resource usage of every run_monitored() child started on
+    this thread inside the block.
+    
+    CPU time is the RUSAGE_CHILDREN difference across reaping the child,
+    so a child reaped by another thread at the same moment can be
+    counted in it too.
+    
+    Yields:
+        List that receives a ChildUsage per child as each one exits
+    """
+    records: List[ChildUsage] = []
+    stack = getattr(_usage, "stack", None)
+    if stack is None:
+        stack = _usage.stack = []
+    stack.append(records)
+    try:
+        yield records
+    finally:
+        stack.remove(records)
+
+
+def _proc_io(pid: int) -> Dict[str, int]:
+    """I/O counters of a running (or exited but unreaped) process."""
+    try:
+        with open(f"/proc/{pid}/io", "r") as f:
+            return {name: int(value) for name, value in
+                    (line.split(":", 1) for line in f if ":" in line)}
+    except (OSError, ValueError):
+        return {}
+
+
+def _wait_exited(process: subprocess.Popen, timeout: float):
+    """Wait until the child has exited without reaping it, so /proc/<pid> stays readable."""
+    if not hasattr(os, "waitid"):
+        return
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None:
+                return
+        except ChildProcessError:
+            return
+        time.sleep(0.005)
+
+
+def _reap(process: subprocess.Popen, reap: Callable[[], Optional[int]],
+          started: float, collectors: List[List[ChildUsage]]) -> Optional[int]:
+    """Reap the child through reap(), recording its usage into every collector."""
+    io = _proc_io(process.pid)
+    before = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+    returncode = reap()
+    usage = ChildUsage(
+        command=" ".join(str(arg) for arg in process.args),
+        pid=process.pid,
+        returncode=returncode,
+        wall=time.monotonic() - started,
+        rchar=io.get("rchar"),
+        wchar=io.get("wchar"),
+        read_bytes=io.get("read_bytes"),
+        write_bytes=io.get("write_bytes")
+    )
+    if before is not None:
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        usage.user_cpu = after.ru_utime - before.ru_utime
+        usage.system_cpu = after.ru_stime - before.ru_stime
+    for collector in collectors:
+        collector.append(usage)
+    return returncode
+
+
+class ProcessStalled(subprocess.TimeoutExpired):
+    """Raised when a child process stops making progress"""
+    
+    def __init__(self, cmd, idle: float, output=None, stderr=None):
+        super().__init__(cmd, idle, output, stderr)
+        self.idle = idle
+    
+    def __str__(self):
+        return f"Command '{self.cmd}' stalled: no progress for {self.idle:.0f} seconds"
+
+
+class OutputTail:
+    """
+    Ring buffer of the last lines of a stream.
+    
+    Holds at most max_lines lines and max_bytes characters; older lines
+    are dropped (and counted) as new ones arrive.
+    """
+    
+    def __init__(self, max_lines: int = TAIL_LINES, max_bytes: int = TAIL_BYTES):
+        self.max_bytes = max_bytes
+        self._lines: Deque[str] = deque(maxlen=max_lines)
+        self._size = 0
+        self.dropped = 0
+    
+    def append(self, line: str):
+        if len(self._lines) == self._lines.maxlen:
+            self._size -= len(self._lines[0])
+            self.dropped += 1
+        self._lines.append(line)
+        self._size += len(line)
+        while self._size > self.max_bytes and len(self._lines) > 1:
+            self._size -= len(self._lines.popleft())
+            self.dropped += 1
+    
+    def text(self) -> str:
+        """The kept lines, noting how many earlier ones were dropped."""
+        lines = list(self._lines)
+        if self.dropped:
+            lines.insert(0, f"[... {self.dropped} earlier lines not kept]")
+        return "\n".join(lines)
+
+
+def _pump(stream, name: str, sink: "queue.Queue"):
+    """Forward output lines (split on \\n or \\r) from a pipe to a queue as (name, line)."""
+    pending = b""
+    fd = stream.fileno()
+    while True:
+        data = os.read(fd, 4096)
+        if not data:
+            break
+        pending += data.replace(b"\r", b"\n")
+        *lines, pending = pending.split(b"\n")
+        while len(pending) > MAX_LINE:
+            lines.append(pending[:MAX_LINE])
+            pending = pending[MAX_LINE:]
+        for line in lines:
+            sink.put((name, line.decode("utf-8", "replace")))
+    if pending:
+        sink.put((name, pending.decode("utf-8", "replace")))
+    sink.put((name, None))
+
+
+def _join_readers(readers, lines: "queue.Queue", timeout: float = 1.0):
+    """Wait for the reader threads, discarding lines so none blocks on a full queue."""
+    deadline = time.monotonic() + timeout
+    while any(reader.is_alive() for reader in readers) and time.monotonic() < deadline:
+        try:
+            while True:
+                lines.get_nowait()
+        except queue.Empty:
+            pass
+        for reader in readers:
+            reader.join(timeout=0.01)
+
+
+def _signal(process: subprocess.Popen, sig: int):
+    try:
+        if os.name == "posix":
+            # The child leads its own process group; stop helpers it spawned too
+            os.killpg(process.pid, sig)
+        elif sig == signal.SIGTERM:
+            process.terminate()
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def stop_process(process: subprocess.Popen, grace: float = TERMINATE_GRACE,
+                 kill_grace: float = KILL_GRACE) -> Optional[int]:
+    """
+    Stop a child process: SIGTERM, then SIGKILL after `grace` seconds.
+    
+    Args:
+        process: Process started by run_monitored (or any Popen)
+        grace: Seconds to wait for a clean exit after SIGTERM
+        kill_grace: Seconds to wait for the process to be reaped after SIGKILL
+        
+    Returns:
+        Exit code, or None if the process could not be reaped
+    """
+    if process.poll() is not None:
+        return process.returncode
+    
+    _signal(process, signal.SIGTERM)
+    try:
+        return process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        pass
+    
+    logger.warning(f"Process {process.pid} ignored SIGTERM - killing")
+    _signal(process, getattr(signal, "SIGKILL", signal.SIGTERM))
+    try:
+        return process.wait(timeout=kill_grace)
+    except subprocess.TimeoutExpired:
+        logger.error(f"Process {process.pid} could not be killed")
+        return None
+
+
+def run_monitored(cmd: Sequence[str], timeout: float,
+                  on_line: Optional[Callable[[str], None]] = None,
+                  stall=None, cancel=None,
+                  grace: float = TERMINATE_GRACE,
+                  log=None,
+                  tail_lines: int = TAIL_LINES) -> subprocess.CompletedProcess:
+    """
+    Run a command, streaming its stdout lines and enforcing timeouts.
+    
+    on_line sees every stdout line as it arrives (carriage-return
+    progress updates count as lines) and is expected to feed `stall`.
+    Only the last `tail_lines` lines of stdout and stderr are returned;
+    every line of both goes to `log` if one is given.
+    
+    Args:
+        cmd: Command and arguments
+        timeout: Overall deadline in seconds
+        on_line: Called with each stdout line
+        stall: StallDetector (core.timeouts) checked while waiting for output
+        cancel: CancellationToken (core.cancellation) that stops the command
+        grace: Seconds the command gets to exit after SIGTERM
+        log: SessionLog (utils.session_log) receiving the full output
+        tail_lines: Lines of each stream kept in memory
+        
+    Returns:
+        CompletedProcess with the text tails of stdout/stderr
+        
+    Raises:
+        subprocess.TimeoutExpired: Deadline passed (the process is killed)
+        ProcessStalled: No progress within the stall timeout (the process is killed)
+        OperationCancelled: `cancel` was cancelled (the process is stopped)
+    """
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+    
+    collectors = list(getattr(_usage, "stack", ()))
+    started = time.monotonic()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               start_new_session=(os.name == "posix"))
+    lines: "queue.Queue" = queue.Queue(QUEUE_LINES)
+    tails = {STDOUT: OutputTail(tail_lines), STDERR: OutputTail(tail_lines)}
+    stdout = tails[STDOUT]
+    if log is not None:
+        log.command(cmd)
+    
+    readers = [
+        threading.Thread(target=_pump, args=(process.stdout, STDOUT, lines), daemon=True),
+        threading.Thread(target=_pump, args=(process.stderr, STDERR, lines), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+    
+    def wake():
+        try:
+            lines.put_nowait(_WAKE)
+        except queue.Full:
+            pass  # The loop has lines to handle and will see the cancellation
+    
+    unregister = cancel.on_cancel(wake) if cancel is not None else None
+    deadline = time.monotonic() + timeout
+    open_streams = len(readers)
+    try:
+        while open_streams:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            wait = deadline - time.monotonic()
+            if stall is not None:
+                wait = min(wait, stall.remaining())
+            if time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(cmd, timeout, stdout.text())
+            if stall is not None and stall.stalled:
+                raise ProcessStalled(cmd, stall.idle(), stdout.text())
+            
+            try:
+                item = lines.get(timeout=max(wait, 0.01))
+            except queue.Empty:
+                continue
+            if item is _WAKE:
+                continue
+            name, line = item
+            if line is None:
+                open_streams -= 1
+                continue
+            tails[name].append(line)
+            if log is not None:
+                log.write(name, line)
+            if name == STDOUT and on_line is not None:
+                on_line(line)
+        
+        if collectors:
+            _wait_exited(process, max(deadline - time.monotonic(), 0.01))
+            returncode = _reap(process, lambda: process.wait(timeout=max(deadline - time.monotonic(), 0.01)),
+                               started, collectors)
+        else:
+            returncode = process.wait(timeout=max(deadline - time.monotonic(), 0.01))
+    except BaseException as e:
+        if collectors and process.returncode is None:
+            _reap(process, lambda: stop_process(process, grace), started, collectors)
+        else:
+            stop_process(process, grace)
+        if log is not None:
+            log.finish(f"aborted: {type(e).__name__}: {e}")
+        raise
+    finally:
+        if unregister is not None:
+            unregister()
+        _join_readers(readers, lines)
+        process.stdout.close()
+        process.stderr.close()
+    
+    if log is not None:
+        log.finish(f"exit {returncode}")
+    return subprocess.CompletedProcess(
+        cmd,
+        returncode,
+        stdout=stdout.text(),
+        stderr=tails[STDERR].text()
+    )
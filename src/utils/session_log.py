@@ -0,0 +1,124 @@
+"""
+SecureOS Flash - Session Logs
+
+Full output of the flashing tools run during a device session, written
+gzip-compressed to <data dir>/logs. Only a short tail of each command's
+output is kept in memory (for error messages); the log is where the
+whole transcript goes for post-mortems.
+"""
+
+import gzip
+import logging
+import os
+import threading
+import time
+from typing import Optional, Sequence
+
+from .paths import data_dir
+
+
+logger = logging.getLogger(__name__)
+
+
+# Session logs kept per prefix; older ones are deleted when a new one opens
+MAX_SESSION_LOGS = 200
+
+
+class SessionLog:
+    """
+    Compressed transcript of the commands run in one session.
+    
+    Each line is stamped with the seconds since the log was opened and
+    the stream it came from. Safe to write from several threads.
+    """
+    
+    def __init__(self, path: str):
+        """
+        Open a log file for writing.
+        
+        Args:
+            path: File to create (should end in .gz)
+        """
+        self.path = path
+        self._file = gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.lines = 0
+    
+    @classmethod
+    def create(cls, prefix: str, keep: int = MAX_SESSION_LOGS) -> "SessionLog":
+        """
+        Start a new session log in <data dir>/logs.
+        
+        Args:
+            prefix: File name prefix, e.g. the backend name
+            keep: Logs with this prefix to keep (older ones are deleted)
+            
+        Returns:
+            Open SessionLog
+        """
+        directory = data_dir("logs")
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(directory, f"{prefix}-{stamp}-{os.getpid()}.log.gz")
+        suffix = 1
+        while os.path.exists(path):
+            suffix += 1
+            path = os.path.join(directory, f"{prefix}-{stamp}-{os.getpid()}-{suffix}.log.gz")
+        
+        _prune(directory, prefix, keep - 1)
+        logger.debug(f"Session log: {path}")
+        return cls(path)
+    
+    @property
+    def closed(self) -> bool:
+        return self._file is None
+    
+    def _write(self, text: str):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(f"{time.monotonic() - self._started:10.3f} {text}\n")
+            self.lines += 1
+    
+    def command(self, cmd: Sequence[str]):
+        """Record that a command is starting."""
+        self._write(f"$ {' '.join(cmd)}  [{time.strftime('%Y-%m-%d %H:%M:%S')}]")
+    
+    def write(self, stream: str, line: str):
+        """Record one output line of the running command ("out" or "err")."""
+        self._write(f"{stream} {line}")
+    
+    def finish(self, outcome: str):
+        """Record how the command ended and flush what was written so far."""
+        self._write(f"= {outcome}")
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+    
+    def close(self):
+        """Finish the gzip stream; further writes are ignored."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+    
+    def __enter__(self) -> "SessionLog":
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _prune(directory: str, prefix: str, keep: int):
+    """Delete all but the newest `keep` logs with the given prefix."""
+    logs = sorted(
+        (entry for entry in os.scandir(directory)
+         if entry.name.startswith(f"{prefix}-") and entry.name.endswith(".log.gz")),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in logs[:max(len(logs) - keep, 0)]:
+        try:
+            os.unlink(entry.path)
+        except OSError as e:
+            logger.warning(f"Could not remove old session log {entry.path}: {e}")
+
@@ -0,0 +1,45 @@
+"""
+SecureOS Flash - USB Helpers
+
+Helpers shared by the pyusb transports.
+"""
+
+from typing import Optional
+
+
+def port_path(device) -> str:
+    """
+    Where a pyusb device is plugged in.
+    
+    Unlike the device address, the port path stays the same when the
+    device resets and re-enumerates, so a transport bound to it finds
+    the device again afterwards.
+    
+    Args:
+        device: pyusb device
+        
+    Returns:
+        "usb-<bus>-<port>.<port>...", e.g. "usb-1-2.3"
+    """
+    ports = getattr(device, "port_numbers", None) or ()
+    return f"usb-{device.bus}-" + ".".join(str(p) for p in ports)
+
+
+def serial_number(device) -> Optional[str]:
+    """
+    The serial number string a pyusb device reports.
+    
+    Args:
+        device: pyusb device
+        
+    Returns:
+        Serial number, None if the device has none or it cannot be read
+    """
+    if not getattr(device, "iSerialNumber", 0):
+        return None
+    try:
+        serial = device.serial_number
+    except (ValueError, IOError, NotImplementedError):
+        # No permission to read string descriptors, or no language ID
+        return None
+    return (serial or "").strip() or None